@@ -30,6 +30,7 @@ from common import (
     initialize_managers,
     apply_custom_styles,
 )
+from utils.metrics_report import start_metrics_reporter
 
 # ページ設定
 st.set_page_config(
@@ -48,6 +49,9 @@ def main():
     # データマネージャーとチャットボットヘルパーを初期化
     initialize_managers()
 
+    # 性能計測値の定期的なログ出力を開始
+    start_metrics_reporter()
+
     # 認証の設定
     authenticator = setup_authentication()
 
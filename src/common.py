@@ -17,6 +17,7 @@ from utils.database import DataManager
 from utils.chatbot_helper import ChatBotHelper
 from utils.styles import get_custom_css
 from utils.tools import timer
+from utils.metrics_report import summarize_metrics
 
 # データディレクトリのパス
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
@@ -24,6 +25,13 @@ USERS_FILE = os.path.join(DATA_DIR, "users.yaml")
 PROMPTS_FILE = os.path.join(DATA_DIR, "prompts.json")
 CHAT_HISTORY_FILE = os.path.join(DATA_DIR, "chat_history.json")
 
+# 性能計測値を表示するユーザー（カンマ区切り）
+METRICS_ADMIN_USERS = {
+    name.strip()
+    for name in os.getenv("METRICS_ADMIN_USERS", "admin").split(",")
+    if name.strip()
+}
+
 
 def init_auth_config():
     """認証設定ファイルの初期化"""
@@ -162,6 +170,24 @@ def display_statistics():
 
             st.metric("プロンプト数", stats["total_prompts"])
 
+        if st.session_state.get("username") in METRICS_ADMIN_USERS:
+            display_performance_metrics()
+
+
+def display_performance_metrics():
+    """性能計測値（キャッシュのヒット率、実行待ち時間、応答時間など）の表示"""
+    summary = summarize_metrics()
+    with st.expander("⏱️ 性能計測値"):
+        if not summary:
+            st.caption("まだ計測値がありません")
+            return
+        rows = [
+            {"区分": section, "項目": key, "値": round(value, 3)}
+            for section, values in summary.items()
+            for key, value in values.items()
+        ]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
 
 def setup_authentication():
     """認証の設定と実行"""
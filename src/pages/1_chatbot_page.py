@@ -3,18 +3,29 @@ import os
 import sys
 import re
 import uuid
+import time
 import asyncio as _asyncio
 from utils.database import DataManager
-from utils.autogen_agent import setup_agent
+from utils.autogen_agent import get_agent_factory
 from utils.tools import timer
 from datetime import datetime
 import pytz
 import logging
-from utils.tools import check_content
+from utils.tools import check_content, display_execution_output, get_image_source
+from utils.llm_clients import ResponseTimer, get_llm_loop
+from utils.agent_knowledge import augment_prompt, record_turn
+from utils.response_cache import (
+    get_response_cache,
+    replay_response,
+    response_cache_context,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# 生成中のテキストを再描画する最短の間隔（秒）
+PARTIAL_RENDER_INTERVAL = 0.05
+
 
 # パスの設定を改善
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -55,8 +66,11 @@ def display_message_with_images(content: str):
         if i % 2 == 1:  # 奇数番目の要素が画像パス
             image_path = part.strip()
             # URLかローカルパスかを判定
-            if image_path.startswith("http"):
-                st.image(image_path, width=600)  # URLの場合は直接表示
+            # アップロード中の画像やローカル・メモリの保存先の画像は内容を取得
+            image_source = get_image_source(image_path)
+            if isinstance(image_source, bytes) or image_path.startswith("http"):
+                # URLの場合は直接表示（アップロード中はローカルのファイルを表示）
+                st.image(image_source, width=600)
             elif os.path.exists(image_path):
                 st.image(image_path)
             else:
@@ -137,7 +151,12 @@ def enhanced_chatbot_page():
         if "session_id" not in st.session_state:
             st.session_state.session_id = str(uuid.uuid4())
 
-        st.session_state.agent = setup_agent()
+        # エージェントとコード実行中の出力の表示先（セッション固有）
+        # 次の「新しい会話」用の予備はバックグラウンドで作成される
+        agent, st.session_state.execution_output = get_agent_factory().acquire(
+            st.session_state.get("username")
+        )
+        st.session_state.agent = agent
         logger.info(
             f"新しいエージェントを初期化しました。セッションID: {st.session_state.session_id}"
         )
@@ -218,43 +237,130 @@ def enhanced_chatbot_page():
                 enhanced_prompt = f"""{prompt}
 
 ######現在の時刻: {current_time_str}######"""
+                # 質問に関係する業務知識だけを付与（システムメッセージには含めない）
+                augmented = augment_prompt(enhanced_prompt)
+                enhanced_prompt = augmented["prompt"]
+                # 同じ質問への応答がキャッシュにあれば、エージェントを実行せずに再生する
+                # （時刻・参考情報を付与する前の質問と、それまでの質問・データセットで検索）
+                response_cache = get_response_cache()
+                cache_context = response_cache_context(
+                    [
+                        m["content"]
+                        for m in st.session_state.chat_messages[:-1]
+                        if m["role"] == "user"
+                    ]
+                )
+                cached = (
+                    response_cache.lookup(prompt, cache_context)
+                    if response_cache
+                    else None
+                )
+                if cached:
+                    st.caption(
+                        f"♻️ 以前の同じ質問への回答を表示しています（類似度: {cached['similarity']:.2f}）"
+                    )
                 # 非同期ストリーミング応答を逐次表示
                 response_chunks = []
+                received_messages = []
                 streaming = True  # ストリーミング応答を利用
+                # キャッシュの再生はモデルの応答時間と分けて計測する
+                timer = ResponseTimer("chat.cached" if cached else "chat")
                 with st.spinner("エージェント応答生成中..."):
                     try:
 
                         async def stream_response():
-                            async for msg in agent.run_stream(task=enhanced_prompt):
-                                logger.info(f"Received message: {msg}")
-                                content = getattr(msg, "content", "")
-                                # contentがJSONシリアライズ不可能なオブジェクトの場合、文字列に変換
-                                # FunctionCallオブジェクトなどが含まれるリストを安全に処理するため
-                                if not isinstance(
-                                    content, (str, int, float, bool, type(None))
-                                ):
-                                    content = str(content)
-
-                                if content != "":
-                                    role = getattr(msg, "source", "assistant")
-                                    response_chunks.append(content)
-                                    if (
-                                        role != "user"
-                                    ):  # userのメッセージは発話時に格納している
-                                        st.session_state.chat_messages.append(
-                                            {"role": role, "content": content}
+                            # コード実行中の出力を逐次表示
+                            output_watcher = _asyncio.create_task(
+                                display_execution_output(
+                                    st.session_state.execution_output
+                                )
+                            )
+                            try:
+                                if cached:
+
+                                    def stream_factory():
+                                        return replay_response(
+                                            agent, enhanced_prompt, cached
                                         )
 
-                                    if role == "user":
-                                        display_custom_chat_message("user", content)
-                                    else:
-                                        display_custom_chat_message(
-                                            "assistant", content
-                                        )
+                                else:
+
+                                    def stream_factory():
+                                        return agent.run_stream(task=enhanced_prompt)
+
+                                # 生成中のテキストを表示する吹き出し（完成したメッセージで置き換える）
+                                partial_bubble = None
+                                partial_text = ""
+                                rendered_at = 0.0
+                                # LLMとの通信は常駐するLLMループで行い、接続を会話間で再利用する
+                                async for msg in get_llm_loop().stream(stream_factory):
+                                    if type(msg).__name__ == "ModelClientStreamingChunkEvent":
+                                        timer.first_token()
+                                        partial_text += msg.content
+                                        if partial_bubble is None:
+                                            partial_bubble = st.empty()
+                                        # 描画の回数を抑えるため一定間隔ごとに更新
+                                        now = time.perf_counter()
+                                        if now - rendered_at >= PARTIAL_RENDER_INTERVAL:
+                                            rendered_at = now
+                                            with partial_bubble.container():
+                                                with st.chat_message(
+                                                    "assistant", avatar="avanade.png"
+                                                ):
+                                                    st.markdown(partial_text + "▌")
+                                        continue
+                                    if partial_bubble is not None:
+                                        partial_bubble.empty()
+                                        partial_bubble = None
+                                        partial_text = ""
+                                        rendered_at = 0.0
+                                    logger.info(f"Received message: {msg}")
+                                    received_messages.append(msg)
+                                    content = getattr(msg, "content", "")
+                                    # contentがJSONシリアライズ不可能なオブジェクトの場合、文字列に変換
+                                    # FunctionCallオブジェクトなどが含まれるリストを安全に処理するため
+                                    if not isinstance(
+                                        content, (str, int, float, bool, type(None))
+                                    ):
+                                        content = str(content)
+
+                                    if content != "":
+                                        role = getattr(msg, "source", "assistant")
+                                        if role != "user":
+                                            timer.first_token()
+                                        response_chunks.append(content)
+                                        if (
+                                            role != "user"
+                                        ):  # userのメッセージは発話時に格納している
+                                            st.session_state.chat_messages.append(
+                                                {"role": role, "content": content}
+                                            )
+
+                                        if role == "user":
+                                            # 付与した時刻・参考情報は表示しない
+                                            display_custom_chat_message("user", prompt)
+                                        else:
+                                            display_custom_chat_message(
+                                                "assistant", content
+                                            )
+                            finally:
+                                output_watcher.cancel()
+                                await _asyncio.gather(output_watcher, return_exceptions=True)
 
                         # イベントループで実行
                         _asyncio.run(stream_response())
+                        elapsed = timer.finish()
                         response = "".join(response_chunks)
+                        if not cached:
+                            # システムメッセージの削減で節約できたトークン数を記録
+                            record_turn(received_messages, augmented["tokens"])
+                            if response_cache:
+                                response_cache.store(
+                                    prompt,
+                                    cache_context,
+                                    received_messages,
+                                    elapsed,
+                                )
                     except Exception as e:
                         response = f"エージェント応答生成エラー: {e}"
 
@@ -284,8 +390,11 @@ def reset_agent_state():
         # 新しいセッションIDを生成
         st.session_state.session_id = str(uuid.uuid4())
 
-        # 新しいエージェントを作成
-        st.session_state.agent = setup_agent()
+        # 新しいエージェントを取得（事前に作成済みの予備があれば待たずに使う）
+        agent, st.session_state.execution_output = get_agent_factory().acquire(
+            st.session_state.get("username")
+        )
+        st.session_state.agent = agent
         logger.info(
             f"新しいエージェントを作成しました。セッションID: {st.session_state.session_id}"
         )
@@ -0,0 +1,127 @@
+"""
+生産スケジュール最適化サンプルタスクのベンチマーク
+
+CP-SATソルバー（optimize_production_schedule）と、マルチエージェントチームが
+コード生成で解く従来の方法について、実行時間と解の品質（P1の生産時間）を比較します。
+
+使い方（プロジェクトルートで実行）:
+    python -m src.samples.benchmark_schedule_optimizer
+    python -m src.samples.benchmark_schedule_optimizer --sweep  # What-ifシナリオの並列スイープ
+    python -m src.samples.benchmark_schedule_optimizer --llm  # Azure OpenAIの環境変数が必要
+"""
+
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from src.utils.sample_tasks import SAMPLE_TASKS, SCHEDULE_OPTIMIZATION_TASK
+from src.utils.schedule_optimizer import SAMPLE_SCHEDULE_PROBLEM, solve_production_schedule
+from src.utils.schedule_sweep import build_schedule_scenarios, run_schedule_sweep
+
+TARGET_PRODUCT = "P1"
+STOPPED_PRODUCTS = ("P19", "P20")
+
+
+def benchmark_solver(repeat: int, time_limit_seconds: float) -> None:
+    """サンプルタスクをCP-SATで繰り返し解き、計算時間と結果を表示"""
+    product_hours = {
+        p: h
+        for p, h in SAMPLE_SCHEDULE_PROBLEM["product_hours"].items()
+        if p not in STOPPED_PRODUCTS
+    }
+    wall_times = []
+    for _ in range(repeat):
+        result = solve_production_schedule(
+            SAMPLE_SCHEDULE_PROBLEM["lines"],
+            product_hours,
+            changeover_hours=SAMPLE_SCHEDULE_PROBLEM["changeover_hours"],
+            horizon_hours=SAMPLE_SCHEDULE_PROBLEM["horizon_hours"],
+            objective="maximize_product",
+            target_product=TARGET_PRODUCT,
+            time_limit_seconds=time_limit_seconds,
+        )
+        wall_times.append(result["wall_time_seconds"])
+
+    print("## CP-SAT")
+    print(f"status: {result['status']}")
+    print(f"{TARGET_PRODUCT}の生産時間: {result['objective_value']:g}時間")
+    print(
+        f"計算時間: 平均 {statistics.mean(wall_times):.2f}秒 / "
+        f"最大 {max(wall_times):.2f}秒（{repeat}回）"
+    )
+
+
+def benchmark_sweep(time_limit_seconds: float) -> None:
+    """切替時間・停止商品・ライン追加の組み合わせを並列に解き、比較表と合計時間を表示"""
+    scenarios = build_schedule_scenarios(
+        SAMPLE_SCHEDULE_PROBLEM["lines"],
+        SAMPLE_SCHEDULE_PROBLEM["product_hours"],
+        changeover_options=(0, 1, 2),
+        drop_product_options=((), STOPPED_PRODUCTS, ("P15", "P16", "P17", "P18")),
+        extra_line_options=(0, 1),
+        horizon_hours=SAMPLE_SCHEDULE_PROBLEM["horizon_hours"],
+        objective="maximize_product",
+        target_product=TARGET_PRODUCT,
+    )
+    table = run_schedule_sweep(scenarios, time_limit_seconds=time_limit_seconds)
+
+    print("## What-ifスイープ")
+    print(table.to_string(index=False))
+    print(
+        f"{len(scenarios)}シナリオ: {table.attrs['elapsed_seconds']:.1f}秒"
+        f"（並列数 {table.attrs['max_workers']}）"
+    )
+
+
+async def benchmark_llm_team() -> None:
+    """マルチエージェントチームにサンプルタスクを解かせ、所要時間と回答を表示"""
+    from src.utils.autogen_agent import setup_multiagent_team
+
+    load_dotenv(override=True)
+    # 比較対象は従来の方法のため、スケジュール最適化ツールを持たないチームでコードを生成させる
+    team = setup_multiagent_team(schedule_solver=False)
+    if team is None:
+        print("マルチエージェントチームを初期化できませんでした（環境変数を確認してください）")
+        return
+
+    start_time = time.perf_counter()
+    result = await team.run(task=SAMPLE_TASKS[SCHEDULE_OPTIMIZATION_TASK])
+    elapsed = time.perf_counter() - start_time
+
+    answer = ""
+    for message in reversed(result.messages):
+        content = getattr(message, "content", None)
+        if isinstance(content, str) and TARGET_PRODUCT in content:
+            answer = content
+            break
+    match = re.search(rf"{TARGET_PRODUCT}の生産時間[^\d]*(\d+)", answer)
+
+    print("## マルチエージェント（コード生成）")
+    print(f"メッセージ数: {len(result.messages)}")
+    print(
+        f"{TARGET_PRODUCT}の生産時間: {match.group(1) + '時間' if match else '回答から抽出できませんでした'}"
+    )
+    print(f"所要時間: {elapsed:.1f}秒")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="ソルバーの実行回数")
+    parser.add_argument("--time-limit", type=float, default=10.0, help="ソルバーの制限時間（秒）")
+    parser.add_argument("--sweep", action="store_true", help="What-ifシナリオのスイープも実行する")
+    parser.add_argument("--llm", action="store_true", help="マルチエージェントチームでも実行する")
+    args = parser.parse_args()
+
+    benchmark_solver(args.repeat, args.time_limit)
+    if args.sweep:
+        benchmark_sweep(args.time_limit)
+    if args.llm:
+        asyncio.run(benchmark_llm_team())
+
+
+if __name__ == "__main__":
+    main()
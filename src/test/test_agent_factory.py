@@ -0,0 +1,67 @@
+import threading
+
+from src.utils.agent_factory import AgentFactory
+
+
+def test_acquire_returns_warm_spare_per_user():
+    """
+    正常系: 最初の取得ではその場で作成し、次の取得ではバックグラウンドで作成済みの予備が
+    返され、予備はユーザーごとに別の表示先とともに作成されることをテストします。
+    """
+    # --- Arrange ---
+    built = []
+    lock = threading.Lock()
+
+    def builder(output_stream, user):
+        with lock:
+            built.append((user, threading.current_thread().name))
+            return {"user": user, "stream": output_stream, "index": len(built)}
+
+    factory = AgentFactory(builder, "test")
+
+    # --- Act ---
+    first, first_stream = factory.acquire("alice")
+    factory.wait(timeout=5)
+    second, second_stream = factory.acquire("alice")
+    factory.wait(timeout=5)
+    other, _ = factory.acquire("bob")
+    factory.wait(timeout=5)
+
+    # --- Assert ---
+    assert first["index"] == 1
+    assert built[0][1] == threading.current_thread().name
+    # 2回目は最初の取得の直後に予備として作成されたもの
+    assert second["index"] == 2
+    assert built[1] == ("alice", "test-spare")
+    assert second["stream"] is second_stream is not first_stream
+    assert other["user"] == "bob"
+    assert factory.stats() == {"spares": 2, "warming": 0}
+
+
+def test_expired_or_disabled_spares_are_not_used():
+    """
+    正常系: 保持期間を過ぎた予備は使われずに作り直され、予備の作成を無効にした場合は
+    毎回その場で作成されることをテストします。
+    """
+    # --- Arrange ---
+    calls = []
+
+    def builder(output_stream, user):
+        calls.append(user)
+        return object()
+
+    expiring = AgentFactory(builder, "expiring", spare_max_age_seconds=0)
+    disabled = AgentFactory(builder, "disabled", warm_spare=False)
+
+    # --- Act ---
+    expiring.acquire()
+    expiring.wait(timeout=5)
+    expiring.acquire()
+    expiring.wait(timeout=5)
+    disabled.acquire()
+    disabled.acquire()
+
+    # --- Assert ---
+    # 初回・予備・期限切れで作り直し・次の予備の4回と、無効の2回
+    assert len(calls) == 6
+    assert disabled.stats() == {"spares": 0, "warming": 0}
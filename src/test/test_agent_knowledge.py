@@ -0,0 +1,72 @@
+from autogen_agentchat.messages import (
+    TextMessage,
+    ToolCallExecutionEvent,
+    ToolCallRequestEvent,
+)
+from autogen_core import FunctionCall
+from autogen_core.models import FunctionExecutionResult
+
+from src.utils.agent_knowledge import (
+    KNOWLEDGE_HEADER,
+    augment_prompt,
+    count_tokens,
+    full_knowledge_tokens,
+    lookup_knowledge,
+    record_turn,
+    search_knowledge,
+)
+
+
+def test_relevant_knowledge_is_injected_and_looked_up():
+    """
+    正常系: 質問に関係する業務知識だけがメッセージに付与され、グラフ作成の手順は
+    lookup_knowledgeで取得でき、関係しない質問には何も付与されないことをテストします。
+    """
+    # --- Arrange ---
+    question = "ｌｏｔ５６１２のトラブル情報を教えてください"
+
+    # --- Act ---
+    augmented = augment_prompt(question)
+    unrelated = augment_prompt("こんにちは")
+    chart = lookup_knowledge("グラフ作成のコード例")
+    missing = lookup_knowledge("天気")
+
+    # --- Assert ---
+    assert search_knowledge(question)[0]["id"] == "lot5612_trouble"
+    assert augmented["prompt"].startswith(question + "\n\n" + KNOWLEDGE_HEADER)
+    assert "動作不良の発生率が2倍" in augmented["prompt"]
+    assert "chart_code" not in augmented["entries"]
+    assert 0 < augmented["tokens"] < full_knowledge_tokens()
+    assert unrelated == {"prompt": "こんにちは", "entries": [], "tokens": 0}
+    assert "save_figure(fig)" in chart
+    assert missing.startswith("該当する情報はありません")
+
+
+def test_record_turn_reports_tokens_saved_per_model_call():
+    """
+    正常系: ツール呼び出しの要求とエージェントの応答の数からモデルの呼び出し回数が数えられ、
+    削減できたトークン数から付与・検索した知識の分が差し引かれることをテストします。
+    """
+    # --- Arrange ---
+    call = FunctionCall(id="1", name="lookup_knowledge", arguments='{"query": "グラフ"}')
+    looked_up = "## 手順\nsave_figureで保存"
+    messages = [
+        TextMessage(source="user", content="質問"),
+        ToolCallRequestEvent(source="DataAnalystAgent", content=[call]),
+        ToolCallExecutionEvent(
+            source="DataAnalystAgent",
+            content=[FunctionExecutionResult(content=looked_up, name="lookup_knowledge", call_id="1")],
+        ),
+        TextMessage(source="DataAnalystAgent", content="回答"),
+    ]
+
+    # --- Act ---
+    report = record_turn(messages, injected_tokens=10)
+
+    # --- Assert ---
+    removed = full_knowledge_tokens()
+    assert report["model_calls"] == 2
+    assert report["removed_tokens_per_call"] == removed
+    assert report["injected_tokens"] == 10 + count_tokens(looked_up)
+    assert report["saved_tokens"] == removed * 2 - report["injected_tokens"] * 2
+    assert report["saved_tokens"] > 0
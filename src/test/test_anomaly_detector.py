@@ -0,0 +1,102 @@
+from src.utils.anomaly_detector import (
+    PackagingMachineAnomalyDetector,
+    PackagingMachineMonitor,
+    RollingStatistics,
+)
+
+HEADER = "timestamp,lot_id,good_count,defective_count,vibration,temperature,current,alarm_code,cut_length_stddev,needs_cleaning\n"
+
+
+def _row(i, lot_id="Lot1", vibration=0.1, alarm_code="", needs_cleaning=0):
+    return {
+        "timestamp": f"2025-07-01 08:{i:02d}:00",
+        "lot_id": lot_id,
+        "good_count": "100",
+        "defective_count": "2",
+        "vibration": str(vibration),
+        "temperature": "45.0",
+        "current": "10.0",
+        "alarm_code": alarm_code,
+        "cut_length_stddev": "0.04",
+        "needs_cleaning": str(needs_cleaning),
+    }
+
+
+def test_rolling_statistics_window():
+    """
+    正常系: 移動窓から外れた値が平均・標準偏差に影響しないことをテストします。
+    """
+    # --- Arrange ---
+    stats = RollingStatistics(window=3, alpha=0.5)
+
+    # --- Act ---
+    for value in [100.0, 1.0, 2.0, 3.0]:
+        stats.update(value)
+
+    # --- Assert ---
+    assert stats.count == 3
+    assert stats.mean == 2.0
+    assert abs(stats.std - (2 / 3) ** 0.5) < 1e-9
+
+
+def test_detector_flags_vibration_spike():
+    """
+    正常系: 振動の急上昇がzスコアの外れ値として検知されることをテストします。
+    """
+    # --- Arrange ---
+    detector = PackagingMachineAnomalyDetector(window=10, z_threshold=3.0)
+    for i in range(10):
+        detector.ingest(_row(i, vibration=0.10 + 0.001 * (i % 2)))
+
+    # --- Act ---
+    events = detector.ingest(_row(10, lot_id="Lot2", vibration=0.5))
+
+    # --- Assert ---
+    outliers = [e for e in events if e["type"] == "metric_outlier"]
+    assert [e["metric"] for e in outliers] == ["vibration"]
+    assert outliers[0]["lot_id"] == "Lot2"
+    lot_state = detector.get_lot_states(["Lot2"])[0]
+    assert lot_state["anomaly_count"] == len(events)
+
+
+def test_detector_flags_alarm_rate_once():
+    """
+    正常系: アラーム発生率がしきい値を超えたときに1回だけイベントが発行されることをテストします。
+    """
+    # --- Arrange ---
+    detector = PackagingMachineAnomalyDetector(window=5, alarm_rate_threshold=0.6)
+
+    # --- Act ---
+    events = []
+    for i in range(8):
+        events += detector.ingest(_row(i, alarm_code="E101"))
+
+    # --- Assert ---
+    assert len([e for e in events if e["type"] == "alarm_rate"]) == 1
+
+
+def test_monitor_reads_only_appended_rows(tmp_path):
+    """
+    正常系: モニターが追記された行だけを取り込み、書き込み途中の行を無視することをテストします。
+    """
+    # --- Arrange ---
+    csv_path = tmp_path / "telemetry.csv"
+    csv_path.write_text(
+        HEADER + "2025-07-01 08:00:00,Lot1,100,2,0.1,45,10,,0.04,0\n",
+        encoding="utf-8",
+    )
+    monitor = PackagingMachineMonitor(str(csv_path))
+
+    # --- Act ---
+    first = monitor.refresh()
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("2025-07-01 08:05:00,Lot2,90,10,0.2,48,11,E101,0.08,1\n")
+        f.write("2025-07-01 08:10:00,Lot3")
+    second = monitor.refresh()
+    third = monitor.refresh()
+
+    # --- Assert ---
+    assert (first, second, third) == (1, 1, 0)
+    lots = {s["lot_id"]: s for s in monitor.snapshot()["lots"]}
+    assert set(lots) == {"Lot1", "Lot2"}
+    assert lots["Lot2"]["alarm_rate"] == 1.0
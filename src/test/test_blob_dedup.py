@@ -0,0 +1,40 @@
+import time
+
+from src.utils.blob_dedup import BlobIndex, storage_key
+from src.utils.blob_storage import create_container_client
+
+
+def test_collect_deletes_only_unreferenced_old_blobs(tmp_path):
+    """
+    正常系: 保存済みのチャットから参照されておらず猶予期間を過ぎたBLOBだけが削除され、
+    索引からも取り除かれることをテストします。
+    """
+    # --- Arrange ---
+    connect_str = f"local:{tmp_path / 'blob'}"
+    client = create_container_client(connect_str, "images")
+    key = storage_key(connect_str, "images")
+    index = BlobIndex(str(tmp_path / "blob_index.json"))
+    urls = {}
+    for name in ("referenced", "unreferenced", "recent"):
+        blob_name = f"sha256/{name}.png"
+        client.get_blob_client(blob_name).upload_blob(b"png", overwrite=True)
+        client.get_blob_client(f"thumbnails/{blob_name}").upload_blob(b"t", overwrite=True)
+        urls[name] = client.get_blob_client(blob_name).url
+        index.record(key, name, blob_name, urls[name], 3, f"thumbnails/{blob_name}")
+    old = time.time() - 3600
+    for name in ("referenced", "unreferenced"):
+        index._entries[key][name]["last_used"] = old
+    history = [
+        {"messages": [{"role": "assistant", "content": f"結果です。[image: {urls['referenced']}]"}]}
+    ]
+
+    # --- Act ---
+    stats = index.collect(key, client, history, min_age_seconds=60)
+
+    # --- Assert ---
+    assert stats == {"referenced": 1, "deleted": 1, "bytes_reclaimed": 3}
+    assert sorted(index.entries(key)) == ["recent", "referenced"]
+    assert not (tmp_path / "blob" / "images" / "sha256" / "unreferenced.png").exists()
+    assert not (tmp_path / "blob" / "images" / "thumbnails" / "sha256" / "unreferenced.png").exists()
+    assert (tmp_path / "blob" / "images" / "sha256" / "recent.png").exists()
+    assert sorted(BlobIndex(index.path).entries(key)) == ["recent", "referenced"]
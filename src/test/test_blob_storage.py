@@ -0,0 +1,134 @@
+import threading
+
+from src.utils.blob_storage import (
+    BackgroundUploader,
+    BlobClientPool,
+    create_container_client,
+    get_storage_settings,
+)
+
+
+def test_pool_shares_one_client_across_threads(tmp_path):
+    """
+    正常系: 複数のスレッドから同時にアップロードしても、接続文字列とコンテナの組ごとに
+    クライアントが1つだけ作成され、接続と転送の時間が記録されることをテストします。
+    """
+    # --- Arrange ---
+    created = []
+
+    def factory(connect_str, container, pool_maxsize):
+        created.append((connect_str, container))
+        return create_container_client(connect_str, container, pool_maxsize)
+
+    pool = BlobClientPool(client_factory=factory)
+    connect_str = f"local:{tmp_path / 'blob'}"
+    sources = []
+    for i in range(8):
+        path = tmp_path / f"image_{i}.png"
+        path.write_bytes(b"x" * (i + 1))
+        sources.append(path)
+    results = [None] * len(sources)
+
+    def upload(index):
+        results[index] = pool.upload_file(
+            connect_str, "images", f"blob_{index}.png", str(sources[index])
+        )
+
+    # --- Act ---
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(len(sources))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.upload_file(connect_str, "other", "blob.png", str(sources[0]))
+
+    # --- Assert ---
+    assert created == [(connect_str, "images"), (connect_str, "other")]
+    assert sum(not r["reused"] for r in results) == 1
+    for i, result in enumerate(results):
+        assert result["bytes"] == i + 1
+        assert result["connect_seconds"] >= 0 and result["transfer_seconds"] >= 0
+        assert (tmp_path / "blob" / "images" / f"blob_{i}.png").read_bytes() == b"x" * (i + 1)
+
+
+def test_background_upload_retries_and_serves_local_preview(tmp_path):
+    """
+    正常系: URLがすぐに返り、完了までローカルのファイルを参照でき、失敗してもリトライで
+    アップロードされた後にローカルのファイルが削除されることをテストします。
+    """
+    # --- Arrange ---
+    release = threading.Event()
+    calls = []
+
+    class FlakyBlobClient:
+        def __init__(self, inner):
+            self._inner = inner
+            self.url = inner.url
+
+        def upload_blob(self, data, **kwargs):
+            release.wait(10)
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise ConnectionError("temporary failure")
+            self._inner.upload_blob(data, **kwargs)
+
+    class FlakyContainerClient:
+        def __init__(self, inner):
+            self._inner = inner
+
+        def get_blob_client(self, blob):
+            return FlakyBlobClient(self._inner.get_blob_client(blob))
+
+        def exists(self):
+            return True
+
+    pool = BlobClientPool(
+        client_factory=lambda c, n, m: FlakyContainerClient(create_container_client(c, n, m))
+    )
+    uploader = BackgroundUploader(pool, max_attempts=3, retry_base_seconds=0.01)
+    image_path = tmp_path / "graph.png"
+    image_path.write_bytes(b"png")
+
+    # --- Act ---
+    url = uploader.submit(f"local:{tmp_path / 'blob'}", "images", "graph.png", str(image_path))
+    pending = (uploader.status(url), uploader.local_preview(url))
+    release.set()
+    status = uploader.wait(url, timeout=10)
+
+    # --- Assert ---
+    assert pending == ("pending", str(image_path))
+    assert status == "uploaded"
+    assert len(calls) == 2
+    assert uploader.local_preview(url) is None
+    assert not image_path.exists()
+    assert (tmp_path / "blob" / "images" / "graph.png").read_bytes() == b"png"
+
+
+def test_local_and_memory_backends_serve_stored_artifacts(tmp_path, monkeypatch):
+    """
+    正常系: ARTIFACT_STORAGE=local/memoryの場合、Azureを使わずに保存でき、
+    保存した内容をURLから読み出せることをテストします。
+    """
+    # --- Arrange ---
+    source = tmp_path / "chart.png"
+    source.write_bytes(b"chart data")
+    pool = BlobClientPool()
+    monkeypatch.setenv("ARTIFACT_STORAGE", "local")
+    monkeypatch.setenv("ARTIFACT_LOCAL_DIR", str(tmp_path / "static"))
+    monkeypatch.setenv("ARTIFACT_BASE_URL", "/app/static")
+    monkeypatch.delenv("AZURE_STORAGE_CONTAINER_NAME", raising=False)
+    local_settings = get_storage_settings()
+    monkeypatch.setenv("ARTIFACT_STORAGE", "memory")
+    memory_settings = get_storage_settings()
+
+    # --- Act ---
+    local_upload = pool.upload_file(*local_settings, "sha256/abc.png", str(source))
+    memory_upload = pool.upload_file(*memory_settings, "sha256/abc.png", str(source))
+
+    # --- Assert ---
+    assert local_upload["url"] == "/app/static/artifacts/sha256/abc.png"
+    assert (tmp_path / "static" / "artifacts" / "sha256" / "abc.png").read_bytes() == b"chart data"
+    assert memory_upload["url"] == "memory://artifacts/sha256/abc.png"
+    assert pool.read_stored(local_upload["url"]) == b"chart data"
+    assert pool.read_stored(memory_upload["url"]) == b"chart data"
+    assert pool.read_stored("https://example.blob.core.windows.net/a/b.png") is None
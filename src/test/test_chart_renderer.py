@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.utils.chart_renderer import chart_cache_key, prepare_chart_data, normalize_spec
+from src.utils.tools import render_chart
+
+# フォントのない環境で出る日本語グリフの警告は無視する
+pytestmark = pytest.mark.filterwarnings("ignore:Glyph")
+
+LOSS_COLUMNS = ["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"]
+
+
+def test_prepare_chart_data_aggregates_by_spec():
+    """
+    正常系: 仕様に従って月別・SKU別に集計され、不良率が集計後に計算されることをテストします。
+    """
+    # --- Arrange ---
+    spec = normalize_spec(
+        {
+            "dataset": "mes_total",
+            "chart_type": "bar",
+            "y": "不良率(%)",
+            "group_by": "SKU",
+            "year_months": ["2024-06"],
+        }
+    )
+    pareto_spec = normalize_spec(
+        {"dataset": "mes_loss", "chart_type": "pareto", "y": LOSS_COLUMNS, "skus": ["SKU-1234"]}
+    )
+
+    # --- Act ---
+    data = prepare_chart_data(spec)
+    pareto = prepare_chart_data(pareto_spec)
+
+    # --- Assert ---
+    assert list(data.index) == ["2024-06"]
+    assert "SKU-1234" in data.columns
+    assert 0 < data.loc["2024-06", "SKU-1234"] < 100
+    assert sorted(pareto.index) == sorted(LOSS_COLUMNS)
+    assert pareto["合計"].is_monotonic_decreasing
+
+
+def test_prepare_chart_data_rejects_unknown_column():
+    """
+    異常系: 存在しない列を指定した場合、指定できる列を含むエラーになることをテストします。
+    """
+    # --- Arrange ---
+    spec = normalize_spec({"dataset": "erp", "chart_type": "line", "y": ["売上"]})
+
+    # --- Act & Assert ---
+    with pytest.raises(ValueError, match="変動費-材料費"):
+        prepare_chart_data(spec)
+
+
+def test_render_chart_uses_cache_until_data_changes(tmp_path):
+    """
+    正常系: 同じ仕様のグラフはキャッシュから返され、データのバージョンが変わると再描画されることをテストします。
+    """
+    # --- Arrange ---
+    uploaded = []
+
+    def fake_upload(file_path):
+        uploaded.append(file_path)
+        return f"画像のアップロードに成功しました。[image: https://example.com/{len(uploaded)}.png]"
+
+    kwargs = {"dataset": "erp", "chart_type": "line", "y": ["固定費"], "skus": ["SKU002"]}
+
+    with patch("src.utils.tools.get_work_directory", return_value=str(tmp_path)), patch(
+        "src.utils.tools.upload_image_to_blob", side_effect=fake_upload
+    ):
+        # --- Act ---
+        first = render_chart(**kwargs)
+        second = render_chart(**kwargs)
+        with patch("src.utils.chart_renderer.get_dataset_version", return_value="new"):
+            third = render_chart(**kwargs)
+
+    # --- Assert ---
+    assert "[image: https://example.com/1.png]" in first
+    assert "固定費" in first
+    assert second == first
+    assert "[image: https://example.com/2.png]" in third
+    assert len(uploaded) == 2
+    assert uploaded[0].endswith(".png")
+    assert chart_cache_key(kwargs) != chart_cache_key({**kwargs, "chart_type": "bar"})
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from src.utils.cost_simulator import load_cost_baseline, simulate_cost_scenarios
+
+
+def _baseline():
+    return {
+        "lots": ["LotA", "LotB"],
+        "lot_costs": np.array([600.0, 400.0]),
+        "outsourcing_cost": 200.0,
+        "total_units": 1000.0,
+        "good_units": 900.0,
+        "defect_rate": 0.1,
+    }
+
+
+def test_simulate_cost_scenarios_deterministic_shifts():
+    """
+    正常系: 標準偏差0のシナリオで、単価変化・不良削減が解析解どおりになることをテストします。
+    """
+    # --- Arrange ---
+    scenarios = [
+        {"name": "現状"},
+        {"name": "LotA+10%", "target_lot": "LotA", "lot_price_change_pct": 10},
+        {"name": "不良半減", "defect_reduction_pct": 50},
+    ]
+
+    # --- Act ---
+    result = simulate_cost_scenarios(_baseline(), scenarios, n_samples=100, seed=0)
+
+    # --- Assert ---
+    means = result.set_index("シナリオ")["平均(円/個)"]
+    assert means["現状"] == pytest.approx(1200 / 900)
+    assert means["LotA+10%"] == pytest.approx(1260 / 900)
+    assert means["不良半減"] == pytest.approx(1200 / 950)
+
+
+def test_simulate_cost_scenarios_rejects_unknown_lot():
+    """
+    異常系: 存在しない原料ロットを指定した場合にValueErrorとなることをテストします。
+    """
+    with pytest.raises(ValueError):
+        simulate_cost_scenarios(_baseline(), [{"target_lot": "LotX"}])
+
+
+def test_load_cost_baseline_recovers_shifted_material_cost():
+    """
+    正常系: 備考が欠けた材料費の行（Lot5612）でも費用が補完されることをテストします。
+    """
+    baseline = load_cost_baseline("SKU-1234", "2025-06")
+
+    assert dict(zip(baseline["lots"], baseline["lot_costs"]))["Lot5612"] == 8800000
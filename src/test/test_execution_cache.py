@@ -0,0 +1,170 @@
+import asyncio
+import threading
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from src.utils.execution_cache import (
+    CachedCodeExecutor,
+    ExecutionResultCache,
+    is_cacheable,
+)
+from src.utils.execution_limiter import ExecutionLimiter, LimitedCodeExecutor
+from src.utils.kernel_executor import STATE_RESET_NOTICE, WarmPythonKernelExecutor
+
+
+def _run(executor, code):
+    return asyncio.run(
+        executor.execute_code_blocks(
+            [CodeBlock(code=code, language="python")], CancellationToken()
+        )
+    )
+
+
+def _cached_executor(work_dir, cache):
+    kernel = WarmPythonKernelExecutor(str(work_dir), timeout=30, preload_modules=())
+    executor = CachedCodeExecutor(
+        kernel, cache, str(work_dir), dataset_version=lambda: "v1"
+    )
+    return kernel, executor
+
+
+def test_cache_returns_output_and_restores_artifacts(tmp_path):
+    """
+    正常系: 同じコードを別セッションで実行した場合、実行せずに出力とファイルが返されることをテストします。
+    """
+    # --- Arrange ---
+    cache = ExecutionResultCache()
+    code = (
+        "import os\n"
+        "os.makedirs('img', exist_ok=True)\n"
+        "open('img/result.txt', 'w').write('42')\n"
+        "print(os.path.abspath('img/result.txt'))"
+    )
+    first_kernel, first = _cached_executor(tmp_path / "a", cache)
+    second_kernel, second = _cached_executor(tmp_path / "b", cache)
+
+    try:
+        expected = _run(first, code)
+
+        # --- Act ---
+        # 正規化により空行・コメントの違いは無視される
+        hit = _run(second, "# 再実行\n" + code + "\n\n")
+
+        # --- Assert ---
+        assert second_kernel._kernel.pid is None
+        assert hit.exit_code == 0
+        assert hit.output == expected.output.replace(str(tmp_path / "a"), str(tmp_path / "b"))
+        assert (tmp_path / "b" / "img" / "result.txt").read_text() == "42"
+    finally:
+        asyncio.run(first.stop())
+        asyncio.run(second.stop())
+
+
+def test_cache_replays_skipped_code_before_new_code(tmp_path):
+    """
+    正常系: キャッシュから返したコードで定義されるはずの変数が、次のコードの実行前に再現されることをテストします。
+    """
+    # --- Arrange ---
+    cache = ExecutionResultCache()
+    first_kernel, first = _cached_executor(tmp_path / "a", cache)
+    second_kernel, second = _cached_executor(tmp_path / "b", cache)
+
+    try:
+        _run(first, "value = 21\nprint('set')")
+        _run(first, "print(value * 2)")
+
+        # --- Act ---
+        hit = _run(second, "value = 21\nprint('set')")
+        # 別のコードを前に実行した場合は、同じコードでもキャッシュを使わない
+        miss = _run(second, "print(value * 3)")
+
+        # --- Assert ---
+        assert hit.output == "set\n"
+        assert miss.output == "63\n"
+        assert cache.stats()["entries"] == 3
+    finally:
+        asyncio.run(first.stop())
+        asyncio.run(second.stop())
+
+
+class _ResetKernelExecutor(CodeExecutor):
+    """カーネルが切り替わった直後のように、出力の先頭に通知を付けて返すExecutor"""
+
+    async def execute_code_blocks(self, code_blocks, cancellation_token):
+        return CodeResult(exit_code=0, output=STATE_RESET_NOTICE + "42\n")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def restart(self):
+        pass
+
+
+def test_cache_does_not_replay_wait_and_reset_notices(tmp_path, monkeypatch):
+    """
+    正常系: 実行待ちやカーネルの切り替えの通知が付いた実行結果をキャッシュしても、
+    別セッションへのキャッシュの結果には通知が含まれないことをテストします。
+    """
+    # --- Arrange ---
+    # 待ち時間に関係なく実行待ちの通知を付ける
+    monkeypatch.setattr("src.utils.execution_limiter.WAIT_NOTICE_SECONDS", 0.0)
+    cache = ExecutionResultCache()
+    limiter = ExecutionLimiter(max_concurrent=1)
+    # 別のユーザーが実行中のため、最初の実行は待ち行列に入る
+    limiter.acquire("carol")
+    threading.Timer(0.2, limiter.release, args=("carol",)).start()
+
+    def cached_executor(user):
+        executor = LimitedCodeExecutor(_ResetKernelExecutor(), limiter, user)
+        return CachedCodeExecutor(
+            executor, cache, str(tmp_path / user), dataset_version=lambda: "v1"
+        )
+
+    first = _run(cached_executor("alice"), "print(42)")
+
+    # --- Act ---
+    hit = _run(cached_executor("bob"), "print(42)")
+
+    # --- Assert ---
+    assert first.output.startswith("（混雑のため1番目で待機し、")
+    assert STATE_RESET_NOTICE in first.output
+    assert cache.stats()["entries"] == 1
+    assert hit.output == "42\n"
+
+
+def test_cache_evicts_by_size_and_ttl():
+    """
+    正常系: 件数・容量の上限を超えた場合は古いものから削除され、期限切れは返されないことをテストします。
+    """
+    # --- Arrange ---
+    cache = ExecutionResultCache(ttl_seconds=3600, max_entries=2, max_bytes=10)
+    expired = ExecutionResultCache(ttl_seconds=0)
+
+    # --- Act ---
+    cache.put("a", 0, "1", {})
+    cache.put("b", 0, "2", {})
+    cache.put("c", 0, "3", {"img/x.png": b"12345"})
+    too_large = cache.put("d", 0, "x" * 11, {})
+    expired.put("a", 0, "1", {})
+
+    # --- Assert ---
+    assert cache.get("a") is None
+    assert cache.get("c")["artifacts"] == {"img/x.png": b"12345"}
+    assert too_large is False
+    assert expired.get("a") is None
+
+
+def test_nondeterministic_code_is_not_cacheable():
+    """
+    正常系: 現在時刻・シードなしの乱数・no-cache指定を含むコードがキャッシュ対象外になることをテストします。
+    """
+    # --- Assert ---
+    assert is_cacheable("df = pd.DataFrame({'a': [1]})\nprint(df)")
+    assert not is_cacheable("print(datetime.now())")
+    assert not is_cacheable("x = np.random.rand(3)")
+    assert is_cacheable("np.random.seed(0)\nx = np.random.rand(3)")
+    assert not is_cacheable("print(1)  # no-cache")
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from src.utils.execution_limiter import ExecutionLimiter, LimitedCodeExecutor, QueueFullError
+from src.utils.execution_output import ExecutionOutputStream
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_limiter_starts_waiting_users_fairly():
+    """
+    正常系: 空きができた場合、実行中の件数が少ないユーザーの要求が先に開始されることをテストします。
+    """
+    # --- Arrange ---
+    limiter = ExecutionLimiter(max_concurrent=1, max_per_user=2, max_queue=10)
+    limiter.acquire("alice")
+    started = []
+
+    def worker(user):
+        limiter.acquire(user)
+        started.append(user)
+        limiter.release(user)
+
+    # aliceの2件目が先に到着しても、実行中でないbobが先に開始される
+    threads = [threading.Thread(target=worker, args=(user,)) for user in ("alice", "bob")]
+    for thread in threads:
+        thread.start()
+        _wait_for(lambda: limiter.stats()["queue_depth"] == threads.index(thread) + 1)
+
+    # --- Act ---
+    queued = limiter.stats()["queue_depth"]
+    limiter.release("alice")
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # --- Assert ---
+    assert queued == 2
+    assert started == ["bob", "alice"]
+    assert limiter.stats()["running"] == 0
+
+
+def test_limiter_rejects_when_queue_full_and_reports_position():
+    """
+    異常系: 待ち行列が上限に達した場合はQueueFullErrorとなり、待機中の要求には待ち順が通知されることをテストします。
+    """
+    # --- Arrange ---
+    limiter = ExecutionLimiter(max_concurrent=1, max_per_user=1, max_queue=1)
+    limiter.acquire("alice")
+    positions = []
+    admissions = []
+    waiter = threading.Thread(
+        target=lambda: admissions.append(limiter.acquire("bob", on_position=positions.append))
+    )
+    waiter.start()
+    _wait_for(lambda: limiter.stats()["queue_depth"] == 1)
+
+    # --- Act ---
+    with pytest.raises(QueueFullError):
+        limiter.acquire("carol")
+    limiter.release("alice")
+    waiter.join(timeout=5)
+
+    # --- Assert ---
+    assert positions == [1]
+    assert admissions[0]["position"] == 1
+    assert admissions[0]["wait_seconds"] > 0
+
+
+class _EchoExecutor(CodeExecutor):
+    async def execute_code_blocks(self, code_blocks, cancellation_token):
+        return CodeResult(exit_code=0, output=code_blocks[0].code)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def restart(self):
+        pass
+
+
+def test_limited_executor_shows_queue_position_while_waiting():
+    """
+    正常系: 実行枠の空きを待つ間は待ち順が出力先の状態として表示され、実行が始まると消えることをテストします。
+    """
+    # --- Arrange ---
+    limiter = ExecutionLimiter(max_concurrent=1, max_per_user=1, max_queue=10)
+    limiter.acquire("alice")
+    stream = ExecutionOutputStream()
+    stream.begin()
+    executor = LimitedCodeExecutor(_EchoExecutor(), limiter, "bob", output_stream=stream)
+    results = []
+
+    def run():
+        block = CodeBlock(code="print(1)", language="python")
+        results.append(asyncio.run(executor.execute_code_blocks([block], CancellationToken())))
+
+    waiter = threading.Thread(target=run)
+    waiter.start()
+    _wait_for(lambda: stream.snapshot()["status"] is not None)
+
+    # --- Act ---
+    waiting_status = stream.snapshot()["status"]
+    limiter.release("alice")
+    waiter.join(timeout=5)
+
+    # --- Assert ---
+    assert waiting_status == "実行待ち: 1番目"
+    assert stream.snapshot()["status"] is None
+    assert results[0].exit_code == 0
+    assert results[0].output == "print(1)"
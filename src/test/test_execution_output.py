@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from src.utils.execution_output import (
+    ExecutionOutputStream,
+    OutputLimitedCodeExecutor,
+    truncate_output,
+)
+from src.utils.kernel_executor import WarmPythonKernelExecutor
+
+
+class _StaticExecutor(CodeExecutor):
+    """決まった出力を返すテスト用のExecutor"""
+
+    def __init__(self, output):
+        self.output = output
+
+    async def execute_code_blocks(self, code_blocks, cancellation_token):
+        return CodeResult(exit_code=0, output=self.output)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def restart(self):
+        pass
+
+
+def _run(executor, code):
+    return asyncio.run(
+        executor.execute_code_blocks(
+            [CodeBlock(code=code, language="python")], CancellationToken()
+        )
+    )
+
+
+def test_kernel_streams_output_while_running(tmp_path):
+    """
+    正常系: 実行中の出力が終了を待たずに逐次通知され、最終的な出力にも全て含まれることをテストします。
+    """
+    # --- Arrange ---
+    received = []
+    first_chunk_at = []
+
+    def on_output(text):
+        if not received:
+            first_chunk_at.append(time.monotonic())
+        received.append(text)
+
+    executor = WarmPythonKernelExecutor(
+        str(tmp_path), timeout=30, preload_modules=(), on_output=on_output
+    )
+    code = "import time\nprint('epoch 1')\ntime.sleep(1.5)\nprint('epoch 2')"
+
+    try:
+        # --- Act ---
+        started_at = time.monotonic()
+        result = _run(executor, code)
+        finished_at = time.monotonic()
+
+        # --- Assert ---
+        assert (result.exit_code, result.output) == (0, "epoch 1\nepoch 2\n")
+        assert "".join(received) == "epoch 1\nepoch 2\n"
+        assert first_chunk_at[0] - started_at < finished_at - started_at - 1.0
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_truncate_output_keeps_head_and_tail_on_line_boundaries():
+    """
+    正常系: 長い出力の先頭と末尾が行単位で残り、省略した行数とログのパスが記載されることをテストします。
+    """
+    # --- Arrange ---
+    text = "".join(f"line {i:04d}\n" for i in range(1000))
+
+    # --- Act ---
+    truncated = truncate_output(text, head_chars=100, tail_chars=100, log_path="logs/a.log")
+
+    # --- Assert ---
+    assert truncated.startswith("line 0000\n")
+    assert truncated.endswith("line 0999\n")
+    assert "logs/a.log" in truncated
+    kept_lines = [line for line in truncated.splitlines() if line.startswith("line ")]
+    assert all(len(line) == len("line 0000") for line in kept_lines)
+    assert f"{1000 - len(kept_lines)}行" in truncated
+    assert truncate_output("short\n", 100, 100) == "short\n"
+
+
+def test_output_limited_executor_saves_full_log(tmp_path):
+    """
+    正常系: 上限を超えた出力は切り詰めて返し、全文を作業ディレクトリのlogs配下に保存することをテストします。
+    """
+    # --- Arrange ---
+    full_output = "".join(f"step {i}\n" for i in range(5000))
+    stream = ExecutionOutputStream()
+    executor = OutputLimitedCodeExecutor(
+        _StaticExecutor(full_output),
+        str(tmp_path),
+        head_chars=200,
+        tail_chars=200,
+        output_stream=stream,
+    )
+
+    # --- Act ---
+    result = _run(executor, "print('x')")
+
+    # --- Assert ---
+    log_files = os.listdir(tmp_path / "logs")
+    assert len(log_files) == 1
+    assert (tmp_path / "logs" / log_files[0]).read_text(encoding="utf-8") == full_output
+    assert len(result.output) < 1000
+    assert f"logs/{log_files[0]}" in result.output
+    assert result.output.endswith("step 4999\n")
+    assert stream.snapshot()["running"] is False
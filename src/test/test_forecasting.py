@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+from src.utils.forecasting import TARGETS, ForecastService
+
+
+def test_forecast_service_reuses_persisted_models(tmp_path):
+    """
+    正常系: 一度学習したモデルがディスクから再利用され、再学習されないことをテストします。
+    """
+    # --- Arrange ---
+    ForecastService(str(tmp_path)).predict("SKU-1234", horizon_days=3)
+    service = ForecastService(str(tmp_path))
+
+    # --- Act ---
+    with patch.object(ForecastService, "train") as mock_train:
+        result = service.predict("SKU-1234", horizon_days=7)
+
+    # --- Assert ---
+    mock_train.assert_not_called()
+    assert result["stale"] is False
+    assert len(result["forecast"]) == 7
+    assert list(result["forecast"].columns) == ["年月日"] + TARGETS
+
+
+def test_forecast_service_serves_stale_model_on_new_data(tmp_path):
+    """
+    正常系: データセットが更新された場合、古いモデルで応答しつつ再学習が開始されることをテストします。
+    """
+    # --- Arrange ---
+    service = ForecastService(str(tmp_path))
+    service.predict("SKU-1234", horizon_days=3)
+
+    # --- Act ---
+    with patch(
+        "src.utils.forecasting.get_dataset_version", return_value="new-version"
+    ), patch.object(service, "_retrain_in_background") as mock_retrain:
+        result = service.predict("SKU-1234", horizon_days=3)
+
+    # --- Assert ---
+    assert result["stale"] is True
+    mock_retrain.assert_called_once_with("SKU-1234", "new-version")
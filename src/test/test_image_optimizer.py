@@ -0,0 +1,60 @@
+import os
+
+from PIL import Image, ImageDraw
+
+from src.utils.image_optimizer import optimize_image
+
+
+def _make_chart_like_image(path, size=(3000, 1800)):
+    """グラフに似た（背景が白で線が数色の）画像を作成"""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for i, color in enumerate(["blue", "red", "green", "orange"]):
+        points = [(x, 900 + ((x * (i + 3)) % 700) - 350) for x in range(0, size[0], 60)]
+        draw.line(points, fill=color, width=8)
+    image.save(path, "PNG")
+
+
+def test_optimize_image_downscales_and_creates_thumbnail(tmp_path):
+    """
+    正常系: 表示サイズまで縮小・減色してファイルサイズが小さくなり、サムネイルが作成されることをテストします。
+    """
+    # --- Arrange ---
+    source = tmp_path / "graph.png"
+    _make_chart_like_image(source)
+
+    # --- Act ---
+    result = optimize_image(str(source), max_width=1200, thumbnail_width=320)
+
+    # --- Assert ---
+    assert result["path"] != str(source)
+    assert (result["width"], result["height"]) == (1200, 720)
+    assert result["bytes_saved"] == result["original_bytes"] - result["optimized_bytes"] > 0
+    assert result["optimized_bytes"] == os.path.getsize(result["path"])
+    with Image.open(result["path"]) as optimized:
+        assert optimized.mode == "P"
+    with Image.open(result["thumbnail_path"]) as thumbnail:
+        assert thumbnail.width == 320
+    assert source.exists()
+
+
+def test_optimize_image_webp_and_non_image(tmp_path):
+    """
+    正常系: WebPに変換できること、画像として読み込めないファイルはNoneを返すことをテストします。
+    """
+    # --- Arrange ---
+    photo = tmp_path / "photo.png"
+    Image.radial_gradient("L").resize((1600, 1000)).convert("RGB").save(photo, "PNG")
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+
+    # --- Act ---
+    webp = optimize_image(str(photo), image_format="webp", thumbnail_width=0)
+    not_image = optimize_image(str(broken))
+
+    # --- Assert ---
+    assert webp["path"].endswith(".webp")
+    assert webp["thumbnail_path"] is None
+    with Image.open(webp["path"]) as image:
+        assert image.format == "WEBP"
+    assert not_image is None
@@ -0,0 +1,274 @@
+import asyncio
+import signal
+import threading
+import time
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock
+
+from src.utils.kernel_executor import (
+    STATE_RESET_NOTICE,
+    BootstrappedLocalCommandLineCodeExecutor,
+    TIMEOUT_EXIT_CODE,
+    KernelPool,
+    WarmPythonKernelExecutor,
+)
+
+
+def _run(executor, code):
+    return asyncio.run(
+        executor.execute_code_blocks(
+            [CodeBlock(code=code, language="python")], CancellationToken()
+        )
+    )
+
+
+def test_kernel_keeps_variables_between_runs(tmp_path):
+    """
+    正常系: 常駐カーネルで実行した変数が次の実行でも参照できることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(str(tmp_path), timeout=30, preload_modules=())
+
+    try:
+        # --- Act ---
+        first = _run(executor, "value = 21\nprint('set')")
+        second = _run(executor, "print(value * 2)")
+        error = _run(executor, "raise ValueError('boom')")
+
+        # --- Assert ---
+        assert (first.exit_code, first.output) == (0, "set\n")
+        assert (second.exit_code, second.output) == (0, "42\n")
+        assert error.exit_code == 1
+        assert "ValueError: boom" in error.output
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_kernel_timeout_interrupts_and_keeps_state(tmp_path):
+    """
+    正常系: タイムアウト時に割り込みで処理が止まり、カーネルの変数が保持されることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(str(tmp_path), timeout=1, preload_modules=())
+
+    try:
+        # --- Act ---
+        timed_out = _run(
+            executor, "import time\nvalue = 'kept'\nwhile True:\n    time.sleep(0.05)"
+        )
+        after = _run(executor, "print(value)")
+
+        # --- Assert ---
+        assert timed_out.exit_code == TIMEOUT_EXIT_CODE
+        assert timed_out.output.endswith("Timeout")
+        assert after.output == "kept\n"
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_kernel_ignores_interrupt_outside_user_code(tmp_path):
+    """
+    正常系: 実行の終了後に遅れて届いた割り込みではワーカーが終了せず、変数が保持されることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(str(tmp_path), timeout=30, preload_modules=())
+
+    try:
+        _run(executor, "value = 'kept'")
+        pid = executor._kernel.pid
+
+        # --- Act ---
+        # 要求を待っている間に割り込む
+        executor._kernel._process.send_signal(signal.SIGINT)
+        time.sleep(0.5)
+        after = _run(executor, "print(value)")
+
+        # --- Assert ---
+        assert executor._kernel.pid == pid
+        assert after.output == "kept\n"
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_kernel_restart_clears_state(tmp_path):
+    """
+    正常系: 再起動後は変数がリセットされることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(str(tmp_path), timeout=30, preload_modules=())
+    _run(executor, "value = 1")
+
+    try:
+        # --- Act ---
+        asyncio.run(executor.restart())
+        result = _run(executor, "print('value' in globals())")
+
+        # --- Assert ---
+        assert result.output == "False\n"
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_pool_reuses_kernel_and_resets_for_other_session(tmp_path):
+    """
+    正常系: プールのカーネルが同じセッションでは変数を保持し、別セッションへの貸出時に初期化されることをテストします。
+    """
+    # --- Arrange ---
+    pool = KernelPool(max_size=1, min_idle=1, work_dir=str(tmp_path), preload_modules=())
+    first = WarmPythonKernelExecutor(str(tmp_path / "a"), timeout=30, pool=pool)
+    second = WarmPythonKernelExecutor(str(tmp_path / "b"), timeout=30, pool=pool)
+
+    try:
+        # --- Act ---
+        _run(first, "import os\nvalue = 1")
+        kept = _run(first, "print(value, os.getcwd().endswith('a'))")
+        other = _run(second, "print('value' in globals())")
+        back = _run(first, "print('value' in globals())")
+
+        # --- Assert ---
+        assert kept.output == "1 True\n"
+        assert other.output == "False\n"
+        assert back.output.startswith(STATE_RESET_NOTICE)
+        assert pool.stats()["size"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_pool_reset_removes_modules_and_environment_of_previous_session(tmp_path):
+    """
+    正常系: 別セッションへの貸出時に、前のセッションが作業ディレクトリからimportしたモジュール・
+    環境変数・importの検索先の変更が元に戻されることをテストします。
+    """
+    # --- Arrange ---
+    pool = KernelPool(max_size=1, min_idle=1, work_dir=str(tmp_path), preload_modules=())
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "secret_helper.py").write_text("TOKEN = 'owner-a'\n")
+    first = WarmPythonKernelExecutor(str(tmp_path / "a"), timeout=30, pool=pool)
+    second = WarmPythonKernelExecutor(str(tmp_path / "b"), timeout=30, pool=pool)
+
+    try:
+        # --- Act ---
+        imported = _run(
+            first,
+            "import os, sys, secret_helper\n"
+            "os.environ['OWNER_A_KEY'] = 'x'\n"
+            "sys.path.append('/owner-a')\n"
+            "print(secret_helper.TOKEN)",
+        )
+        other = _run(
+            second,
+            "import os, sys\n"
+            "print('secret_helper' in sys.modules, 'OWNER_A_KEY' in os.environ, '/owner-a' in sys.path)\n"
+            "import secret_helper",
+        )
+
+        # --- Assert ---
+        assert imported.output == "owner-a\n"
+        assert other.output.startswith("False False False\n")
+        assert "ModuleNotFoundError" in other.output
+        assert pool.stats()["size"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_pool_queues_when_exhausted(tmp_path):
+    """
+    正常系: カーネルがすべて使用中の場合、返却されるまで待機してから貸し出されることをテストします。
+    """
+    # --- Arrange ---
+    pool = KernelPool(max_size=1, min_idle=1, work_dir=str(tmp_path), preload_modules=())
+    kernel, _ = pool.acquire("session-1")
+    acquired = []
+
+    def waiter():
+        acquired.append(pool.acquire("session-2"))
+
+    thread = threading.Thread(target=waiter)
+
+    try:
+        # --- Act ---
+        thread.start()
+        time.sleep(0.3)
+        queued = pool.stats()["queue_depth"]
+        pool.release(kernel)
+        thread.join(timeout=10)
+
+        # --- Assert ---
+        assert queued == 1
+        assert acquired[0][0] is kernel
+        assert acquired[0][1] is False
+    finally:
+        pool.release(kernel)
+        pool.shutdown()
+
+
+def test_kernel_bootstrap_provides_chart_helpers(tmp_path):
+    """
+    正常系: 起動時の初期設定でAggバックエンドとsave_figureが使えることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(str(tmp_path), timeout=60)
+
+    try:
+        # --- Act ---
+        result = _run(
+            executor,
+            "import matplotlib\n"
+            "fig, ax = plt.subplots()\n"
+            "ax.plot([1, 2], [3, 4])\n"
+            "path = save_figure(fig)\n"
+            "print(matplotlib.get_backend().lower(), os.path.exists(path), plt.rcParams['axes.unicode_minus'])",
+        )
+
+        # --- Assert ---
+        assert result.exit_code == 0
+        assert result.output.splitlines()[-1] == "agg True False"
+        assert list((tmp_path / "img").glob("graph_*.png"))
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_kernel_cpu_limit_stops_run_and_keeps_kernel(tmp_path):
+    """
+    異常系: CPU時間の上限を超えた実行が中断され、カーネルは次の実行に使えることをテストします。
+    """
+    # --- Arrange ---
+    executor = WarmPythonKernelExecutor(
+        str(tmp_path), timeout=30, preload_modules=(), bootstrap_script=None, cpu_limit_seconds=1
+    )
+
+    try:
+        # --- Act ---
+        limited = _run(executor, "value = 'kept'\nwhile True:\n    pass")
+        after = _run(executor, "print(value)")
+
+        # --- Assert ---
+        assert limited.exit_code == 1
+        assert "CPU時間の上限" in limited.output
+        assert after.output == "kept\n"
+    finally:
+        asyncio.run(executor.stop())
+
+
+def test_subprocess_executor_keeps_line_numbers_and_filename(tmp_path):
+    """
+    正常系: 実行ごとにプロセスを起動する方式でも初期化済みの変数が使え、コードは変更されずに
+    「# filename:」で指定したファイルに保存され、トレースバックの行番号がずれないことをテストします。
+    """
+    # --- Arrange ---
+    executor = BootstrappedLocalCommandLineCodeExecutor(
+        timeout=60, work_dir=str(tmp_path), cleanup_temp_files=False
+    )
+    code = "# filename: job.py\nprint(pd.__name__, __name__)\nraise ValueError('boom')\n"
+
+    # --- Act ---
+    result = _run(executor, code)
+
+    # --- Assert ---
+    assert result.exit_code == 1
+    assert result.output.startswith("Traceback")
+    assert f'File "{tmp_path / "job.py"}", line 3, in <module>' in result.output
+    assert "pandas __main__" in result.output
+    assert (tmp_path / "job.py").read_text(encoding="utf-8") == code
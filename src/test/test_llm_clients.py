@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.utils.llm_clients import (
+    BackgroundEventLoop,
+    ModelClientRegistry,
+    ResponseTimer,
+    create_http_client,
+    is_streaming_enabled,
+)
+from src.utils.metrics import metrics
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _counter(name):
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_connections_are_reused_across_event_loops():
+    """
+    正常系: プロンプトごとに別のイベントループ（asyncio.run）から呼び出しても、
+    LLMループで共有する接続が再利用され、応答までの時間が記録されることをテストします。
+    """
+    # --- Arrange ---
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    llm_loop = BackgroundEventLoop()
+    http_client = create_http_client()
+    new_before = _counter("llm.connections_new")
+    reused_before = _counter("llm.connections_reused")
+    timings_before = metrics.snapshot()["timings"].get("llm.first_byte_seconds", {})
+    first_byte_before = timings_before.get("count", 0)
+
+    async def request():
+        response = await llm_loop.run(lambda: http_client.get(url))
+        return response.text
+
+    try:
+        # --- Act ---
+        bodies = [asyncio.run(request()) for _ in range(3)]
+
+        # --- Assert ---
+        assert bodies == ["ok"] * 3
+        assert _counter("llm.connections_new") - new_before == 1
+        assert _counter("llm.connections_reused") - reused_before == 2
+        timings = metrics.snapshot()["timings"]["llm.first_byte_seconds"]
+        assert timings["count"] - first_byte_before == 3
+    finally:
+        asyncio.run(llm_loop.run(http_client.aclose))
+        llm_loop.stop()
+        server.shutdown()
+
+
+def test_stream_forwards_items_and_errors_from_background_loop():
+    """
+    正常系: 非同期イテレータがLLMループで実行され、要素と例外が呼び出し元のループに転送され、
+    レジストリが同じ組のクライアントと同じエンドポイントの接続プールを共有することをテストします。
+    """
+    # --- Arrange ---
+    llm_loop = BackgroundEventLoop()
+    loops = []
+
+    async def numbers(fail):
+        loops.append(asyncio.get_running_loop())
+        for i in range(3):
+            yield i
+        if fail:
+            raise ValueError("boom")
+
+    async def collect(fail=False):
+        return [item async for item in llm_loop.stream(lambda: numbers(fail))]
+
+    registry = ModelClientRegistry(client_factory=lambda **kwargs: kwargs)
+    args = ("https://example.openai.azure.com/", "key", "gpt", "2024-10-21", None)
+
+    try:
+        # --- Act ---
+        first = asyncio.run(collect())
+        second = asyncio.run(collect())
+        with pytest.raises(ValueError, match="boom"):
+            asyncio.run(collect(fail=True))
+        shared = registry.get(*args)
+        again = registry.get(*args)
+        other = registry.get(args[0], "key", "gpt-mini", "2024-10-21", None)
+
+        # --- Assert ---
+        assert first == second == [0, 1, 2]
+        assert loops[0] is loops[1] is loops[2] is llm_loop.loop
+        assert shared is again
+        assert other is not shared
+        assert other["http_client"] is shared["http_client"]
+        assert registry.stats() == {"clients": 2, "http_clients": 1}
+    finally:
+        llm_loop.stop()
+
+
+def test_response_timer_records_first_token_once(monkeypatch):
+    """
+    正常系: 最初のトークンまでの時間は最初の1回だけ記録され、全体の時間はそれ以上になり、
+    LLM_STREAM="0"でトークン単位の受信を無効にできることをテストします。
+    """
+    # --- Arrange ---
+    timer = ResponseTimer("test_chat")
+    monkeypatch.setenv("LLM_STREAM", "0")
+
+    # --- Act ---
+    timer.first_token()
+    first = timer.time_to_first_token
+    timer.first_token()
+    elapsed = timer.finish()
+
+    # --- Assert ---
+    timings = metrics.snapshot()["timings"]
+    assert timer.time_to_first_token == first
+    assert timings["test_chat.time_to_first_token_seconds"]["count"] == 1
+    assert timings["test_chat.response_seconds"]["last"] == elapsed >= first
+    assert is_streaming_enabled() is False
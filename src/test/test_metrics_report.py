@@ -0,0 +1,43 @@
+from src.utils.metrics import MetricsRegistry
+from src.utils.metrics_report import format_report, summarize_metrics
+
+
+def test_summary_reports_hit_rates_queue_waits_and_time_to_first_token():
+    """
+    正常系: 記録された計測値から、キャッシュのヒット率と省略できた時間、実行待ち時間、
+    エージェント作成時間、最初のトークンまでの時間が区分ごとに要約されることをテストします。
+    """
+    # --- Arrange ---
+    registry = MetricsRegistry()
+    registry.increment("search_cache.hits", 2)
+    registry.increment("search_cache.coalesced")
+    registry.increment("search_cache.misses")
+    registry.increment("search_cache.latency_saved_seconds", 4.5)
+    registry.increment("response_cache.semantic_hits")
+    registry.increment("response_cache.misses", 3)
+    registry.observe("execution_limiter.wait_seconds", 0.0)
+    registry.observe("execution_limiter.wait_seconds", 2.0)
+    registry.set_gauge("execution_limiter.queue_depth", 1)
+    registry.observe("agent_factory.agent.build_seconds", 3.0)
+    registry.observe("agent_factory.agent.acquire_seconds", 0.5)
+    registry.increment("agent_factory.agent.spare_hits")
+    registry.observe("chat.time_to_first_token_seconds", 1.5)
+    registry.observe("chat.response_seconds", 9.0)
+
+    # --- Act ---
+    summary = summarize_metrics(registry.snapshot())
+    report = format_report(summary)
+
+    # --- Assert ---
+    assert summary["search_cache"]["hit_rate"] == 0.75
+    assert summary["search_cache"]["latency_saved_seconds"] == 4.5
+    assert summary["response_cache"]["hit_rate"] == 0.25
+    assert summary["execution_limiter"]["wait_avg_seconds"] == 1.0
+    assert summary["execution_limiter"]["queue_depth"] == 1
+    assert summary["agent_factory.agent"]["build_avg_seconds"] == 3.0
+    assert summary["agent_factory.agent"]["spare_hits"] == 1
+    assert summary["chat"]["time_to_first_token_avg_seconds"] == 1.5
+    assert "llm" not in summary
+    assert "search_cache hit_rate=0.750" in report
+    assert "chat turns=1 time_to_first_token_avg_seconds=1.500" in report
+    assert format_report(summarize_metrics(MetricsRegistry().snapshot())) == ""
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import types
+
+from autogen_agentchat.messages import TextMessage, ToolCallExecutionEvent
+from autogen_core.model_context import UnboundedChatCompletionContext
+from autogen_core.models import FunctionExecutionResult
+
+from src.utils.response_cache import ResponseCache, get_response_cache, replay_response
+
+
+def _answer(text):
+    return [
+        TextMessage(source="user", content="質問"),
+        TextMessage(source="DataAnalystAgent", content=text),
+    ]
+
+
+def test_exact_and_similar_questions_hit_within_same_context():
+    """
+    正常系: 表記ゆれだけの質問と、埋め込みモデルで十分に似ている質問はキャッシュから返され、
+    ロット番号の異なる質問・文脈（データセットや前の質問）の異なる質問は返されないことをテストします。
+    """
+    # --- Arrange ---
+    vectors = {
+        "変動費が上昇している理由は?": [1.0, 0.0, 0.0],
+        "変動費が上がっているのはなぜ?": [0.99, 0.1, 0.0],
+        "変動費が下降している理由は?": [0.6, 0.8, 0.0],
+        "lot5612のトラブル情報": [0.0, 0.0, 1.0],
+        "lot4899のトラブル情報": [0.0, 0.0, 1.0],
+    }
+    cache = ResponseCache(embed=lambda query: vectors[query])
+    cache.store("変動費が上昇している理由は?", "v1", _answer("原材料費の高騰です"), 12.0)
+    cache.store("LOT5612のトラブル情報", "v1", _answer("動作不良です"), 8.0)
+
+    # --- Act ---
+    exact = cache.lookup("変動費が上昇している理由は？", "v1")
+    similar = cache.lookup("変動費が上がっているのはなぜ?", "v1")
+    different = cache.lookup("変動費が下降している理由は?", "v1")
+    other_lot = cache.lookup("LOT4899のトラブル情報", "v1")
+    other_context = cache.lookup("変動費が上昇している理由は?", "v2")
+
+    # --- Assert ---
+    assert exact["similarity"] == 1.0
+    assert exact["messages"][-1].content == "原材料費の高騰です"
+    assert similar["messages"][-1].content == "原材料費の高騰です"
+    assert 0.95 <= similar["similarity"] < 1.0
+    assert different is None
+    assert other_lot is None
+    assert other_context is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 3)
+    assert stats["latency_saved_seconds"] == 24.0
+    assert stats["hit_rate"] == 0.4
+
+
+def test_questions_differing_in_one_word_miss_without_embedding_model(monkeypatch):
+    """
+    異常系: 埋め込みモデルを設定しない場合は完全一致だけが使われ、文字はほとんど同じでも
+    意味の異なる質問（折れ線グラフと棒グラフ、増加と減少）に別の質問の回答が返されないことをテストします。
+    """
+    # --- Arrange ---
+    monkeypatch.delenv("RESPONSE_CACHE_EMBEDDING_DEPLOYMENT", raising=False)
+    monkeypatch.delenv("RESPONSE_CACHE", raising=False)
+    monkeypatch.setattr("src.utils.response_cache._cache", None)
+    cache = get_response_cache()
+    line_chart = "2024年の変動費の推移を月別に折れ線グラフで表示して、特に大きく増えている月を教えてください"
+    cache.store(line_chart, "v1", _answer("折れ線グラフです"), 30.0)
+
+    # --- Act ---
+    bar_chart = cache.lookup(line_chart.replace("折れ線グラフ", "棒グラフ"), "v1")
+    decreasing = cache.lookup(line_chart.replace("増えている", "減っている"), "v1")
+    same = cache.lookup(line_chart, "v1")
+
+    # --- Assert ---
+    assert cache.embed is None
+    assert bar_chart is None
+    assert decreasing is None
+    assert same["messages"][-1].content == "折れ線グラフです"
+
+
+def test_store_rules_eviction_and_replay():
+    """
+    正常系: ツールがエラーになった応答は保存されず、期限切れ・上限超過のものは削除され、
+    再生時にはエージェントの会話履歴へ質問と回答が追加されることをテストします。
+    """
+    # --- Arrange ---
+    failed = [
+        TextMessage(source="user", content="質問"),
+        ToolCallExecutionEvent(
+            source="DataAnalystAgent",
+            content=[FunctionExecutionResult(content="Error", name="execute", call_id="1", is_error=True)],
+        ),
+        TextMessage(source="DataAnalystAgent", content="失敗しました"),
+    ]
+    cache = ResponseCache(max_entries=2)
+    expiring = ResponseCache(ttl_seconds=0)
+    agent = types.SimpleNamespace(name="DataAnalystAgent", model_context=UnboundedChatCompletionContext())
+
+    # --- Act ---
+    stored_failed = cache.store("エラーになる質問", "", failed, 1.0)
+    for question in ("紙詰まりの原因は?", "不良率の推移", "設備2の効果"):
+        cache.store(question, "", _answer(question + "の回答"), 1.0)
+    expiring.store("紙詰まりの原因は?", "", _answer("回答"), 1.0)
+    time.sleep(0.01)
+    cached = cache.lookup("設備2の効果", "")
+
+    async def replay():
+        return [m async for m in replay_response(agent, "設備2の効果\n\n(時刻)", cached)]
+
+    replayed = asyncio.run(replay())
+    history = asyncio.run(agent.model_context.get_messages())
+
+    # --- Assert ---
+    assert stored_failed is False
+    assert cache.lookup("紙詰まりの原因は?", "") is None
+    assert cache.stats()["entries"] == 2
+    assert expiring.lookup("紙詰まりの原因は?", "") is None
+    assert replayed == cached["messages"]
+    assert [m.content for m in history] == ["設備2の効果\n\n(時刻)", "設備2の効果の回答"]
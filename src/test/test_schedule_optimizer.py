@@ -0,0 +1,70 @@
+from src.utils.schedule_optimizer import (
+    CHANGEOVER_LABEL,
+    build_timetable,
+    solve_production_schedule,
+)
+
+
+def test_maximize_product_respects_changeover():
+    """
+    正常系: 切替時間を考慮したうえで対象商品の生産時間が最大化されることをテストします。
+    """
+    # --- Arrange ---
+    lines = ["L1", "L2"]
+    product_hours = {"P1": 4, "P2": 5, "P3": 5, "P4": 3}
+
+    # --- Act ---
+    result = solve_production_schedule(
+        lines,
+        product_hours,
+        changeover_hours=1,
+        horizon_hours=10,
+        objective="maximize_product",
+        target_product="P1",
+        time_limit_seconds=5,
+    )
+
+    # --- Assert ---
+    # P2とP3は同じラインに収まらない（5+1+5=11 > 10）ため、P1は4時間が上限
+    assert result["status"] == "OPTIMAL"
+    assert result["objective_value"] == 4
+    for line in lines:
+        on_line = sorted(
+            (a for a in result["assignments"] if a["line"] == line),
+            key=lambda a: a["start"],
+        )
+        for prev, nxt in zip(on_line, on_line[1:]):
+            assert nxt["start"] >= prev["end"] + 1
+
+
+def test_infeasible_schedule_returns_no_assignments():
+    """
+    異常系: 使用可能時間に収まらない場合、割り当てが空で返されることをテストします。
+    """
+    # --- Act ---
+    result = solve_production_schedule(
+        ["L1"], {"P1": 5, "P2": 5}, changeover_hours=1, horizon_hours=10
+    )
+
+    # --- Assert ---
+    assert result["status"] == "INFEASIBLE"
+    assert result["assignments"] == []
+
+
+def test_build_timetable_marks_changeover():
+    """
+    正常系: 時間帯×ラインの表に生産・切替・空き枠が表示されることをテストします。
+    """
+    # --- Arrange ---
+    assignments = [
+        {"line": "L1", "product": "P1", "start": 0, "end": 2, "hours": 2},
+        {"line": "L1", "product": "P2", "start": 3, "end": 4, "hours": 1},
+    ]
+
+    # --- Act ---
+    df = build_timetable(assignments, ["L1", "L2"], horizon_hours=5)
+
+    # --- Assert ---
+    assert df["時間帯"].iloc[0] == "0:00-1:00"
+    assert df["L1"].tolist() == ["P1", "P1", CHANGEOVER_LABEL, "P2", ""]
+    assert df["L2"].tolist() == [""] * 5
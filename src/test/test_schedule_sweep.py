@@ -0,0 +1,97 @@
+import multiprocessing
+import threading
+import time
+
+from src.utils.schedule_sweep import (
+    CANCELLED,
+    build_schedule_scenarios,
+    run_schedule_sweep,
+)
+
+LINES = ["L1", "L2"]
+PRODUCT_HOURS = {"P1": 4, "P2": 5, "P3": 5, "P4": 3}
+
+
+def test_build_schedule_scenarios_grid():
+    """
+    正常系: 切替時間・停止商品・ライン追加の直積でシナリオが生成されることをテストします。
+    """
+    # --- Act ---
+    scenarios = build_schedule_scenarios(
+        LINES,
+        PRODUCT_HOURS,
+        changeover_options=[0, 1],
+        drop_product_options=[[], ["P4"]],
+        extra_line_options=[0, 1],
+    )
+
+    # --- Assert ---
+    assert len(scenarios) == 8
+    last = scenarios[-1]
+    assert last["name"] == "切替1h P4停止 ライン+1"
+    assert len(last["lines"]) == 3
+    assert "P4" not in last["product_hours"]
+
+
+def test_run_schedule_sweep_compares_scenarios():
+    """
+    正常系: 各シナリオが並列に解かれ、比較表にまとめられることをテストします。
+    """
+    # --- Arrange ---
+    scenarios = build_schedule_scenarios(
+        LINES,
+        PRODUCT_HOURS,
+        changeover_options=[1],
+        extra_line_options=[0, 1],
+        horizon_hours=10,
+        objective="maximize_product",
+        target_product="P1",
+    )
+
+    # --- Act ---
+    table = run_schedule_sweep(scenarios, time_limit_seconds=5, max_workers=2)
+
+    # --- Assert ---
+    assert table["状態"].tolist() == ["OPTIMAL", "OPTIMAL"]
+    # ラインを追加するとP1を1ラインで使用可能時間いっぱいまで生産できる
+    assert table["P1の生産時間"].tolist() == [4, 10]
+
+
+def test_run_schedule_sweep_cancelled():
+    """
+    正常系: キャンセルされた場合、未完了のシナリオがCANCELLEDとして返されることをテストします。
+    """
+    # --- Arrange ---
+    scenarios = build_schedule_scenarios(LINES, PRODUCT_HOURS, changeover_options=[0, 1])
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    # --- Act ---
+    table = run_schedule_sweep(scenarios, cancel_event=cancel_event)
+
+    # --- Assert ---
+    assert table["状態"].tolist() == [CANCELLED, CANCELLED]
+    assert table.attrs["cancelled"] == 2
+
+
+def test_run_schedule_sweep_deadline_stops_running_solvers():
+    """
+    正常系: スイープ全体の制限時間を超えた場合、解いている途中のシナリオのワーカープロセスも停止し、
+    シナリオごとの制限時間まで計算が続かないことをテストします。
+    """
+    # --- Arrange ---
+    # 制限時間内に最適解が得られない大きさの問題
+    product_hours = {f"P{i}": 3 + (i * 7) % 11 for i in range(40)}
+    scenarios = build_schedule_scenarios(
+        ["L1", "L2", "L3", "L4", "L5"], product_hours, changeover_options=[1, 2], horizon_hours=60
+    )
+
+    # --- Act ---
+    start_time = time.perf_counter()
+    table = run_schedule_sweep(scenarios, time_limit_seconds=60, deadline_seconds=2)
+    elapsed = time.perf_counter() - start_time
+
+    # --- Assert ---
+    assert table["状態"].tolist() == [CANCELLED, CANCELLED]
+    assert elapsed < 15
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from src.utils.search_cache import SearchResultCache
+
+
+def test_identical_queries_are_coalesced_and_cached(tmp_path):
+    """
+    正常系: 同じクエリ（表記揺れを含む）の同時検索が1回の通信にまとめられ、
+    その後の検索はキャッシュから返されることをテストします。
+    """
+    # --- Arrange ---
+    cache = SearchResultCache(path=str(tmp_path / "search_cache.json"))
+    calls = []
+    release = threading.Event()
+
+    def fetch(query):
+        calls.append(query)
+        release.wait(timeout=5)
+        return f"result for {query}"
+
+    results = [None] * 4
+    queries = ["Python  機械学習", "python 機械学習", "ＰＹＴＨＯＮ 機械学習", " Python 機械学習 "]
+
+    def search(index):
+        results[index] = cache.get_or_fetch(queries[index], fetch)
+
+    # --- Act ---
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    cached = cache.get_or_fetch("PYTHON 機械学習", fetch)
+
+    # --- Assert ---
+    assert len(calls) == 1
+    assert results == [f"result for {calls[0]}"] * 4
+    assert cached == results[0]
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] + stats["coalesced"] == 4
+    assert stats["hit_rate"] == 0.8
+    assert stats["latency_saved_seconds"] > 0
+
+
+def test_cache_persists_expires_and_skips_errors(tmp_path):
+    """
+    正常系: 保存した結果が再起動後も使われ、期限切れ・上限超過の結果は破棄され、
+    失敗した検索は保存されないことをテストします。
+    """
+    # --- Arrange ---
+    path = str(tmp_path / "search_cache.json")
+    cache = SearchResultCache(path=path, max_entries=2)
+    cache.put("a", "result a")
+    cache.put("b", "result b")
+    cache.put("c", "result c")
+
+    def failing_fetch(query):
+        raise RuntimeError("rate limited")
+
+    # --- Act ---
+    restarted = SearchResultCache(path=path, max_entries=2)
+    time.sleep(0.01)
+    expired = SearchResultCache(path=path, ttl_seconds=0)
+    try:
+        restarted.get_or_fetch("d", failing_fetch)
+        raised = False
+    except RuntimeError:
+        raised = True
+
+    # --- Assert ---
+    assert restarted.get("a") is None
+    assert restarted.get("B") == "result b"
+    assert restarted.get("c") == "result c"
+    assert expired.get("c") is None
+    assert raised
+    assert restarted.get("d") is None
+    assert restarted.stats()["entries"] == 2
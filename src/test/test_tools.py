@@ -2,161 +2,205 @@
 
 # 1. 必要なライブラリをインポートする
 #    - pytest: テストフレームワーク
-#    - os: ファイルパスの操作
 #    - unittest.mock の patch: オブジェクトをテスト中に置き換える（モックする）ため
-#    - テスト対象の関数 upload_file_to_blob をインポートする
+#    - テスト対象の関数 upload_image_to_blob をインポートする
 
 # 2. テストケース1: 正常系テスト
-#    - 関数名: test_upload_file_to_blob_success
-#    - pytestのtmp_pathフィクスチャを使用して、テスト用のダミーファイルを一時ディレクトリに作成する
-#    - @patchデコレータを使用して、以下のオブジェクトをモックする
-#      - 'src.utils.tools.os.getenv': 環境変数の読み取りをシミュレートする
-#      - 'src.utils.tools.BlobServiceClient': Azure SDKのクライアントをシミュレートする
-#      - 'src.utils.tools.uuid.uuid4': 一意なID生成を固定値に置き換える
+#    - 関数名: test_upload_image_to_blob_success
+#    - pytestのtmp_pathフィクスチャを使用して、テスト用のダミー画像を一時ディレクトリに作成する
+#    - 接続文字列を"local:<ディレクトリ>"にして、Blob Storageのローカル代替実装にアップロードする
+#    - アップロードはバックグラウンドで行われるため、完了を待ってから検証する
 #
 #    - テストの準備 (Arrange)
-#      - モックされたos.getenvが、テスト用の接続文字列とコンテナ名を返すように設定する
-#      - モックされたuuid.uuid4が、固定のUUID文字列を返すように設定する
-#      - モックされたBlobServiceClientのインスタンスと、そのメソッド(get_blob_client)、プロパティ(url)の振る舞いを定義する
-#        - get_blob_clientは、モックされたblob_clientを返す
-#        - blob_clientのurlプロパティは、期待されるURL文字列を返す
-#      - テスト用のダミーファイルを作成し、中身を書き込む
+#      - monkeypatchで接続文字列とコンテナ名の環境変数を設定する
+#      - テスト用のダミー画像を作成し、中身を書き込む
 #
 #    - テストの実行 (Act)
-#      - upload_file_to_blob関数を、作成したダミーファイルのパスを引数にして呼び出す
+#      - upload_image_to_blob関数を、作成したダミー画像のパスを引数にして呼び出す
 #
 #    - 検証 (Assert)
-#      - os.getenvが正しい引数で呼び出されたことを確認する
-#      - BlobServiceClient.from_connection_stringが正しい接続文字列で呼び出されたことを確認する
-#      - blob_service_client.get_blob_clientが正しいコンテナ名とBLOB名で呼び出されたことを確認する
-#      - blob_client.upload_blobが呼び出されたことを確認する
-#      - 関数の戻り値が、期待されるURLと一致することを確認する
+#      - 戻り値が成功メッセージと[image: URL]を含むことを確認する
+#      - URLの指す先に同じ内容が保存され、ローカルファイルが削除されたことを確認する
 
 # 3. テストケース2: 環境変数が設定されていない場合の異常系テスト
-#    - 関数名: test_upload_file_to_blob_no_env_vars
-#    - @patchデコレータを使用して 'src.utils.tools.os.getenv' をモックする
+#    - 関数名: test_upload_image_to_blob_no_env_vars
 #
 #    - テストの準備 (Arrange)
-#      - モックされたos.getenvがNoneを返すように設定する
+#      - monkeypatchで接続情報の環境変数を削除する
 #
 #    - テストの実行 (Act)
-#      - upload_file_to_blob関数を呼び出す
+#      - upload_image_to_blob関数を呼び出す
 #
 #    - 検証 (Assert)
 #      - 戻り値が期待されるエラーメッセージを含んでいることを確認する
 
 # 4. テストケース3: ファイルアップロード時に例外が発生した場合の異常系テスト
-#    - 関数名: test_upload_file_to_blob_upload_failure
-#    - pytestのtmp_pathフィクスチャを使用する
-#    - @patchデコレータを使用して、os.getenv, BlobServiceClient, uuid.uuid4をモックする
+#    - 関数名: test_upload_image_to_blob_upload_failure
+#    - @patchデコレータを使用して get_blob_client_pool をモックする
 #
 #    - テストの準備 (Arrange)
-#      - 正常系テストと同様に、各モックを設定する
-#      - ただし、blob_client.upload_blobが呼び出されたときにExceptionを発生させるように設定する
-#      - ダミーファイルを作成する
+#      - BLOB_UPLOAD_ASYNC=0でアップロードの完了を待つ方式にする
+#      - upload_fileが呼び出されたときにExceptionを発生させるように設定する
+#      - ダミー画像を作成する
 #
 #    - テストの実行 (Act)
-#      - upload_file_to_blob関数を呼び出す
+#      - upload_image_to_blob関数を呼び出す
 #
 #    - 検証 (Assert)
-#      - 戻り値が期待されるエラーメッセージを含んでいることを確認するimport os
-import uuid
-from unittest.mock import patch, MagicMock, mock_open
+#      - 戻り値が期待されるエラーメッセージを含んでいることを確認する
+#      - ローカルファイルが削除されていないことを確認する
+
+# 5. テストケース4: 同じ内容の画像の重複排除テスト
+#    - 関数名: test_upload_image_to_blob_reuses_identical_content
+#    - 同じ内容の画像を2回アップロードし、2回目はアップロードせずに同じURLが返されることを確認する
+
+# 6. テストケース5: セッションの作業ディレクトリに固定したツールのテスト
+#    - 関数名: test_upload_image_tool_only_reads_own_session_dir
+#    - 他のセッションにある同名のファイルはアップロードされず、自分のセッションのファイルだけが使われることを確認する
+import hashlib
+import re
+from pathlib import Path
+from unittest.mock import patch
+from urllib.parse import unquote, urlparse
+
 import pytest
-from src.utils.tools import upload_file_to_blob
 
+from src.utils.blob_dedup import BlobIndex, storage_key
+from src.utils.blob_storage import get_background_uploader
+from src.utils.tools import create_upload_image_tool, get_image_source, upload_image_to_blob
+from src.utils.work_dirs import WorkDirectoryManager
 
-@patch("src.utils.tools.uuid.uuid4")
-@patch("src.utils.tools.open", new_callable=mock_open, read_data=b"test data")
-@patch("src.utils.tools.BlobServiceClient")
-@patch("src.utils.tools.os.getenv")
-def test_upload_file_to_blob_success(
-    mock_getenv, mock_blob_service_client, mock_open_file, mock_uuid
-):
+
+@pytest.fixture(autouse=True)
+def blob_index(tmp_path, monkeypatch):
+    """アップロード済みの索引をテストごとに一時ディレクトリに作成し、定期的な整理は無効にする"""
+    index = BlobIndex(str(tmp_path / "blob_index.json"))
+    monkeypatch.setattr("src.utils.tools.get_blob_index", lambda persistent=True: index)
+    monkeypatch.setenv("BLOB_GC_INTERVAL_SECONDS", "0")
+    return index
+
+
+def test_upload_image_to_blob_success(tmp_path, monkeypatch):
     """
-    正常系: ファイルが正常にアップロードされ、BLOBのURLが返されることをテストします。
+    正常系: バックグラウンドで画像がアップロードされ、BLOBのURLが返されることをテストします。
     """
     # --- Arrange ---
-    # 環境変数のモック
-    mock_getenv.side_effect = [
-        "DefaultEndpointsProtocol=https;AccountName=test;AccountKey=testkey;EndpointSuffix=core.windows.net",
-        "test-container",
-    ]
-
-    # uuidのモック
-    mock_uuid.return_value = uuid.UUID("12345678-1234-5678-1234-567812345678")
-
-    # BlobServiceClientと関連オブジェクトのモック
-    mock_blob_client = MagicMock()
-    mock_blob_client.url = "https://test.blob.core.windows.net/test-container/12345678-1234-5678-1234-567812345678-test.txt"
-    mock_container_client = MagicMock()
-    mock_container_client.get_blob_client.return_value = mock_blob_client
-    mock_blob_service_client.from_connection_string.return_value.get_container_client.return_value = (
-        mock_container_client
-    )
-    # get_blob_clientはBlobServiceClientから直接呼び出されるように修正
-    mock_service_instance = mock_blob_service_client.from_connection_string.return_value
-    mock_service_instance.get_blob_client.return_value = mock_blob_client
-
-    file_path = "test.txt"
+    monkeypatch.setenv("AZURE_STORAGE_CONNECTION_STRING", f"local:{tmp_path / 'blob'}")
+    monkeypatch.setenv("AZURE_STORAGE_CONTAINER_NAME", "test-container")
+    image_path = tmp_path / "graph.png"
+    image_path.write_bytes(b"test data")
 
     # --- Act ---
-    result = upload_file_to_blob(file_path)
+    result = upload_image_to_blob(str(image_path))
+    url = re.search(r"\[image: (.+)\]", result).group(1)
+    status = get_background_uploader().wait(url, timeout=10)
 
     # --- Assert ---
-    # 環境変数が正しく呼び出されたか
-    mock_getenv.assert_any_call("AZURE_STORAGE_CONNECTION_STRING")
-    mock_getenv.assert_any_call("AZURE_STORAGE_CONTAINER_NAME")
-
-    # BlobServiceClientが正しく初期化されたか
-    mock_blob_service_client.from_connection_string.assert_called_once()
+    assert result.startswith("画像のアップロードに成功しました。")
+    assert status == "uploaded"
+    assert get_image_source(url) == url
+    uploaded = Path(unquote(urlparse(url).path))
+    assert uploaded.parent.parent.name == "test-container"
+    assert uploaded.name == hashlib.sha256(b"test data").hexdigest() + ".png"
+    assert uploaded.read_bytes() == b"test data"
+    assert not image_path.exists()
 
-    # BlobClientが正しい名前で取得されたか
-    expected_blob_name = f"{mock_uuid.return_value}-{os.path.basename(file_path)}"
-    mock_service_instance.get_blob_client.assert_called_once_with(
-        container="test-container", blob=expected_blob_name
-    )
 
-    # ファイルが開かれ、アップロードされたか
-    mock_open_file.assert_called_once_with(file_path, "rb")
-    mock_blob_client.upload_blob.assert_called_once()
-
-    # 戻り値が期待通りか
-    assert result == mock_blob_client.url
-
-
-@patch("src.utils.tools.os.getenv")
-def test_upload_file_to_blob_no_env_vars(mock_getenv):
+def test_upload_image_to_blob_no_env_vars(tmp_path, monkeypatch):
     """
     異常系: 環境変数が設定されていない場合にエラーが返されることをテストします。
     """
     # --- Arrange ---
-    mock_getenv.return_value = None
-    file_path = "test.txt"
+    monkeypatch.delenv("AZURE_STORAGE_CONNECTION_STRING", raising=False)
+    monkeypatch.delenv("AZURE_STORAGE_CONTAINER_NAME", raising=False)
+    image_path = tmp_path / "graph.png"
+    image_path.write_bytes(b"test data")
 
     # --- Act ---
-    result = upload_file_to_blob(file_path)
+    result = upload_image_to_blob(str(image_path))
 
     # --- Assert ---
     assert "エラー: 環境変数にAzure Storageの接続情報が設定されていません。" in result
 
 
-@patch("src.utils.tools.os.getenv")
-@patch("src.utils.tools.BlobServiceClient")
-def test_upload_file_to_blob_upload_failure(mock_blob_service_client, mock_getenv):
+@patch("src.utils.tools.get_blob_client_pool")
+def test_upload_image_to_blob_upload_failure(mock_get_pool, tmp_path, monkeypatch):
     """
     異常系: アップロード中に例外が発生した場合にエラーが返されることをテストします。
     """
     # --- Arrange ---
-    mock_getenv.side_effect = ["dummy_connection_string", "dummy_container"]
-    mock_blob_service_client.from_connection_string.side_effect = Exception(
-        "Connection failed"
-    )
-    file_path = "test.txt"
+    monkeypatch.setenv("AZURE_STORAGE_CONNECTION_STRING", "dummy_connection_string")
+    monkeypatch.setenv("AZURE_STORAGE_CONTAINER_NAME", "dummy_container")
+    monkeypatch.setenv("BLOB_UPLOAD_ASYNC", "0")
+    mock_get_pool.return_value.upload_file.side_effect = Exception("Connection failed")
+    image_path = tmp_path / "graph.png"
+    image_path.write_bytes(b"test data")
 
     # --- Act ---
-    result = upload_file_to_blob(file_path)
+    result = upload_image_to_blob(str(image_path))
 
     # --- Assert ---
     assert "エラー: ファイルのアップロードに失敗しました。" in result
     assert "Connection failed" in result
+    assert image_path.exists()
+
+
+def test_upload_image_to_blob_reuses_identical_content(tmp_path, monkeypatch, blob_index):
+    """
+    正常系: 同じ内容の画像を再度アップロードすると、索引の参照だけで同じURLが返されることをテストします。
+    """
+    # --- Arrange ---
+    monkeypatch.setenv("AZURE_STORAGE_CONNECTION_STRING", f"local:{tmp_path / 'blob'}")
+    monkeypatch.setenv("AZURE_STORAGE_CONTAINER_NAME", "test-container")
+    monkeypatch.setenv("BLOB_UPLOAD_ASYNC", "0")
+    first_path = tmp_path / "first.png"
+    second_path = tmp_path / "second.png"
+    first_path.write_bytes(b"same chart")
+    second_path.write_bytes(b"same chart")
+
+    # --- Act ---
+    first = upload_image_to_blob(str(first_path))
+    with patch("src.utils.tools.get_blob_client_pool") as mock_get_pool:
+        second = upload_image_to_blob(str(second_path))
+
+    # --- Assert ---
+    assert first == second
+    mock_get_pool.return_value.upload_file.assert_not_called()
+    assert not second_path.exists()
+    key = storage_key(f"local:{tmp_path / 'blob'}", "test-container")
+    assert len(blob_index.entries(key)) == 1
+
+
+def test_upload_image_tool_only_reads_own_session_dir(tmp_path, monkeypatch):
+    """
+    異常系: 自分のセッションにないファイルは、他のセッションに同名のファイルがあっても
+    アップロードされずにエラーが返され、モデルにはfile_pathだけが見えることをテストします。
+    """
+    # --- Arrange ---
+    monkeypatch.setenv("AZURE_STORAGE_CONNECTION_STRING", f"local:{tmp_path / 'blob'}")
+    monkeypatch.setenv("AZURE_STORAGE_CONTAINER_NAME", "test-container")
+    monkeypatch.setenv("BLOB_UPLOAD_ASYNC", "0")
+    manager = WorkDirectoryManager(str(tmp_path / "work"))
+    monkeypatch.setattr("src.utils.tools.get_work_dir_manager", lambda root: manager)
+    own_dir = manager.create_session_dir()
+    other_dir = manager.create_session_dir()
+    other_chart = Path(other_dir) / "chart.png"
+    other_chart.write_bytes(b"other user's chart")
+    tool = create_upload_image_tool(own_dir)
+
+    # --- Act ---
+    missing = upload_image_to_blob("chart.png", work_dir=own_dir)
+    absolute = upload_image_to_blob(str(other_chart), work_dir=own_dir)
+    (Path(own_dir) / "chart.png").write_bytes(b"own chart")
+    uploaded = upload_image_to_blob("chart.png", work_dir=own_dir)
+
+    # --- Assert ---
+    assert missing.startswith("エラー: ファイルが見つかりません。")
+    assert absolute.startswith("エラー: ファイルが見つかりません。")
+    assert other_chart.read_bytes() == b"other user's chart"
+    assert uploaded.startswith("画像のアップロードに成功しました。")
+    url = re.search(r"\[image: (.+)\]", uploaded).group(1)
+    assert Path(unquote(urlparse(url).path)).read_bytes() == b"own chart"
+    assert tool.name == "upload_image_to_blob"
+    assert list(tool.schema["parameters"]["properties"]) == ["file_path"]
+    assert "work_dir" not in tool.description
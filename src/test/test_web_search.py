@@ -0,0 +1,74 @@
+import threading
+import time
+
+from src.utils.web_search import format_digest, merge_results, run_multi_search
+
+
+def test_multi_search_runs_in_parallel_with_timeouts():
+    """
+    正常系: 複数のクエリが並列に検索され、遅いクエリはタイムアウト、失敗したクエリは
+    エラーとして記録され、表記揺れのみ異なるクエリは1回だけ検索されることをテストします。
+    """
+    # --- Arrange ---
+    calls = []
+    release = threading.Event()
+
+    def fetch(query):
+        calls.append(query)
+        if query == "slow":
+            release.wait(timeout=5)
+        if query == "broken":
+            raise RuntimeError("rate limited")
+        time.sleep(0.2)
+        return [{"title": query, "href": f"https://example.com/{query}", "body": "..."}]
+
+    # --- Act ---
+    try:
+        search = run_multi_search(
+            ["a", "b", "A ", "slow", "broken"],
+            fetch,
+            query_timeout_seconds=0.5,
+            deadline_seconds=5,
+            max_workers=4,
+        )
+    finally:
+        release.set()
+
+    # --- Assert ---
+    assert sorted(calls) == ["a", "b", "broken", "slow"]
+    assert list(search["results"]) == ["a", "b"]
+    assert search["timed_out"] == ["slow"]
+    assert "rate limited" in search["failed"]["broken"]
+    # 直列なら0.4秒以上＋タイムアウト0.5秒かかる
+    assert search["elapsed_seconds"] < 0.9
+
+
+def test_merge_results_deduplicates_and_ranks_by_agreement():
+    """
+    正常系: 同じURL（www・末尾のスラッシュ違いを含む）の結果が1件にまとめられ、複数のクエリで
+    上位に出た結果が先頭になり、ダイジェストが上限の文字数に収まることをテストします。
+    """
+    # --- Arrange ---
+    results = {
+        "q1": [
+            {"title": "Only q1", "href": "https://only.example.com/", "body": "x" * 1000},
+            {"title": "Shared", "href": "https://www.shared.example.com/page/", "body": "short"},
+        ],
+        "q2": [
+            {"title": "Shared", "href": "https://shared.example.com/page", "body": "longer body"},
+            {"title": "Only q2", "href": "https://q2.example.com/", "body": "y" * 1000},
+        ],
+    }
+
+    # --- Act ---
+    ranked = merge_results(results)
+    digest = format_digest(ranked, {}, ["q3"], max_chars=800)
+
+    # --- Assert ---
+    assert [entry["title"] for entry in ranked] == ["Shared", "Only q1", "Only q2"]
+    assert ranked[0]["queries"] == ["q1", "q2"]
+    assert ranked[0]["body"] == "longer body"
+    assert digest.startswith("1. Shared")
+    assert "省略しました" in digest
+    assert digest.endswith("タイムアウトしたクエリ: q3")
+    assert len(digest) <= 800
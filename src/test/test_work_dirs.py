@@ -0,0 +1,86 @@
+import os
+import time
+
+from src.utils.work_dirs import WorkDirectoryManager
+
+
+def _write(path, size, age_seconds=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_manager_creates_isolated_session_dirs(tmp_path):
+    """
+    正常系: セッションごとに別の作業ディレクトリが作成され、ファイルは自分のセッションの中だけから
+    探され、他のセッションの同名ファイルやセッションの外は見つからないことをテストします。
+    """
+    # --- Arrange ---
+    manager = WorkDirectoryManager(str(tmp_path))
+
+    # --- Act ---
+    first = manager.create_session_dir()
+    second = manager.create_session_dir()
+    _write(tmp_path / "sessions" / os.path.basename(second) / "img" / "graph.png", 10)
+
+    # --- Assert ---
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path / "sessions")
+    graph = os.path.join(second, "img", "graph.png")
+    assert manager.resolve(os.path.join("img", "graph.png"), second) == graph
+    assert manager.resolve(graph, second) == graph
+    assert manager.resolve(os.path.join("img", "graph.png"), first) is None
+    assert manager.resolve(graph, first) is None
+    assert manager.resolve(os.path.join("..", os.path.basename(second), "img", "graph.png"), first) is None
+    assert manager.resolve("missing.png", second) is None
+
+
+def test_collect_removes_expired_and_over_quota_files(tmp_path):
+    """
+    正常系: 期限切れのセッション・古いファイルと、容量上限を超えた分が削除され、解放量が集計されることをテストします。
+    """
+    # --- Arrange ---
+    manager = WorkDirectoryManager(
+        str(tmp_path), max_age_seconds=3600, max_session_bytes=100, max_total_bytes=10_000
+    )
+    expired = manager.create_session_dir()
+    active = manager.create_session_dir()
+    _write(tmp_path / "sessions" / os.path.basename(expired) / "old.png", 50, 7200)
+    os.utime(expired, (time.time() - 7200,) * 2)
+    _write(tmp_path / "sessions" / os.path.basename(active) / "a.png", 80, 60)
+    _write(tmp_path / "sessions" / os.path.basename(active) / "b.png", 80, 0)
+    _write(tmp_path / "legacy.py", 30, 7200)
+
+    # --- Act ---
+    stats = manager.collect()
+
+    # --- Assert ---
+    assert not os.path.exists(expired)
+    assert not (tmp_path / "legacy.py").exists()
+    assert sorted(os.listdir(active)) == ["b.png"]
+    assert stats["bytes_reclaimed"] == 50 + 80 + 30
+    assert stats["sessions_removed"] == 1
+    assert stats["sessions"] == 1
+    assert stats["total_bytes"] == 80
+
+
+def test_collect_keeps_active_sessions_when_total_quota_exceeded(tmp_path):
+    """
+    正常系: 全体の容量上限を超えた場合、実行中でないセッションから削除されることをテストします。
+    """
+    # --- Arrange ---
+    manager = WorkDirectoryManager(str(tmp_path), max_total_bytes=100)
+    idle = manager.create_session_dir()
+    active = manager.create_session_dir()
+    _write(tmp_path / "sessions" / os.path.basename(idle) / "a.png", 80, 3600)
+    os.utime(idle, (time.time() - 3600,) * 2)
+    _write(tmp_path / "sessions" / os.path.basename(active) / "b.png", 80, 0)
+
+    # --- Act ---
+    stats = manager.collect()
+
+    # --- Assert ---
+    assert not os.path.exists(idle)
+    assert os.path.exists(active)
+    assert stats["total_bytes"] == 80
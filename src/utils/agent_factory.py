@@ -0,0 +1,170 @@
+"""
+エージェント・チームの作成と予備の事前作成
+
+「新しい会話」を押すと、エージェント（またはSelectorGroupChat）とコード実行環境を
+画面のスレッドで同期的に作り直すため、その間は画面が止まります。このモジュールは
+作成済みの予備をバックグラウンドで用意しておき、作り直しを待たずに返します。
+
+- AgentFactory.acquire(): 予備があればそれを返し（なければその場で作成）、次の予備を
+  バックグラウンドで作成する
+- 予備はユーザーごとに用意します（コード実行の公平性の単位をユーザーにするため）
+- 計測値: agent_factory.<name>.build_seconds（作成時間）、acquire_seconds（画面が待った時間）、
+  spare_hits / spare_misses
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .execution_output import ExecutionOutputStream
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_SPARES = 8
+# 作業ディレクトリの定期削除より十分短い時間で予備を作り直す
+DEFAULT_SPARE_MAX_AGE_SECONDS = 3600.0
+
+
+class AgentFactory:
+    """エージェントを作成し、次に使う予備をユーザーごとに1つ事前に作成しておくファクトリ"""
+
+    def __init__(
+        self,
+        builder: Callable[[ExecutionOutputStream, Optional[str]], Any],
+        name: str,
+        warm_spare: bool = True,
+        max_spares: int = DEFAULT_MAX_SPARES,
+        spare_max_age_seconds: float = DEFAULT_SPARE_MAX_AGE_SECONDS,
+    ):
+        """
+        初期化
+
+        Args:
+            builder (Callable[[ExecutionOutputStream, Optional[str]], Any]): 出力の表示先とユーザーを
+                受け取ってエージェントを作成する関数（失敗時はNoneを返す）
+            name (str): 計測値・ログに使う名前
+            warm_spare (bool): 予備をバックグラウンドで作成するかどうか
+            max_spares (int): 保持する予備の最大数（超えたら最も古く使われたユーザーの予備から破棄）
+            spare_max_age_seconds (float): 予備を使わずに保持する最大の時間（秒）
+        """
+        self._builder = builder
+        self.name = name
+        self.warm_spare = warm_spare
+        self.max_spares = max_spares
+        self.spare_max_age_seconds = spare_max_age_seconds
+        self._lock = threading.Lock()
+        # ユーザー → (エージェント, 出力の表示先, 作成した時刻)
+        self._spares: "collections.OrderedDict[str, Tuple]" = collections.OrderedDict()
+        self._warming: Dict[str, threading.Thread] = {}
+
+    def _build(self, user: Optional[str]) -> Tuple[Any, ExecutionOutputStream]:
+        output_stream = ExecutionOutputStream()
+        start_time = time.perf_counter()
+        agent = self._builder(output_stream, user)
+        metrics.observe(
+            f"agent_factory.{self.name}.build_seconds", time.perf_counter() - start_time
+        )
+        return agent, output_stream
+
+    def _warm(self, key: str, user: Optional[str]) -> None:
+        try:
+            agent, output_stream = self._build(user)
+            if agent is None:
+                return
+            with self._lock:
+                self._spares[key] = (agent, output_stream, time.monotonic())
+                self._spares.move_to_end(key)
+                while len(self._spares) > self.max_spares:
+                    self._spares.popitem(last=False)
+                metrics.set_gauge(f"agent_factory.{self.name}.spares", len(self._spares))
+        except Exception as e:
+            logger.warning(f"予備のエージェントの作成に失敗しました（{self.name}）: {e}")
+        finally:
+            with self._lock:
+                self._warming.pop(key, None)
+
+    def warm(self, user: Optional[str] = None) -> None:
+        """ユーザーの予備をバックグラウンドで作成（予備がある・作成中の場合は何もしない）"""
+        if not self.warm_spare:
+            return
+        key = user or ""
+        with self._lock:
+            if key in self._spares or key in self._warming:
+                return
+            thread = threading.Thread(
+                target=self._warm, args=(key, user), name=f"{self.name}-spare", daemon=True
+            )
+            self._warming[key] = thread
+        thread.start()
+
+    def acquire(self, user: Optional[str] = None) -> Tuple[Any, ExecutionOutputStream]:
+        """
+        新しい会話用のエージェントを取得
+
+        Args:
+            user (Optional[str]): ログイン中のユーザー
+
+        Returns:
+            Tuple[Any, ExecutionOutputStream]: エージェント（作成に失敗した場合はNone）と
+                コード実行中の出力の表示先
+        """
+        start_time = time.perf_counter()
+        key = user or ""
+        spare = None
+        with self._lock:
+            entry = self._spares.pop(key, None)
+            if entry is not None:
+                if time.monotonic() - entry[2] <= self.spare_max_age_seconds:
+                    spare = entry[:2]
+                else:
+                    metrics.increment(f"agent_factory.{self.name}.spares_expired")
+            metrics.set_gauge(f"agent_factory.{self.name}.spares", len(self._spares))
+
+        if spare is not None:
+            metrics.increment(f"agent_factory.{self.name}.spare_hits")
+            agent, output_stream = spare
+        else:
+            metrics.increment(f"agent_factory.{self.name}.spare_misses")
+            agent, output_stream = self._build(user)
+        metrics.observe(
+            f"agent_factory.{self.name}.acquire_seconds", time.perf_counter() - start_time
+        )
+        # 次の「新しい会話」に備えて予備を作成
+        self.warm(user)
+        return agent, output_stream
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """作成中の予備の完了を待つ（テスト・終了処理用）"""
+        with self._lock:
+            threads = list(self._warming.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        """予備の数と作成中の数"""
+        with self._lock:
+            return {"spares": len(self._spares), "warming": len(self._warming)}
+
+
+def create_agent_factory(
+    builder: Callable[[ExecutionOutputStream, Optional[str]], Any], name: str
+) -> AgentFactory:
+    """
+    環境変数の設定でAgentFactoryを作成
+
+    AGENT_WARM_SPARE="0"で予備の事前作成を無効にし、予備を保持する時間は
+    AGENT_SPARE_MAX_AGE_SECONDS（既定3600）で指定します。
+    """
+    return AgentFactory(
+        builder,
+        name,
+        warm_spare=os.getenv("AGENT_WARM_SPARE", "1").lower() not in ("0", "false", "off"),
+        spare_max_age_seconds=float(
+            os.getenv("AGENT_SPARE_MAX_AGE_SECONDS", str(DEFAULT_SPARE_MAX_AGE_SECONDS))
+        ),
+    )
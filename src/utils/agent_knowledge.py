@@ -0,0 +1,317 @@
+"""
+データ分析エージェントの詳細な手順・業務知識の検索と、プロンプトのトークン数の集計
+
+setup_agent()のシステムメッセージには、グラフ作成のコード例・ツールの使用例・ロットや設備に
+関する業務知識がすべて含まれていたため、ツールを連続実行するたび（最大max_tool_iterations回）に
+数千文字が毎回モデルに送られていました。このモジュールはそれらをシステムメッセージから外し、
+必要なときだけ取り出します。
+
+- KNOWLEDGE_ENTRIES: 手順・業務知識（キーワード付き）
+- augment_prompt(): ユーザーのメッセージに関係する知識を【参考情報】として付与
+- lookup_knowledge: エージェントが途中で手順・知識を調べるためのツール
+- record_prompt_savings(): 1ターンで削減できたプロンプトのトークン数を集計
+"""
+
+import functools
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 1回の検索で返す知識の最大件数
+DEFAULT_MAX_ENTRIES = 3
+
+KNOWLEDGE_HEADER = "【参考情報】"
+
+KNOWLEDGE_ENTRIES: List[Dict] = [
+    {
+        "id": "chart_code",
+        "title": "execute_toolでのグラフ作成の手順",
+        "keywords": ["グラフ", "図", "チャート", "可視化", "プロット", "execute_tool", "save_figure"],
+        "content": """**グラフ作成の場合:**
+費用・生産数・不良率・ロス内訳の折れ線・棒・積み上げ棒・パレート図は、render_chart を1回呼ぶだけで作成・アップロードできます（データ取得やコードは不要です）。
+例: render_chart(dataset="erp", chart_type="line", y=["変動費-材料費"], skus=["SKU-1234"])
+例: render_chart(dataset="mes_loss", chart_type="pareto", y=["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"])
+render_chartで描けないグラフの場合:
+1. データ取得ツール実行
+2. execute_toolでグラフ作成・保存
+3. upload_image_to_blobでアップロードし、実行結果から、画像の公開URLを取得します。
+
+**実行環境（execute_tool）:**
+日本語フォント・Aggバックエンド・rcParams（axes.unicode_minus=False）は設定済みです。フォントを検索・設定するコードは書かないでください。
+次の変数はimportせずに使えます: pd, np, plt, StringIO, datetime, os, save_figure
+グラフは `file_path = save_figure(fig)` で保存してください（PNGで保存して図を閉じ、絶対パスを返します）。返されたパスを upload_image_to_blob に渡します。
+
+```python
+df = pd.read_csv(StringIO(data))
+df = df.drop(columns=[col for col in df.columns if col.startswith('Unnamed')])
+fig, ax = plt.subplots(figsize=(10, 6))
+df.plot(x="年月", y="変動費-材料費", ax=ax, marker="o")
+ax.set_title("月別材料費の推移")
+file_path = save_figure(fig)
+```
+
+**エラー回避のポイント:**
+- CSVデータはStringIOで処理
+- グラフの保存はsave_figureを使用（保存先ディレクトリは自動で作成されます）""",
+    },
+    {
+        "id": "tool_examples",
+        "title": "データ取得・分析ツールの使用例",
+        "keywords": [
+            "データ", "費用", "原価", "材料費", "生産数", "不良率", "ロス", "日報", "包装機",
+            "テレメトリ", "異常", "清掃", "予測", "シナリオ", "シミュレーション", "スケジュール",
+            "ライン", "切替", "ツール", "load_",
+        ],
+        "content": """**利用可能なデータ取得ツール:**
+- `load_erp_data`: 変動費、固定費データの取得（年月リスト、SKUリスト指定）
+  例: load_erp_data(year_months=["2025-01", "2025-02"], skus=["SKU-1234"])
+- `load_material_cost_breakdown`: 変動費の内、材料費の内訳データの取得（年月リスト、SKUリスト指定）
+  例: load_material_cost_breakdown(year_months=["2025-01"], skus=["SKU-1234"])
+- `load_daily_report`: 日報データの取得（年月"YYYY-MM"形式、オプションキーワード）
+  例: load_daily_report(year_month="2025-01", keyword="品質")
+- `get_packaging_machine_status`: 包装機テレメトリの異常検知結果・清掃要否予測の取得（ロットリスト指定、異常のみ）
+  例: get_packaging_machine_status(lot_ids=["Lot12353"]), get_packaging_machine_status(only_anomalies=True)
+- `forecast_defect_trend`: SKU別の不良率・ロス内訳の将来予測（学習済みモデルを使用、SKUと予測日数を指定）
+  例: forecast_defect_trend(sku="SKU-1234", horizon_days=14)
+- `simulate_variable_cost`: 原料単価・歩留まり・ライン切替のシナリオ別に良品1個あたり変動費の分布を計算（モンテカルロ）
+  例: simulate_variable_cost(sku="SKU-1234", year_month="2025-06", scenarios=[{"name": "設備2号機へ切替", "defect_reduction_pct": 30}])
+- `optimize_production_schedule`: ライン割り当て・生産順序・切替時間を考慮した生産スケジュールの最適化（制約ソルバー）
+  例: optimize_production_schedule(lines=["L1", "L2"], product_hours={"P1": 10, "P2": 5}, objective="minimize_makespan")
+- `render_chart`: サンプルデータの定型グラフ（折れ線・棒・積み上げ棒・パレート図）の作成とアップロード
+  例: render_chart(dataset="mes_loss", chart_type="pareto", y=["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"])""",
+    },
+    {
+        "id": "variable_cost_reasons",
+        "title": "変動費が上昇している理由",
+        "keywords": ["変動費", "上昇", "理由", "原因", "増え", "高く"],
+        "content": """**変動費が上昇している理由を聞かれたら、以下の3点を基に答えてください。**
+- 材料原価の単価の上昇
+- 歩留まりの低下によるロス増加
+- メンテナンス頻度の増加による材料廃棄率の上昇""",
+    },
+    {
+        "id": "paper_jam",
+        "title": "紙詰まりの原因",
+        "keywords": ["紙詰まり", "詰まり", "搬送"],
+        "content": """**紙詰まりの原因を聞かれたら、以下の内容を基に答えてください。**
+- 搬送装置の排出部の動作不良""",
+    },
+    {
+        "id": "lot5612_trouble",
+        "title": "Lot5612のトラブル情報",
+        "keywords": ["lot5612", "トラブル", "動作不良", "自動供給", "lot4899"],
+        "content": """**Lot5612のトラブル情報について聞かれたら、以下の内容を基に答えてください。**
+- 自動供給装置でLot5612を使用すると、Lot4899に比べて装置の動作不良の発生率が2倍になることが報告されています。
+- Lot5612を設備2号機で使用すると、設備1号機に比べて、動作不良の発生率が30％減少することが確認されています。""",
+    },
+    {
+        "id": "lot5612_maintenance",
+        "title": "Lot5612のメンテナンス頻度",
+        "keywords": ["lot5612", "メンテナンス", "頻度", "保守"],
+        "content": """**Lot5612のメンテナンス頻度が増えたかどうかについて聞かれたら、以下の内容を基に答えてください。**
+- Lot5612を使用したSKU-1234の製造ではメンテナンス頻度が月4回から7回に増加しています。""",
+    },
+    {
+        "id": "variable_cost_measures",
+        "title": "変動費の増加を抑える対策",
+        "keywords": ["変動費", "対策", "抑え", "削減", "改善", "lot4899", "設備2号機"],
+        "content": """**変動費の増加について聞かれたら、以下の内容を基に答えてください。**
+- 変動費の増加を抑えるために、最も効果的な対策は、原材料をLot4899に戻すことです。
+- 変動費の増加を抑えるために、他に有効な方法は、設備1号機から設備2号機に変更することです。""",
+    },
+    {
+        "id": "lot4899_resume",
+        "title": "Lot4899の使用の再開",
+        "keywords": ["lot4899", "再開", "戻す", "購買"],
+        "content": """**Lot4899の使用の再開について聞かれたら、以下の内容を基に答えてください。**
+- 購買部に確認が必要です。""",
+    },
+    {
+        "id": "equipment2_effect",
+        "title": "設備2号機への切替の効果",
+        "keywords": ["設備2号機", "設備1号機", "切替", "効果", "改善", "シナリオ", "lot5612"],
+        "content": """**Lot5612を使用した生産で、設備２号機へ切替の対策を行った場合、設備1号機に比べて金額ベースで1.4%の改善効果が見込まれます。
+価格変動・歩留まり変化・ライン切替などのシナリオを比較する場合は、simulate_variable_cost で変動費の分布を計算して回答してください。""",
+    },
+]
+
+
+def _normalize(text: str) -> str:
+    """検索用に正規化（全角・半角の統一、小文字化、空白の除去）"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text).lower())
+
+
+def search_knowledge(
+    query: str, max_entries: int = DEFAULT_MAX_ENTRIES, exclude: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    クエリに含まれるキーワードが多い知識から順に返す
+
+    Args:
+        query (str): ユーザーのメッセージや調べたい内容
+        max_entries (int): 返す最大件数
+        exclude (Optional[List[str]]): 除外する知識のid
+
+    Returns:
+        List[Dict]: id, title, keywords, contentの一覧（キーワードを含まないものは返さない）
+    """
+    text = _normalize(query)
+    scored = []
+    for index, entry in enumerate(KNOWLEDGE_ENTRIES):
+        if exclude and entry["id"] in exclude:
+            continue
+        score = sum(1 for keyword in entry["keywords"] if _normalize(keyword) in text)
+        if _normalize(entry["title"]) in text:
+            score += 1
+        if score:
+            scored.append((-score, index, entry))
+    return [entry for _, _, entry in sorted(scored)[:max_entries]]
+
+
+def augment_prompt(prompt: str, max_entries: int = DEFAULT_MAX_ENTRIES) -> Dict:
+    """
+    ユーザーのメッセージに関係する業務知識を【参考情報】として付与
+
+    手順（グラフ作成・ツールの使用例）はlookup_knowledgeで必要なときに取得するため付与しません。
+
+    Args:
+        prompt (str): エージェントに渡すメッセージ
+        max_entries (int): 付与する最大件数
+
+    Returns:
+        Dict: prompt（付与後のメッセージ）, entries（付与した知識のid）, tokens（付与したトークン数）
+    """
+    entries = search_knowledge(prompt, max_entries, exclude=["chart_code", "tool_examples"])
+    if not entries:
+        return {"prompt": prompt, "entries": [], "tokens": 0}
+    knowledge = "\n\n".join(entry["content"] for entry in entries)
+    metrics.increment("prompt.knowledge_injected", len(entries))
+    return {
+        "prompt": f"{prompt}\n\n{KNOWLEDGE_HEADER}\n{knowledge}",
+        "entries": [entry["id"] for entry in entries],
+        "tokens": count_tokens(knowledge) + count_tokens(KNOWLEDGE_HEADER),
+    }
+
+
+def lookup_knowledge(query: str) -> str:
+    """
+    グラフ作成のコード例・データ取得ツールの使用例・業務知識（変動費、ロット、設備、トラブルなど）を検索するツール。
+
+    手順が分からない場合や、業務に関する質問に答える前に呼び出してください。
+
+    Args:
+        query (str): 調べたい内容（例: "グラフ作成", "Lot5612 トラブル", "変動費 対策"）
+
+    Returns:
+        str: 関係する手順・業務知識（見つからない場合はその旨）
+    """
+    entries = search_knowledge(query)
+    metrics.increment("prompt.knowledge_lookups")
+    if not entries:
+        titles = "、".join(entry["title"] for entry in KNOWLEDGE_ENTRIES)
+        return f"該当する情報はありません。登録されている情報: {titles}"
+    return "\n\n".join(f"## {entry['title']}\n{entry['content']}" for entry in entries)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    """tiktokenのエンコーディング（読み込めない場合はNone）"""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.info(f"tiktokenのエンコーディングを読み込めないため文字数から推定します: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    トークン数を数える
+
+    環境変数TOKEN_ENCODING（既定o200k_base）のtiktokenのエンコーディングを使い、読み込めない場合
+    （オフライン環境など）は、ASCIIは4文字で1トークン、それ以外は1文字1トークンとして推定します。
+    """
+    encoding = _get_encoding(os.getenv("TOKEN_ENCODING", "o200k_base"))
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def full_knowledge_tokens() -> int:
+    """すべての手順・業務知識のトークン数（システムメッセージに含めた場合に毎回送られる量）"""
+    return sum(count_tokens(entry["content"]) for entry in KNOWLEDGE_ENTRIES)
+
+
+def record_prompt_savings(
+    model_calls: int, injected_tokens: int = 0, looked_up_tokens: int = 0
+) -> Dict:
+    """
+    1ターンで削減できたプロンプトのトークン数を集計
+
+    システムメッセージはモデルを呼び出すたびに送られるため、削減量は
+    （外した知識のトークン数）×（モデルの呼び出し回数）から、付与・検索した知識の分を引いたものです。
+
+    Args:
+        model_calls (int): このターンでのモデルの呼び出し回数
+        injected_tokens (int): メッセージに付与した知識のトークン数
+        looked_up_tokens (int): lookup_knowledgeで取得した知識のトークン数
+
+    Returns:
+        Dict: model_calls, removed_tokens_per_call, injected_tokens, saved_tokens
+    """
+    removed = full_knowledge_tokens()
+    # 付与・検索した知識は会話履歴に入り、以降の呼び出しでも送られる
+    added = (injected_tokens + looked_up_tokens) * max(model_calls, 1)
+    saved = removed * model_calls - added
+    metrics.increment("prompt.turns")
+    metrics.increment("prompt.model_calls", model_calls)
+    metrics.increment("prompt.tokens_saved", saved)
+    report = {
+        "model_calls": model_calls,
+        "removed_tokens_per_call": removed,
+        "injected_tokens": injected_tokens + looked_up_tokens,
+        "saved_tokens": saved,
+    }
+    logger.info(
+        f"プロンプトのトークン数: 1回あたり{removed}トークンを削減、モデル呼び出し{model_calls}回で"
+        f"計{saved}トークン削減（付与・検索した知識 {report['injected_tokens']}トークン）"
+    )
+    return report
+
+
+def record_turn(messages: List, injected_tokens: int = 0) -> Dict:
+    """
+    run_streamで受け取ったメッセージからモデルの呼び出し回数と検索した知識の量を数えて集計
+
+    モデルの呼び出しは、ツール呼び出しの要求（ToolCallRequestEvent）とエージェントの
+    テキストの応答（TextMessage）1件ごとに1回です。
+
+    Args:
+        messages (List): run_streamで受け取ったメッセージ・イベント
+        injected_tokens (int): augment_promptで付与した知識のトークン数
+
+    Returns:
+        Dict: record_prompt_savingsの結果
+    """
+    model_calls = 0
+    looked_up_tokens = 0
+    for message in messages:
+        kind = type(message).__name__
+        if kind == "ToolCallRequestEvent":
+            model_calls += 1
+        elif kind == "TextMessage" and getattr(message, "source", "user") != "user":
+            model_calls += 1
+        elif kind == "ToolCallExecutionEvent":
+            for result in message.content:
+                if getattr(result, "name", None) == "lookup_knowledge":
+                    looked_up_tokens += count_tokens(str(result.content))
+    return record_prompt_savings(model_calls, injected_tokens, looked_up_tokens)
@@ -0,0 +1,530 @@
+"""
+包装機テレメトリ（mes_packagingmachine.csv）のストリーミング異常検知
+
+行が到着するたびに移動統計（EWMA・移動窓のzスコア・アラーム発生率）を
+1サンプルあたりO(1)で更新し、ロット別・設備別の現在状態をすぐに参照できるようにします。
+"""
+
+import csv
+import io
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+from .datasets import get_sampledata_path
+
+# 異常検知の対象とする計測値（defect_rateは不良数/生産数から算出する派生値）
+MONITORED_METRICS = (
+    "vibration",
+    "temperature",
+    "current",
+    "cut_length_stddev",
+    "defect_rate",
+)
+
+# 設備IDの列がないデータは単一の包装機として扱う
+DEFAULT_MACHINE_ID = "packaging_machine"
+
+# 清掃要否予測の特徴量に使うzスコアの上限
+_ZSCORE_CLIP = 5.0
+
+
+def _to_float(value) -> Optional[float]:
+    """CSVの値をfloatに変換（空欄や変換できない値はNone）"""
+    if value is None:
+        return None
+    try:
+        text = str(value).strip()
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+
+class RollingStatistics:
+    """EWMAと固定長窓の移動平均・標準偏差を1サンプルあたりO(1)で更新するクラス"""
+
+    __slots__ = ("alpha", "window", "_values", "_sum", "_sum_sq", "ewma", "ewm_var")
+
+    def __init__(self, window: int = 20, alpha: float = 0.2):
+        """
+        初期化
+
+        Args:
+            window (int): 移動窓のサンプル数
+            alpha (float): EWMAの平滑化係数（0 < alpha <= 1）
+        """
+        self.window = window
+        self.alpha = alpha
+        self._values: Deque[float] = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.ewma: Optional[float] = None
+        self.ewm_var = 0.0
+
+    @property
+    def count(self) -> int:
+        """移動窓内のサンプル数"""
+        return len(self._values)
+
+    @property
+    def mean(self) -> float:
+        """移動窓の平均"""
+        return self._sum / len(self._values) if self._values else 0.0
+
+    @property
+    def std(self) -> float:
+        """移動窓の標準偏差（母標準偏差）"""
+        n = len(self._values)
+        if n == 0:
+            return 0.0
+        mean = self._sum / n
+        return math.sqrt(max(self._sum_sq / n - mean * mean, 0.0))
+
+    def zscore(self, value: float) -> Optional[float]:
+        """現在の移動窓に対する値のzスコア（サンプル不足の場合はNone）"""
+        if len(self._values) < 2:
+            return None
+        mean = self.mean
+        # 定数列でもゼロ除算にならないよう、平均の1%を標準偏差の下限とする
+        std = max(self.std, abs(mean) * 0.01, 1e-9)
+        return (value - mean) / std
+
+    def update(self, value: float) -> Optional[float]:
+        """
+        値を取り込み、取り込み前の統計に対するzスコアを返す
+
+        Args:
+            value (float): 新しいサンプル
+
+        Returns:
+            Optional[float]: 取り込み前の移動窓に対するzスコア
+        """
+        z = self.zscore(value)
+
+        self._values.append(value)
+        self._sum += value
+        self._sum_sq += value * value
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            self.ewma += self.alpha * diff
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + self.alpha * diff * diff)
+        return z
+
+
+class OnlineLogisticRegression:
+    """SGDで逐次学習するロジスティック回帰（特徴量数が固定のため1サンプルO(1)）"""
+
+    def __init__(self, n_features: int, learning_rate: float = 0.1, l2: float = 1e-4):
+        self.weights = [0.0] * n_features
+        self.bias = 0.0
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.n_updates = 0
+
+    def predict_proba(self, features: List[float]) -> float:
+        """正例（清掃が必要）の確率を返す"""
+        score = self.bias + sum(w * x for w, x in zip(self.weights, features))
+        score = max(min(score, 30.0), -30.0)
+        return 1.0 / (1.0 + math.exp(-score))
+
+    def update(self, features: List[float], label: int) -> None:
+        """1サンプル分の勾配で重みを更新"""
+        error = self.predict_proba(features) - label
+        for i, x in enumerate(features):
+            self.weights[i] -= self.learning_rate * (error * x + self.l2 * self.weights[i])
+        self.bias -= self.learning_rate * error
+        self.n_updates += 1
+
+
+class _MachineState:
+    """設備単位の移動統計と清掃要否モデル"""
+
+    def __init__(self, machine_id: str, window: int, alpha: float, learning_rate: float):
+        self.machine_id = machine_id
+        self.metrics = {m: RollingStatistics(window, alpha) for m in MONITORED_METRICS}
+        self.alarms = RollingStatistics(window, alpha)
+        self.cleaning_model = OnlineLogisticRegression(
+            len(MONITORED_METRICS), learning_rate=learning_rate
+        )
+        self.samples = 0
+        self.anomaly_count = 0
+        self.alarm_rate_flagged = False
+        self.last_timestamp: Optional[str] = None
+        self.last_lot_id: Optional[str] = None
+        self.cleaning_probability: Optional[float] = None
+
+
+class _LotState:
+    """ロット単位の集計値と直近の判定結果"""
+
+    def __init__(self, lot_id: str, machine_id: str):
+        self.lot_id = lot_id
+        self.machine_id = machine_id
+        self.samples = 0
+        self.alarm_count = 0
+        self.good_count = 0.0
+        self.defective_count = 0.0
+        self.anomaly_count = 0
+        self.first_timestamp: Optional[str] = None
+        self.last_timestamp: Optional[str] = None
+        self.last_values: Dict[str, Optional[float]] = {}
+        self.last_zscores: Dict[str, Optional[float]] = {}
+        self.cleaning_probability: Optional[float] = None
+        self.max_cleaning_probability = 0.0
+        self.needs_cleaning_observed: Optional[int] = None
+        self.cleaning_flagged = False
+
+
+class PackagingMachineAnomalyDetector:
+    """包装機テレメトリのオンライン異常検知クラス"""
+
+    def __init__(
+        self,
+        window: int = 20,
+        alpha: float = 0.2,
+        z_threshold: float = 2.5,
+        min_samples: int = 5,
+        alarm_rate_threshold: float = 0.5,
+        cleaning_threshold: float = 0.5,
+        learning_rate: float = 0.1,
+        max_events: int = 200,
+    ):
+        """
+        初期化
+
+        Args:
+            window (int): 移動窓のサンプル数
+            alpha (float): EWMAの平滑化係数
+            z_threshold (float): 異常と判定するzスコアの絶対値
+            min_samples (int): 判定を開始するまでに必要なサンプル数
+            alarm_rate_threshold (float): 異常と判定する移動窓内のアラーム発生率
+            cleaning_threshold (float): 清掃が必要と予測する確率のしきい値
+            learning_rate (float): 清掃要否モデルの学習率
+            max_events (int): 保持する直近の異常イベント数
+        """
+        self.window = window
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.alarm_rate_threshold = alarm_rate_threshold
+        self.cleaning_threshold = cleaning_threshold
+        self.learning_rate = learning_rate
+        self._machines: Dict[str, _MachineState] = {}
+        self._lots: Dict[str, _LotState] = {}
+        self._events: Deque[Dict] = deque(maxlen=max_events)
+        self.total_samples = 0
+
+    def ingest(self, row: Dict[str, str]) -> List[Dict]:
+        """
+        1行分のテレメトリを取り込み、検知した異常イベントを返す
+
+        Args:
+            row (Dict[str, str]): CSVの1行（列名→値）
+
+        Returns:
+            List[Dict]: この行で検知した異常イベントのリスト
+        """
+        machine_id = (row.get("machine_id") or "").strip() or DEFAULT_MACHINE_ID
+        lot_id = (row.get("lot_id") or "").strip() or "unknown"
+        timestamp = (row.get("timestamp") or "").strip() or None
+
+        machine = self._machines.get(machine_id)
+        if machine is None:
+            machine = _MachineState(
+                machine_id, self.window, self.alpha, self.learning_rate
+            )
+            self._machines[machine_id] = machine
+        lot = self._lots.get(lot_id)
+        if lot is None:
+            lot = _LotState(lot_id, machine_id)
+            lot.first_timestamp = timestamp
+            self._lots[lot_id] = lot
+
+        values = {m: _to_float(row.get(m)) for m in MONITORED_METRICS}
+        good = _to_float(row.get("good_count")) or 0.0
+        defective = _to_float(row.get("defective_count")) or 0.0
+        if good + defective > 0:
+            values["defect_rate"] = defective / (good + defective)
+
+        # 設備のベースラインに対するzスコア（取り込み前の統計で評価）
+        zscores: Dict[str, Optional[float]] = {}
+        for metric, value in values.items():
+            if value is None:
+                zscores[metric] = None
+                continue
+            stats = machine.metrics[metric]
+            enough = stats.count >= self.min_samples
+            z = stats.update(value)
+            zscores[metric] = z if enough else None
+
+        alarm_code = (row.get("alarm_code") or "").strip()
+        alarm = 1.0 if alarm_code else 0.0
+        machine.alarms.update(alarm)
+
+        # 清掃要否: 予測してから実績ラベルで学習する（prequential評価）
+        features = [
+            max(min(zscores[m] or 0.0, _ZSCORE_CLIP), -_ZSCORE_CLIP)
+            for m in MONITORED_METRICS
+        ]
+        probability = machine.cleaning_model.predict_proba(features)
+        label = _to_float(row.get("needs_cleaning"))
+        model_ready = machine.cleaning_model.n_updates >= self.min_samples
+        if label is not None:
+            machine.cleaning_model.update(features, int(label))
+            lot.needs_cleaning_observed = int(label)
+
+        events: List[Dict] = []
+        base_event = {"timestamp": timestamp, "machine_id": machine_id, "lot_id": lot_id}
+        for metric, z in zscores.items():
+            if z is not None and abs(z) >= self.z_threshold:
+                events.append(
+                    {
+                        **base_event,
+                        "type": "metric_outlier",
+                        "metric": metric,
+                        "value": values[metric],
+                        "zscore": round(z, 2),
+                    }
+                )
+
+        alarm_rate = machine.alarms.mean
+        if machine.alarms.count >= self.min_samples:
+            if alarm_rate >= self.alarm_rate_threshold and not machine.alarm_rate_flagged:
+                events.append(
+                    {
+                        **base_event,
+                        "type": "alarm_rate",
+                        "metric": "alarm_rate",
+                        "value": round(alarm_rate, 3),
+                        "zscore": None,
+                    }
+                )
+            # 発生率が下がるまで同じアラーム率イベントを繰り返さない
+            machine.alarm_rate_flagged = alarm_rate >= self.alarm_rate_threshold
+
+        # 清掃予測イベントはロットごとに最初の1回だけ発行する
+        if (
+            model_ready
+            and probability >= self.cleaning_threshold
+            and not lot.cleaning_flagged
+        ):
+            lot.cleaning_flagged = True
+            events.append(
+                {
+                    **base_event,
+                    "type": "cleaning_predicted",
+                    "metric": "needs_cleaning",
+                    "value": round(probability, 3),
+                    "zscore": None,
+                }
+            )
+
+        machine.samples += 1
+        machine.anomaly_count += len(events)
+        machine.last_timestamp = timestamp
+        machine.last_lot_id = lot_id
+        machine.cleaning_probability = probability if model_ready else None
+
+        lot.samples += 1
+        lot.alarm_count += int(alarm)
+        lot.good_count += good
+        lot.defective_count += defective
+        lot.anomaly_count += len(events)
+        lot.last_timestamp = timestamp
+        lot.last_values = values
+        lot.last_zscores = zscores
+        if model_ready:
+            lot.cleaning_probability = probability
+            lot.max_cleaning_probability = max(lot.max_cleaning_probability, probability)
+
+        self.total_samples += 1
+        self._events.extend(events)
+        return events
+
+    def ingest_many(self, rows: Iterable[Dict[str, str]]) -> int:
+        """複数行を順に取り込み、検知した異常イベント数を返す"""
+        return sum(len(self.ingest(row)) for row in rows)
+
+    def get_machine_states(self) -> List[Dict]:
+        """設備別の現在状態を返す"""
+        states = []
+        for machine in self._machines.values():
+            state = {
+                "machine_id": machine.machine_id,
+                "samples": machine.samples,
+                "last_timestamp": machine.last_timestamp,
+                "last_lot_id": machine.last_lot_id,
+                "anomaly_count": machine.anomaly_count,
+                "alarm_rate_window": round(machine.alarms.mean, 3),
+                "alarm_rate_ewma": round(machine.alarms.ewma or 0.0, 3),
+                "cleaning_probability": _round_or_none(machine.cleaning_probability),
+                "cleaning_predicted": _is_flagged(
+                    machine.cleaning_probability, self.cleaning_threshold
+                ),
+            }
+            for metric, stats in machine.metrics.items():
+                state[f"{metric}_ewma"] = _round_or_none(stats.ewma, 4)
+                state[f"{metric}_std"] = round(stats.std, 4)
+            states.append(state)
+        return states
+
+    def get_lot_states(self, lot_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        ロット別の現在状態を返す
+
+        Args:
+            lot_ids (Optional[List[str]]): 対象ロット（指定しない場合は全ロット）
+
+        Returns:
+            List[Dict]: ロットごとの状態
+        """
+        targets = lot_ids if lot_ids else list(self._lots.keys())
+        states = []
+        for lot_id in targets:
+            lot = self._lots.get(lot_id)
+            if lot is None:
+                continue
+            total = lot.good_count + lot.defective_count
+            state = {
+                "lot_id": lot.lot_id,
+                "machine_id": lot.machine_id,
+                "samples": lot.samples,
+                "first_timestamp": lot.first_timestamp,
+                "last_timestamp": lot.last_timestamp,
+                "defect_rate": round(lot.defective_count / total, 4) if total else None,
+                "alarm_rate": round(lot.alarm_count / lot.samples, 3),
+                "anomaly_count": lot.anomaly_count,
+                "cleaning_probability": _round_or_none(lot.cleaning_probability),
+                "cleaning_predicted": _is_flagged(
+                    lot.cleaning_probability, self.cleaning_threshold
+                ),
+                "needs_cleaning_observed": lot.needs_cleaning_observed,
+            }
+            for metric in MONITORED_METRICS:
+                state[f"{metric}_z"] = _round_or_none(lot.last_zscores.get(metric), 2)
+            states.append(state)
+        return states
+
+    def get_recent_anomalies(
+        self, limit: int = 20, lot_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """直近の異常イベントを新しい順に返す"""
+        events = [
+            e for e in reversed(self._events) if not lot_ids or e["lot_id"] in lot_ids
+        ]
+        return events[:limit]
+
+
+def _round_or_none(value: Optional[float], digits: int = 3) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+def _is_flagged(probability: Optional[float], threshold: float) -> bool:
+    return probability is not None and probability >= threshold
+
+
+class PackagingMachineMonitor:
+    """CSVファイルを追尾し、追記された行だけを異常検知器に流し込むクラス"""
+
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        detector: Optional[PackagingMachineAnomalyDetector] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            file_path (Optional[str]): テレメトリCSVのパス（省略時はsampledata/mes_packagingmachine.csv）
+            detector (Optional[PackagingMachineAnomalyDetector]): 使用する検知器
+        """
+        self.file_path = file_path or get_sampledata_path("mes_packagingmachine.csv")
+        self.detector = detector or PackagingMachineAnomalyDetector()
+        self._detector_factory = (
+            None if detector is not None else PackagingMachineAnomalyDetector
+        )
+        self._offset = 0
+        self._header: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """
+        前回以降に追記された行を取り込む
+
+        Returns:
+            int: 取り込んだ行数（追記がなければ0）
+        """
+        with self._lock:
+            size = os.path.getsize(self.file_path)
+            if size < self._offset:
+                # ファイルが置き換えられた場合は最初から読み直す
+                self._reset()
+            if size == self._offset:
+                return 0
+
+            with open(self.file_path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(size - self._offset)
+
+            # 書き込み途中の最終行は次回に回す
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                return 0
+            chunk = chunk[: end + 1]
+            self._offset += len(chunk)
+
+            text = chunk.decode("utf-8-sig" if self._header is None else "utf-8")
+            reader = csv.reader(io.StringIO(text))
+            if self._header is None:
+                self._header = [c.strip() for c in next(reader, [])]
+            rows = [dict(zip(self._header, values)) for values in reader if values]
+            self.detector.ingest_many(rows)
+            return len(rows)
+
+    def _reset(self) -> None:
+        self._offset = 0
+        self._header = None
+        if self._detector_factory is not None:
+            self.detector = self._detector_factory()
+
+    def snapshot(
+        self, lot_ids: Optional[List[str]] = None, anomaly_limit: int = 20
+    ) -> Dict[str, List[Dict]]:
+        """
+        設備・ロットの現在状態と直近の異常イベントを取得
+
+        Args:
+            lot_ids (Optional[List[str]]): 対象ロット（指定しない場合は全ロット）
+            anomaly_limit (int): 返す異常イベントの最大件数
+
+        Returns:
+            Dict[str, List[Dict]]: machines / lots / anomalies の各状態
+        """
+        with self._lock:
+            return {
+                "machines": self.detector.get_machine_states(),
+                "lots": self.detector.get_lot_states(lot_ids),
+                "anomalies": self.detector.get_recent_anomalies(anomaly_limit, lot_ids),
+            }
+
+
+_monitor: Optional[PackagingMachineMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_packaging_machine_monitor() -> PackagingMachineMonitor:
+    """プロセス共通の包装機モニターを取得（初回のみ生成）"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = PackagingMachineMonitor()
+        return _monitor
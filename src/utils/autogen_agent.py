@@ -4,23 +4,38 @@ from autogen_agentchat.agents import (
 from autogen_agentchat.teams import SelectorGroupChat
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
 from autogen_core.models import ModelInfo
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+from autogen_core.tools import FunctionTool
 from dotenv import load_dotenv
 import logging
 import os
 import sys
 import asyncio
+import functools
+import threading
+from typing import Callable, Dict, Optional
 
 # ローカルモジュールのインポート
+from .agent_factory import AgentFactory, create_agent_factory
+from .agent_knowledge import lookup_knowledge
+from .execution_output import ExecutionOutputStream
+from .llm_clients import get_model_client, is_streaming_enabled
 from .tools import (
     search_duckduckgo,
+    search_web_multi,
     create_execute_tool,
+    create_session_work_dir,
+    create_upload_image_tool,
     load_erp_data,
     load_material_cost_breakdown,
     load_mes_total_data,
     load_mes_loss_data,
     load_daily_report,
-    upload_image_to_blob,
+    get_packaging_machine_status,
+    forecast_defect_trend,
+    simulate_variable_cost,
+    optimize_production_schedule,
+    sweep_production_schedule,
+    render_chart,
     timer,
 )
 
@@ -34,18 +49,55 @@ if sys.platform == "win32":
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# モデルの情報（全セッションで共通）
+MODEL_INFO = ModelInfo(
+    vision=False,
+    function_calling=True,
+    json_output=False,
+    family="unknown",
+    structured_output=True,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def shared_tool(func: Callable) -> FunctionTool:
+    """
+    関数からツールを作成（引数のスキーマの生成は関数ごとに1回だけ行い、全エージェントで共有）
+
+    AssistantAgentに関数をそのまま渡した場合と同じく、docstringをツールの説明にします。
+    """
+    return FunctionTool(func, description=func.__doc__ or "")
+
+
+# DataAnalystAgentへの生産スケジュール最適化ツールの使い方の指示
+SCHEDULE_SOLVER_INSTRUCTIONS = """**生産スケジュールの最適化:**
+ラインへの商品割り当て・生産順序・切替時間を含むスケジュール問題は、コードを書かずに optimize_production_schedule で解いてください。
+生産をやめる商品は product_hours に含めず、特定の商品の生産時間を最大化する場合は objective="maximize_product" と target_product を指定します。
+例: optimize_production_schedule(lines=["L1", "L2", "L3", "L4", "L5"], product_hours={"P1": 10, "P2": 10, "P3": 5}, changeover_hours=1, horizon_hours=24, objective="maximize_product", target_product="P1")
+ソルバー状態が OPTIMAL の場合は最適解であることを、FEASIBLE の場合は制限時間内の最良解であることを明記し、出力されたマークダウン表をそのまま提示してください。
+切替時間・生産をやめる商品・ライン追加など複数の条件を比較する場合は、sweep_production_schedule で全シナリオを一度に解き、比較表から最良のシナリオを選んでから optimize_production_schedule で詳細なスケジュールを作成してください。
+例: sweep_production_schedule(lines=["L1", "L2", "L3", "L4", "L5"], product_hours={"P1": 10, "P2": 10, "P19": 2, "P20": 2}, changeover_options=[0, 1, 2], drop_product_options=[[], ["P19", "P20"]], extra_line_options=[0, 1], objective="maximize_product", target_product="P1")
+
+"""
 
-def setup_multiagent_team():
-    """マルチエージェントチームのセットアップ"""
+
+def setup_multiagent_team(
+    output_stream: Optional[ExecutionOutputStream] = None,
+    user: Optional[str] = None,
+    schedule_solver: bool = True,
+):
+    """
+    マルチエージェントチームのセットアップ
+
+    Args:
+        output_stream (Optional[ExecutionOutputStream]): コード実行中の出力を画面に表示するための出力先
+        user (Optional[str]): コード実行の公平性の単位となるユーザー（省略時はログイン中のユーザー）
+        schedule_solver (bool): 生産スケジュールの最適化ツールとその指示を含めるか
+            （Falseの場合はスケジュール問題もコード生成で解く。ソルバーとの比較用）
+    """
     try:
         # LLM設定（Azure OpenAI）
-        model_info = ModelInfo(
-            vision=False,
-            function_calling=True,
-            json_output=False,
-            family="unknown",
-            structured_output=True,
-        )
+        model_info = MODEL_INFO
         logger.info(
             f"""Azure OpenAIモデル情報: {model_info} AZURE_AI_AGENT_ENDPOINT=
                     {os.environ.get('AZURE_AI_AGENT_ENDPOINT')}  AZURE_API_KEY=
@@ -54,25 +106,32 @@ def setup_multiagent_team():
                     {os.environ.get('AZURE_API_VERSION')}"""
         )
 
-        model_client = AzureOpenAIChatCompletionClient(
+        # プロセス共通のクライアント（HTTPの接続プールを全セッションで共有）
+        model_client = get_model_client(
             azure_endpoint=os.environ.get("AZURE_AI_AGENT_ENDPOINT"),
             api_key=os.environ.get("AZURE_API_KEY"),
-            model=os.environ.get("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME"),
+            deployment=os.environ.get("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME"),
             api_version=os.environ.get("AZURE_API_VERSION"),
             model_info=model_info,
         )
 
+        schedule_solver_role = (
+            " It solves production scheduling problems (line assignment, sequencing, changeovers) with the optimize_production_schedule constraint-solver tool, and compares many what-if variants at once with sweep_production_schedule."
+            if schedule_solver
+            else ""
+        )
+
         # Reasoner（推論担当）エージェント
         planning_agent = AssistantAgent(
             name="PlanningAgent",
             description="タスクの計画と管理と結果の検証を行うエージェント",
             model_client=model_client,
-            system_message="""
+            system_message=f"""
     You are a planning agent.
 Your job is to break down complex tasks into smaller, manageable subtasks and delegate them to team members. You do not execute tasks or verify results yourself during the planning phase.
 Your team members are:
     WebSearchAgent: Specializes in information retrieval from the web.
-    DataAnalystAgent: Parses instructions, converts them into mathematical or statistical formulas and Python/SQL code, executes data analysis, and delivers efficient, accurate results.
+    DataAnalystAgent: Parses instructions, converts them into mathematical or statistical formulas and Python/SQL code, executes data analysis, and delivers efficient, accurate results. It renders standard line/bar/pareto charts of the sample datasets in one call with render_chart. It forecasts the defect rate and loss breakdown of a SKU with the forecast_defect_trend tool, which reuses a trained model instead of writing training code.{schedule_solver_role}
 
 **Planning Phase Instructions**:
 1. Analyze the task and break it into clear, actionable subtasks.
@@ -117,15 +176,19 @@ Your team members are:
         web_search_agent = AssistantAgent(
             "WebSearchAgent",
             description="ウェブ検索を行うエージェント",
-            tools=[search_duckduckgo],
+            tools=[shared_tool(search_web_multi), shared_tool(search_duckduckgo)],
             model_client=model_client,
             system_message="""あなたはウェブ検索エージェントです。
-search_duckduckgoツールを使用して情報を検索します。
-一度に1回の検索を行い、結果に基づいた計算は行いません。
+調べる観点が複数ある場合は、search_web_multiツールで必要なクエリをまとめて1回で検索します。
+例: search_web_multi(queries=["包装機 フィルムロス 原因", "包装機 シール不良 対策"])
+1つのクエリだけを調べる場合はsearch_duckduckgoツールを使用します。
+結果に基づいた計算は行いません。
 必ず日本語で回答してください。""",
         )
 
-        execute_tool = create_execute_tool()
+        # コードの実行と画像のアップロードは同じセッションの作業ディレクトリで行う
+        work_dir = create_session_work_dir()
+        execute_tool = create_execute_tool(output_stream, user, work_dir)
 
         data_analyst_agent = AssistantAgent(
             name="DataAnalystAgent",
@@ -133,91 +196,37 @@ search_duckduckgoツールを使用して情報を検索します。
             description="データ分析を行うエージェント",
             system_message="""あなたはデータ分析エージェントです。
 
-**グラフ作成の完全手順:**
+"""
+            + (SCHEDULE_SOLVER_INSTRUCTIONS if schedule_solver else "")
+            + """**不良率・ロス内訳の予測（forecast_defect_trend）:**
+SKUの将来の不良率とロス内訳の予測は、学習コードを書かずに forecast_defect_trend を呼んでください。SKUごとの学習済みモデルを再利用するため、すぐに結果が返ります。
+例: forecast_defect_trend(sku="SKU-1234", horizon_days=30)
+
+**定型グラフ（render_chart）:**
+サンプルデータ（erp, erp_material, mes_total, mes_loss）の折れ線・棒・積み上げ棒・パレート図は、コードを書かずに render_chart を1回呼ぶだけで作成・アップロードできます。
+例: render_chart(dataset="mes_total", chart_type="line", y=["不良率(%)"], group_by="SKU", year_months=["2024-06", "2024-07"])
+例: render_chart(dataset="mes_loss", chart_type="pareto", y=["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"], skus=["SKU-1234"])
+
+**グラフ作成の完全手順（render_chartで描けない場合）:**
 1. データ取得ツール実行
 2. execute_toolでグラフ作成・保存
 3. upload_image_to_blobでアップロード
 4. 最終結果報告
 
+execute_toolは同じ分析の中で変数とimport済みのモジュールを保持します。前の実行で作成したDataFrameなどはそのまま再利用してください。
+
+**実行環境（execute_tool）:**
+日本語フォント・Aggバックエンド・rcParams（axes.unicode_minus=False）は設定済みです。フォントを検索・設定するコードは書かないでください。
+次の変数はimportせずに使えます: pd, np, plt, StringIO, datetime, os, save_figure
+グラフは `file_path = save_figure(fig)` で保存してください（PNGで保存して図を閉じ、絶対パスを返します）。返されたパスを upload_image_to_blob に渡します。
 
-**クロスプラットフォーム対応グラフ作成テンプレート:**
 ```python
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import pandas as pd
-import glob
-import os
-from pathlib import Path
-from datetime import datetime
-from io import StringIO
-
-# カスタムフォント設定（Azure App Service含む）
-search_patterns = [
-    "./assets/fonts/ipaexg.ttf",
-    "../assets/fonts/ipaexg.ttf",
-    "../../assets/fonts/ipaexg.ttf",
-    "/home/site/wwwroot/assets/fonts/ipaexg.ttf",  # Azure App Service
-]
-
-font_found = False
-# Linux/Unix環境のみワイルドカード検索を追加
-if os.name == 'posix':  # Linux/Unix (Azure App Service含む)
-    search_patterns.extend([
-        "/tmp/*/assets/fonts/ipaexg.ttf",  # Azure App Service環境
-        "/home/*/projects/*/assets/fonts/ipaexg.ttf",
-        "/opt/*/assets/fonts/ipaexg.ttf"
-    ])
-
-# フォント検索（Linux/Unix環境）
-if os.name == 'posix':
-    for pattern in search_patterns:
-        if "*" in pattern:
-            font_paths = glob.glob(pattern, recursive=True)
-            if font_paths:
-                font_path = font_paths[0]
-                fm.fontManager.addfont(font_path)
-                font_prop = fm.FontProperties(fname=font_path)
-                plt.rcParams["font.family"] = font_prop.get_name()
-                print(f"✅ 使用フォント: {font_prop.get_name()}: {font_path}")
-                font_found = True
-                break
-        else:
-            if Path(pattern).exists():
-                fm.fontManager.addfont(pattern)
-                font_prop = fm.FontProperties(fname=pattern)
-                plt.rcParams["font.family"] = font_prop.get_name()
-                print(f"✅ 使用フォント: {font_prop.get_name()}: {pattern}")
-                font_found = True
-                break
-
-# Windows環境ではシステムフォントを使用
-if os.name == 'nt':  # Windows
-    plt.rcParams["font.family"] = ["Yu Gothic", "Meiryo", "MS Gothic", "sans-serif"]
-    print("✅ Windowsシステムフォントを使用します")
-    font_found = True
-
-if not font_found:
-    print("⚠️ カスタムフォントが見つかりません。デフォルトフォントを使用します。")
-
-plt.rcParams["axes.unicode_minus"] = False
-
-# データ処理とグラフ作成
-# [ここにデータ処理コード]
-
-# ファイル保存（クロスプラットフォーム対応）
-timestamp = datetime.now().strftime("%Y_%m_%d_%H%M%S")
-if os.name == 'nt':  # Windows
-    work_dir = os.path.abspath("work")
-    img_dir = os.path.join(work_dir, "img")
-    os.makedirs(img_dir, exist_ok=True)
-    file_path = os.path.join(img_dir, f"graph_{timestamp}.png")
-else:  # Linux/Unix (Azure App Service)
-    file_path = f"/tmp/graph_{timestamp}.png"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-plt.savefig(file_path, dpi=300, bbox_inches='tight')
-plt.close()
-print(f"✅ グラフを保存しました: {os.path.abspath(file_path)}")
+df = pd.read_csv(StringIO(data))
+df = df.drop(columns=[col for col in df.columns if col.startswith('Unnamed')])
+fig, ax = plt.subplots(figsize=(10, 6))
+df.plot(x="年月", y="変動費-材料費", ax=ax, marker="o")
+ax.set_title("月別材料費の推移")
+file_path = save_figure(fig)
 ```
 
 
@@ -228,75 +237,25 @@ print(f"✅ グラフを保存しました: {os.path.abspath(file_path)}")
   例: load_mes_loss_data(year_months=["2025-01"], skus=["SKU-1234"])
 
 **エラー回避のためのベストプラクティス:**
-1. クロスプラットフォーム対応パス処理: Windows用とLinux用で分岐
-2. フォント設定: Windows=システムフォント、Linux=IPAフォント検索
-3. ファイル保存前にディレクトリ確認
-4. CSVデータは必ずStringIOで処理
-5. 数値データは適切な型変換を実行
-
-**完全なクロスプラットフォーム対応手順:**
-```python
-# 1. データ取得
-data = load_xxx_data(...)
-
-# 2. データ処理
-df = pd.read_csv(StringIO(data))
-df = df.drop(columns=[col for col in df.columns if col.startswith('Unnamed')])
-
-# 3. クロスプラットフォーム対応フォント設定
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import glob
-from pathlib import Path
-
-if os.name == 'posix':  # Linux/Unix (Azure App Service)
-    # カスタムフォント検索
-    search_patterns = [
-        "./assets/fonts/ipaexg.ttf",
-        "../assets/fonts/ipaexg.ttf",
-        "/home/site/wwwroot/assets/fonts/ipaexg.ttf",
-        "/tmp/*/assets/fonts/ipaexg.ttf"
-    ]
-    font_found = False
-    for pattern in search_patterns:
-        if "*" in pattern:
-            font_paths = glob.glob(pattern, recursive=True)
-            if font_paths:
-                fm.fontManager.addfont(font_paths[0])
-                font_prop = fm.FontProperties(fname=font_paths[0])
-                plt.rcParams["font.family"] = font_prop.get_name()
-                font_found = True
-                break
-        elif Path(pattern).exists():
-            fm.fontManager.addfont(pattern)
-            font_prop = fm.FontProperties(fname=pattern)
-            plt.rcParams["font.family"] = font_prop.get_name()
-            font_found = True
-            break
-    if not font_found:
-        print("⚠️ カスタムフォントが見つかりません")
-else:  # Windows
-    plt.rcParams["font.family"] = ["Yu Gothic", "Meiryo", "MS Gothic", "sans-serif"]
-
-plt.rcParams["axes.unicode_minus"] = False
-
-# 5. クロスプラットフォーム対応ファイル保存
-timestamp = datetime.now().strftime("%Y_%m_%d_%H%M%S")
-if os.name == 'nt':  # Windows
-    work_dir = os.path.abspath("work")
-    img_dir = os.path.join(work_dir, "img")
-    os.makedirs(img_dir, exist_ok=True)
-    file_path = os.path.join(img_dir, f"graph_{timestamp}.png")
-else:  # Linux/Unix (Azure App Service)
-    file_path = f"/tmp/graph_{timestamp}.png"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-plt.savefig(file_path, dpi=300, bbox_inches='tight')
-plt.close()
+1. CSVデータは必ずStringIOで処理
+2. 数値データは適切な型変換を実行
 
 
 必ず日本語で回答してください。""",
-            tools=[execute_tool, upload_image_to_blob],
+            tools=[
+                execute_tool,
+                create_upload_image_tool(work_dir),
+                shared_tool(render_chart),
+                shared_tool(forecast_defect_trend),
+            ]
+            + (
+                [
+                    shared_tool(optimize_production_schedule),
+                    shared_tool(sweep_production_schedule),
+                ]
+                if schedule_solver
+                else []
+            ),
             reflect_on_tool_use=False,  # 連続実行を可能にするため無効化
             max_tool_iterations=10,  # 複数ツールの連続実行を許可
         )
@@ -346,17 +305,19 @@ plt.close()
 
 
 @timer
-def setup_agent():
-    """エージェントのセットアップ"""
+def setup_agent(
+    output_stream: Optional[ExecutionOutputStream] = None, user: Optional[str] = None
+):
+    """
+    エージェントのセットアップ
+
+    Args:
+        output_stream (Optional[ExecutionOutputStream]): コード実行中の出力を画面に表示するための出力先
+        user (Optional[str]): コード実行の公平性の単位となるユーザー（省略時はログイン中のユーザー）
+    """
     try:
         # LLM設定（Azure OpenAI）
-        model_info = ModelInfo(
-            vision=False,
-            function_calling=True,
-            json_output=False,
-            family="unknown",
-            structured_output=True,
-        )
+        model_info = MODEL_INFO
         logger.info(
             f"""Azure OpenAIモデル情報: {model_info} AZURE_AI_AGENT_ENDPOINT=
                     {os.environ.get('AZURE_AI_AGENT_ENDPOINT')}  AZURE_API_KEY=
@@ -379,153 +340,62 @@ def setup_agent():
                 "環境変数が設定されていません: AZURE_AI_AGENT_ENDPOINT/API_KEY/MODEL_DEPLOYMENT_NAME を確認してください"
             )
             return None
-        # クライアント初期化
-        model_client = AzureOpenAIChatCompletionClient(
+        # クライアント初期化（プロセス共通のクライアントを再利用）
+        model_client = get_model_client(
             azure_endpoint=azure_endpoint,
             api_key=api_key,
-            model=model_deployment,
+            deployment=model_deployment,
             api_version=api_version,
             model_info=model_info,
         )
 
-        execute_tool = create_execute_tool()
+        # コードの実行と画像のアップロードは同じセッションの作業ディレクトリで行う
+        work_dir = create_session_work_dir()
+        execute_tool = create_execute_tool(output_stream, user, work_dir)
 
         data_analyst_agent = AssistantAgent(
             name="DataAnalystAgent",
             model_client=model_client,
             description="効率的にツールを実行するデータ分析AI",
+            # 手順・業務知識はagent_knowledgeに移し、必要なときだけ取得する（毎回送るのは要点のみ）
             system_message="""あなたは効率的にツールを実行するデータ分析AIです。
 ユーザーの要求を受け取ったら、確認を求めることなく即座にすべてを実行してください。
-
-**グラフ作成の場合:**
-1. データ取得ツール実行
-2. execute_toolでグラフ作成・保存
-3. upload_image_to_blobでアップロードし、実行結果から、画像の公開URLを取得します。
-4. 結果報告(応答メッセージに、取得した公開URLを `[image: 公開URL]` の形式で正確に記載してください)
-
 **重要:** 中間で応答を返さず、すべてのツールを連続実行してください。
 
+**グラフ作成:**
+費用・生産数・不良率・ロス内訳の折れ線・棒・積み上げ棒・パレート図は render_chart を1回呼ぶだけで作成・アップロードできます。
+それ以外のグラフは、データ取得ツール → execute_tool で作成して `file_path = save_figure(fig)` で保存 → upload_image_to_blob の順に実行します。
+いずれの場合も、応答メッセージに取得した公開URLを `[image: 公開URL]` の形式で正確に記載してください。
 
-**クロスプラットフォーム対応グラフ作成テンプレート:**
-```python
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import pandas as pd
-import glob
-import os
-from pathlib import Path
-from datetime import datetime
-from io import StringIO
-
-# クロスプラットフォーム対応フォント設定
-if os.name == 'posix':  # Linux/Unix (Azure App Service)
-    # カスタムフォント検索
-    search_patterns = [
-        "./assets/fonts/ipaexg.ttf",
-        "../assets/fonts/ipaexg.ttf",
-        "../../assets/fonts/ipaexg.ttf",
-        "/home/site/wwwroot/assets/fonts/ipaexg.ttf",
-        "/tmp/*/assets/fonts/ipaexg.ttf"
-    ]
-    font_found = False
-    for pattern in search_patterns:
-        if "*" in pattern:
-            font_paths = glob.glob(pattern, recursive=True)
-            if font_paths:
-                fm.fontManager.addfont(font_paths[0])
-                font_prop = fm.FontProperties(fname=font_paths[0])
-                plt.rcParams["font.family"] = font_prop.get_name()
-                print(f"✅ 使用フォント: {font_prop.get_name()}")
-                font_found = True
-                break
-        elif Path(pattern).exists():
-            fm.fontManager.addfont(pattern)
-            font_prop = fm.FontProperties(fname=pattern)
-            plt.rcParams["font.family"] = font_prop.get_name()
-            print(f"✅ 使用フォント: {font_prop.get_name()}")
-            font_found = True
-            break
-    if not font_found:
-        print("⚠️ カスタムフォントが見つかりません")
-else:  # Windows
-    plt.rcParams["font.family"] = ["Yu Gothic", "Meiryo", "MS Gothic", "sans-serif"]
-    print("✅ Windowsシステムフォントを使用します")
-
-plt.rcParams["axes.unicode_minus"] = False
-
-# データ処理
-# [ここにデータ処理コード]
-
-# クロスプラットフォーム対応ファイル保存
-file_uuid = uuid.uuid4()
-if os.name == 'nt':  # Windows
-    img_dir = "img"
-    os.makedirs(img_dir, exist_ok=True)
-    file_path = os.path.join(img_dir, f"graph_{file_uuid}.png")
-else:  # Linux/Unix (Azure App Service)
-    file_path = f"/tmp/graph_{file_uuid}.png"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-plt.savefig(file_path, dpi=300, bbox_inches='tight')
-plt.close()
-print(f"✅ グラフ保存: {os.path.abspath(file_path)}")
-
-```
-
-**利用可能なデータ取得ツール:**
-- `load_erp_data`: 変動費、固定費データの取得（年月リスト、SKUリスト指定）
-  例: load_erp_data(year_months=["2025-01", "2025-02"], skus=["SKU-1234"])
-- `load_material_cost_breakdown`: 変動費の内、材料費の内訳データの取得（年月リスト、SKUリスト指定）
-  例: load_material_cost_breakdown(year_months=["2025-01"], skus=["SKU-1234"])
-- `load_mes_total_data`: MES総生産データの取得（年月リスト、SKUリスト指定）
-  例: load_mes_total_data(year_months=["2025-01"], skus=["SKU-1234"])
-- `load_mes_loss_data`: MESロスデータの取得（年月リスト、SKUリスト指定）
-  例: load_mes_loss_data(year_months=["2025-01"], skus=["SKU-1234"])
-- `load_daily_report`: 日報データの取得（年月"YYYY-MM"形式、オプションキーワード）
-  例: load_daily_report(year_month="2025-01", keyword="品質")
-
-**エラー回避のポイント:**
-- クロスプラットフォーム対応: Windows/Linux両対応
-- フォント設定: 環境別に最適化
-- CSVデータはStringIOで処理
-- ファイル保存前にディレクトリ確認
-
-**変動費が上昇している理由を聞かれたら、以下の3点を基に答えてください。**
-- 材料原価の単価の上昇
-- 歩留まりの低下によるロス増加
-- メンテナンス頻度の増加による材料廃棄率の上昇
-
-**紙詰まりの原因を聞かれたら、以下の内容を基に答えてください。**
-- 搬送装置の排出部の動作不良
-
-**Lot5612のトラブル情報について聞かれたら、以下の内容を基に答えてください。**
-- 自動供給装置でLot5612を使用すると、Lot4899に比べて装置の動作不良の発生率が2倍になることが報告されています。
-- Lot5612を設備2号機で使用すると、設備1号機に比べて、動作不良の発生率が30％減少することが確認されています。
-
-**Lot5612のメンテナンス頻度が増えたかどうかについて聞かれたら、以下の内容を基に答えてください。**
-- Lot5612を使用したSKU-1234の製造ではメンテナンス頻度が月4回から7回に増加しています。
+**実行環境（execute_tool）:**
+同じ会話の中で変数とimport済みのモジュールを保持します。日本語フォントなどの設定は済んでいるため、フォントを設定するコードは書かないでください。
+pd, np, plt, StringIO, datetime, os, save_figure はimportせずに使えます。CSVデータはStringIOで読み込んでください。
 
-**変動費の増加について聞かれたら、以下の内容を基に答えてください。**
-- 変動費の増加を抑えるために、最も効果的な対策は、原材料をLot4899に戻すことです。
-- 変動費の増加を抑えるために、他に有効な方法は、設備1号機から設備2号機に変更することです。
-
-**Lot4899の使用の再開について聞かれたら、以下の内容を基に答えてください。**
-- 購買部に確認が必要です。
-
-**Lot5612を使用した生産で、設備２号機へ切替の対策を行った場合、設備1号機に比べて金額ベースで1.4%の改善効果が見込まれます。
+**詳しい手順と業務知識:**
+グラフ作成のコード例・ツールの使用例・業務知識（変動費、ロット、設備、トラブルなど）は lookup_knowledge で取得できます。
+ユーザーのメッセージに【参考情報】がある場合は、その内容を基に答えてください。
+価格変動・歩留まり変化・ライン切替などのシナリオを比較する場合は、simulate_variable_cost で変動費の分布を計算して回答してください。
 
 必ず日本語で回答してください。""",
             tools=[
                 execute_tool,
-                upload_image_to_blob,
-                load_erp_data,
-                load_material_cost_breakdown,
+                create_upload_image_tool(work_dir),
+                shared_tool(load_erp_data),
+                shared_tool(load_material_cost_breakdown),
                 # load_mes_total_data,
                 # load_mes_loss_data,
-                load_daily_report,
+                shared_tool(load_daily_report),
+                shared_tool(get_packaging_machine_status),
+                shared_tool(forecast_defect_trend),
+                shared_tool(simulate_variable_cost),
+                shared_tool(optimize_production_schedule),
+                shared_tool(render_chart),
+                shared_tool(lookup_knowledge),
             ],
             reflect_on_tool_use=False,  # 連続実行を可能にするため無効化
             max_tool_iterations=10,  # 複数ツールの連続実行を許可
+            # 生成中のテキストをトークン単位で受け取り、画面に逐次表示する
+            model_client_stream=is_streaming_enabled(),
         )
 
         return data_analyst_agent
@@ -533,3 +403,25 @@ print(f"✅ グラフ保存: {os.path.abspath(file_path)}")
     except Exception as e:
         logger.error(f"エージェントのセットアップ中にエラー: {str(e)}")
         return None
+
+
+_factories: Dict[str, AgentFactory] = {}
+_factories_lock = threading.Lock()
+
+
+def get_agent_factory() -> AgentFactory:
+    """分析ボット（setup_agent）のプロセス共通のファクトリを取得"""
+    return _get_factory("agent", setup_agent)
+
+
+def get_team_factory() -> AgentFactory:
+    """シミュレーションボット（setup_multiagent_team）のプロセス共通のファクトリを取得"""
+    return _get_factory("team", setup_multiagent_team)
+
+
+def _get_factory(name: str, builder: Callable) -> AgentFactory:
+    with _factories_lock:
+        factory = _factories.get(name)
+        if factory is None:
+            factory = _factories[name] = create_agent_factory(builder, name)
+        return factory
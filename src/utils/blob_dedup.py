@@ -0,0 +1,313 @@
+"""
+アップロードする画像の重複排除
+
+同じグラフを再度作成するたびに別名（uuid4-ファイル名）でアップロードすると、同じ内容のBLOBが
+増え続けます。このモジュールは画像の内容のハッシュをBLOB名にし、アップロード済みのハッシュを
+ローカルの索引に記録して、同じ内容の再アップロードを索引の参照だけで済ませます。
+
+- BlobIndex: アップロード済みのハッシュ・BLOB名・URLの索引（JSONファイル）
+- collect(): 保存済みのチャットから参照されなくなったBLOBを削除（参照数による整理）。
+  索引に登録したBLOBだけを対象とし、従来のuuid名のBLOBには触れません
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .blob_storage import MEMORY_CONNECTION_PREFIX, get_blob_client_pool
+from .database import DataManager
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data"
+)
+INDEX_FILE_NAME = "blob_index.json"
+
+# 内容のハッシュで名前を付けたBLOBの接頭辞
+CONTENT_BLOB_PREFIX = "sha256/"
+
+# 最後に使われてからこの時間が経過していないBLOBは、参照がなくても削除しない
+# （回答したがまだ保存されていないチャットから参照されている可能性があるため）
+DEFAULT_MIN_AGE_SECONDS = 7 * 24 * 3600
+DEFAULT_GC_INTERVAL_SECONDS = 3600
+
+
+def content_digest(file_path: str) -> str:
+    """ファイルの内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_blob_name(digest: str, file_path: str) -> str:
+    """内容のハッシュと拡張子からBLOB名を作成"""
+    return f"{CONTENT_BLOB_PREFIX}{digest}{os.path.splitext(file_path)[1].lower()}"
+
+
+def storage_key(connect_str: str, container: str) -> str:
+    """索引のキー（接続文字列は秘密情報を含むためハッシュにする）"""
+    return f"{hashlib.sha256(connect_str.encode()).hexdigest()[:16]}/{container}"
+
+
+def count_references(urls: List[str], chat_history: List[Dict]) -> Dict[str, int]:
+    """
+    保存済みのチャットの中で各URLが参照されている回数を数える
+
+    Args:
+        urls (List[str]): 数えるURL
+        chat_history (List[Dict]): DataManager.load_chat_history()の結果
+
+    Returns:
+        Dict[str, int]: URLごとの参照数
+    """
+    texts = []
+    for session in chat_history:
+        for message in session.get("messages") or []:
+            content = message.get("content")
+            if isinstance(content, str):
+                texts.append(content)
+    text = "\n".join(texts)
+    return {url: text.count(url) for url in urls}
+
+
+class BlobIndex:
+    """アップロード済みの画像のハッシュとBLOBの対応を保持するスレッドセーフな索引"""
+
+    def __init__(self, path: Optional[str]):
+        """
+        初期化
+
+        Args:
+            path (Optional[str]): 索引を保存するJSONファイルのパス（Noneの場合はメモリ上のみ）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict]] = self._load()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"BLOBの索引を読み込めないため空の索引で開始します: {e}")
+            return {}
+
+    def _save(self) -> None:
+        """索引をファイルに保存（書き込み途中で壊れないよう一時ファイルから置き換える）"""
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, key: str, digest: str) -> Optional[Dict]:
+        """
+        アップロード済みのBLOBを探し、見つかった場合は最終利用時刻を更新
+
+        Args:
+            key (str): storage_key()の結果
+            digest (str): 画像の内容のハッシュ
+
+        Returns:
+            Optional[Dict]: blob_name, url, bytes, thumbnail_blob_name, uploaded_at, last_used
+        """
+        with self._lock:
+            entry = self._entries.get(key, {}).get(digest)
+            if entry is None:
+                metrics.increment("blob.dedup_misses")
+                return None
+            entry["last_used"] = time.time()
+            self._save()
+        metrics.increment("blob.dedup_hits")
+        metrics.increment("blob.dedup_bytes_saved", entry.get("bytes", 0))
+        return dict(entry)
+
+    def record(
+        self,
+        key: str,
+        digest: str,
+        blob_name: str,
+        url: str,
+        size: int,
+        thumbnail_blob_name: Optional[str] = None,
+    ) -> None:
+        """アップロードが完了したBLOBを登録"""
+        now = time.time()
+        with self._lock:
+            self._entries.setdefault(key, {})[digest] = {
+                "blob_name": blob_name,
+                "url": url,
+                "bytes": size,
+                "thumbnail_blob_name": thumbnail_blob_name,
+                "uploaded_at": now,
+                "last_used": now,
+            }
+            self._save()
+            metrics.set_gauge("blob.indexed", sum(len(e) for e in self._entries.values()))
+
+    def entries(self, key: str) -> Dict[str, Dict]:
+        """登録済みのBLOBの一覧（ハッシュ: 情報）"""
+        with self._lock:
+            return {digest: dict(entry) for digest, entry in self._entries.get(key, {}).items()}
+
+    def collect(
+        self,
+        key: str,
+        container_client,
+        chat_history: List[Dict],
+        min_age_seconds: float = DEFAULT_MIN_AGE_SECONDS,
+    ) -> Dict:
+        """
+        保存済みのチャットから参照されていないBLOBを削除し、索引からも取り除く
+
+        Args:
+            key (str): storage_key()の結果
+            container_client: delete_blobを持つContainerClient
+            chat_history (List[Dict]): 保存済みのチャット
+            min_age_seconds (float): 最後に使われてからこの時間が経過したBLOBだけを削除
+
+        Returns:
+            Dict: referenced（参照されているBLOB数）, deleted, bytes_reclaimed
+        """
+        now = time.time()
+        entries = self.entries(key)
+        references = count_references([e["url"] for e in entries.values()], chat_history)
+        stats = {"referenced": 0, "deleted": 0, "bytes_reclaimed": 0}
+        for digest, entry in entries.items():
+            if references.get(entry["url"], 0) > 0:
+                stats["referenced"] += 1
+                continue
+            if now - entry.get("last_used", 0) < min_age_seconds:
+                continue
+            with self._lock:
+                # 索引から先に取り除く（確認してから削除するまでの間に再利用されないようにする）
+                current = self._entries.get(key, {}).get(digest)
+                if current is None or current.get("last_used") != entry.get("last_used"):
+                    continue
+                del self._entries[key][digest]
+                self._save()
+            try:
+                for blob_name in (entry["blob_name"], entry.get("thumbnail_blob_name")):
+                    if blob_name:
+                        _delete_blob(container_client, blob_name)
+            except Exception as e:
+                logger.warning(f"参照されていないBLOBを削除できませんでした {entry['blob_name']}: {e}")
+                with self._lock:
+                    self._entries.setdefault(key, {}).setdefault(digest, current)
+                    self._save()
+                continue
+            stats["deleted"] += 1
+            stats["bytes_reclaimed"] += entry.get("bytes", 0)
+
+        metrics.increment("blob.gc_runs")
+        metrics.increment("blob.gc_deleted", stats["deleted"])
+        metrics.increment("blob.gc_bytes_reclaimed", stats["bytes_reclaimed"])
+        if stats["deleted"]:
+            logger.info(
+                f"参照されていないBLOBを{stats['deleted']}件削除しました"
+                f"（{stats['bytes_reclaimed'] / 1024:.0f}KB）"
+            )
+        return stats
+
+    def _gc_loop(self, interval_seconds: float, job: Callable[[], None]) -> None:
+        while not self._stop_event.wait(interval_seconds):
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"BLOBの整理に失敗しました: {e}")
+
+    def start_background_cleanup(self, interval_seconds: float, job: Callable[[], None]) -> None:
+        """一定間隔でjob（collectを呼ぶ関数）を実行するバックグラウンドスレッドを開始（開始済みの場合は何もしない）"""
+        with self._lock:
+            if self._gc_thread is not None and self._gc_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._gc_thread = threading.Thread(
+                target=self._gc_loop, args=(interval_seconds, job), daemon=True
+            )
+            self._gc_thread.start()
+
+    def stop_background_cleanup(self) -> None:
+        """バックグラウンドの整理を停止"""
+        self._stop_event.set()
+
+
+def _delete_blob(container_client, blob_name: str) -> None:
+    """BLOBを削除（既に存在しない場合は何もしない）"""
+    try:
+        container_client.delete_blob(blob_name)
+    except Exception as e:
+        if type(e).__name__ in ("ResourceNotFoundError", "FileNotFoundError"):
+            return
+        raise
+
+
+_index: Optional[BlobIndex] = None
+_memory_index: Optional[BlobIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_blob_index(persistent: bool = True) -> BlobIndex:
+    """
+    プロセス共通のBLOBの索引を取得（初回のみ生成）
+
+    索引のファイルは環境変数BLOB_INDEX_PATH（既定はdata/blob_index.json）で指定します。
+
+    Args:
+        persistent (bool): Falseの場合はファイルに保存しない索引を返す
+            （メモリ上の保存先など、再起動すると消えるBLOB用）
+    """
+    global _index, _memory_index
+    with _index_lock:
+        if not persistent:
+            if _memory_index is None:
+                _memory_index = BlobIndex(None)
+            return _memory_index
+        if _index is None:
+            _index = BlobIndex(
+                os.getenv("BLOB_INDEX_PATH") or os.path.join(DATA_DIR, INDEX_FILE_NAME)
+            )
+        return _index
+
+
+def start_blob_cleanup(connect_str: str, container: str) -> None:
+    """
+    保存済みのチャットから参照されなくなったBLOBの定期的な整理を開始（開始済みの場合は何もしない）
+
+    間隔は環境変数BLOB_GC_INTERVAL_SECONDS（既定3600、0で無効）、
+    削除までの猶予はBLOB_GC_MIN_AGE_HOURS（既定168）で指定します。
+    """
+    interval_seconds = float(
+        os.getenv("BLOB_GC_INTERVAL_SECONDS", str(DEFAULT_GC_INTERVAL_SECONDS))
+    )
+    if interval_seconds <= 0:
+        return
+    min_age_seconds = float(
+        os.getenv("BLOB_GC_MIN_AGE_HOURS", str(DEFAULT_MIN_AGE_SECONDS / 3600))
+    ) * 3600
+    index = get_blob_index(persistent=not connect_str.startswith(MEMORY_CONNECTION_PREFIX))
+    key = storage_key(connect_str, container)
+
+    def job():
+        client, _ = get_blob_client_pool().get_container_client(connect_str, container)
+        history = DataManager(DATA_DIR).load_chat_history()
+        index.collect(key, client, history, min_age_seconds)
+
+    index.start_background_cleanup(interval_seconds, job)
@@ -0,0 +1,595 @@
+"""
+Azure Blob Storageクライアントの共有
+
+アップロードのたびにBlobServiceClient.from_connection_stringを呼ぶと、接続文字列の解析と
+HTTPS接続（TLSハンドシェイク）を毎回やり直すことになります。このモジュールは接続文字列と
+コンテナの組ごとにクライアントを1つだけ作成し、プロセス内の全セッション（スレッド）で共有します。
+
+- BlobClientPool: コンテナクライアントをキャッシュし、keep-aliveの接続プールを使い回してアップロード
+- BackgroundUploader: URLを先に確定させて即座に返し、バックグラウンドでリトライしながらアップロード。
+  完了するまでは画面にローカルのファイルを表示できるようにします
+
+保存先は環境変数ARTIFACT_STORAGEで切り替えられます（get_storage_settingsを参照）。どの保存先も
+同じContainerClientのインターフェースを持つため、BLOB名・重複排除・最適化の扱いは共通です。
+
+- azure（既定）: Azure Blob Storage
+- local: ローカルディスク（LocalContainerClient）。既定ではsrc/static/artifactsに保存し、
+  Streamlitの静的ファイル配信（/app/static/artifacts/...）で配信します。ネットワークのない環境での
+  負荷試験・プロファイリング用
+- memory: プロセス内のメモリ（InMemoryContainerClient）。テスト用
+
+アップロードごとに、クライアントの取得（接続）にかかった時間と転送にかかった時間を分けて記録します。
+大きなファイルはブロックに分割して並列にアップロードします。
+"""
+
+import collections
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# この接頭辞で始まる接続文字列はローカルディスクの代替実装を使う（例: "local:/tmp/blob"）
+LOCAL_CONNECTION_PREFIX = "local:"
+# この接頭辞で始まる接続文字列はメモリ上の代替実装を使う
+MEMORY_CONNECTION_PREFIX = "memory:"
+
+STORAGE_BACKENDS = ("azure", "local", "memory")
+DEFAULT_CONTAINER = "artifacts"
+
+# Streamlitの静的ファイル配信（server.enableStaticServing）で配信されるディレクトリとそのURL
+STATIC_ARTIFACT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "artifacts"
+)
+STATIC_ARTIFACT_ROUTE = "/app/static/artifacts"
+
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_CONNECTION_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+# このサイズを超えるファイルはブロックに分割し、並列にアップロードする
+BLOCK_UPLOAD_THRESHOLD = 4 * 1024 * 1024
+BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+
+# バックグラウンドアップロードの状態
+UPLOAD_PENDING = "pending"
+UPLOAD_DONE = "uploaded"
+UPLOAD_FAILED = "failed"
+
+# 状態を保持するアップロードの件数（古い完了済みのものから破棄）
+MAX_TRACKED_UPLOADS = 1000
+
+
+class LocalBlobClient:
+    """ローカルディスクに保存するBlobClientの代替実装"""
+
+    def __init__(self, path: Path, url: str):
+        self._path = path
+        self.url = url
+
+    def upload_blob(self, data, overwrite: bool = False, **kwargs) -> None:
+        if self._path.exists() and not overwrite:
+            raise FileExistsError(f"BLOBが既に存在します: {self._path.name}")
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f".{self._path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            if isinstance(data, (bytes, bytearray)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f)
+        os.replace(tmp_path, self._path)
+
+    def download_blob(self) -> bytes:
+        return self._path.read_bytes()
+
+
+class LocalContainerClient:
+    """ローカルディスクのディレクトリをコンテナとして扱うContainerClientの代替実装"""
+
+    def __init__(self, root: str, container: str, base_url: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            root (str): 保存先のルートディレクトリ
+            container (str): コンテナ名（ルート配下のディレクトリ名）
+            base_url (Optional[str]): ルートディレクトリを配信するURL（省略時はfile://のURL）
+        """
+        self.directory = Path(root).resolve() / container
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.base_url = f"{base_url.rstrip('/')}/{container}" if base_url else None
+
+    def _url(self, blob: str) -> str:
+        if self.base_url is None:
+            return (self.directory / blob).as_uri()
+        return f"{self.base_url}/{blob}"
+
+    def get_blob_client(self, blob: str) -> LocalBlobClient:
+        return LocalBlobClient(self.directory / blob, self._url(blob))
+
+    def exists(self) -> bool:
+        return self.directory.is_dir()
+
+    def delete_blob(self, blob: str) -> None:
+        os.remove(self.directory / blob)
+
+    def read_url(self, url: str) -> Optional[bytes]:
+        """このコンテナのURLであれば内容を返す"""
+        prefix = self._url("")
+        if not url.startswith(prefix):
+            return None
+        try:
+            return (self.directory / url[len(prefix) :]).read_bytes()
+        except OSError:
+            return None
+
+
+class _InMemoryBlobClient:
+    """メモリ上に保存するBlobClientの代替実装"""
+
+    def __init__(self, blobs: Dict[str, bytes], name: str, url: str):
+        self._blobs = blobs
+        self._name = name
+        self.url = url
+
+    def upload_blob(self, data, overwrite: bool = False, **kwargs) -> None:
+        if self._name in self._blobs and not overwrite:
+            raise FileExistsError(f"BLOBが既に存在します: {self._name}")
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.read()
+        self._blobs[self._name] = bytes(data)
+
+    def download_blob(self) -> bytes:
+        return self._blobs[self._name]
+
+
+class InMemoryContainerClient:
+    """プロセス内のメモリをコンテナとして扱うContainerClientの代替実装"""
+
+    def __init__(self, container: str):
+        self.container = container
+        self.blobs: Dict[str, bytes] = {}
+
+    def _url(self, blob: str) -> str:
+        return f"memory://{self.container}/{blob}"
+
+    def get_blob_client(self, blob: str) -> _InMemoryBlobClient:
+        return _InMemoryBlobClient(self.blobs, blob, self._url(blob))
+
+    def exists(self) -> bool:
+        return True
+
+    def delete_blob(self, blob: str) -> None:
+        if self.blobs.pop(blob, None) is None:
+            raise FileNotFoundError(blob)
+
+    def read_url(self, url: str) -> Optional[bytes]:
+        """このコンテナのURLであれば内容を返す"""
+        prefix = self._url("")
+        return self.blobs.get(url[len(prefix) :]) if url.startswith(prefix) else None
+
+
+def _local_base_url(root: str) -> Optional[str]:
+    """ローカルディスクの保存先を配信するURL（ARTIFACT_BASE_URL、静的ファイル配信のディレクトリなら既定のURL）"""
+    base_url = os.getenv("ARTIFACT_BASE_URL")
+    if base_url:
+        return base_url
+    if Path(root).resolve() == Path(STATIC_ARTIFACT_DIR).resolve():
+        return STATIC_ARTIFACT_ROUTE
+    return None
+
+
+def create_azure_container_client(
+    connect_str: str, container: str, pool_maxsize: int = DEFAULT_POOL_MAXSIZE
+):
+    """
+    接続プール付きのAzureのContainerClientを作成
+
+    requestsのSessionを明示的に渡し、同時アップロード数に見合った接続数をkeep-aliveで保持します。
+    """
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.storage.blob import BlobServiceClient
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(
+        session=session,
+        session_owner=False,
+        connection_timeout=DEFAULT_CONNECTION_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+    )
+    service_client = BlobServiceClient.from_connection_string(
+        connect_str,
+        transport=transport,
+        max_single_put_size=BLOCK_UPLOAD_THRESHOLD,
+        max_block_size=BLOCK_SIZE,
+    )
+    return service_client.get_container_client(container)
+
+
+def create_container_client(
+    connect_str: str, container: str, pool_maxsize: int = DEFAULT_POOL_MAXSIZE
+):
+    """接続文字列に応じてAzure・ローカルディスク・メモリのContainerClientを作成"""
+    if connect_str.startswith(LOCAL_CONNECTION_PREFIX):
+        root = connect_str[len(LOCAL_CONNECTION_PREFIX) :]
+        return LocalContainerClient(root, container, _local_base_url(root))
+    if connect_str.startswith(MEMORY_CONNECTION_PREFIX):
+        return InMemoryContainerClient(container)
+    return create_azure_container_client(connect_str, container, pool_maxsize)
+
+
+def get_storage_settings() -> Tuple[Optional[str], Optional[str]]:
+    """
+    環境変数から保存先の接続文字列とコンテナ名を取得
+
+    ARTIFACT_STORAGEで保存先（azure/local/memory、既定azure）を指定します。
+    - azure: AZURE_STORAGE_CONNECTION_STRINGとAZURE_STORAGE_CONTAINER_NAME
+    - local: ARTIFACT_LOCAL_DIR（既定はsrc/static/artifacts）に保存。
+      配信するURLはARTIFACT_BASE_URL（既定は静的ファイル配信の/app/static/artifacts）
+    - memory: プロセス内のメモリに保存
+    local・memoryのコンテナ名はAZURE_STORAGE_CONTAINER_NAME（既定artifacts）です。
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: 接続文字列とコンテナ名（未設定の場合はNone）
+    """
+    backend = os.getenv("ARTIFACT_STORAGE", "azure").lower()
+    container = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
+    if backend == "local":
+        root = os.getenv("ARTIFACT_LOCAL_DIR") or STATIC_ARTIFACT_DIR
+        return f"{LOCAL_CONNECTION_PREFIX}{root}", container or DEFAULT_CONTAINER
+    if backend == "memory":
+        return MEMORY_CONNECTION_PREFIX, container or DEFAULT_CONTAINER
+    if backend != "azure":
+        raise ValueError(f"ARTIFACT_STORAGEは{list(STORAGE_BACKENDS)}のいずれかを指定してください")
+    return os.getenv("AZURE_STORAGE_CONNECTION_STRING"), container
+
+
+class BlobClientPool:
+    """接続文字列とコンテナの組ごとにContainerClientを共有するスレッドセーフなプール"""
+
+    def __init__(
+        self,
+        client_factory: Callable = create_container_client,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        """
+        初期化
+
+        Args:
+            client_factory (Callable): (接続文字列, コンテナ名, pool_maxsize) からContainerClientを作成する関数
+            pool_maxsize (int): 1クライアントが保持するHTTP接続数の上限
+            max_concurrency (int): 大きなファイルをブロックに分割したときの並列アップロード数
+        """
+        self._client_factory = client_factory
+        self.pool_maxsize = pool_maxsize
+        self.max_concurrency = max_concurrency
+        self._clients: Dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+
+    def _warm_up(self, client) -> None:
+        """作成直後のクライアントで軽い要求を送り、TLS接続を確立しておく（権限がなくても接続は残る）"""
+        try:
+            client.exists()
+        except Exception as e:
+            logger.debug(f"Blob Storageへの事前接続で応答がエラーでした: {e}")
+
+    def get_container_client(self, connect_str: str, container: str) -> Tuple[object, bool]:
+        """
+        ContainerClientを取得（初回のみ作成して事前接続）
+
+        Args:
+            connect_str (str): 接続文字列
+            container (str): コンテナ名
+
+        Returns:
+            Tuple[object, bool]: ContainerClientと、既存のクライアントを再利用したかどうか
+        """
+        key = (connect_str, container)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client, True
+            # 同じ組のクライアントを複数のスレッドが同時に作らないようロック内で作成
+            client = self._client_factory(connect_str, container, self.pool_maxsize)
+            self._warm_up(client)
+            self._clients[key] = client
+        metrics.increment("blob.clients_created")
+        logger.info(f"Blob Storageのクライアントを作成しました（コンテナ: {container}）")
+        return client, False
+
+    def upload_file(
+        self,
+        connect_str: str,
+        container: str,
+        blob_name: str,
+        file_path: str,
+        content_type: Optional[str] = None,
+    ) -> Dict:
+        """
+        ファイルをアップロード
+
+        Args:
+            connect_str (str): 接続文字列
+            container (str): コンテナ名
+            blob_name (str): BLOB名
+            file_path (str): アップロードするファイルのパス
+            content_type (Optional[str]): Content-Type（省略時はBLOB名の拡張子から推定）
+
+        Returns:
+            Dict: url, bytes, connect_seconds（クライアントの取得）, transfer_seconds（転送）, reused
+        """
+        start_time = time.perf_counter()
+        client, reused = self.get_container_client(connect_str, container)
+        blob_client = client.get_blob_client(blob_name)
+        connect_seconds = time.perf_counter() - start_time
+
+        size = os.path.getsize(file_path)
+        kwargs = {}
+        content_type = content_type or mimetypes.guess_type(blob_name)[0]
+        if content_type and not isinstance(
+            client, (LocalContainerClient, InMemoryContainerClient)
+        ):
+            from azure.storage.blob import ContentSettings
+
+            # ブラウザが画像として表示できるようにContent-Typeを付ける
+            kwargs["content_settings"] = ContentSettings(content_type=content_type)
+        if size > BLOCK_UPLOAD_THRESHOLD:
+            # ブロックに分割して並列に転送
+            kwargs["max_concurrency"] = self.max_concurrency
+            metrics.increment("blob.block_uploads")
+        start_time = time.perf_counter()
+        with open(file_path, "rb") as data:
+            blob_client.upload_blob(data, overwrite=True, length=size, **kwargs)
+        transfer_seconds = time.perf_counter() - start_time
+
+        metrics.observe("blob.connect_seconds", connect_seconds)
+        metrics.observe("blob.transfer_seconds", transfer_seconds)
+        metrics.increment("blob.uploads")
+        metrics.increment("blob.upload_bytes", size)
+        return {
+            "url": blob_client.url,
+            "bytes": size,
+            "connect_seconds": connect_seconds,
+            "transfer_seconds": transfer_seconds,
+            "reused": reused,
+        }
+
+    def read_stored(self, url: str) -> Optional[bytes]:
+        """ローカルディスク・メモリの保存先にあるURLの内容を返す（Azureの場合はNone）"""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            read_url = getattr(client, "read_url", None)
+            if read_url is not None:
+                data = read_url(url)
+                if data is not None:
+                    return data
+        return None
+
+    def blob_url(self, connect_str: str, container: str, blob_name: str) -> str:
+        """アップロード前にBLOBのURLを取得（通信は発生しない）"""
+        client, _ = self.get_container_client(connect_str, container)
+        return client.get_blob_client(blob_name).url
+
+    def clear(self) -> None:
+        """保持しているクライアントを破棄（接続文字列の変更時など）"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+
+class BackgroundUploader:
+    """
+    バックグラウンドでファイルをアップロードし、完了まではローカルのファイルを参照できるようにするクラス
+
+    BLOBのURLはアップロード前に確定するため、submit()はURLをすぐに返します。
+    アップロードに成功したらローカルのファイルを削除し、失敗した場合はリトライします。
+    """
+
+    def __init__(
+        self,
+        pool: BlobClientPool,
+        max_workers: int = 4,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 1.0,
+    ):
+        """
+        初期化
+
+        Args:
+            pool (BlobClientPool): アップロードに使うクライアントのプール
+            max_workers (int): 同時にアップロードするファイル数
+            max_attempts (int): 1ファイルあたりの試行回数
+            retry_base_seconds (float): リトライ間隔の基準（試行ごとに2倍）
+        """
+        self._pool = pool
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="blob-upload"
+        )
+        self._uploads: "collections.OrderedDict[str, Dict]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        connect_str: str,
+        container: str,
+        blob_name: str,
+        file_path: str,
+        on_success: Optional[Callable[[Dict], None]] = None,
+    ) -> str:
+        """
+        アップロードを開始し、BLOBのURLを返す
+
+        Args:
+            connect_str (str): 接続文字列
+            container (str): コンテナ名
+            blob_name (str): BLOB名
+            file_path (str): アップロードするファイルのパス（成功後に削除）
+            on_success (Optional[Callable[[Dict], None]]): アップロードの成功時にupload_fileの結果を受け取る関数
+
+        Returns:
+            str: BLOBのURL
+        """
+        url = self._pool.blob_url(connect_str, container, blob_name)
+        record = {
+            "status": UPLOAD_PENDING,
+            "file_path": file_path,
+            "error": None,
+            "on_success": on_success,
+        }
+        record["done"] = threading.Event()
+        with self._lock:
+            self._uploads[url] = record
+            self._forget_old_uploads()
+            metrics.set_gauge("blob.pending_uploads", self._pending_count())
+        self._executor.submit(self._upload, url, record, connect_str, container, blob_name)
+        return url
+
+    def _pending_count(self) -> int:
+        return sum(1 for r in self._uploads.values() if r["status"] == UPLOAD_PENDING)
+
+    def _forget_old_uploads(self) -> None:
+        while len(self._uploads) > MAX_TRACKED_UPLOADS:
+            url = next(
+                (u for u, r in self._uploads.items() if r["status"] != UPLOAD_PENDING), None
+            )
+            if url is None:
+                break
+            del self._uploads[url]
+
+    def _upload(
+        self, url: str, record: Dict, connect_str: str, container: str, blob_name: str
+    ) -> None:
+        start_time = time.perf_counter()
+        error = None
+        upload = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                metrics.increment("blob.upload_retries")
+                time.sleep(self.retry_base_seconds * 2 ** (attempt - 1))
+            try:
+                upload = self._pool.upload_file(
+                    connect_str, container, blob_name, record["file_path"]
+                )
+                error = None
+                break
+            except Exception as e:
+                error = e
+                logger.warning(
+                    f"Blob Storageへのアップロードに失敗しました（{attempt + 1}/{self.max_attempts}回目）: {e}"
+                )
+
+        with self._lock:
+            if error is None:
+                record["status"] = UPLOAD_DONE
+            else:
+                record["status"] = UPLOAD_FAILED
+                record["error"] = str(error)
+            metrics.set_gauge("blob.pending_uploads", self._pending_count())
+        metrics.observe("blob.background_upload_seconds", time.perf_counter() - start_time)
+
+        if error is None:
+            if record["on_success"] is not None:
+                try:
+                    record["on_success"](upload)
+                except Exception as e:
+                    logger.warning(f"アップロード完了後の処理に失敗しました（{url}）: {e}")
+            try:
+                os.remove(record["file_path"])
+                logger.info(f"ローカルファイルを削除しました: {record['file_path']}")
+            except OSError as e:
+                logger.warning(f"ローカルファイルの削除に失敗しました {record['file_path']}: {e}")
+        else:
+            metrics.increment("blob.upload_failures")
+            logger.error(f"Blob Storageへのアップロードを断念しました（{url}）: {error}")
+        record["done"].set()
+
+    def status(self, url: str) -> Optional[str]:
+        """アップロードの状態（pending / uploaded / failed、このプロセスで扱っていないURLはNone）"""
+        with self._lock:
+            record = self._uploads.get(url)
+            return record["status"] if record else None
+
+    def local_preview(self, url: str) -> Optional[str]:
+        """アップロードが完了していない場合に表示できるローカルのファイルのパス"""
+        with self._lock:
+            record = self._uploads.get(url)
+        if record is None or record["status"] == UPLOAD_DONE:
+            return None
+        return record["file_path"] if os.path.exists(record["file_path"]) else None
+
+    def wait(self, url: str, timeout: Optional[float] = None) -> Optional[str]:
+        """アップロードの完了を待って状態を返す"""
+        with self._lock:
+            record = self._uploads.get(url)
+        if record is None:
+            return None
+        record["done"].wait(timeout)
+        return self.status(url)
+
+
+_pool: Optional[BlobClientPool] = None
+_uploader: Optional[BackgroundUploader] = None
+_pool_lock = threading.Lock()
+
+
+def get_blob_client_pool() -> BlobClientPool:
+    """
+    プロセス共通のBlob Storageクライアントのプールを取得（初回のみ生成）
+
+    1クライアントあたりのHTTP接続数は環境変数BLOB_POOL_MAXSIZE（既定16）、
+    大きなファイルの並列アップロード数はBLOB_MAX_CONCURRENCY（既定4）で指定します。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BlobClientPool(
+                pool_maxsize=int(os.getenv("BLOB_POOL_MAXSIZE", str(DEFAULT_POOL_MAXSIZE))),
+                max_concurrency=int(
+                    os.getenv("BLOB_MAX_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))
+                ),
+            )
+        return _pool
+
+
+def get_background_uploader() -> BackgroundUploader:
+    """
+    プロセス共通のバックグラウンドアップロードを取得（初回のみ生成）
+
+    同時にアップロードするファイル数は環境変数BLOB_UPLOAD_WORKERS（既定4）、
+    試行回数はBLOB_UPLOAD_ATTEMPTS（既定3）で指定します。
+    """
+    global _uploader
+    pool = get_blob_client_pool()
+    with _pool_lock:
+        if _uploader is None:
+            _uploader = BackgroundUploader(
+                pool,
+                max_workers=int(os.getenv("BLOB_UPLOAD_WORKERS", "4")),
+                max_attempts=int(os.getenv("BLOB_UPLOAD_ATTEMPTS", "3")),
+            )
+        return _uploader
@@ -0,0 +1,258 @@
+"""
+定型グラフの描画
+
+よく使う折れ線・棒・積み上げ棒・パレート図は、LLMがmatplotlibのコードを書いて
+execute_toolで実行しなくても、データセット・グラフの種類・軸・グループ化を指定した
+仕様（spec）からアプリのプロセス内で直接描画できます。
+描画結果は仕様とデータのバージョンをキーにキャッシュします。
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from .datasets import get_dataset_version, get_sampledata_path
+from .kernel_bootstrap import configure_matplotlib
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# グラフにできるデータセット（名前: sampledataのファイル名）
+DATASETS = {
+    "erp": "erp.csv",
+    "erp_material": "erp_material.csv",
+    "mes_total": "mes_total.csv",
+    "mes_loss": "mes_total_err.csv",
+}
+
+CHART_TYPES = ("line", "bar", "stacked_bar", "pareto")
+AGGREGATES = ("sum", "mean")
+
+# 集計後に計算する指標（指標名: (計算式, 必要な列)）
+DERIVED_METRICS = {
+    "不良率(%)": (
+        lambda df: df["不良数"] / (df["良品数"] + df["不良数"]) * 100,
+        ("良品数", "不良数"),
+    ),
+}
+
+# 描画処理を変更したら更新する（キャッシュの無効化用）
+RENDERER_VERSION = "1"
+
+CHART_CACHE_SIZE = 128
+DEFAULT_DPI = 150
+PARETO_LABEL = "累積比率(%)"
+
+_data_cache: Dict[str, Any] = {}
+_result_cache: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+_lock = threading.Lock()
+_matplotlib_ready = False
+
+
+def _ensure_matplotlib() -> None:
+    """日本語フォントとAggバックエンドを一度だけ設定"""
+    global _matplotlib_ready
+    with _lock:
+        if not _matplotlib_ready:
+            configure_matplotlib()
+            _matplotlib_ready = True
+
+
+def load_dataset(dataset: str) -> pd.DataFrame:
+    """
+    データセットを読み込み（ファイルが更新されるまでメモリに保持）
+
+    Args:
+        dataset (str): DATASETSのキー
+
+    Returns:
+        pd.DataFrame: データ（日次データには"年月"列を追加）
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"datasetは{list(DATASETS)}のいずれかを指定してください: {dataset}")
+    file_name = DATASETS[dataset]
+    version = get_dataset_version(file_name)
+    with _lock:
+        cached = _data_cache.get(dataset)
+    if cached is not None and cached["version"] == version:
+        return cached["df"]
+
+    df = pd.read_csv(get_sampledata_path(file_name), encoding="utf-8-sig")
+    if "年月" not in df.columns and "年月日" in df.columns:
+        df["年月"] = df["年月日"].astype(str).str[:7]
+    with _lock:
+        _data_cache[dataset] = {"version": version, "df": df}
+    return df
+
+
+def normalize_spec(spec: Dict) -> Dict:
+    """
+    仕様を検証し、省略された項目を既定値で補完
+
+    Args:
+        spec (Dict): dataset, chart_type, y（必須）と x, group_by, year_months, skus, aggregate, title
+
+    Returns:
+        Dict: 補完した仕様
+    """
+    normalized = {
+        "dataset": spec.get("dataset"),
+        "chart_type": spec.get("chart_type", "line"),
+        "y": spec.get("y"),
+        "x": spec.get("x") or "年月",
+        "group_by": spec.get("group_by") or None,
+        "year_months": sorted(spec.get("year_months") or []),
+        "skus": sorted(spec.get("skus") or []),
+        "aggregate": spec.get("aggregate", "sum"),
+        "title": spec.get("title") or None,
+    }
+    if isinstance(normalized["y"], str):
+        normalized["y"] = [normalized["y"]]
+    if not normalized["y"]:
+        raise ValueError("yに描画する列を1つ以上指定してください")
+    if normalized["dataset"] not in DATASETS:
+        raise ValueError(f"datasetは{list(DATASETS)}のいずれかを指定してください")
+    if normalized["chart_type"] not in CHART_TYPES:
+        raise ValueError(f"chart_typeは{list(CHART_TYPES)}のいずれかを指定してください")
+    if normalized["aggregate"] not in AGGREGATES:
+        raise ValueError(f"aggregateは{list(AGGREGATES)}のいずれかを指定してください")
+    if normalized["group_by"] and len(normalized["y"]) > 1:
+        raise ValueError("group_byを指定する場合、yは1列にしてください")
+    if normalized["group_by"] and normalized["chart_type"] == "pareto":
+        raise ValueError("パレート図ではgroup_byを指定できません")
+    return normalized
+
+
+def prepare_chart_data(spec: Dict) -> pd.DataFrame:
+    """
+    仕様に従ってデータを絞り込み・集計し、描画用の表を作成
+
+    Args:
+        spec (Dict): normalize_spec済みの仕様
+
+    Returns:
+        pd.DataFrame: インデックスがx軸（パレート図は項目）、列が系列の表
+    """
+    df = load_dataset(spec["dataset"])
+    if spec["year_months"]:
+        df = df[df["年月"].isin(spec["year_months"])]
+    if spec["skus"] and "SKU" in df.columns:
+        df = df[df["SKU"].isin(spec["skus"])]
+
+    base_columns = []
+    for column in spec["y"]:
+        required = DERIVED_METRICS[column][1] if column in DERIVED_METRICS else (column,)
+        base_columns.extend(c for c in required if c not in base_columns)
+    keys = [spec["x"]] + ([spec["group_by"]] if spec["group_by"] else [])
+    missing = [c for c in base_columns + keys if c not in df.columns]
+    if missing:
+        available = [c for c in df.columns if c != "年月"] + ["年月"] + list(DERIVED_METRICS)
+        raise ValueError(f"列が見つかりません: {missing}（指定できる列: {available}）")
+    if df.empty:
+        raise ValueError("指定された条件に該当するデータがありません")
+
+    if spec["chart_type"] == "pareto" and len(spec["y"]) > 1:
+        # 複数の列を項目として合計し、大きい順に並べる（ロス内訳のパレート図など）
+        totals = df[spec["y"]].agg(spec["aggregate"])
+        return totals.sort_values(ascending=False).to_frame(name="合計")
+
+    grouped = df.groupby(keys)[base_columns].agg(spec["aggregate"])
+    for column in spec["y"]:
+        if column in DERIVED_METRICS:
+            grouped[column] = DERIVED_METRICS[column][0](grouped)
+    data = grouped[spec["y"]]
+    if spec["group_by"]:
+        data = data[spec["y"][0]].unstack(spec["group_by"])
+    if spec["chart_type"] == "pareto":
+        data = data.sort_values(data.columns[0], ascending=False)
+    return data
+
+
+def _draw(spec: Dict, data: pd.DataFrame, file_path: str, dpi: int) -> None:
+    """matplotlibのFigureに描画してPNGで保存（pyplotの状態を使わないためスレッドから呼べる）"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    chart_type = spec["chart_type"]
+    if chart_type == "line":
+        data.plot(ax=ax, marker="o")
+    elif chart_type in ("bar", "stacked_bar"):
+        data.plot.bar(ax=ax, stacked=chart_type == "stacked_bar", rot=45)
+    else:
+        values = data.iloc[:, 0]
+        ax.bar(values.index.astype(str), values.values)
+        ax.tick_params(axis="x", rotation=45)
+        cumulative = values.cumsum() / values.sum() * 100
+        ax2 = ax.twinx()
+        ax2.plot(values.index.astype(str), cumulative.values, color="tab:red", marker="o")
+        ax2.set_ylim(0, 105)
+        ax2.set_ylabel(PARETO_LABEL)
+
+    ax.set_xlabel(data.index.name or "")
+    ax.set_ylabel(spec["y"][0] if len(spec["y"]) == 1 else "")
+    ax.set_title(spec["title"] or f"{'・'.join(spec['y'])}（{spec['x']}別）")
+    ax.grid(axis="y", alpha=0.3)
+    if chart_type != "pareto" and data.shape[1] > 1:
+        ax.legend(title=spec["group_by"])
+    fig.savefig(file_path, dpi=dpi, bbox_inches="tight")
+
+
+def render_chart_spec(spec: Dict, output_dir: str, dpi: int = DEFAULT_DPI) -> Dict:
+    """
+    仕様からグラフを描画してPNGで保存
+
+    Args:
+        spec (Dict): グラフの仕様（normalize_specを参照）
+        output_dir (str): 保存先ディレクトリ
+        dpi (int): 解像度
+
+    Returns:
+        Dict: file_path（保存したPNG）、data（描画した表）、spec（補完後の仕様）
+    """
+    spec = normalize_spec(spec)
+    _ensure_matplotlib()
+    with metrics.measure("chart.render_seconds"):
+        data = prepare_chart_data(spec)
+        os.makedirs(output_dir, exist_ok=True)
+        file_path = os.path.join(
+            os.path.abspath(output_dir), f"chart_{spec['chart_type']}_{uuid.uuid4().hex}.png"
+        )
+        _draw(spec, data, file_path, dpi)
+    return {"file_path": file_path, "data": data, "spec": spec}
+
+
+def chart_cache_key(spec: Dict) -> str:
+    """仕様・データのバージョン・描画処理のバージョンからキャッシュキーを作成"""
+    spec = normalize_spec(spec)
+    payload = json.dumps(spec, ensure_ascii=False, sort_keys=True)
+    version = get_dataset_version(DATASETS[spec["dataset"]])
+    return hashlib.sha256(f"{payload};{version};{RENDERER_VERSION}".encode()).hexdigest()
+
+
+def get_cached_chart(key: str) -> Optional[str]:
+    """キャッシュ済みの結果（アップロード後のメッセージ）を取得"""
+    with _lock:
+        result = _result_cache.get(key)
+        if result is not None:
+            _result_cache.move_to_end(key)
+    metrics.increment("chart.cache_hits" if result is not None else "chart.cache_misses")
+    return result
+
+
+def cache_chart(key: str, result: str) -> None:
+    """結果をキャッシュ（CHART_CACHE_SIZEを超えたら古いものから削除）"""
+    with _lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > CHART_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
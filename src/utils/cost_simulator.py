@@ -0,0 +1,182 @@
+"""
+ERP・材料費・MES歩留まりを組み合わせた変動費のモンテカルロシミュレーション
+
+複数のシナリオ×試行回数をNumPyの配列演算で一括計算し、
+良品1個あたり変動費の分布を返します。
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .datasets import get_sampledata_path
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MAX_SAMPLES = 100_000
+
+# シナリオで指定できるパラメータ（平均・標準偏差の組）と既定値
+SCENARIO_PARAMETERS = {
+    "lot_price_change_pct": 0.0,  # 原料ロット単価の変化率（%）
+    "lot_price_volatility_pct": 0.0,  # 同・標準偏差（%）
+    "yield_change_pt": 0.0,  # 歩留まりの変化（ポイント）
+    "yield_volatility_pt": 0.0,  # 同・標準偏差（ポイント）
+    "defect_reduction_pct": 0.0,  # ライン切替などによる不良数の削減率（%）
+    "defect_reduction_volatility_pct": 0.0,  # 同・標準偏差（%）
+    "outsourcing_change_pct": 0.0,  # 委託費の変化率（%）
+    "outsourcing_volatility_pct": 0.0,  # 同・標準偏差（%）
+}
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def load_cost_baseline(sku: str, year_month: str) -> Dict:
+    """
+    指定SKU・年月の変動費と歩留まりの基準値を読み込み
+
+    Args:
+        sku (str): SKU（例: "SKU-1234"）
+        year_month (str): 年月（例: "2025-06"）
+
+    Returns:
+        Dict: 材料費の原料別内訳、委託費、総生産数、良品数などの基準値
+    """
+    erp_df = pd.read_csv(get_sampledata_path("erp.csv"), encoding="utf-8-sig")
+    erp_row = erp_df[(erp_df["年月"] == year_month) & (erp_df["SKU"] == sku)]
+    if erp_row.empty:
+        raise ValueError(f"ERPデータに該当する行がありません（年月: {year_month}, SKU: {sku}）")
+    material_cost = float(erp_row["変動費-材料費"].iloc[0])
+    outsourcing_cost = float(erp_row["変動費-委託費"].iloc[0])
+
+    # 原料別の内訳（備考が欠けた行は費用が備考列にずれるため補完する）
+    material_df = pd.read_csv(
+        get_sampledata_path("erp_material.csv"), encoding="utf-8-sig"
+    )
+    material_df = material_df[
+        (material_df["年月"] == year_month) & (material_df["SKU"] == sku)
+    ]
+    costs = pd.to_numeric(material_df["費用"], errors="coerce").fillna(
+        pd.to_numeric(material_df["備考"], errors="coerce")
+    )
+    lots = material_df["原料"].tolist()
+    lot_costs = costs.fillna(0).tolist()
+    residual = material_cost - sum(lot_costs)
+    if not lots:
+        lots, lot_costs = ["材料費"], [material_cost]
+    elif residual > 0:
+        lots.append("その他材料")
+        lot_costs.append(residual)
+
+    # MESの良品数・不良数（該当月がない場合は最も近い月を使用）
+    mes_df = pd.read_csv(get_sampledata_path("mes_total.csv"), encoding="utf-8-sig")
+    mes_df = mes_df[mes_df["SKU"] == sku]
+    if mes_df.empty:
+        raise ValueError(f"MESデータに該当するSKUがありません: {sku}")
+    mes_df = mes_df.assign(年月=mes_df["年月日"].str[:7])
+    monthly = mes_df.groupby("年月")[["良品数", "不良数"]].sum()
+    mes_month = year_month
+    if year_month not in monthly.index:
+        target = pd.Period(year_month, freq="M")
+        mes_month = min(
+            monthly.index, key=lambda m: abs((pd.Period(m, freq="M") - target).n)
+        )
+    good = float(monthly.loc[mes_month, "良品数"])
+    defect = float(monthly.loc[mes_month, "不良数"])
+
+    return {
+        "sku": sku,
+        "year_month": year_month,
+        "mes_month": mes_month,
+        "lots": lots,
+        "lot_costs": np.array(lot_costs, dtype=float),
+        "outsourcing_cost": outsourcing_cost,
+        "total_units": good + defect,
+        "good_units": good,
+        "defect_rate": defect / (good + defect),
+    }
+
+
+def simulate_cost_scenarios(
+    baseline: Dict,
+    scenarios: List[Dict],
+    n_samples: int = 5000,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    全シナリオ×試行を1回の配列演算で計算し、良品1個あたり変動費の分布を集計
+
+    Args:
+        baseline (Dict): load_cost_baselineの戻り値
+        scenarios (List[Dict]): シナリオのリスト（name, target_lot と SCENARIO_PARAMETERS のキー）
+        n_samples (int): シナリオごとの試行回数
+        seed (Optional[int]): 乱数シード
+
+    Returns:
+        pd.DataFrame: シナリオごとの平均・標準偏差・パーセンタイル・基準比
+    """
+    n_samples = int(min(max(n_samples, 1), MAX_SAMPLES))
+    k = len(scenarios)
+    lots = baseline["lots"]
+    lot_costs = baseline["lot_costs"]
+
+    def column(name: str) -> np.ndarray:
+        default = SCENARIO_PARAMETERS[name]
+        return np.array([float(s.get(name, default) or 0.0) for s in scenarios])[:, None]
+
+    # 単価変動の対象ロット（未指定なら全ロット）を (k, L) のマスクで表す
+    lot_mask = np.ones((k, len(lots)))
+    for i, scenario in enumerate(scenarios):
+        target_lot = scenario.get("target_lot")
+        if target_lot:
+            if target_lot not in lots:
+                raise ValueError(f"原料ロットが見つかりません: {target_lot}（候補: {lots}）")
+            lot_mask[i] = [1.0 if lot == target_lot else 0.0 for lot in lots]
+
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((4, k, n_samples))
+
+    price_change = (
+        column("lot_price_change_pct") + column("lot_price_volatility_pct") * z[0]
+    ) / 100
+    material = (
+        lot_costs[None, None, :]
+        * (1 + price_change[:, :, None] * lot_mask[:, None, :])
+    ).sum(axis=2)
+
+    outsourcing = baseline["outsourcing_cost"] * (
+        1
+        + (column("outsourcing_change_pct") + column("outsourcing_volatility_pct") * z[1])
+        / 100
+    )
+
+    defect_reduction = (
+        column("defect_reduction_pct") + column("defect_reduction_volatility_pct") * z[2]
+    ) / 100
+    yield_change = (column("yield_change_pt") + column("yield_volatility_pt") * z[3]) / 100
+    yield_rate = np.clip(
+        1 - baseline["defect_rate"] * (1 - defect_reduction) + yield_change, 0.01, 1.0
+    )
+    good_units = baseline["total_units"] * yield_rate
+
+    unit_cost = (material + outsourcing) / good_units  # (k, n_samples)
+
+    base_unit_cost = (lot_costs.sum() + baseline["outsourcing_cost"]) / baseline[
+        "good_units"
+    ]
+    percentiles = np.percentile(unit_cost, PERCENTILES, axis=1)
+    result = pd.DataFrame(
+        {
+            "シナリオ": [s.get("name") or f"シナリオ{i + 1}" for i, s in enumerate(scenarios)],
+            "平均(円/個)": unit_cost.mean(axis=1),
+            "標準偏差": unit_cost.std(axis=1),
+            **{f"P{p}": percentiles[j] for j, p in enumerate(PERCENTILES)},
+            "基準比(%)": (unit_cost.mean(axis=1) / base_unit_cost - 1) * 100,
+            "基準超過確率": (unit_cost > base_unit_cost).mean(axis=1),
+        }
+    )
+    result.attrs["base_unit_cost"] = base_unit_cost
+    result.attrs["n_samples"] = n_samples
+    return result
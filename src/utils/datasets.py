@@ -0,0 +1,53 @@
+"""
+サンプルデータ（sampledata/*.csv）へのアクセス用ユーティリティ関数
+"""
+
+import hashlib
+import os
+
+# プロジェクトルート直下のsampledataディレクトリ
+SAMPLEDATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "sampledata",
+)
+
+
+def get_sampledata_path(filename: str) -> str:
+    """
+    sampledataディレクトリ内のファイルの絶対パスを取得
+
+    Args:
+        filename (str): ファイル名（例: "mes_packagingmachine.csv"）
+
+    Returns:
+        str: ファイルの絶対パス
+    """
+    return os.path.join(SAMPLEDATA_DIR, filename)
+
+
+def get_dataset_version(*filenames: str) -> str:
+    """
+    データセットのバージョン識別子を取得
+
+    ファイルの更新時刻とサイズから算出するため、内容を読み込まずに変更を検知できます。
+
+    Args:
+        *filenames (str): 対象のファイル名（省略時はsampledata内の全CSV）
+
+    Returns:
+        str: 12桁のバージョン文字列
+    """
+    if not filenames:
+        filenames = tuple(
+            sorted(f for f in os.listdir(SAMPLEDATA_DIR) if f.endswith(".csv"))
+        )
+
+    digest = hashlib.sha1()
+    for filename in filenames:
+        path = get_sampledata_path(filename)
+        try:
+            stat = os.stat(path)
+            digest.update(f"{filename}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        except OSError:
+            digest.update(f"{filename}:missing;".encode())
+    return digest.hexdigest()[:12]
@@ -0,0 +1,424 @@
+"""
+実行したコードの結果キャッシュ
+
+同じサンプルタスクの再実行やページ再読み込み後のグラフ再生成では、同じデータに対して
+同じコードが何度も実行されます。このモジュールは（正規化したコードのハッシュ、データセットの
+バージョン、実行環境）をキーに、標準出力と作業ディレクトリに作成されたファイルを保存し、
+一致した場合は実行せずに返します。
+
+- ExecutionResultCache: TTLと件数・容量の上限を持つプロセス内キャッシュ
+- CachedCodeExecutor: 任意のCodeExecutorをラップしてキャッシュを適用するExecutor
+
+常駐カーネルでは前の実行で作った変数を後のコードが参照するため、キーには同じセッションで
+これまでに実行したコードの並びも含めます。キャッシュから返したコードは実行されないため、
+その後キャッシュにないコードを実行するときは、先に返したコードを出力なしで再実行します。
+"""
+
+import asyncio
+import collections
+import functools
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from .datasets import get_dataset_version
+from .execution_limiter import WAIT_NOTICE_PATTERN
+from .kernel_executor import BOOTSTRAP_SCRIPT, STATE_RESET_NOTICE
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# コードにこのコメントがあればキャッシュしない
+NO_CACHE_MARKER = "# no-cache"
+
+# 実行のたびに結果が変わるため、キャッシュしない処理
+NONDETERMINISTIC_PATTERNS = [
+    re.compile(r"\bdatetime\.(now|today|utcnow)\s*\("),
+    re.compile(r"\bdate\.today\s*\("),
+    re.compile(r"\btime\.(time|time_ns|perf_counter)\s*\("),
+    re.compile(r"\b(random|np\.random|numpy\.random)\.(?!seed\b|default_rng\s*\(\s*\d)\w+\s*\("),
+    re.compile(r"\buuid\.uuid[14]\s*\("),
+    re.compile(r"\b(requests|urllib|httpx)\b"),
+]
+
+# 環境情報に含めるパッケージ
+ENVIRONMENT_PACKAGES = ("numpy", "pandas", "matplotlib", "scipy", "scikit-learn")
+
+# 成果物として扱わないファイル（実行時に作成されるコードファイル）
+CODE_FILE_PATTERN = re.compile(r"^tmp_code_[0-9a-f]+\.py$")
+
+# 出力中の作業ディレクトリのパスを置き換える文字列（別の作業ディレクトリでも再利用するため）
+WORK_DIR_PLACEHOLDER = "\x00WORK_DIR\x00"
+
+
+def normalize_code(code: str) -> str:
+    """
+    キャッシュキー用にコードを正規化（改行コード・行末の空白・空行・行全体のコメントを除去）
+
+    Args:
+        code (str): コード
+
+    Returns:
+        str: 正規化したコード
+    """
+    lines = []
+    for line in code.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        stripped = line.rstrip()
+        if not stripped or stripped.lstrip().startswith("#"):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+def is_cacheable(code: str) -> bool:
+    """
+    コードの結果をキャッシュしてよいか判定（no-cacheの指定や、現在時刻・乱数などを使う場合は不可）
+
+    Args:
+        code (str): コード
+
+    Returns:
+        bool: キャッシュしてよい場合はTrue
+    """
+    if NO_CACHE_MARKER in code:
+        return False
+    if re.search(r"\bseed\s*\(", code):
+        # 乱数のシードを固定している場合、乱数は再現できる
+        patterns = [p for p in NONDETERMINISTIC_PATTERNS if "random" not in p.pattern]
+    else:
+        patterns = NONDETERMINISTIC_PATTERNS
+    return not any(p.search(code) for p in patterns)
+
+
+def strip_notices(output: str) -> str:
+    """
+    出力の先頭から、その実行だけの通知（実行待ちの時間・カーネルの切り替え）を取り除く
+
+    Args:
+        output (str): 実行結果の出力
+
+    Returns:
+        str: 通知を除いた出力（キャッシュから返す別の実行に通知が表示されないようにする）
+    """
+    while True:
+        if output.startswith(STATE_RESET_NOTICE):
+            output = output[len(STATE_RESET_NOTICE) :]
+            continue
+        match = WAIT_NOTICE_PATTERN.match(output)
+        if match is None:
+            return output
+        output = output[match.end() :]
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment_fingerprint(executor_name: str = "") -> str:
+    """
+    実行環境の識別子を取得（Pythonと主要パッケージのバージョン、初期化スクリプトの内容）
+
+    パッケージのメタデータの読み込みに時間がかかるため、プロセスごとに1回だけ計算します。
+
+    Args:
+        executor_name (str): 実行方式の名前（Executorのクラス名など）
+
+    Returns:
+        str: 12桁の識別子
+    """
+    digest = hashlib.sha1(f"{executor_name};{sys.version}".encode())
+    for package in ENVIRONMENT_PACKAGES:
+        try:
+            version = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            version = "missing"
+        digest.update(f"{package}:{version};".encode())
+    try:
+        digest.update(Path(BOOTSTRAP_SCRIPT).read_bytes())
+    except OSError:
+        digest.update(b"bootstrap:missing")
+    return digest.hexdigest()[:12]
+
+
+class ExecutionResultCache:
+    """実行結果（終了コード・出力・作成されたファイル）をTTLと容量の上限付きで保持するキャッシュ"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 256,
+        max_bytes: int = 200 * 1024 * 1024,
+    ):
+        """
+        初期化
+
+        Args:
+            ttl_seconds (float): 保存してから有効な時間（秒）
+            max_entries (int): 保持する最大件数（超えたら最も古く使われたものから削除）
+            max_bytes (int): 保持する出力・ファイルの合計サイズの上限（バイト）
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[str, Dict]" = collections.OrderedDict()
+        self._total_bytes = 0
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("execution_cache.entries", len(self._entries))
+        metrics.set_gauge("execution_cache.bytes", self._total_bytes)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry["size"]
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        キャッシュを取得（期限切れの場合は削除してNone）
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            Optional[Dict]: exit_code, output, artifacts（相対パス→内容）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry["stored_at"] > self.ttl_seconds:
+                self._remove(key)
+                metrics.increment("execution_cache.expired")
+                self._update_gauges()
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, exit_code: int, output: str, artifacts: Dict[str, bytes]) -> bool:
+        """
+        実行結果を保存（1件で上限を超える場合は保存しない）
+
+        Args:
+            key (str): キャッシュキー
+            exit_code (int): 終了コード
+            output (str): 出力
+            artifacts (Dict[str, bytes]): 作業ディレクトリからの相対パスとファイルの内容
+
+        Returns:
+            bool: 保存した場合はTrue
+        """
+        size = len(output.encode("utf-8")) + sum(len(b) for b in artifacts.values())
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "exit_code": exit_code,
+                "output": output,
+                "artifacts": artifacts,
+                "size": size,
+                "stored_at": time.monotonic(),
+            }
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                metrics.increment("execution_cache.evictions")
+            self._update_gauges()
+        return True
+
+    def clear(self) -> None:
+        """すべてのキャッシュを削除"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._update_gauges()
+
+    def stats(self) -> Dict:
+        """キャッシュの状態（件数・合計サイズ）を取得"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes}
+
+
+_cache: Optional[ExecutionResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_execution_cache() -> Optional[ExecutionResultCache]:
+    """
+    プロセス共通の実行結果キャッシュを取得（初回のみ生成）
+
+    環境変数CODE_RESULT_CACHEが"0"の場合は無効（None）です。有効期間・上限は
+    CODE_RESULT_CACHE_TTL_SECONDS（既定3600）、CODE_RESULT_CACHE_MAX_ENTRIES（既定256）、
+    CODE_RESULT_CACHE_MAX_MB（既定200）で指定します。
+    """
+    global _cache
+    if os.getenv("CODE_RESULT_CACHE", "1").lower() in ("0", "false", "off"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExecutionResultCache(
+                ttl_seconds=float(os.getenv("CODE_RESULT_CACHE_TTL_SECONDS", "3600")),
+                max_entries=int(os.getenv("CODE_RESULT_CACHE_MAX_ENTRIES", "256")),
+                max_bytes=int(float(os.getenv("CODE_RESULT_CACHE_MAX_MB", "200")) * 1024 * 1024),
+            )
+        return _cache
+
+
+def _snapshot_files(work_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """作業ディレクトリ内のファイルの更新時刻とサイズを取得（実行用のコードファイルと隠しディレクトリは除く）"""
+    files = {}
+    for root, dirs, names in os.walk(work_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if CODE_FILE_PATTERN.match(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[os.path.relpath(path, work_dir)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+class CachedCodeExecutor(CodeExecutor):
+    """実行結果をExecutionResultCacheで再利用するExecutor（実際の実行は内側のExecutorに委譲）"""
+
+    def __init__(
+        self,
+        executor: CodeExecutor,
+        cache: ExecutionResultCache,
+        work_dir: str,
+        stateful: bool = True,
+        dataset_version: Callable[[], str] = get_dataset_version,
+    ):
+        """
+        初期化
+
+        Args:
+            executor (CodeExecutor): 実際にコードを実行するExecutor
+            cache (ExecutionResultCache): 実行結果キャッシュ
+            work_dir (str): 内側のExecutorの作業ディレクトリ（作成されたファイルの検出に使用）
+            stateful (bool): 変数を実行間で保持するExecutorか（Trueの場合はこれまでのコードもキーに含める）
+            dataset_version (Callable[[], str]): 入力データのバージョンを返す関数
+        """
+        self._executor = executor
+        self._cache = cache
+        self.work_dir = Path(work_dir)
+        self._stateful = stateful
+        self._dataset_version = dataset_version
+        self._environment = get_environment_fingerprint(type(executor).__name__)
+        # これまでに実行したコードの並びのハッシュと、キャッシュから返して未実行のコード
+        self._history = hashlib.sha256()
+        self._pending: List[List[CodeBlock]] = []
+
+    def _make_key(self, code_blocks: List[CodeBlock]) -> Tuple[str, Any]:
+        """キャッシュキーと、このコードを実行した後の実行履歴のハッシュを返す"""
+        history = self._history.copy() if self._stateful else hashlib.sha256()
+        for block in code_blocks:
+            history.update(
+                f"{block.language.lower()}\n{normalize_code(block.code)}\n\x00".encode()
+            )
+        digest = hashlib.sha256(history.digest())
+        digest.update(f"{self._dataset_version()};{self._environment}".encode())
+        return digest.hexdigest(), history
+
+    def _restore_artifacts(self, artifacts: Dict[str, bytes]) -> None:
+        for relative_path, content in artifacts.items():
+            path = self.work_dir / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+    def _collect_artifacts(self, before: Dict[str, Tuple[int, int]]) -> Dict[str, bytes]:
+        artifacts = {}
+        for relative_path, stat in _snapshot_files(self.work_dir).items():
+            if before.get(relative_path) != stat:
+                try:
+                    artifacts[relative_path] = (self.work_dir / relative_path).read_bytes()
+                except OSError:
+                    continue
+        return artifacts
+
+    async def _replay_pending(self, cancellation_token: CancellationToken) -> None:
+        """キャッシュから返したコードを実行し、カーネルの変数をそろえる"""
+        pending, self._pending = self._pending, []
+        for code_blocks in pending:
+            metrics.increment("execution_cache.replays")
+            result = await self._executor.execute_code_blocks(code_blocks, cancellation_token)
+            if result.exit_code != 0:
+                logger.warning(
+                    f"キャッシュ済みコードの再実行に失敗しました（終了コード{result.exit_code}）"
+                )
+                break
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        """
+        コードブロックを実行（同じコード・データ・環境の結果があれば実行せずに返す）
+
+        Args:
+            code_blocks (List[CodeBlock]): 実行するコードブロック
+            cancellation_token (CancellationToken): キャンセル用トークン
+
+        Returns:
+            CodeResult: 終了コードと出力
+        """
+        code = "\n".join(block.code for block in code_blocks)
+        if not is_cacheable(code):
+            metrics.increment("execution_cache.bypassed")
+            await self._replay_pending(cancellation_token)
+            # 結果が再現できないコードの後は、同じ並びでもキャッシュを使わない
+            self._history.update(os.urandom(16))
+            return await self._executor.execute_code_blocks(code_blocks, cancellation_token)
+
+        key, next_history = self._make_key(code_blocks)
+        work_dir = str(self.work_dir.resolve())
+        entry = self._cache.get(key)
+        if entry is not None:
+            metrics.increment("execution_cache.hits")
+            await asyncio.to_thread(self._restore_artifacts, entry["artifacts"])
+            if self._stateful:
+                self._pending.append(code_blocks)
+                self._history = next_history
+            return CodeResult(
+                exit_code=entry["exit_code"],
+                output=entry["output"].replace(WORK_DIR_PLACEHOLDER, work_dir),
+            )
+
+        metrics.increment("execution_cache.misses")
+        await self._replay_pending(cancellation_token)
+        before = await asyncio.to_thread(_snapshot_files, self.work_dir)
+        result = await self._executor.execute_code_blocks(code_blocks, cancellation_token)
+        if self._stateful:
+            self._history = next_history
+        if result.exit_code == 0:
+            artifacts = await asyncio.to_thread(self._collect_artifacts, before)
+            output = strip_notices(result.output).replace(work_dir, WORK_DIR_PLACEHOLDER)
+            if self._cache.put(key, result.exit_code, output, artifacts):
+                metrics.increment("execution_cache.stores")
+        return result
+
+    async def start(self) -> None:
+        await self._executor.start()
+
+    async def stop(self) -> None:
+        """内側のExecutorを停止し、実行履歴を破棄"""
+        self._history = hashlib.sha256()
+        self._pending = []
+        await self._executor.stop()
+
+    async def restart(self) -> None:
+        """内側のExecutorを再起動し、実行履歴を破棄"""
+        self._history = hashlib.sha256()
+        self._pending = []
+        await self._executor.restart()
@@ -0,0 +1,292 @@
+"""
+コード実行の同時実行数の制御
+
+多数のセッションがexecute_toolを同時に実行すると、CPU・メモリを使い切ってインスタンス全体が
+遅くなります。このモジュールはExecutorの手前で実行の開始を制御します。
+
+- ExecutionLimiter: 全体の同時実行数とユーザーごとの同時実行数を制限し、待ち行列は上限付き。
+  空きができたら、実行中の件数が少ないユーザー、最後に開始したのが古いユーザーの順に開始します
+- LimitedCodeExecutor: 任意のCodeExecutorをラップし、ExecutionLimiterの許可を得てから実行するExecutor
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from .execution_output import ExecutionOutputStream
+from .kernel_executor import CANCELLED_EXIT_CODE
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+POLL_INTERVAL_SECONDS = 0.1
+
+# この時間以上待った場合は、待ち時間を出力の先頭に表示する
+WAIT_NOTICE_SECONDS = 1.0
+
+# 出力の先頭に表示する待ち時間の通知（結果をキャッシュする前に取り除くためのパターン）
+WAIT_NOTICE_PATTERN = re.compile(r"（混雑のため\d+番目で待機し、\d+(?:\.\d+)?秒後に実行しました）\n")
+
+
+class QueueFullError(RuntimeError):
+    """待ち行列が上限に達している"""
+
+
+class _Ticket:
+    """待ち行列の1件"""
+
+    def __init__(self, user: str, sequence: int):
+        self.user = user
+        self.sequence = sequence
+        self.enqueued_at = time.perf_counter()
+
+
+class ExecutionLimiter:
+    """全体・ユーザーごとの同時実行数を制限し、ユーザー間で公平に実行を開始させるクラス"""
+
+    def __init__(self, max_concurrent: int = 4, max_per_user: int = 2, max_queue: int = 20):
+        """
+        初期化
+
+        Args:
+            max_concurrent (int): 全体の同時実行数の上限
+            max_per_user (int): 1ユーザーの同時実行数の上限
+            max_queue (int): 待ち行列の上限（超えた要求はQueueFullError）
+        """
+        if max_concurrent < 1 or max_per_user < 1:
+            raise ValueError("max_concurrentとmax_per_userは1以上を指定してください")
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+
+        self._condition = threading.Condition()
+        self._running: Dict[str, int] = {}
+        self._waiting: List[_Ticket] = []
+        # ユーザーごとの最後に開始した順番（ラウンドロビンに使用）
+        self._last_started: Dict[str, int] = {}
+        self._sequence = itertools.count()
+
+    def _running_count(self) -> int:
+        return sum(self._running.values())
+
+    def _ordered_waiters(self) -> List[_Ticket]:
+        """開始させる順に並べた待ち行列（実行中の件数が少ない > 最後の開始が古い > 到着順）"""
+        return sorted(
+            self._waiting,
+            key=lambda t: (
+                self._running.get(t.user, 0),
+                self._last_started.get(t.user, -1),
+                t.sequence,
+            ),
+        )
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        if self._running_count() >= self.max_concurrent:
+            return None
+        for ticket in self._ordered_waiters():
+            if self._running.get(ticket.user, 0) < self.max_per_user:
+                return ticket
+        return None
+
+    def _position(self, ticket: _Ticket) -> int:
+        return self._ordered_waiters().index(ticket) + 1
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("execution_limiter.running", self._running_count())
+        metrics.set_gauge("execution_limiter.queue_depth", len(self._waiting))
+
+    def acquire(
+        self,
+        user: str,
+        cancel: Optional[threading.Event] = None,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> Optional[Dict]:
+        """
+        実行の開始を許可されるまで待機
+
+        Args:
+            user (str): ユーザー（セッション）の識別子
+            cancel (Optional[threading.Event]): セットされたら待機をやめるイベント
+            on_position (Optional[Callable[[int], None]]): 待ち順（1始まり）が変わるたびに呼ばれる関数
+
+        Returns:
+            Optional[Dict]: wait_seconds（待ち時間）とposition（最初の待ち順、待たなかった場合は0）。キャンセル時はNone
+
+        Raises:
+            QueueFullError: 待ち行列が上限に達している場合
+        """
+        cancel = cancel or threading.Event()
+        with self._condition:
+            ticket = _Ticket(user, next(self._sequence))
+            self._waiting.append(ticket)
+            if self._next_ticket() is not ticket and len(self._waiting) > self.max_queue:
+                self._waiting.remove(ticket)
+                metrics.increment("execution_limiter.rejected")
+                raise QueueFullError(
+                    f"実行待ちが上限（{self.max_queue}件）に達しています。しばらくしてから再実行してください。"
+                )
+            first_position = 0
+            last_position = None
+            try:
+                while self._next_ticket() is not ticket:
+                    if cancel.is_set():
+                        return None
+                    position = self._position(ticket)
+                    first_position = first_position or position
+                    if position != last_position:
+                        last_position = position
+                        if on_position is not None:
+                            on_position(position)
+                    self._update_gauges()
+                    self._condition.wait(POLL_INTERVAL_SECONDS)
+            finally:
+                self._waiting.remove(ticket)
+                self._update_gauges()
+                self._condition.notify_all()
+
+            self._running[user] = self._running.get(user, 0) + 1
+            self._last_started[user] = next(self._sequence)
+            self._update_gauges()
+
+        wait_seconds = time.perf_counter() - ticket.enqueued_at
+        metrics.observe("execution_limiter.wait_seconds", wait_seconds)
+        if first_position:
+            logger.info(f"実行待ち: {wait_seconds:.2f}秒（待ち順 {first_position}番目）")
+        return {"wait_seconds": wait_seconds, "position": first_position}
+
+    def release(self, user: str) -> None:
+        """
+        実行の終了を通知し、次の要求を開始させる
+
+        Args:
+            user (str): acquireに渡したユーザーの識別子
+        """
+        with self._condition:
+            count = self._running.get(user, 0) - 1
+            if count > 0:
+                self._running[user] = count
+            else:
+                self._running.pop(user, None)
+            self._update_gauges()
+            self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        """実行中の件数・待ち行列の長さ・上限を取得"""
+        with self._condition:
+            return {
+                "running": self._running_count(),
+                "queue_depth": len(self._waiting),
+                "max_concurrent": self.max_concurrent,
+                "max_per_user": self.max_per_user,
+                "max_queue": self.max_queue,
+            }
+
+
+_limiter: Optional[ExecutionLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_execution_limiter() -> ExecutionLimiter:
+    """
+    プロセス共通の同時実行数の制御を取得（初回のみ生成）
+
+    上限は環境変数EXECUTION_MAX_CONCURRENT（既定はKERNEL_POOL_SIZEと同じ4）、
+    EXECUTION_MAX_PER_USER（既定2）、EXECUTION_MAX_QUEUE（既定20）で指定します。
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ExecutionLimiter(
+                max_concurrent=int(
+                    os.getenv("EXECUTION_MAX_CONCURRENT", os.getenv("KERNEL_POOL_SIZE", "4"))
+                ),
+                max_per_user=int(os.getenv("EXECUTION_MAX_PER_USER", "2")),
+                max_queue=int(os.getenv("EXECUTION_MAX_QUEUE", "20")),
+            )
+        return _limiter
+
+
+class LimitedCodeExecutor(CodeExecutor):
+    """ExecutionLimiterの許可を得てから内側のExecutorで実行するExecutor"""
+
+    def __init__(
+        self,
+        executor: CodeExecutor,
+        limiter: ExecutionLimiter,
+        user: str,
+        output_stream: Optional[ExecutionOutputStream] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            executor (CodeExecutor): 実際にコードを実行するExecutor
+            limiter (ExecutionLimiter): 同時実行数の制御
+            user (str): 公平性の単位となるユーザー（セッション）の識別子
+            output_stream (Optional[ExecutionOutputStream]): 待ち順を画面に表示するための出力先
+        """
+        self._executor = executor
+        self._limiter = limiter
+        self.user = user
+        self._output_stream = output_stream
+
+    def _on_position(self, position: int) -> None:
+        if self._output_stream is not None:
+            self._output_stream.set_status(f"実行待ち: {position}番目")
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        """
+        実行枠が空くまで待ってからコードブロックを実行
+
+        Args:
+            code_blocks (List[CodeBlock]): 実行するコードブロック
+            cancellation_token (CancellationToken): キャンセル用トークン
+
+        Returns:
+            CodeResult: 終了コードと出力（待ち行列が満杯の場合は終了コード1とメッセージ）
+        """
+        cancel = threading.Event()
+        cancellation_token.add_callback(cancel.set)
+        try:
+            admission = await asyncio.to_thread(
+                self._limiter.acquire, self.user, cancel, self._on_position
+            )
+        except QueueFullError as e:
+            return CodeResult(exit_code=1, output=str(e))
+        finally:
+            if self._output_stream is not None:
+                self._output_stream.set_status(None)
+        if admission is None:
+            return CodeResult(exit_code=CANCELLED_EXIT_CODE, output="\nCancelled")
+
+        try:
+            result = await self._executor.execute_code_blocks(code_blocks, cancellation_token)
+        finally:
+            self._limiter.release(self.user)
+        if admission["wait_seconds"] >= WAIT_NOTICE_SECONDS:
+            notice = (
+                f"（混雑のため{admission['position']}番目で待機し、"
+                f"{admission['wait_seconds']:.1f}秒後に実行しました）\n"
+            )
+            result = CodeResult(exit_code=result.exit_code, output=notice + result.output)
+        return result
+
+    async def start(self) -> None:
+        await self._executor.start()
+
+    async def stop(self) -> None:
+        await self._executor.stop()
+
+    async def restart(self) -> None:
+        await self._executor.restart()
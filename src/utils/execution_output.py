@@ -0,0 +1,284 @@
+"""
+コード実行の出力の逐次表示と切り詰め
+
+機械学習の学習ループなどの長い実行では、終了するまで何も表示されず、終了後に大量の標準出力が
+そのままモデルのコンテキストに入ってしまいます。このモジュールは次の2つを提供します。
+
+- ExecutionOutputStream: 実行中の出力を受け取り、画面（Streamlit）から末尾を読み出すためのバッファ
+- OutputLimitedCodeExecutor: 任意のCodeExecutorをラップし、モデルに返す出力を先頭と末尾だけに
+  切り詰めるExecutor（全文は作業ディレクトリのlogs配下に保存し、そのパスを出力に記載）
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+LOG_DIR_NAME = "logs"
+
+DEFAULT_HEAD_CHARS = 4000
+DEFAULT_TAIL_CHARS = 4000
+
+# 画面表示用に保持する出力の末尾（文字数）
+DISPLAY_TAIL_CHARS = 20000
+
+# 画面を更新する間隔（秒）
+FOLLOW_INTERVAL_SECONDS = 0.5
+
+
+class ExecutionOutputStream:
+    """実行中の出力を受け取り、画面表示用に末尾を保持するスレッドセーフなバッファ"""
+
+    def __init__(self, max_chars: int = DISPLAY_TAIL_CHARS):
+        """
+        初期化
+
+        Args:
+            max_chars (int): 保持する出力の末尾の文字数
+        """
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._text = ""
+        self._total_chars = 0
+        self._running = False
+        self._started_at = 0.0
+        # 実行待ちなど、出力の代わりに表示する状態
+        self._status: Optional[str] = None
+        # 内容が変わるたびに増える番号（画面側で再描画が必要か判定する）
+        self._version = 0
+
+    def begin(self) -> None:
+        """新しい実行の開始（前回の出力は破棄）"""
+        with self._lock:
+            self._text = ""
+            self._total_chars = 0
+            self._running = True
+            self._started_at = time.monotonic()
+            self._status = None
+            self._version += 1
+
+    def set_status(self, status: Optional[str]) -> None:
+        """実行中の状態（「実行待ち: 2番目」など）を設定（Noneで消去）"""
+        with self._lock:
+            if status != self._status:
+                self._status = status
+                self._version += 1
+
+    def write(self, text: str) -> None:
+        """実行中の出力を追加"""
+        if not text:
+            return
+        with self._lock:
+            self._text = (self._text + text)[-self.max_chars :]
+            self._total_chars += len(text)
+            self._version += 1
+
+    def end(self) -> None:
+        """実行の終了"""
+        with self._lock:
+            self._running = False
+            self._version += 1
+
+    def snapshot(self) -> Dict:
+        """
+        現在の状態を取得
+
+        Returns:
+            Dict: running, status, text（出力の末尾）, total_chars, elapsed_seconds, version
+        """
+        with self._lock:
+            return {
+                "running": self._running,
+                "status": self._status,
+                "text": self._text,
+                "total_chars": self._total_chars,
+                "elapsed_seconds": (
+                    time.monotonic() - self._started_at if self._running else 0.0
+                ),
+                "version": self._version,
+            }
+
+
+async def follow_output(
+    stream: ExecutionOutputStream,
+    render: Callable[[Dict], None],
+    interval_seconds: float = FOLLOW_INTERVAL_SECONDS,
+) -> None:
+    """
+    出力が変わるたびにrenderを呼び出す（キャンセルされるまで続ける）
+
+    Streamlitの要素はスクリプトのスレッドからしか更新できないため、run_streamと同じ
+    イベントループのタスクとして実行します。
+
+    Args:
+        stream (ExecutionOutputStream): 監視する出力
+        render (Callable[[Dict], None]): snapshot()の結果を受け取って表示する関数
+        interval_seconds (float): 確認する間隔（秒）
+    """
+    last_version = None
+    while True:
+        snapshot = stream.snapshot()
+        if snapshot["version"] != last_version:
+            last_version = snapshot["version"]
+            try:
+                render(snapshot)
+            except Exception as e:
+                logger.warning(f"実行中の出力の表示に失敗しました: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def truncate_output(
+    text: str,
+    head_chars: int = DEFAULT_HEAD_CHARS,
+    tail_chars: int = DEFAULT_TAIL_CHARS,
+    log_path: Optional[str] = None,
+) -> str:
+    """
+    出力の先頭と末尾だけを残し、間を省略した旨の注記に置き換える
+
+    切り詰める位置は行の途中にならないよう改行に合わせます（近くに改行がない場合は文字数で切ります）。
+
+    Args:
+        text (str): 出力
+        head_chars (int): 残す先頭の文字数
+        tail_chars (int): 残す末尾の文字数
+        log_path (Optional[str]): 全文を保存したファイルのパス（注記に記載）
+
+    Returns:
+        str: 切り詰めた出力（上限以下の場合はそのまま）
+    """
+    if len(text) <= head_chars + tail_chars:
+        return text
+
+    head_end = head_chars
+    newline = text.rfind("\n", head_chars // 2, head_chars)
+    if newline >= 0:
+        head_end = newline + 1
+    tail_start = len(text) - tail_chars
+    newline = text.find("\n", tail_start, len(text) - tail_chars // 2)
+    if newline >= 0:
+        tail_start = newline + 1
+    head = text[:head_end]
+    tail = text[tail_start:]
+
+    omitted_chars = tail_start - head_end
+    omitted_lines = text.count("\n", head_end, tail_start)
+    note = f"\n... （出力が長いため{omitted_lines}行・{omitted_chars}文字を省略しました"
+    if log_path:
+        note += f"。全文は{log_path}に保存しています"
+    note += "） ...\n"
+    return head + note + tail
+
+
+def save_output_log(text: str, work_dir: str) -> str:
+    """
+    出力の全文を作業ディレクトリのlogs配下に保存
+
+    Args:
+        text (str): 出力の全文
+        work_dir (str): 作業ディレクトリ
+
+    Returns:
+        str: 保存したファイルの作業ディレクトリからの相対パス
+    """
+    log_dir = os.path.join(work_dir, LOG_DIR_NAME)
+    os.makedirs(log_dir, exist_ok=True)
+    file_name = f"output_{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.log"
+    with open(os.path.join(log_dir, file_name), "w", encoding="utf-8") as f:
+        f.write(text)
+    return f"{LOG_DIR_NAME}/{file_name}"
+
+
+def get_output_limits() -> Dict[str, int]:
+    """
+    モデルに返す出力の上限を環境変数から取得
+
+    EXECUTION_OUTPUT_HEAD_CHARS（既定4000）、EXECUTION_OUTPUT_TAIL_CHARS（既定4000）で指定します。
+    """
+    return {
+        "head_chars": int(os.getenv("EXECUTION_OUTPUT_HEAD_CHARS", str(DEFAULT_HEAD_CHARS))),
+        "tail_chars": int(os.getenv("EXECUTION_OUTPUT_TAIL_CHARS", str(DEFAULT_TAIL_CHARS))),
+    }
+
+
+class OutputLimitedCodeExecutor(CodeExecutor):
+    """内側のExecutorの出力を先頭と末尾に切り詰めて返し、全文をファイルに保存するExecutor"""
+
+    def __init__(
+        self,
+        executor: CodeExecutor,
+        work_dir: str,
+        head_chars: int = DEFAULT_HEAD_CHARS,
+        tail_chars: int = DEFAULT_TAIL_CHARS,
+        output_stream: Optional[ExecutionOutputStream] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            executor (CodeExecutor): 実際にコードを実行するExecutor
+            work_dir (str): 全文のログを保存する作業ディレクトリ
+            head_chars (int): モデルに返す先頭の文字数
+            tail_chars (int): モデルに返す末尾の文字数
+            output_stream (Optional[ExecutionOutputStream]): 実行の開始・終了を通知する出力（画面表示用）
+        """
+        self._executor = executor
+        self.work_dir = work_dir
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._output_stream = output_stream
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        """
+        コードブロックを実行し、長い出力を切り詰めて返す
+
+        Args:
+            code_blocks (List[CodeBlock]): 実行するコードブロック
+            cancellation_token (CancellationToken): キャンセル用トークン
+
+        Returns:
+            CodeResult: 終了コードと（切り詰めた）出力
+        """
+        if self._output_stream is not None:
+            self._output_stream.begin()
+        try:
+            result = await self._executor.execute_code_blocks(code_blocks, cancellation_token)
+        finally:
+            if self._output_stream is not None:
+                self._output_stream.end()
+
+        output = result.output
+        if len(output) <= self.head_chars + self.tail_chars:
+            return result
+        try:
+            log_path = await asyncio.to_thread(save_output_log, output, self.work_dir)
+        except OSError as e:
+            logger.warning(f"実行結果の全文を保存できませんでした: {e}")
+            log_path = None
+        truncated = truncate_output(output, self.head_chars, self.tail_chars, log_path)
+        metrics.increment("execution_output.truncated")
+        metrics.increment("execution_output.chars_omitted", len(output) - len(truncated))
+        return CodeResult(exit_code=result.exit_code, output=truncated)
+
+    async def start(self) -> None:
+        await self._executor.start()
+
+    async def stop(self) -> None:
+        await self._executor.stop()
+
+    async def restart(self) -> None:
+        await self._executor.restart()
@@ -0,0 +1,307 @@
+"""
+SKU別の不良率・ロス内訳の予測モデルを管理するサービス
+
+データセットのバージョンごとに1回だけ学習し、モデルと予測結果をディスクに保存します。
+データが更新された場合は古いモデルで即座に応答しつつ、バックグラウンドで再学習します。
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMRegressor
+
+from .datasets import get_dataset_version, get_sampledata_path
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MES_TOTAL_FILE = "mes_total.csv"
+MES_LOSS_FILE = "mes_total_err.csv"
+LOSS_CATEGORIES = ["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"]
+
+# 予測対象（いずれも総生産数に対する比率）
+TARGETS = ["不良率"] + [f"{c}率" for c in LOSS_CATEGORIES]
+
+LAGS = (1, 7, 14)
+ROLLING_WINDOWS = (7, 28)
+FEATURE_COLUMNS = (
+    [f"lag_{lag}" for lag in LAGS]
+    + [f"rolling_mean_{w}" for w in ROLLING_WINDOWS]
+    + ["dayofweek", "month", "trend"]
+)
+
+# 学習時にまとめて計算しておく最大予測日数
+MAX_HORIZON_DAYS = 60
+VALIDATION_DAYS = 28
+
+DEFAULT_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data",
+    "models",
+)
+
+
+def load_mes_rate_series() -> pd.DataFrame:
+    """
+    MES総合データとロス内訳データを結合し、SKU×日付ごとの不良率・ロス率を算出
+
+    Returns:
+        pd.DataFrame: 年月日, SKU, 総生産数, 各予測対象の比率
+    """
+    total_df = pd.read_csv(get_sampledata_path(MES_TOTAL_FILE), encoding="utf-8-sig")
+    loss_df = pd.read_csv(get_sampledata_path(MES_LOSS_FILE), encoding="utf-8-sig")
+    df = total_df.merge(loss_df, on=["年月日", "SKU"], how="left")
+    df["年月日"] = pd.to_datetime(df["年月日"])
+    df["総生産数"] = df["良品数"] + df["不良数"]
+    df["不良率"] = df["不良数"] / df["総生産数"]
+    for category in LOSS_CATEGORIES:
+        df[f"{category}率"] = df[category].fillna(0) / df["総生産数"]
+    return df[["年月日", "SKU", "総生産数"] + TARGETS].sort_values(["SKU", "年月日"])
+
+
+def _make_features(history: List[float], date: pd.Timestamp, trend: int) -> List[float]:
+    """直近の実績（または予測値）の履歴から1日分の特徴量を作成"""
+    features = [history[-lag] if len(history) >= lag else np.nan for lag in LAGS]
+    features += [
+        float(np.mean(history[-w:])) if history else np.nan for w in ROLLING_WINDOWS
+    ]
+    features += [date.dayofweek, date.month, trend]
+    return features
+
+
+def _build_training_frame(dates: pd.Series, values: np.ndarray) -> pd.DataFrame:
+    """時系列全体から学習用の特徴量行列を作成"""
+    rows = [
+        _make_features(list(values[:i]), dates.iloc[i], i)
+        for i in range(max(LAGS), len(values))
+    ]
+    frame = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    frame["target"] = values[max(LAGS) :]
+    return frame
+
+
+def _new_model() -> LGBMRegressor:
+    return LGBMRegressor(
+        n_estimators=200,
+        learning_rate=0.05,
+        num_leaves=15,
+        min_child_samples=10,
+        verbose=-1,
+    )
+
+
+class ForecastService:
+    """SKU別の予測モデルをデータセットのバージョン単位でキャッシュするクラス"""
+
+    def __init__(self, model_dir: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            model_dir (Optional[str]): モデルの保存先（省略時は環境変数FORECAST_MODEL_DIRまたはdata/models）
+        """
+        self.model_dir = model_dir or os.getenv("FORECAST_MODEL_DIR", DEFAULT_MODEL_DIR)
+        self._bundles: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._retraining: Dict[str, threading.Thread] = {}
+
+    def _bundle_path(self, sku: str) -> str:
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in sku)
+        return os.path.join(self.model_dir, f"forecast_{safe_name}.joblib")
+
+    def train(self, sku: str, version: Optional[str] = None) -> Dict:
+        """
+        指定SKUの全予測対象のモデルを学習し、予測結果と合わせて保存
+
+        Args:
+            sku (str): SKU（例: "SKU-1234"）
+            version (Optional[str]): データセットのバージョン（省略時は現在のバージョン）
+
+        Returns:
+            Dict: 学習済みモデル・予測結果・検証誤差を含むバンドル
+        """
+        version = version or get_dataset_version(MES_TOTAL_FILE, MES_LOSS_FILE)
+        start_time = time.perf_counter()
+
+        df = load_mes_rate_series()
+        series = df[df["SKU"] == sku].reset_index(drop=True)
+        if len(series) <= max(LAGS) + VALIDATION_DAYS:
+            raise ValueError(f"{sku}の学習に必要なデータが不足しています")
+
+        dates = series["年月日"]
+        last_date = dates.iloc[-1]
+        future_dates = pd.date_range(
+            last_date + pd.Timedelta(days=1), periods=MAX_HORIZON_DAYS, freq="D"
+        )
+        forecast = pd.DataFrame({"年月日": future_dates})
+        models = {}
+        validation_mae = {}
+
+        for target in TARGETS:
+            values = series[target].to_numpy(dtype=float)
+            frame = _build_training_frame(dates, values)
+
+            # 直近VALIDATION_DAYS日を検証に使い、その後全期間で再学習する
+            train_part = frame.iloc[:-VALIDATION_DAYS]
+            valid_part = frame.iloc[-VALIDATION_DAYS:]
+            model = _new_model()
+            model.fit(train_part[FEATURE_COLUMNS], train_part["target"])
+            predicted = model.predict(valid_part[FEATURE_COLUMNS])
+            validation_mae[target] = float(
+                np.mean(np.abs(predicted - valid_part["target"].to_numpy()))
+            )
+
+            model = _new_model()
+            model.fit(frame[FEATURE_COLUMNS], frame["target"])
+            models[target] = model
+
+            # 予測値を履歴に追加しながら再帰的に先の日付を予測
+            history = list(values)
+            predictions = []
+            for step, date in enumerate(future_dates):
+                features = _make_features(history, date, len(values) + step)
+                value = float(model.predict(pd.DataFrame([features], columns=FEATURE_COLUMNS))[0])
+                value = max(value, 0.0)
+                predictions.append(value)
+                history.append(value)
+            forecast[target] = predictions
+
+        elapsed = time.perf_counter() - start_time
+        bundle = {
+            "sku": sku,
+            "version": version,
+            "trained_at": datetime.now().isoformat(timespec="seconds"),
+            "last_actual_date": last_date.strftime("%Y-%m-%d"),
+            "models": models,
+            "forecast": forecast,
+            "validation_mae": validation_mae,
+            "training_seconds": elapsed,
+        }
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        joblib.dump(bundle, self._bundle_path(sku))
+        metrics.observe("forecast.train_seconds", elapsed)
+        logger.info(f"予測モデルを学習しました: {sku} (version={version}, {elapsed:.2f}秒)")
+        return bundle
+
+    def _load_bundle(self, sku: str) -> Optional[Dict]:
+        """保存済みのバンドルを読み込み（存在しない場合はNone）"""
+        path = self._bundle_path(sku)
+        if not os.path.exists(path):
+            return None
+        try:
+            with metrics.measure("forecast.load_seconds"):
+                return joblib.load(path)
+        except Exception as e:
+            logger.warning(f"予測モデルの読み込みに失敗しました {path}: {e}")
+            return None
+
+    def _retrain_in_background(self, sku: str, version: str) -> None:
+        """同じSKUの再学習が重複しないようにバックグラウンドで再学習"""
+
+        def run():
+            try:
+                bundle = self.train(sku, version)
+                with self._lock:
+                    self._bundles[sku] = bundle
+            except Exception as e:
+                logger.error(f"予測モデルの再学習に失敗しました {sku}: {e}")
+            finally:
+                with self._lock:
+                    self._retraining.pop(sku, None)
+
+        with self._lock:
+            if sku in self._retraining:
+                return
+            thread = threading.Thread(target=run, name=f"forecast-retrain-{sku}", daemon=True)
+            self._retraining[sku] = thread
+        metrics.increment("forecast.background_retrains")
+        thread.start()
+
+    def get_bundle(self, sku: str) -> Dict:
+        """
+        現在のデータセットに対応するバンドルを取得
+
+        メモリ → ディスクの順に探し、どちらもなければ同期的に学習します。
+        古いバージョンのバンドルしかない場合はそれを返し、再学習をバックグラウンドで開始します。
+
+        Args:
+            sku (str): SKU
+
+        Returns:
+            Dict: バンドル（古いモデルで応答した場合は"stale"がTrue）
+        """
+        version = get_dataset_version(MES_TOTAL_FILE, MES_LOSS_FILE)
+        with self._lock:
+            bundle = self._bundles.get(sku)
+        if bundle is None:
+            bundle = self._load_bundle(sku)
+            if bundle is not None:
+                with self._lock:
+                    self._bundles[sku] = bundle
+
+        if bundle is not None and bundle["version"] == version:
+            metrics.increment("forecast.model_cache_hits")
+            return {**bundle, "stale": False}
+
+        if bundle is not None:
+            logger.info(f"データ更新を検知しました。{sku}の予測モデルを再学習します。")
+            self._retrain_in_background(sku, version)
+            return {**bundle, "stale": True}
+
+        metrics.increment("forecast.model_cache_misses")
+        bundle = self.train(sku, version)
+        with self._lock:
+            self._bundles[sku] = bundle
+        return {**bundle, "stale": False}
+
+    def predict(self, sku: str, horizon_days: int = 14) -> Dict:
+        """
+        指定SKUの将来の不良率・ロス率の予測値を取得
+
+        Args:
+            sku (str): SKU
+            horizon_days (int): 予測日数（1〜MAX_HORIZON_DAYS）
+
+        Returns:
+            Dict: 予測結果（forecast）とモデル情報
+        """
+        if not 1 <= horizon_days <= MAX_HORIZON_DAYS:
+            raise ValueError(f"予測日数は1〜{MAX_HORIZON_DAYS}日で指定してください")
+
+        start_time = time.perf_counter()
+        bundle = self.get_bundle(sku)
+        forecast = bundle["forecast"].head(horizon_days).copy()
+        elapsed = time.perf_counter() - start_time
+        metrics.observe("forecast.predict_seconds", elapsed)
+        return {
+            "sku": sku,
+            "version": bundle["version"],
+            "trained_at": bundle["trained_at"],
+            "last_actual_date": bundle["last_actual_date"],
+            "stale": bundle["stale"],
+            "validation_mae": bundle["validation_mae"],
+            "forecast": forecast,
+            "elapsed_ms": elapsed * 1000,
+        }
+
+
+_service: Optional[ForecastService] = None
+_service_lock = threading.Lock()
+
+
+def get_forecast_service() -> ForecastService:
+    """プロセス共通の予測サービスを取得（初回のみ生成）"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ForecastService()
+        return _service
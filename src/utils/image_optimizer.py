@@ -0,0 +1,158 @@
+"""
+アップロード前の画像の最適化
+
+グラフはdpi=300で保存されるため数MBのPNGになりますが、チャット画面ではst.image(..., width=600)で
+表示するだけです。このモジュールはアップロードの前に画像を表示サイズまで縮小し、減色・再圧縮
+（またはWebPに変換）して、一覧表示用のサムネイルも作成します。
+
+- optimize_image: 画像を最適化して保存し、削減できたバイト数などを返す
+- 最適化後の方が大きい場合や画像として読み込めない場合は、元のファイルをそのまま使います
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 画面の表示幅（600px）の2倍（高解像度ディスプレイ向け）
+DEFAULT_MAX_WIDTH = 1200
+DEFAULT_THUMBNAIL_WIDTH = 320
+DEFAULT_WEBP_QUALITY = 85
+
+IMAGE_FORMATS = ("png", "webp")
+OPTIMIZABLE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+THUMBNAIL_SUFFIX = "_thumb"
+
+
+def _resize(image, max_width: int):
+    """幅がmax_widthを超える場合は縦横比を保って縮小"""
+    from PIL import Image
+
+    if max_width <= 0 or image.width <= max_width:
+        return image
+    height = max(1, round(image.height * max_width / image.width))
+    return image.resize((max_width, height), Image.Resampling.LANCZOS)
+
+
+def _save(image, path: str, image_format: str, quantize: bool, webp_quality: int) -> None:
+    """PNG（256色に減色して圧縮）またはWebPで保存"""
+    from PIL import Image
+
+    if image_format == "webp":
+        image.save(path, "WEBP", quality=webp_quality, method=6)
+        return
+    if quantize and image.mode not in ("P", "L"):
+        # グラフは色数が少ないため、256色に減色しても見た目はほぼ変わらない
+        mode = "RGBA" if "A" in image.getbands() else "RGB"
+        image = image.convert(mode).quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    image.save(path, "PNG", optimize=True)
+
+
+def optimized_path(file_path: str, image_format: str) -> str:
+    """最適化後のファイルのパス（拡張子を変換後の形式にする）"""
+    stem, _ = os.path.splitext(file_path)
+    return f"{stem}_opt.{image_format}"
+
+
+def thumbnail_path(file_path: str) -> str:
+    """サムネイルのファイルのパス"""
+    stem, ext = os.path.splitext(file_path)
+    return f"{stem}{THUMBNAIL_SUFFIX}{ext}"
+
+
+def optimize_image(
+    file_path: str,
+    max_width: int = DEFAULT_MAX_WIDTH,
+    image_format: str = "png",
+    quantize: bool = True,
+    thumbnail_width: int = DEFAULT_THUMBNAIL_WIDTH,
+    webp_quality: int = DEFAULT_WEBP_QUALITY,
+) -> Optional[Dict]:
+    """
+    画像を縮小・再圧縮し、サムネイルを作成
+
+    Args:
+        file_path (str): 元の画像のパス（削除はしない）
+        max_width (int): 縮小後の最大の幅（0で縮小しない）
+        image_format (str): 保存形式（"png"または"webp"）
+        quantize (bool): PNGを256色に減色するかどうか
+        thumbnail_width (int): サムネイルの幅（0で作成しない）
+        webp_quality (int): WebPの品質（1〜100）
+
+    Returns:
+        Optional[Dict]: path（アップロードするファイル）, thumbnail_path, original_bytes,
+            optimized_bytes, bytes_saved, width, height。画像でない場合はNone
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"image_formatは{list(IMAGE_FORMATS)}のいずれかを指定してください")
+    if not file_path.lower().endswith(OPTIMIZABLE_EXTENSIONS):
+        return None
+
+    from PIL import Image
+
+    start_time = time.perf_counter()
+    original_bytes = os.path.getsize(file_path)
+    try:
+        with Image.open(file_path) as source:
+            source.load()
+            image = _resize(source, max_width)
+            output_path = optimized_path(file_path, image_format)
+            _save(image, output_path, image_format, quantize, webp_quality)
+
+            thumb = None
+            if thumbnail_width > 0:
+                thumb = thumbnail_path(output_path)
+                _save(_resize(image, thumbnail_width), thumb, image_format, quantize, webp_quality)
+        width, height = image.size
+    except (OSError, ValueError) as e:
+        logger.warning(f"画像を最適化できないため元のファイルを使用します {file_path}: {e}")
+        return None
+
+    optimized_bytes = os.path.getsize(output_path)
+    if optimized_bytes >= original_bytes:
+        # 最適化しても小さくならない場合は元のファイルを使う
+        os.remove(output_path)
+        output_path = file_path
+        optimized_bytes = original_bytes
+    bytes_saved = original_bytes - optimized_bytes
+
+    metrics.observe("image.optimize_seconds", time.perf_counter() - start_time)
+    metrics.increment("image.optimized")
+    metrics.increment("image.original_bytes", original_bytes)
+    metrics.increment("image.optimized_bytes", optimized_bytes)
+    metrics.increment("image.bytes_saved", bytes_saved)
+    logger.info(
+        f"画像を最適化しました: {original_bytes / 1024:.0f}KB -> {optimized_bytes / 1024:.0f}KB"
+        f"（{bytes_saved / 1024:.0f}KB削減、{width}x{height}）"
+    )
+    return {
+        "path": output_path,
+        "thumbnail_path": thumb,
+        "original_bytes": original_bytes,
+        "optimized_bytes": optimized_bytes,
+        "bytes_saved": bytes_saved,
+        "width": width,
+        "height": height,
+    }
+
+
+def get_optimize_options() -> Optional[Dict]:
+    """
+    画像の最適化の設定を環境変数から取得（IMAGE_OPTIMIZE=0の場合はNone）
+
+    IMAGE_MAX_WIDTH（既定1200）、IMAGE_FORMAT（png/webp、既定png）、
+    IMAGE_THUMBNAIL_WIDTH（既定320、0で作成しない）、IMAGE_WEBP_QUALITY（既定85）で指定します。
+    """
+    if os.getenv("IMAGE_OPTIMIZE", "1") == "0":
+        return None
+    return {
+        "max_width": int(os.getenv("IMAGE_MAX_WIDTH", str(DEFAULT_MAX_WIDTH))),
+        "image_format": os.getenv("IMAGE_FORMAT", "png").lower(),
+        "thumbnail_width": int(os.getenv("IMAGE_THUMBNAIL_WIDTH", str(DEFAULT_THUMBNAIL_WIDTH))),
+        "webp_quality": int(os.getenv("IMAGE_WEBP_QUALITY", str(DEFAULT_WEBP_QUALITY))),
+    }
@@ -0,0 +1,185 @@
+"""
+コード実行環境の初期設定
+
+Pythonカーネルの起動時に1回だけ実行し、日本語フォント（IPAexゴシック）の登録、
+Aggバックエンド・rcParamsの設定と、グラフ作成でよく使うモジュール・ヘルパー関数の
+読み込みを行います。bootstrap()の戻り値が実行時の名前空間の初期値になります。
+実行ごとにプロセスを起動する方式では、run_script()で初期化してからコードのファイルを実行します。
+パッケージに依存せず単体のスクリプトとして読み込めるようにしています。
+"""
+
+import os
+import sys
+import traceback
+import uuid
+from datetime import datetime
+from io import StringIO
+from typing import Optional
+
+PROJECT_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+FONT_DIR = os.path.join(PROJECT_ROOT, "assets", "fonts")
+DEFAULT_FONT_FILE = "ipaexg.ttf"
+
+# IPAフォントが見つからない場合（Windowsのローカル開発など）に使うシステムフォント
+FALLBACK_FONTS = ["Yu Gothic", "Meiryo", "MS Gothic", "IPAexGothic", "Noto Sans CJK JP"]
+
+IMAGE_DIR_NAME = "img"
+
+
+def find_font_file(font_dir: str = FONT_DIR) -> Optional[str]:
+    """assets/fontsのフォントファイルを取得（ipaexg.ttfを優先し、なければ最初のTTF/OTF）"""
+    if not os.path.isdir(font_dir):
+        return None
+    candidates = sorted(
+        f for f in os.listdir(font_dir) if f.lower().endswith((".ttf", ".otf"))
+    )
+    if DEFAULT_FONT_FILE in candidates:
+        return os.path.join(font_dir, DEFAULT_FONT_FILE)
+    return os.path.join(font_dir, candidates[0]) if candidates else None
+
+
+def configure_matplotlib(font_path: Optional[str] = None) -> str:
+    """
+    Aggバックエンドと日本語フォントを設定
+
+    Args:
+        font_path (Optional[str]): 登録するフォントファイル（省略時はassets/fontsから検索）
+
+    Returns:
+        str: 設定したフォント名（見つからない場合は代替フォントの一覧）
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.font_manager as fm
+    import matplotlib.pyplot as plt
+
+    font_path = font_path or find_font_file()
+    if font_path and os.path.exists(font_path):
+        fm.fontManager.addfont(font_path)
+        font_name = fm.FontProperties(fname=font_path).get_name()
+        plt.rcParams["font.family"] = font_name
+    else:
+        # インストール済みのものだけを指定し、見つからないフォントの警告を避ける
+        installed = {f.name for f in fm.fontManager.ttflist}
+        families = [f for f in FALLBACK_FONTS if f in installed] or ["sans-serif"]
+        font_name = ", ".join(families)
+        plt.rcParams["font.family"] = families
+    plt.rcParams["axes.unicode_minus"] = False
+    plt.rcParams["savefig.bbox"] = "tight"
+    return font_name
+
+
+def save_figure(fig=None, prefix: str = "graph", dpi: int = 300) -> str:
+    """
+    図を作業ディレクトリのimgフォルダにPNGで保存して閉じる
+
+    Args:
+        fig: 保存する図（省略時は現在の図）
+        prefix (str): ファイル名の接頭辞
+        dpi (int): 解像度
+
+    Returns:
+        str: 保存したファイルの絶対パス（upload_image_to_blobに渡す）
+    """
+    import matplotlib.pyplot as plt
+
+    fig = fig or plt.gcf()
+    image_dir = os.path.abspath(IMAGE_DIR_NAME)
+    os.makedirs(image_dir, exist_ok=True)
+    file_path = os.path.join(image_dir, f"{prefix}_{uuid.uuid4()}.png")
+    fig.savefig(file_path, dpi=dpi)
+    plt.close(fig)
+    print(f"グラフを保存しました: {file_path}")
+    return file_path
+
+
+def limit_resources(
+    memory_limit_mb: Optional[int] = None, cpu_limit_seconds: Optional[float] = None
+) -> None:
+    """
+    このプロセスの仮想メモリとCPU時間の上限を設定（Unixのみ、Windowsでは何もしない）
+
+    Args:
+        memory_limit_mb (Optional[int]): 仮想メモリの上限（MB、超えるとMemoryError）
+        cpu_limit_seconds (Optional[float]): CPU時間の上限（秒、超えるとプロセスが終了）
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+
+    for limit_name, value in (
+        ("RLIMIT_AS", memory_limit_mb and memory_limit_mb * 1024 * 1024),
+        ("RLIMIT_CPU", cpu_limit_seconds and int(cpu_limit_seconds) + 1),
+    ):
+        if not value:
+            continue
+        limit = getattr(resource, limit_name)
+        _, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, hard))
+
+
+def bootstrap(
+    memory_limit_mb: Optional[int] = None, cpu_limit_seconds: Optional[float] = None
+) -> dict:
+    """
+    実行環境を初期化し、名前空間にあらかじめ用意する変数を返す
+
+    Args:
+        memory_limit_mb (Optional[int]): 実行ごとにプロセスを起動する方式で設定するメモリ上限（MB）
+        cpu_limit_seconds (Optional[float]): 同じくCPU時間の上限（秒）
+
+    Returns:
+        dict: pd, np, plt, StringIO, datetime, os, save_figure, JAPANESE_FONT
+    """
+    font_name = configure_matplotlib()
+
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
+    limit_resources(memory_limit_mb, cpu_limit_seconds)
+    return {
+        "pd": pd,
+        "np": np,
+        "plt": plt,
+        "StringIO": StringIO,
+        "datetime": datetime,
+        "os": os,
+        "save_figure": save_figure,
+        "JAPANESE_FONT": font_name,
+    }
+
+
+def run_script(
+    path: str, memory_limit_mb: Optional[int] = None, cpu_limit_seconds: Optional[float] = None
+) -> None:
+    """
+    実行環境を初期化してから、コードのファイルを__main__として実行
+
+    コードには何も追加しないため、トレースバックの行番号と先頭行の「# filename:」はそのまま使えます。
+
+    Args:
+        path (str): 実行するコードのファイル
+        memory_limit_mb (Optional[int]): 仮想メモリの上限（MB）
+        cpu_limit_seconds (Optional[float]): CPU時間の上限（秒）
+    """
+    namespace = vars(sys.modules["__main__"])
+    namespace.update(bootstrap(memory_limit_mb, cpu_limit_seconds))
+    namespace["__file__"] = path
+    sys.argv[0] = path
+    try:
+        with open(path, encoding="utf-8") as f:
+            exec(compile(f.read(), path, "exec"), namespace)
+    except SystemExit:
+        raise
+    except BaseException:
+        # この関数のフレームを除いたトレースバックを出力
+        exc_type, exc_value, tb = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, tb.tb_next if tb else None)
+        sys.exit(1)
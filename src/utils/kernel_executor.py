@@ -0,0 +1,891 @@
+"""
+常駐Pythonカーネルによるコード実行
+
+LocalCommandLineCodeExecutorはコードブロックごとに新しいPythonプロセスを起動するため、
+毎回pandasやmatplotlibの読み込みに数秒かかります。このモジュールはモジュールを読み込み済みの
+ワーカープロセス（KernelProcess）を常駐させ、変数を実行間で保持します。
+
+- WarmPythonKernelExecutor: セッション専用のカーネル、またはKernelPoolから借りたカーネルで実行
+- KernelPool: プロセス全体で共有する事前起動済みカーネルのプール（上限超過時は待ち行列）
+
+タイムアウト時はワーカーに割り込みを送り、応答しない場合は再起動します。
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import weakref
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+from autogen_ext.code_executors._common import (
+    CommandLineCodeResult,
+    get_file_name_from_content,
+)
+from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_worker.py")
+# フォント・matplotlib・よく使う変数を設定する初期化スクリプト
+BOOTSTRAP_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "kernel_bootstrap.py"
+)
+
+# 起動時に読み込んでおくモジュール
+DEFAULT_PRELOAD_MODULES = ("numpy", "pandas", "matplotlib", "matplotlib.pyplot")
+
+PYTHON_LANGUAGES = ("python", "py")
+
+# LocalCommandLineCodeExecutorと同じ終了コード
+TIMEOUT_EXIT_CODE = 124
+CANCELLED_EXIT_CODE = 125
+
+STARTUP_TIMEOUT_SECONDS = 120
+POLL_INTERVAL_SECONDS = 0.1
+STDERR_TAIL_LINES = 50
+
+STATE_RESET_NOTICE = "（Pythonカーネルが切り替わったため、前回までの変数はリセットされています）\n"
+
+# CPU時間の上限の既定値（コア1つあたりの秒数。実行のタイムアウト300秒に合わせる）
+DEFAULT_CPU_LIMIT_SECONDS_PER_CORE = 300
+
+
+def get_resource_limits() -> Dict:
+    """
+    1回の実行に適用するメモリ・CPU時間の上限を取得
+
+    環境変数EXECUTION_MEMORY_LIMIT_MB（既定4096）とEXECUTION_CPU_LIMIT_SECONDS で指定し、
+    0の場合は無制限です。
+
+    CPU時間の上限（RLIMIT_CPU）は全スレッドの合計で数えるため、numpy・LightGBMなどが複数のコアで
+    並列に計算すると、経過時間よりも速く上限に達します。経過時間のタイムアウト（300秒）より先に
+    打ち切られないよう、既定値は300秒×コア数です。
+
+    Returns:
+        Dict: memory_limit_mb, cpu_limit_seconds
+    """
+    return {
+        "memory_limit_mb": int(os.getenv("EXECUTION_MEMORY_LIMIT_MB", "4096")) or None,
+        "cpu_limit_seconds": float(
+            os.getenv(
+                "EXECUTION_CPU_LIMIT_SECONDS",
+                str(DEFAULT_CPU_LIMIT_SECONDS_PER_CORE * (os.cpu_count() or 1)),
+            )
+        )
+        or None,
+    }
+
+
+def _read_messages(stream, messages: queue.Queue) -> None:
+    """ワーカーの応答（1行1JSON）をキューに積み、終了時はNoneを積む"""
+    try:
+        for line in stream:
+            try:
+                messages.put(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"カーネルの応答を解析できません: {line[:200]}")
+    finally:
+        messages.put(None)
+
+
+def _drain_stderr(stream, tail: collections.deque) -> None:
+    """ワーカーの標準エラーを読み捨て、直近の行だけを保持（パイプの詰まり防止）"""
+    for line in stream:
+        tail.append(line)
+
+
+def _kill_process(process: subprocess.Popen) -> None:
+    """ワーカープロセスを終了"""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class KernelProcess:
+    """モジュールを読み込み済みの常駐ワーカープロセス1つを操作するクラス（スレッドから同期的に使用）"""
+
+    def __init__(
+        self,
+        work_dir: str,
+        preload_modules: Sequence[str] = DEFAULT_PRELOAD_MODULES,
+        interrupt_grace_seconds: float = 5.0,
+        bootstrap_script: Optional[str] = BOOTSTRAP_SCRIPT,
+        memory_limit_mb: Optional[int] = None,
+        cpu_limit_seconds: Optional[float] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            work_dir (str): ワーカーの初期作業ディレクトリ
+            preload_modules (Sequence[str]): 起動時に読み込むモジュール
+            interrupt_grace_seconds (float): 割り込み後に応答を待つ時間（超えたら停止）
+            bootstrap_script (Optional[str]): 起動時に実行する初期化スクリプト（Noneで無効）
+            memory_limit_mb (Optional[int]): ワーカーの仮想メモリの上限（MB、Unixのみ）
+            cpu_limit_seconds (Optional[float]): 1回の実行で使えるCPU時間の上限（秒、Unixのみ）
+        """
+        self.work_dir = str(work_dir)
+        self.preload_modules = list(preload_modules)
+        self.bootstrap_script = bootstrap_script
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit_seconds = cpu_limit_seconds
+        self.interrupt_grace_seconds = interrupt_grace_seconds
+        self.pid: Optional[int] = None
+        self.executions = 0
+
+        self._process: Optional[subprocess.Popen] = None
+        self._messages: Optional[queue.Queue] = None
+        self._stderr_tail: collections.deque = collections.deque(maxlen=STDERR_TAIL_LINES)
+        self._finalizer: Optional[weakref.finalize] = None
+        self._request_id = 0
+
+    @property
+    def is_running(self) -> bool:
+        """ワーカープロセスが起動しているか"""
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        """ワーカープロセスを起動し、モジュールの事前読み込み完了まで待機"""
+        start_time = time.perf_counter()
+        os.makedirs(self.work_dir, exist_ok=True)
+        env = os.environ.copy()
+        env["KERNEL_PRELOAD_MODULES"] = ",".join(self.preload_modules)
+        env["KERNEL_BOOTSTRAP"] = self.bootstrap_script or ""
+        env["KERNEL_MEMORY_LIMIT_MB"] = str(self.memory_limit_mb or "")
+        env["KERNEL_CPU_LIMIT_SECONDS"] = str(self.cpu_limit_seconds or "")
+        env.setdefault("MPLBACKEND", "Agg")
+        process = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT],
+            cwd=self.work_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        messages: queue.Queue = queue.Queue()
+        self._stderr_tail.clear()
+        threading.Thread(
+            target=_read_messages, args=(process.stdout, messages), daemon=True
+        ).start()
+        threading.Thread(
+            target=_drain_stderr, args=(process.stderr, self._stderr_tail), daemon=True
+        ).start()
+
+        try:
+            ready = messages.get(timeout=STARTUP_TIMEOUT_SECONDS)
+        except queue.Empty:
+            ready = None
+        if not ready or ready.get("type") != "ready":
+            _kill_process(process)
+            raise RuntimeError(
+                "Pythonカーネルの起動に失敗しました: " + "".join(self._stderr_tail)[-1000:]
+            )
+        if ready["failed_modules"]:
+            logger.warning(f"事前読み込みに失敗したモジュール: {ready['failed_modules']}")
+
+        self._process = process
+        self._messages = messages
+        self.pid = ready["pid"]
+        self.executions = 0
+        # 参照がなくなったときにワーカーが残らないようにする
+        self._finalizer = weakref.finalize(self, _kill_process, process)
+
+        elapsed = time.perf_counter() - start_time
+        metrics.increment("kernel.starts")
+        metrics.observe("kernel.start_seconds", elapsed)
+        logger.info(f"Pythonカーネルを起動しました: pid={self.pid} ({elapsed:.2f}秒)")
+
+    def stop(self) -> None:
+        """ワーカープロセスを停止"""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._process = None
+        self._messages = None
+
+    def _send(self, request: Dict) -> bool:
+        self._request_id += 1
+        request["id"] = self._request_id
+        try:
+            self._process.stdin.write(json.dumps(request) + "\n")
+            self._process.stdin.flush()
+            return True
+        except (BrokenPipeError, OSError):
+            self.stop()
+            return False
+
+    def _wait_result(
+        self,
+        request_id: int,
+        deadline: Optional[float],
+        cancel: threading.Event,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[str, Optional[dict]]:
+        """
+        指定した要求への応答を待機（実行中の出力はon_outputに渡す）
+
+        Returns:
+            Tuple[str, Optional[dict]]: ("result", 応答) / ("timeout", None) / ("cancelled", None) / ("died", None)
+        """
+        while True:
+            if cancel.is_set():
+                return "cancelled", None
+            if deadline is not None and time.monotonic() >= deadline:
+                return "timeout", None
+            try:
+                message = self._messages.get(timeout=POLL_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            if message is None:
+                return "died", None
+            # 割り込み済みの古い要求への応答は読み捨てる
+            if message.get("id") != request_id:
+                continue
+            if message.get("type") == "output":
+                if on_output is not None:
+                    on_output(message.get("text", ""))
+            elif message.get("type") == "result":
+                return "result", message
+
+    def _interrupt(
+        self, request_id: int, on_output: Optional[Callable[[str], None]] = None
+    ) -> Optional[dict]:
+        """
+        実行中のコードに割り込み、応答があればそれを返す
+
+        応答しない場合（Windowsやシグナルを受け付けない処理）はワーカーを停止します。
+        """
+        if os.name != "nt" and self.is_running:
+            self._process.send_signal(signal.SIGINT)
+            deadline = time.monotonic() + self.interrupt_grace_seconds
+            status, message = self._wait_result(
+                request_id, deadline, threading.Event(), on_output
+            )
+            if status == "result":
+                metrics.increment("kernel.interrupts")
+                return message
+        logger.warning("Pythonカーネルが割り込みに応答しないため停止します")
+        self.stop()
+        return None
+
+    def run(
+        self,
+        code: str,
+        filename: str,
+        cwd: str,
+        timeout: float,
+        cancel: threading.Event,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[int, str]:
+        """
+        コードを実行し、終了コードと出力を返す
+
+        Args:
+            code (str): 実行するコード
+            filename (str): トレースバックに表示するファイル名
+            cwd (str): 実行時の作業ディレクトリ
+            timeout (float): 制限時間（秒）
+            cancel (threading.Event): セットされたら実行を中断するイベント
+            on_output (Optional[Callable[[str], None]]): 実行中の出力を逐次受け取る関数
+
+        Returns:
+            Tuple[int, str]: 終了コード（タイムアウトは124、キャンセルは125）と出力
+        """
+        if not self._send({"code": code, "filename": filename, "cwd": cwd}):
+            return 1, "Pythonカーネルとの通信に失敗しました。再実行してください。"
+        request_id = self._request_id
+        self.executions += 1
+        chunks: List[str] = []
+
+        def collect(text: str) -> None:
+            chunks.append(text)
+            if on_output is not None:
+                try:
+                    on_output(text)
+                except Exception as e:
+                    logger.warning(f"実行中の出力の通知に失敗しました: {e}")
+
+        start_time = time.perf_counter()
+        status, message = self._wait_result(
+            request_id, time.monotonic() + timeout, cancel, collect
+        )
+        metrics.observe("kernel.execute_seconds", time.perf_counter() - start_time)
+
+        if status == "result":
+            return message["exit_code"], "".join(chunks) + message["output"]
+        if status == "died":
+            stderr_tail = "".join(self._stderr_tail)[-1000:]
+            self.stop()
+            metrics.increment("kernel.crashes")
+            return 1, (
+                "".join(chunks)
+                + f"Pythonカーネルが異常終了しました（変数はリセットされます）。\n{stderr_tail}"
+            )
+
+        # タイムアウト・キャンセル: 割り込みで止まれば変数は保持される
+        interrupted = self._interrupt(request_id, collect)
+        output = "".join(chunks) + (interrupted["output"] if interrupted else "")
+        if interrupted is None:
+            output += "\nPythonカーネルを停止しました（変数はリセットされます）。"
+        if status == "timeout":
+            metrics.increment("kernel.timeouts")
+            return TIMEOUT_EXIT_CODE, output + "\nTimeout"
+        return CANCELLED_EXIT_CODE, output + "\nCancelled"
+
+    def reset(self, timeout: float = 30.0) -> bool:
+        """名前空間を初期化（失敗した場合はワーカーを停止してFalseを返す）"""
+        if not self.is_running or not self._send({"type": "reset"}):
+            return False
+        status, _ = self._wait_result(
+            self._request_id, time.monotonic() + timeout, threading.Event()
+        )
+        if status != "result":
+            self.stop()
+            return False
+        return True
+
+
+class _PooledKernel:
+    """プール内のカーネルと、その名前空間を使用中のセッション"""
+
+    def __init__(self, kernel: KernelProcess):
+        self.kernel = kernel
+        self.owner: Optional[str] = None
+        self.last_used = time.monotonic()
+
+
+class KernelPool:
+    """
+    プロセス全体で共有する事前起動済みPythonカーネルのプール
+
+    実行ごとにカーネルを貸し出し、終了後に返却してもらいます。同じセッションには
+    前回使用したカーネルを優先して貸し出すため、空きがあれば変数も保持されます。
+    別のセッションに貸し出すときは名前空間を初期化します。
+    すべてのカーネルが使用中の場合は到着順に待機します。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 4,
+        min_idle: int = 1,
+        work_dir: Optional[str] = None,
+        preload_modules: Sequence[str] = DEFAULT_PRELOAD_MODULES,
+        max_executions_per_kernel: int = 200,
+        interrupt_grace_seconds: float = 5.0,
+        bootstrap_script: Optional[str] = BOOTSTRAP_SCRIPT,
+        memory_limit_mb: Optional[int] = None,
+        cpu_limit_seconds: Optional[float] = None,
+    ):
+        """
+        初期化（min_idle個のカーネルをバックグラウンドで起動）
+
+        Args:
+            max_size (int): カーネルの最大数
+            min_idle (int): 常に待機させておく未使用カーネルの数
+            work_dir (Optional[str]): カーネルの初期作業ディレクトリ（実行時は要求ごとに移動）
+            preload_modules (Sequence[str]): 起動時に読み込むモジュール
+            max_executions_per_kernel (int): この回数実行したカーネルは入れ替える（メモリ増加対策）
+            interrupt_grace_seconds (float): 割り込み後に応答を待つ時間
+            bootstrap_script (Optional[str]): カーネル起動時に実行する初期化スクリプト
+            memory_limit_mb (Optional[int]): カーネルの仮想メモリの上限（MB）
+            cpu_limit_seconds (Optional[float]): 1回の実行で使えるCPU時間の上限（秒）
+        """
+        if max_size < 1:
+            raise ValueError("max_sizeは1以上を指定してください")
+        self.max_size = max_size
+        self.min_idle = max(0, min(min_idle, max_size))
+        self.work_dir = work_dir or os.getcwd()
+        self.preload_modules = list(preload_modules)
+        self.max_executions_per_kernel = max_executions_per_kernel
+        self.interrupt_grace_seconds = interrupt_grace_seconds
+        self.bootstrap_script = bootstrap_script
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit_seconds = cpu_limit_seconds
+
+        self._condition = threading.Condition()
+        self._idle: List[_PooledKernel] = []
+        self._busy: List[_PooledKernel] = []
+        self._starting = 0
+        self._waiters: collections.deque = collections.deque()
+        self._last_start_error: Optional[str] = None
+        self._closed = False
+
+        with self._condition:
+            self._replenish()
+
+    @property
+    def size(self) -> int:
+        """起動済みカーネルの数"""
+        return len(self._idle) + len(self._busy)
+
+    def _update_gauges(self) -> None:
+        size = self.size
+        metrics.set_gauge("kernel_pool.size", size)
+        metrics.set_gauge("kernel_pool.busy", len(self._busy))
+        metrics.set_gauge("kernel_pool.queue_depth", len(self._waiters))
+        metrics.set_gauge("kernel_pool.utilization", len(self._busy) / size if size else 0.0)
+
+    def _replenish(self) -> None:
+        """不足しているカーネルをバックグラウンドで起動（ロック取得中に呼び出す）"""
+        if self._closed:
+            return
+        clean_idle = sum(1 for k in self._idle if k.owner is None)
+        wanted = max(
+            self.min_idle - clean_idle - self._starting,
+            len(self._waiters) - len(self._idle) - self._starting,
+        )
+        capacity = self.max_size - self.size - self._starting
+        for _ in range(max(0, min(wanted, capacity))):
+            self._starting += 1
+            threading.Thread(target=self._start_kernel, daemon=True).start()
+        self._update_gauges()
+
+    def _start_kernel(self) -> None:
+        kernel = KernelProcess(
+            self.work_dir,
+            self.preload_modules,
+            self.interrupt_grace_seconds,
+            self.bootstrap_script,
+            self.memory_limit_mb,
+            self.cpu_limit_seconds,
+        )
+        try:
+            kernel.start()
+        except Exception as e:
+            logger.error(f"プール用のPythonカーネルの起動に失敗しました: {e}")
+            metrics.increment("kernel_pool.start_failures")
+            kernel = None
+            error = str(e)
+        with self._condition:
+            self._starting -= 1
+            if kernel is None:
+                self._last_start_error = error
+            elif self._closed:
+                kernel.stop()
+            else:
+                self._last_start_error = None
+                self._idle.append(_PooledKernel(kernel))
+            self._update_gauges()
+            self._condition.notify_all()
+
+    def _choose(self, owner: str) -> Optional[_PooledKernel]:
+        """待機中のカーネルから貸し出すものを選ぶ（同じセッション > 未使用 > 最も古い）"""
+        if not self._idle:
+            return None
+        for candidates in (
+            [k for k in self._idle if k.owner == owner],
+            [k for k in self._idle if k.owner is None],
+            sorted(self._idle, key=lambda k: k.last_used),
+        ):
+            if candidates:
+                chosen = candidates[0]
+                self._idle.remove(chosen)
+                return chosen
+        return None
+
+    def acquire(
+        self, owner: str, cancel: Optional[threading.Event] = None
+    ) -> Optional[Tuple[KernelProcess, bool]]:
+        """
+        カーネルを借りる（空きがない場合は到着順に待機）
+
+        Args:
+            owner (str): 名前空間の持ち主（セッションごとのキー）
+            cancel (Optional[threading.Event]): セットされたら待機をやめるイベント
+
+        Returns:
+            Optional[Tuple[KernelProcess, bool]]: カーネルと、前回の変数が保持されているか（キャンセル時はNone）
+        """
+        cancel = cancel or threading.Event()
+        ticket = object()
+        start_time = time.perf_counter()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("カーネルプールは停止しています")
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if self._waiters[0] is ticket:
+                        pooled = self._choose(owner)
+                        if pooled is not None:
+                            break
+                    if cancel.is_set():
+                        return None
+                    if (
+                        self._last_start_error
+                        and self.size == 0
+                        and self._starting == 0
+                    ):
+                        raise RuntimeError(
+                            f"Pythonカーネルを起動できません: {self._last_start_error}"
+                        )
+                    self._replenish()
+                    self._condition.wait(POLL_INTERVAL_SECONDS)
+            finally:
+                self._waiters.remove(ticket)
+                self._condition.notify_all()
+
+            self._busy.append(pooled)
+            previous_owner = pooled.owner
+            pooled.owner = owner
+            self._replenish()
+
+        wait_seconds = time.perf_counter() - start_time
+        metrics.observe("kernel_pool.wait_seconds", wait_seconds)
+        if wait_seconds > 1:
+            logger.info(f"カーネルプールの空き待ち: {wait_seconds:.2f}秒")
+
+        if previous_owner not in (None, owner) and not pooled.kernel.reset():
+            # 初期化に失敗したカーネルは入れ替える
+            self.release(pooled.kernel)
+            return self.acquire(owner, cancel)
+        return pooled.kernel, previous_owner == owner
+
+    def release(self, kernel: KernelProcess, run_seconds: Optional[float] = None) -> None:
+        """
+        カーネルを返却（停止したカーネルや実行回数の上限に達したカーネルは入れ替える）
+
+        Args:
+            kernel (KernelProcess): acquireで借りたカーネル
+            run_seconds (Optional[float]): 貸出中の実行時間（メトリクス用）
+        """
+        if run_seconds is not None:
+            metrics.observe("kernel_pool.run_seconds", run_seconds)
+        with self._condition:
+            pooled = next((k for k in self._busy if k.kernel is kernel), None)
+            if pooled is None:
+                return
+            self._busy.remove(pooled)
+            if (
+                self._closed
+                or not kernel.is_running
+                or kernel.executions >= self.max_executions_per_kernel
+            ):
+                kernel.stop()
+                metrics.increment("kernel_pool.recycled")
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._replenish()
+            self._condition.notify_all()
+
+    def forget(self, owner: str) -> None:
+        """セッションの終了・リセット時に、そのセッションの名前空間を次の貸出時に初期化させる"""
+        with self._condition:
+            for pooled in self._idle + self._busy:
+                if pooled.owner == owner:
+                    pooled.owner = f"released:{owner}"
+
+    def stats(self) -> Dict:
+        """プールの状態（起動数・使用中・待機数・起動中）を取得"""
+        with self._condition:
+            return {
+                "size": self.size,
+                "busy": len(self._busy),
+                "idle": len(self._idle),
+                "starting": self._starting,
+                "queue_depth": len(self._waiters),
+                "max_size": self.max_size,
+            }
+
+    def shutdown(self) -> None:
+        """すべてのカーネルを停止"""
+        with self._condition:
+            self._closed = True
+            for pooled in self._idle:
+                pooled.kernel.stop()
+            self._idle.clear()
+            self._update_gauges()
+            self._condition.notify_all()
+
+
+_pool: Optional[KernelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_kernel_pool(work_dir: Optional[str] = None) -> KernelPool:
+    """
+    プロセス共通のカーネルプールを取得（初回のみ生成）
+
+    プールの大きさは環境変数KERNEL_POOL_SIZE（既定4）とKERNEL_POOL_MIN_IDLE（既定1）で指定します。
+    カーネルのメモリ・CPU時間の上限はget_resource_limits()に従います。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KernelPool(
+                max_size=int(os.getenv("KERNEL_POOL_SIZE", "4")),
+                min_idle=int(os.getenv("KERNEL_POOL_MIN_IDLE", "1")),
+                work_dir=work_dir,
+                **get_resource_limits(),
+            )
+        return _pool
+
+
+def _forget_session(pool: KernelPool, session: Dict) -> None:
+    """Executorが破棄されたときに、そのセッションの名前空間を初期化対象にする"""
+    pool.forget(session["key"])
+
+
+class WarmPythonKernelExecutor(CodeExecutor):
+    """変数とimport済みモジュールを保持する常駐Pythonプロセスでコードを実行するExecutor"""
+
+    def __init__(
+        self,
+        work_dir: str,
+        timeout: int = 300,
+        preload_modules: Sequence[str] = DEFAULT_PRELOAD_MODULES,
+        interrupt_grace_seconds: float = 5.0,
+        pool: Optional[KernelPool] = None,
+        bootstrap_script: Optional[str] = BOOTSTRAP_SCRIPT,
+        memory_limit_mb: Optional[int] = None,
+        cpu_limit_seconds: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        初期化（専用カーネルは最初の実行時またはstart()で起動）
+
+        Args:
+            work_dir (str): コードを実行する作業ディレクトリ
+            timeout (int): 1コードブロックあたりの制限時間（秒）
+            preload_modules (Sequence[str]): 専用カーネルの起動時に読み込むモジュール
+            interrupt_grace_seconds (float): 割り込み後に応答を待つ時間（超えたら再起動）
+            pool (Optional[KernelPool]): 指定した場合は専用カーネルを持たず、実行ごとにプールから借りる
+            bootstrap_script (Optional[str]): 専用カーネルの起動時に実行する初期化スクリプト
+            memory_limit_mb (Optional[int]): 専用カーネルの仮想メモリの上限（MB）
+            cpu_limit_seconds (Optional[float]): 専用カーネルで1回の実行に使えるCPU時間の上限（秒）
+            on_output (Optional[Callable[[str], None]]): 実行中の出力を逐次受け取る関数（別スレッドから呼ばれる）
+        """
+        if timeout < 1:
+            raise ValueError("timeoutは1秒以上を指定してください")
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self._timeout = timeout
+        self._pool = pool
+        self._on_output = on_output
+        self._kernel = (
+            None
+            if pool is not None
+            else KernelProcess(
+                str(self.work_dir),
+                preload_modules,
+                interrupt_grace_seconds,
+                bootstrap_script,
+                memory_limit_mb,
+                cpu_limit_seconds,
+            )
+        )
+        # プールのカーネル上でこのExecutorの名前空間を識別するキー（stopのたびに更新）
+        self._session = {"key": uuid.uuid4().hex}
+        self._has_state = False
+        # 同じExecutorでの実行は1件ずつ
+        self._lock = threading.Lock()
+        if pool is not None:
+            weakref.finalize(self, _forget_session, pool, self._session)
+
+    @property
+    def timeout(self) -> int:
+        """1コードブロックあたりの制限時間（秒）"""
+        return self._timeout
+
+    def _run_dedicated(self, code: str, filename: str, cancel: threading.Event) -> Tuple[int, str]:
+        if not self._kernel.is_running:
+            if self._kernel.pid is not None:
+                logger.warning("Pythonカーネルが停止していたため再起動します")
+                metrics.increment("kernel.restarts")
+            self._kernel.start()
+        return self._kernel.run(
+            code, filename, str(self.work_dir.resolve()), self._timeout, cancel, self._on_output
+        )
+
+    def _run_pooled(self, code: str, filename: str, cancel: threading.Event) -> Tuple[int, str]:
+        leased = self._pool.acquire(self._session["key"], cancel)
+        if leased is None:
+            return CANCELLED_EXIT_CODE, "\nCancelled"
+        kernel, state_kept = leased
+        start_time = time.perf_counter()
+        try:
+            exit_code, output = kernel.run(
+                code,
+                filename,
+                str(self.work_dir.resolve()),
+                self._timeout,
+                cancel,
+                self._on_output,
+            )
+        finally:
+            self._pool.release(kernel, time.perf_counter() - start_time)
+        if self._has_state and not state_kept:
+            output = STATE_RESET_NOTICE + output
+        return exit_code, output
+
+    def _execute_sync(self, code: str, filename: str, cancel: threading.Event) -> Tuple[int, str]:
+        """コードを実行し、終了コードと出力を返す（スレッドから呼び出す）"""
+        with self._lock:
+            if self._pool is not None:
+                result = self._run_pooled(code, filename, cancel)
+            else:
+                result = self._run_dedicated(code, filename, cancel)
+            self._has_state = True
+            return result
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        """
+        コードブロックを順に実行（エラーが発生した時点で中断）
+
+        Args:
+            code_blocks (List[CodeBlock]): 実行するコードブロック（Pythonのみ対応）
+            cancellation_token (CancellationToken): キャンセル用トークン
+
+        Returns:
+            CodeResult: 終了コード（タイムアウトは124、キャンセルは125）と出力
+        """
+        outputs = []
+        exit_code = 0
+        for code_block in code_blocks:
+            if code_block.language.lower() not in PYTHON_LANGUAGES:
+                exit_code = 1
+                outputs.append(f"\nunknown language {code_block.language}")
+                break
+
+            # 従来と同様に実行したコードを作業ディレクトリに残す
+            code = code_block.code
+            # 作業ディレクトリが整理で削除されていても実行できるようにする
+            self.work_dir.mkdir(parents=True, exist_ok=True)
+            file_path = self.work_dir / f"tmp_code_{sha256(code.encode()).hexdigest()}.py"
+            file_path.write_text(code, encoding="utf-8")
+
+            cancel = threading.Event()
+            cancellation_token.add_callback(cancel.set)
+            exit_code, output = await asyncio.to_thread(
+                self._execute_sync, code, str(file_path.resolve()), cancel
+            )
+            outputs.append(output)
+            if exit_code != 0:
+                break
+
+        return CodeResult(exit_code=exit_code, output="".join(outputs))
+
+    async def start(self) -> None:
+        """専用カーネルを起動（起動済み、またはプール使用時は何もしない）"""
+
+        def start_sync():
+            with self._lock:
+                if self._kernel is not None and not self._kernel.is_running:
+                    self._kernel.start()
+
+        await asyncio.to_thread(start_sync)
+
+    async def stop(self) -> None:
+        """専用カーネルを停止（プール使用時はこのExecutorの変数を破棄）"""
+
+        def stop_sync():
+            with self._lock:
+                if self._kernel is not None:
+                    self._kernel.stop()
+                else:
+                    self._pool.forget(self._session["key"])
+                    self._session["key"] = uuid.uuid4().hex
+                self._has_state = False
+
+        await asyncio.to_thread(stop_sync)
+
+    async def restart(self) -> None:
+        """カーネルを再起動（変数はリセットされる）"""
+        await self.stop()
+        metrics.increment("kernel.restarts")
+        await self.start()
+
+
+class BootstrappedLocalCommandLineCodeExecutor(LocalCommandLineCodeExecutor):
+    """
+    実行ごとに新しいプロセスを起動する従来方式で、初期化してからコードを実行するExecutor
+
+    コードはそのまま作業ディレクトリのファイルに保存し、初期化処理（kernel_bootstrap.run_script）から
+    実行します。トレースバックの行番号と先頭行の「# filename:」の指定は変わりません。
+    """
+
+    def __init__(
+        self,
+        *args,
+        memory_limit_mb: Optional[int] = None,
+        cpu_limit_seconds: Optional[float] = None,
+        **kwargs,
+    ):
+        """
+        初期化（memory_limit_mb・cpu_limit_seconds以外はLocalCommandLineCodeExecutorと同じ）
+
+        Args:
+            memory_limit_mb (Optional[int]): 実行プロセスの仮想メモリの上限（MB、Unixのみ）
+            cpu_limit_seconds (Optional[float]): 実行プロセスのCPU時間の上限（秒、Unixのみ）
+        """
+        super().__init__(*args, **kwargs)
+        self._resource_limits = {
+            "memory_limit_mb": memory_limit_mb,
+            "cpu_limit_seconds": cpu_limit_seconds,
+        }
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        launch_blocks = []
+        script_paths = []
+        for block in code_blocks:
+            if block.language.lower() not in PYTHON_LANGUAGES:
+                launch_blocks.append(block)
+                continue
+            try:
+                filename = get_file_name_from_content(block.code, self.work_dir)
+            except ValueError:
+                return CommandLineCodeResult(
+                    exit_code=1, output="Filename is not in the workspace", code_file=None
+                )
+            if filename is None:
+                filename = f"tmp_code_{sha256(block.code.encode()).hexdigest()}.py"
+            script_path = (self.work_dir / filename).resolve()
+            script_path.parent.mkdir(parents=True, exist_ok=True)
+            script_path.write_text(block.code, encoding="utf-8")
+            script_paths.append(script_path)
+            # 初期化してからコードのファイルを実行する起動用のコード
+            launcher = (
+                f"__import__('runpy').run_path({BOOTSTRAP_SCRIPT!r})['run_script']("
+                f"{str(script_path)!r}, **{self._resource_limits!r})\n"
+            )
+            launch_blocks.append(CodeBlock(code=launcher, language=block.language))
+
+        result = await super().execute_code_blocks(launch_blocks, cancellation_token)
+        if self.cleanup_temp_files:
+            for script_path in script_paths:
+                script_path.unlink(missing_ok=True)
+        return CommandLineCodeResult(
+            exit_code=result.exit_code,
+            output=result.output,
+            code_file=str(script_paths[0]) if script_paths else result.code_file,
+        )
@@ -0,0 +1,312 @@
+"""
+常駐Pythonカーネルのワーカープロセス
+
+kernel_executor.KernelProcessから起動され、標準入力で受け取ったコードを
+同じ名前空間で実行し、結果を1行のJSONで返します（"reset"要求で名前空間を初期化）。
+"reset"では名前空間に加えて、起動・初期設定の直後に記録したプロセス全体の状態
+（読み込み済みモジュール・環境変数・importの検索先・作業ディレクトリ・matplotlibの設定）に戻し、
+前の利用者が作業ディレクトリからimportしたモジュールや変更した環境変数を次の利用者に残しません。
+実行中の出力は"output"メッセージとして一定間隔で逐次送信します。
+パッケージに依存せず単体のスクリプトとして実行できるようにしています。
+"""
+
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import runpy
+import signal
+import sys
+import threading
+import time
+import traceback
+import warnings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 実行中の出力を送信する間隔（秒）と、間隔を待たずに送信するサイズ（文字数）
+STREAM_INTERVAL_SECONDS = 0.2
+STREAM_CHUNK_CHARS = 64 * 1024
+
+
+class CpuTimeLimitExceeded(Exception):
+    """1回の実行のCPU時間が上限を超えた"""
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuTimeLimitExceeded("CPU時間の上限を超えたため、実行を中断しました")
+
+
+def _limit_memory(limit_mb):
+    """プロセスの仮想メモリの上限を設定（超えるとMemoryError）"""
+    if resource is None or not limit_mb:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+@contextlib.contextmanager
+def _cpu_limit(seconds):
+    """この実行で使えるCPU時間を制限（超えるとSIGXCPUでCpuTimeLimitExceeded）"""
+    if resource is None or not seconds:
+        yield
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _preload(module_names):
+    """よく使うモジュールを事前に読み込み、読み込めなかったモジュール名を返す"""
+    failed = []
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            failed.append(name)
+    return failed
+
+
+def _print_user_traceback():
+    """ワーカー自身のフレームを除いたトレースバックを出力"""
+    exc_type, exc_value, tb = sys.exc_info()
+    traceback.print_exception(exc_type, exc_value, tb.tb_next if tb else None)
+
+
+class _StreamingWriter(io.TextIOBase):
+    """書き込まれた出力を溜め、flush()で"output"メッセージとして送信するストリーム"""
+
+    def __init__(self, send):
+        self._send = send
+        self._lock = threading.Lock()
+        self._pending = []
+        self._size = 0
+        self.request_id = None
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self._lock:
+            self._pending.append(text)
+            self._size += len(text)
+            if self._size >= STREAM_CHUNK_CHARS:
+                self._flush_locked()
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        self._size = 0
+        self._send({"type": "output", "id": self.request_id, "text": text})
+
+
+def _flush_periodically(writer):
+    """実行中の出力を一定間隔で送信（デーモンスレッド）"""
+    while True:
+        time.sleep(STREAM_INTERVAL_SECONDS)
+        try:
+            writer.flush()
+        except Exception:
+            pass
+
+
+@contextlib.contextmanager
+def _interruptible():
+    """
+    この範囲の中だけSIGINTでKeyboardInterruptを発生させる
+
+    範囲の外（要求の待機・結果の送信中）では割り込みを無視し、実行の終了と前後して
+    届いた割り込みでワーカーが終了しないようにします。
+    """
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _execute(code, filename, namespace, buffer):
+    """コードを実行し、終了コードを返す（出力（標準出力・標準エラー）はbufferに書き込む）"""
+    exit_code = 0
+    with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+        try:
+            with _interruptible():
+                exec(compile(code, filename, "exec"), namespace)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except KeyboardInterrupt:
+            _print_user_traceback()
+            exit_code = 130
+        except CpuTimeLimitExceeded as e:
+            print(e, file=sys.stderr)
+            exit_code = 1
+        except BaseException:
+            _print_user_traceback()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+    return exit_code
+
+
+def _run_bootstrap(path):
+    """初期設定スクリプトのbootstrap()を実行し、名前空間の初期値を返す"""
+    try:
+        return runpy.run_path(path)["bootstrap"](), True
+    except Exception:
+        traceback.print_exc()
+        return {}, False
+
+
+def _new_namespace(initial):
+    return {"__name__": "__main__", "__builtins__": __builtins__, **initial}
+
+
+def _snapshot_state():
+    """初期設定直後のプロセス全体の状態を記録（_reset_stateで戻す）"""
+    matplotlib = sys.modules.get("matplotlib")
+    return {
+        "modules": set(sys.modules),
+        "environ": dict(os.environ),
+        "path": list(sys.path),
+        "cwd": os.getcwd(),
+        "rcparams": dict(matplotlib.rcParams) if matplotlib is not None else None,
+    }
+
+
+def _reset_state(baseline):
+    """前の利用者の図やオブジェクトを破棄し、プロセス全体の状態を初期設定直後に戻す"""
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is not None:
+        pyplot.close("all")
+    # 後から読み込まれたモジュール（作業ディレクトリのモジュールを含む）は次のimportで読み直す
+    for name in [name for name in sys.modules if name not in baseline["modules"]]:
+        del sys.modules[name]
+    importlib.invalidate_caches()
+    os.environ.clear()
+    os.environ.update(baseline["environ"])
+    sys.path[:] = baseline["path"]
+    os.chdir(baseline["cwd"])
+    matplotlib = sys.modules.get("matplotlib")
+    if matplotlib is not None and baseline["rcparams"] is not None:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            matplotlib.rcParams.update(baseline["rcparams"])
+    gc.collect()
+
+
+def main():
+    # 応答用に元の標準出力を確保し、C拡張などの直接出力は標準エラーへ回す
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    sys.stdin.reconfigure(encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    # 割り込みはユーザーのコードの実行中だけ受け付ける（_interruptible）
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    # スクリプト実行時と同様に、作業ディレクトリをimportの検索先にする
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path = [p for p in sys.path if os.path.abspath(p or ".") != script_dir]
+    sys.path.insert(0, os.getcwd())
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        with send_lock:
+            protocol.write(line)
+            protocol.flush()
+
+    writer = _StreamingWriter(send)
+    threading.Thread(target=_flush_periodically, args=(writer,), daemon=True).start()
+
+    start_time = time.perf_counter()
+    modules = [m for m in os.environ.get("KERNEL_PRELOAD_MODULES", "").split(",") if m]
+    failed = _preload(modules)
+    initial = {}
+    bootstrap_path = os.environ.get("KERNEL_BOOTSTRAP")
+    if bootstrap_path:
+        initial, ok = _run_bootstrap(bootstrap_path)
+        if not ok:
+            failed.append(bootstrap_path)
+    # 事前読み込みの後にメモリ上限を設定
+    _limit_memory(int(os.environ.get("KERNEL_MEMORY_LIMIT_MB") or 0))
+    cpu_limit_seconds = float(os.environ.get("KERNEL_CPU_LIMIT_SECONDS") or 0)
+    baseline = _snapshot_state()
+    send(
+        {
+            "type": "ready",
+            "pid": os.getpid(),
+            "preload_seconds": time.perf_counter() - start_time,
+            "failed_modules": failed,
+        }
+    )
+
+    namespace = _new_namespace(initial)
+    for line in sys.stdin:
+        request = {}
+        try:
+            request = json.loads(line)
+            if request.get("type") == "reset":
+                namespace = _new_namespace(initial)
+                _reset_state(baseline)
+                exit_code, output = 0, ""
+            else:
+                cwd = request.get("cwd")
+                if cwd and cwd != os.getcwd():
+                    os.chdir(cwd)
+                    sys.path[0] = cwd
+                namespace["__file__"] = request["filename"]
+                writer.request_id = request.get("id")
+                with _cpu_limit(cpu_limit_seconds):
+                    exit_code = _execute(
+                        request["code"], request["filename"], namespace, writer
+                    )
+                # 出力はoutputメッセージで送信する
+                output = ""
+        except CpuTimeLimitExceeded as e:
+            exit_code, output = 1, f"{e}\n"
+        # 未送信の出力を結果より先に送信
+        writer.flush()
+        send(
+            {
+                "type": "result",
+                "id": request.get("id"),
+                "exit_code": exit_code,
+                "output": output,
+            }
+        )
+
+
+if __name__ == "__main__":
+    main()
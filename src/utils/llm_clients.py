@@ -0,0 +1,375 @@
+"""
+プロセス共通のAzure OpenAIクライアント
+
+setup_agent() / setup_multiagent_team() はセッションの開始やリセットのたびに
+AzureOpenAIChatCompletionClientを作成していたため、新しい会話ごとにHTTPの接続プールが作られ、
+TCP・TLSの接続からやり直していました。このモジュールはエンドポイント・デプロイメント・
+APIバージョンの組ごとにクライアントを1つだけ作成し、全セッションで共有します。
+
+httpxの非同期の接続はそれを開いたイベントループでしか再利用できません。ページはプロンプトごとに
+asyncio.runで新しいイベントループを作るため、LLMとの通信（エージェントのrun_stream）は
+常駐するバックグラウンドのイベントループ（LLMループ）で実行し、結果だけを呼び出し元の
+ループに転送します。
+
+- get_model_client: 共有のAzureOpenAIChatCompletionClientを取得
+- get_llm_loop: LLMループを取得（stream()でrun_streamをLLMループで実行して結果を受け取る）
+- is_streaming_enabled: モデルの出力をトークン単位で受け取るかどうか（画面に逐次表示するため）
+- ResponseTimer: 1回の応答の最初のトークンまでの時間（TTFT）と全体の時間を計測
+- 計測値: llm.connections_new / llm.connections_reused（接続の再利用）、
+  llm.first_byte_seconds（リクエストを送ってから応答ヘッダーを受け取るまでの時間）
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_SECONDS = 120.0
+DEFAULT_TIMEOUT_SECONDS = 600.0
+
+# ストリームの終了を表す値
+_END = object()
+
+
+class BackgroundEventLoop:
+    """別スレッドで動き続けるイベントループ（LLMとの通信を同じループで行うため）"""
+
+    def __init__(self, name: str = "llm-loop"):
+        """
+        初期化
+
+        Args:
+            name (str): スレッド名
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """イベントループ（初回のみスレッドを起動）"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    async def run(self, coro_factory: Callable[[], Any]) -> Any:
+        """
+        コルーチンをこのループで実行し、呼び出し元のループで結果を待つ
+
+        Args:
+            coro_factory (Callable[[], Any]): このループ上でコルーチンを作成する関数
+        """
+
+        async def call():
+            return await coro_factory()
+
+        future = asyncio.run_coroutine_threadsafe(call(), self.loop)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            future.cancel()
+
+    async def stream(self, agen_factory: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """
+        非同期イテレータをこのループで実行し、要素を呼び出し元のループで受け取る
+
+        呼び出し元が途中で反復をやめた場合（キャンセル・例外）は、このループ側の処理もキャンセルします。
+
+        Args:
+            agen_factory (Callable[[], AsyncIterator]): このループ上で非同期イテレータを作成する関数
+                （例: lambda: agent.run_stream(task=prompt)）
+
+        Yields:
+            非同期イテレータの要素
+        """
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def forward(item: Any, error: Optional[BaseException] = None) -> None:
+            try:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # 呼び出し元のループが既に終了している
+                pass
+
+        async def pump():
+            try:
+                async for item in agen_factory():
+                    forward(item)
+            except asyncio.CancelledError:
+                forward(_END)
+                raise
+            except Exception as e:
+                forward(_END, e)
+            else:
+                forward(_END)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def stop(self) -> None:
+        """ループを停止（テスト・終了処理用）"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not None:
+                thread.join(timeout=5)
+            loop.close()
+
+
+class _RequestTrace:
+    """1回のリクエストで新しい接続を開いたかと、応答ヘッダーまでの時間を記録するhttpcoreのtrace"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.new_connection = False
+
+    async def __call__(self, name: str, info: Dict) -> None:
+        if name == "connection.connect_tcp.started":
+            self.new_connection = True
+
+
+async def _on_request(request) -> None:
+    request.extensions["trace"] = _RequestTrace()
+
+
+async def _on_response(response) -> None:
+    trace = response.request.extensions.get("trace")
+    if not isinstance(trace, _RequestTrace):
+        return
+    metrics.observe("llm.first_byte_seconds", time.perf_counter() - trace.started_at)
+    metrics.increment("llm.connections_new" if trace.new_connection else "llm.connections_reused")
+
+
+def create_http_client(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    keepalive_seconds: float = DEFAULT_KEEPALIVE_SECONDS,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+):
+    """
+    keep-aliveの接続プールと計測用のフックを持つhttpx.AsyncClientを作成
+
+    Args:
+        max_connections (int): 同時に開く接続数の上限
+        keepalive_seconds (float): 使われていない接続を保持する時間（秒）
+        timeout_seconds (float): 1リクエストのタイムアウト（秒）
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_seconds,
+        ),
+        timeout=httpx.Timeout(timeout_seconds, connect=10.0),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+class ModelClientRegistry:
+    """エンドポイント・デプロイメント・APIバージョンの組ごとにモデルクライアントを共有するレジストリ"""
+
+    def __init__(self, client_factory: Optional[Callable[..., Any]] = None):
+        """
+        初期化
+
+        Args:
+            client_factory (Optional[Callable[..., Any]]): AzureOpenAIChatCompletionClientの引数を受け取って
+                クライアントを作成する関数（既定はAzureOpenAIChatCompletionClient）
+        """
+        self._client_factory = client_factory
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, str, str, str], Any] = {}
+        self._http_clients: Dict[str, Any] = {}
+
+    def _create(self, **kwargs) -> Any:
+        if self._client_factory is not None:
+            return self._client_factory(**kwargs)
+        from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+        return AzureOpenAIChatCompletionClient(**kwargs)
+
+    def get(
+        self,
+        azure_endpoint: str,
+        api_key: str,
+        deployment: str,
+        api_version: Optional[str],
+        model_info: Any,
+    ) -> Any:
+        """
+        共有のモデルクライアントを取得（初回のみ作成）
+
+        同じエンドポイントのクライアントは1つのHTTPの接続プールを共有します。
+
+        Args:
+            azure_endpoint (str): Azure OpenAIのエンドポイント
+            api_key (str): APIキー（キーごとに別のクライアントを作成）
+            deployment (str): モデルのデプロイメント名
+            api_version (Optional[str]): APIバージョン
+            model_info: ModelInfo
+        """
+        key = (
+            azure_endpoint,
+            deployment,
+            api_version or "",
+            # APIキーはそのまま保持しない
+            hashlib.sha256((api_key or "").encode()).hexdigest()[:16],
+        )
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                metrics.increment("llm.client_reused")
+                return client
+            http_client = self._http_clients.get(azure_endpoint)
+            if http_client is None:
+                http_client = self._http_clients[azure_endpoint] = create_http_client(
+                    max_connections=int(
+                        os.getenv("LLM_MAX_CONNECTIONS", str(DEFAULT_MAX_CONNECTIONS))
+                    ),
+                    keepalive_seconds=float(
+                        os.getenv("LLM_KEEPALIVE_SECONDS", str(DEFAULT_KEEPALIVE_SECONDS))
+                    ),
+                )
+            client = self._create(
+                azure_endpoint=azure_endpoint,
+                api_key=api_key,
+                model=deployment,
+                api_version=api_version,
+                model_info=model_info,
+                http_client=http_client,
+            )
+            self._clients[key] = client
+            metrics.increment("llm.client_created")
+            metrics.set_gauge("llm.clients", len(self._clients))
+            logger.info(
+                f"Azure OpenAIの共有クライアントを作成しました: deployment={deployment}, "
+                f"api_version={api_version}"
+            )
+            return client
+
+    def stats(self) -> Dict:
+        """共有しているクライアントと接続プールの数"""
+        with self._lock:
+            return {"clients": len(self._clients), "http_clients": len(self._http_clients)}
+
+
+_registry: Optional[ModelClientRegistry] = None
+_llm_loop: Optional[BackgroundEventLoop] = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ModelClientRegistry:
+    """プロセス共通のモデルクライアントのレジストリを取得（初回のみ生成）"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelClientRegistry()
+        return _registry
+
+
+def get_llm_loop() -> BackgroundEventLoop:
+    """LLMとの通信を行うプロセス共通のイベントループを取得（初回のみ生成）"""
+    global _llm_loop
+    with _registry_lock:
+        if _llm_loop is None:
+            _llm_loop = BackgroundEventLoop()
+        return _llm_loop
+
+
+def get_model_client(
+    azure_endpoint: str,
+    api_key: str,
+    deployment: str,
+    api_version: Optional[str],
+    model_info: Any,
+) -> Any:
+    """
+    プロセス共通のAzureOpenAIChatCompletionClientを取得
+
+    環境変数LLM_SHARED_CLIENT="0"の場合は従来どおり呼び出しごとに作成します。
+    共有する接続プールの大きさはLLM_MAX_CONNECTIONS（既定20）、
+    keep-aliveの時間はLLM_KEEPALIVE_SECONDS（既定120）で指定します。
+    共有のクライアントはget_llm_loop()のループで使用してください。
+    """
+    if os.getenv("LLM_SHARED_CLIENT", "1").lower() in ("0", "false", "off"):
+        from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+        return AzureOpenAIChatCompletionClient(
+            azure_endpoint=azure_endpoint,
+            api_key=api_key,
+            model=deployment,
+            api_version=api_version,
+            model_info=model_info,
+        )
+    return get_client_registry().get(azure_endpoint, api_key, deployment, api_version, model_info)
+
+
+def is_streaming_enabled() -> bool:
+    """
+    エージェントのモデル出力をトークン単位で受け取るかどうか
+
+    環境変数LLM_STREAM="0"の場合は無効で、従来どおり完成したメッセージだけを受け取ります。
+    """
+    return os.getenv("LLM_STREAM", "1").lower() not in ("0", "false", "off")
+
+
+class ResponseTimer:
+    """
+    1回の応答について、最初のトークンまでの時間と全体の時間を計測
+
+    計測値は<name>.time_to_first_token_seconds と <name>.response_seconds です。
+    トークン単位で受け取らない場合は、最初のメッセージを受け取った時点を最初のトークンとします。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.time_to_first_token: Optional[float] = None
+
+    def first_token(self) -> None:
+        """最初のトークン（または応答のメッセージ）を受け取ったことを記録（2回目以降は無視）"""
+        if self.time_to_first_token is not None:
+            return
+        self.time_to_first_token = time.perf_counter() - self.started_at
+        metrics.observe(f"{self.name}.time_to_first_token_seconds", self.time_to_first_token)
+
+    def finish(self) -> float:
+        """応答の完了を記録して全体の時間を返す"""
+        elapsed = time.perf_counter() - self.started_at
+        metrics.observe(f"{self.name}.response_seconds", elapsed)
+        return elapsed
@@ -0,0 +1,77 @@
+"""
+処理時間・件数などの計測値をプロセス内で集計するユーティリティ
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class MetricsRegistry:
+    """カウンター・ゲージ・処理時間をスレッドセーフに集計するクラス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1.0) -> None:
+        """カウンターを加算"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0.0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """ゲージ（現在値）を設定"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """処理時間を記録（件数・合計・最大・直近値を保持）"""
+        with self._lock:
+            timing = self._timings.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["last"] = seconds
+
+    @contextmanager
+    def measure(self, name: str):
+        """withブロックの処理時間を記録するコンテキストマネージャ"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        現在の計測値を取得
+
+        Returns:
+            Dict[str, Dict]: counters / gauges / timings（平均値avgを含む）
+        """
+        with self._lock:
+            timings = {
+                name: {**t, "avg": t["total"] / t["count"] if t["count"] else 0.0}
+                for name, t in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+    def reset(self) -> None:
+        """すべての計測値を破棄"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+# プロセス共通の計測レジストリ
+metrics = MetricsRegistry()
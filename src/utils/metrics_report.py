@@ -0,0 +1,187 @@
+"""
+計測値の要約と定期的なログ出力
+
+各モジュールはmetricsにキャッシュのヒット数・待ち時間・応答時間などを記録しますが、
+それだけではどこからも参照できません。このモジュールは運用で確認したい値を要約し、
+定期的にログへ出力するとともに、管理者向けのサイドバーに表示できる形で返します。
+
+- summarize_metrics(): 検索・応答キャッシュのヒット率と省略できた時間、コード実行の待ち時間、
+  エージェント作成時間、応答の最初のトークンまでの時間（TTFT）などを区分ごとにまとめる
+- format_report(): 要約を1行のログ用文字列にする
+- start_metrics_reporter(): 一定間隔で要約をログに出力するバックグラウンドスレッドを開始
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_REPORT_INTERVAL_SECONDS = 600.0
+
+AGENT_FACTORY_PREFIX = "agent_factory."
+
+
+def _hit_rate(hits: float, misses: float) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+def summarize_metrics(snapshot: Optional[Dict] = None) -> Dict[str, Dict[str, float]]:
+    """
+    計測値を区分ごとに要約
+
+    Args:
+        snapshot (Optional[Dict]): metrics.snapshot()の結果（省略時は現在の値）
+
+    Returns:
+        Dict[str, Dict[str, float]]: 区分（search_cache、response_cacheなど）→ 項目 → 値。
+            まだ記録されていない区分は含みません
+    """
+    snapshot = snapshot if snapshot is not None else metrics.snapshot()
+    counters = snapshot["counters"]
+    gauges = snapshot["gauges"]
+    timings = snapshot["timings"]
+
+    def counter(name: str) -> float:
+        return counters.get(name, 0.0)
+
+    def timing(name: str, field: str = "avg") -> float:
+        return timings.get(name, {}).get(field, 0.0)
+
+    summary: Dict[str, Dict[str, float]] = {}
+
+    hits = counter("search_cache.hits") + counter("search_cache.coalesced")
+    misses = counter("search_cache.misses")
+    if hits or misses:
+        summary["search_cache"] = {
+            "hit_rate": _hit_rate(hits, misses),
+            "hits": counter("search_cache.hits"),
+            "coalesced": counter("search_cache.coalesced"),
+            "misses": misses,
+            "latency_saved_seconds": counter("search_cache.latency_saved_seconds"),
+        }
+
+    hits = counter("response_cache.hits") + counter("response_cache.semantic_hits")
+    misses = counter("response_cache.misses")
+    if hits or misses:
+        summary["response_cache"] = {
+            "hit_rate": _hit_rate(hits, misses),
+            "hits": counter("response_cache.hits"),
+            "semantic_hits": counter("response_cache.semantic_hits"),
+            "misses": misses,
+            "latency_saved_seconds": counter("response_cache.latency_saved_seconds"),
+        }
+
+    if "execution_limiter.wait_seconds" in timings:
+        summary["execution_limiter"] = {
+            "runs": timing("execution_limiter.wait_seconds", "count"),
+            "wait_avg_seconds": timing("execution_limiter.wait_seconds"),
+            "wait_max_seconds": timing("execution_limiter.wait_seconds", "max"),
+            "rejected": counter("execution_limiter.rejected"),
+            "queue_depth": gauges.get("execution_limiter.queue_depth", 0.0),
+            "running": gauges.get("execution_limiter.running", 0.0),
+        }
+
+    factory_names = sorted(
+        {
+            name[len(AGENT_FACTORY_PREFIX) :].rsplit(".", 1)[0]
+            for name in timings
+            if name.startswith(AGENT_FACTORY_PREFIX)
+        }
+    )
+    for name in factory_names:
+        prefix = f"{AGENT_FACTORY_PREFIX}{name}"
+        summary[prefix] = {
+            "build_avg_seconds": timing(f"{prefix}.build_seconds"),
+            "acquire_avg_seconds": timing(f"{prefix}.acquire_seconds"),
+            "acquire_max_seconds": timing(f"{prefix}.acquire_seconds", "max"),
+            "spare_hits": counter(f"{prefix}.spare_hits"),
+            "spare_misses": counter(f"{prefix}.spare_misses"),
+        }
+
+    if "chat.response_seconds" in timings:
+        summary["chat"] = {
+            "turns": timing("chat.response_seconds", "count"),
+            "time_to_first_token_avg_seconds": timing("chat.time_to_first_token_seconds"),
+            "time_to_first_token_max_seconds": timing("chat.time_to_first_token_seconds", "max"),
+            "response_avg_seconds": timing("chat.response_seconds"),
+            "cached_turns": timing("chat.cached.response_seconds", "count"),
+        }
+
+    if "llm.first_byte_seconds" in timings:
+        summary["llm"] = {
+            "first_byte_avg_seconds": timing("llm.first_byte_seconds"),
+            "connections_new": counter("llm.connections_new"),
+            "connections_reused": counter("llm.connections_reused"),
+        }
+    return summary
+
+
+def format_report(summary: Dict[str, Dict[str, float]]) -> str:
+    """
+    要約をログ用の1行の文字列にする
+
+    Args:
+        summary (Dict[str, Dict[str, float]]): summarize_metricsの結果
+
+    Returns:
+        str: "区分 項目=値 ..." を" | "で区切った文字列（記録がない場合は空文字）
+    """
+    sections = []
+    for section, values in summary.items():
+        items = " ".join(
+            f"{key}={value:.3f}" if isinstance(value, float) and not value.is_integer() else f"{key}={value:.0f}"
+            for key, value in values.items()
+        )
+        sections.append(f"{section} {items}")
+    return " | ".join(sections)
+
+
+def _report_loop(interval_seconds: float, stop_event: threading.Event) -> None:
+    while not stop_event.wait(interval_seconds):
+        try:
+            report = format_report(summarize_metrics())
+            if report:
+                logger.info(f"計測値: {report}")
+        except Exception as e:
+            logger.warning(f"計測値のログ出力に失敗しました: {e}")
+
+
+_reporter: Optional[threading.Thread] = None
+_reporter_stop = threading.Event()
+_reporter_lock = threading.Lock()
+
+
+def start_metrics_reporter() -> None:
+    """
+    計測値の要約を定期的にログへ出力するスレッドを開始（開始済みの場合は何もしない）
+
+    間隔は環境変数METRICS_REPORT_INTERVAL_SECONDS（既定600）で指定し、0の場合は出力しません。
+    """
+    global _reporter
+    interval_seconds = float(
+        os.getenv("METRICS_REPORT_INTERVAL_SECONDS", str(DEFAULT_REPORT_INTERVAL_SECONDS))
+    )
+    if interval_seconds <= 0:
+        return
+    with _reporter_lock:
+        if _reporter is not None and _reporter.is_alive():
+            return
+        _reporter_stop.clear()
+        _reporter = threading.Thread(
+            target=_report_loop,
+            args=(interval_seconds, _reporter_stop),
+            name="metrics-reporter",
+            daemon=True,
+        )
+        _reporter.start()
+
+
+def stop_metrics_reporter() -> None:
+    """定期的なログ出力を停止"""
+    _reporter_stop.set()
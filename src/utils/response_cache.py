@@ -0,0 +1,334 @@
+"""
+エージェントの応答キャッシュ
+
+「変動費が上昇している理由は?」「紙詰まりの原因は?」のように多くのユーザーが同じ質問をしますが、
+そのたびにツール呼び出しを含む複数回のモデル呼び出しが行われます。このモジュールは
+agent.run_streamの前に置き、同じ（または十分に似た）質問への応答を再生します。
+
+- キー: 正規化した質問 + データセットのバージョン + 会話の文脈（それまでの質問）
+- lookup(): 完全一致で探し、埋め込みモデルを設定した場合は類似度がしきい値以上のものも探す
+  （数値・ロット番号などの識別子が異なる質問は類似度に関係なく一致させない）
+  文字の重なりだけでは「折れ線グラフ」と「棒グラフ」、「増えている」と「減っている」のような
+  意味の違いを区別できないため、埋め込みモデルを設定しない場合は完全一致だけを使います
+- ResponseCache: TTLと件数の上限（LRU）を持つメモリ上のキャッシュ
+- replay_response(): キャッシュしたメッセージをrun_streamと同じ形で流し、
+  エージェントの会話履歴にも質問と回答を追加する（続けて質問できるように）
+- 計測値: response_cache.hits / semantic_hits / misses / latency_saved_seconds
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Sequence
+
+from .datasets import get_dataset_version
+from .metrics import metrics
+from .search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL_SECONDS = 6 * 3600
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+_IDENTIFIER_PATTERN = re.compile(r"[a-z0-9_.\-]*\d[a-z0-9_.\-]*")
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    """埋め込み同士のコサイン類似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(y * y for y in b))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+def create_azure_embedder(deployment: str) -> Callable[[str], List[float]]:
+    """
+    Azure OpenAIの埋め込みモデルを使う埋め込み関数を作成
+
+    接続先はエージェントと同じ環境変数（AZURE_AI_AGENT_ENDPOINT、AZURE_API_KEY、
+    AZURE_API_VERSION）を使います。
+
+    Args:
+        deployment (str): 埋め込みモデルのデプロイ名
+    """
+    from openai import AzureOpenAI
+
+    client = AzureOpenAI(
+        azure_endpoint=os.environ.get("AZURE_AI_AGENT_ENDPOINT"),
+        api_key=os.environ.get("AZURE_API_KEY"),
+        api_version=os.environ.get("AZURE_API_VERSION"),
+    )
+
+    def embed(text: str) -> List[float]:
+        return client.embeddings.create(model=deployment, input=text).data[0].embedding
+
+    return embed
+
+
+def response_cache_context(history: Sequence[str] = ()) -> str:
+    """
+    キャッシュキーの文脈部分（データセットのバージョンとそれまでの質問）を作成
+
+    会話の途中の質問（「それをグラフにして」など）は前の質問によって答えが変わるため、
+    それまでの質問も文脈に含めます。会話の最初の質問は全ユーザーで共有されます。
+
+    Args:
+        history (Sequence[str]): この会話でのそれまでのユーザーの質問
+
+    Returns:
+        str: 文脈の文字列
+    """
+    return "\n".join([get_dataset_version(), *(normalize_query(q) for q in history)])
+
+
+def _identifiers(query: str) -> frozenset:
+    """数字を含む語（ロット番号・年・設備番号など）の集合"""
+    return frozenset(_IDENTIFIER_PATTERN.findall(query))
+
+
+def is_cacheable(messages: Sequence[Any]) -> bool:
+    """
+    run_streamで受け取ったメッセージがキャッシュしてよい応答かどうか
+
+    エージェントのテキストの回答で終わっていない場合と、ツールの実行がエラーになった場合は
+    キャッシュしません。
+    """
+    answered = False
+    for message in messages:
+        kind = type(message).__name__
+        if kind == "ToolCallExecutionEvent":
+            if any(getattr(result, "is_error", False) for result in message.content):
+                return False
+        elif kind == "TextMessage":
+            answered = getattr(message, "source", "user") != "user"
+    return answered
+
+
+class ResponseCache:
+    """質問と文脈をキーにエージェントの応答メッセージを保持するスレッドセーフなキャッシュ"""
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        """
+        初期化
+
+        Args:
+            embed (Optional[Callable[[str], Sequence[float]]]): 正規化した質問の埋め込みを返す関数
+                （Noneの場合は完全一致のみ）
+            similarity_threshold (float): 類似した質問として扱うコサイン類似度の下限
+            ttl_seconds (float): 保存してから有効な時間（秒）
+            max_entries (int): 保持する最大件数（超えたら最も古く使われたものから削除）
+        """
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (文脈, 正規化した質問) → エントリ
+        self._entries: "collections.OrderedDict[tuple, Dict]" = collections.OrderedDict()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "latency_saved_seconds": 0.0}
+
+    def _embed(self, query: str) -> Any:
+        if self.embed is None:
+            return None
+        try:
+            return self.embed(query)
+        except Exception as e:
+            logger.warning(f"質問の埋め込みを取得できないため完全一致のみで検索します: {e}")
+            return None
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["stored_at"] > self.ttl_seconds]:
+            del self._entries[key]
+            metrics.increment("response_cache.expired")
+
+    def lookup(self, prompt: str, context: str = "") -> Optional[Dict]:
+        """
+        キャッシュした応答を検索
+
+        Args:
+            prompt (str): ユーザーの質問（時刻や参考情報を付与する前のもの）
+            context (str): response_cache_contextで作成した文脈
+
+        Returns:
+            Optional[Dict]: messages（応答のメッセージ）、similarity（完全一致は1.0）、
+                elapsed_seconds（元の応答にかかった時間）。見つからない場合はNone
+        """
+        query = normalize_query(prompt)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get((context, query))
+            candidates = [
+                (key, e)
+                for key, e in self._entries.items()
+                if entry is None and key[0] == context and e["vector"] is not None
+            ]
+        similarity = 1.0
+        kind = "hits"
+        # 埋め込みの取得は通信を伴う場合があるためロックの外で行う
+        vector = self._embed(query) if candidates else None
+        if vector is not None:
+            identifiers = _identifiers(query)
+            best = 0.0
+            for key, candidate in candidates:
+                if candidate["identifiers"] != identifiers:
+                    continue
+                score = cosine_similarity(vector, candidate["vector"])
+                if score >= self.similarity_threshold and score > best:
+                    entry, best, query = candidate, score, key[1]
+            similarity = best
+            kind = "semantic_hits"
+
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                metrics.increment("response_cache.misses")
+                return None
+            if (context, query) in self._entries:
+                self._entries.move_to_end((context, query))
+            self._stats[kind] += 1
+            self._stats["latency_saved_seconds"] += entry["elapsed_seconds"]
+        metrics.increment(f"response_cache.{kind}")
+        metrics.increment("response_cache.latency_saved_seconds", entry["elapsed_seconds"])
+        return {
+            "messages": list(entry["messages"]),
+            "similarity": similarity,
+            "elapsed_seconds": entry["elapsed_seconds"],
+        }
+
+    def store(
+        self, prompt: str, context: str, messages: Sequence[Any], elapsed_seconds: float
+    ) -> bool:
+        """
+        応答を保存（is_cacheableでない応答は保存しない）
+
+        Args:
+            prompt (str): ユーザーの質問（時刻や参考情報を付与する前のもの）
+            context (str): response_cache_contextで作成した文脈
+            messages (Sequence[Any]): run_streamで受け取ったメッセージ
+            elapsed_seconds (float): 応答にかかった時間（ヒット時に省略できた時間として集計）
+
+        Returns:
+            bool: 保存したかどうか
+        """
+        # 最後のTaskResultと、完成したメッセージと重複するトークン単位のチャンクは除く
+        messages = [
+            m
+            for m in messages
+            if type(m).__name__ not in ("TaskResult", "ModelClientStreamingChunkEvent")
+        ]
+        if not is_cacheable(messages):
+            metrics.increment("response_cache.uncacheable")
+            return False
+        query = normalize_query(prompt)
+        entry = {
+            "messages": messages,
+            "vector": self._embed(query),
+            "identifiers": _identifiers(query),
+            "stored_at": time.time(),
+            "elapsed_seconds": elapsed_seconds,
+        }
+        with self._lock:
+            self._entries.pop((context, query), None)
+            self._entries[(context, query)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("response_cache.evictions")
+            metrics.set_gauge("response_cache.entries", len(self._entries))
+        return True
+
+    def clear(self) -> None:
+        """キャッシュを全て削除"""
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("response_cache.entries", 0)
+
+    def stats(self) -> Dict:
+        """ヒット数・ミス数・ヒット率・省略できた応答時間の合計・件数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+async def replay_response(agent: Any, task: str, cached: Dict) -> AsyncGenerator[Any, None]:
+    """
+    キャッシュした応答をrun_streamの代わりに流す
+
+    エージェントの会話履歴に今回の質問と回答を追加してから、保存したメッセージを順に返します。
+    エージェントのmodel_contextを変更するため、run_streamと同じイベントループで実行してください。
+
+    Args:
+        agent (Any): AssistantAgent
+        task (str): エージェントに渡すはずだった質問
+        cached (Dict): ResponseCache.lookupの結果
+    """
+    from autogen_core.models import AssistantMessage, UserMessage
+
+    answers = [
+        m.content
+        for m in cached["messages"]
+        if type(m).__name__ == "TextMessage" and getattr(m, "source", "user") != "user"
+    ]
+    model_context = getattr(agent, "model_context", None)
+    if model_context is not None:
+        await model_context.add_message(UserMessage(content=task, source="user"))
+        await model_context.add_message(AssistantMessage(content=answers[-1], source=agent.name))
+    for message in cached["messages"]:
+        yield message
+        # 表示側に制御を戻して1件ずつ描画させる
+        await asyncio.sleep(0)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    プロセス共通の応答キャッシュを取得（初回のみ生成）
+
+    環境変数RESPONSE_CACHEが"0"の場合は無効（None）です。有効期間・上限・類似度のしきい値は
+    RESPONSE_CACHE_TTL_SECONDS（既定21600）、RESPONSE_CACHE_MAX_ENTRIES（既定256）、
+    RESPONSE_CACHE_SIMILARITY（既定0.95、1以上で完全一致のみ）で指定します。
+    類似した質問の検索はRESPONSE_CACHE_EMBEDDING_DEPLOYMENTでAzure OpenAIの埋め込みモデルを
+    指定した場合だけ有効で、未指定の場合は完全一致だけを使います。
+    """
+    global _cache
+    if os.getenv("RESPONSE_CACHE", "1").lower() in ("0", "false", "off"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            threshold = float(
+                os.getenv("RESPONSE_CACHE_SIMILARITY", str(DEFAULT_SIMILARITY_THRESHOLD))
+            )
+            deployment = os.getenv("RESPONSE_CACHE_EMBEDDING_DEPLOYMENT")
+            embed = create_azure_embedder(deployment) if deployment and threshold < 1.0 else None
+            _cache = ResponseCache(
+                embed=embed,
+                similarity_threshold=threshold,
+                ttl_seconds=float(
+                    os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS))
+                ),
+                max_entries=int(
+                    os.getenv("RESPONSE_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))
+                ),
+            )
+        return _cache
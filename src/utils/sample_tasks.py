@@ -0,0 +1,59 @@
+"""
+分析ページで選択できるサンプルタスク
+"""
+
+SCHEDULE_OPTIMIZATION_TASK = "生産スケジュール最適化"
+
+SAMPLE_TASKS = {
+    SCHEDULE_OPTIMIZATION_TASK: """## 以下のCSVデータは初期の生産スケジュールを表します。
+### L1,L2,L3,L4,L5はラインを表す。
+### P1からP20は商品を表す。
+
+時間帯,L1,L2,L3,L4,L5
+0:00-1:00,P1,P2,P3,P4,P5
+1:00-2:00,P1,P2,P3,P4,P5
+2:00-3:00,P1,P2,P3,P4,P5
+3:00-4:00,P1,P2,P3,P4,P5
+4:00-5:00,P1,P2,P3,P4,P5
+5:00-6:00,P1,P2,切替,切替,切替
+6:00-7:00,P1,P2,P6,P7,P8
+7:00-8:00,P1,P2,P6,P7,P8
+8:00-9:00,P1,P2,P6,P7,P8
+9:00-10:00,P1,P2,P6,P7,P8
+10:00-11:00,切替,切替,P6,P7,P8
+11:00-12:00,P9,P10,切替,切替,切替
+12:00-13:00,P9,P10,P11,P15,P16
+13:00-14:00,P9,P10,P11,P15,P16
+14:00-15:00,P9,P10,P11,P15,P16
+15:00-16:00,P9,P10,P11,P15,P16
+16:00-17:00,切替,切替,P11,切替,切替
+17:00-18:00,P14,P12,切替,P17,P18
+18:00-19:00,P14,P12,P13,P17,P18
+19:00-20:00,P14,P12,P13,P17,P18
+20:00-21:00,P14,P12,P13,P17,P18
+21:00-22:00,P14,P12,P13,切替,切替
+22:00-23:00,,,P13,P19,P20
+23:00-24:00,,,,P19,P20
+
+## データの説明
+- **生産時間**:
+  - P1, P2: 各10時間生産
+  - P3, P4, P5,P6,P7,P8,P9,P10,P11,P12,P13,P14: 各5時間生産
+  - P15, P16, P17, P18: 各4時間生産
+  - P19, P20:各2時間生産
+  **CSVデータ商品が入ってない枠は空いています。使用しても構いません。**
+- **切替時間**: 同一ラインで商品が替わったとき、切替時間(1時間)が発生します。
+  **同一ラインで同じ商品を連続して生産する場合、切替時間は発生しません。
+- **ラインの割り当て**: 各ラインは24時間使用できる。
+
+# 初期のスケジュールからP19,P20の生産をやめて、P1を生産する時間を最も長くした場合のスケジュールを考えてください。
+
+空き時間（商品が入っていない枠）はP1の生産時間増加や他の商品の生産に活用できます。
+P2からP18の生産時間は、プロンプトに記載された時間（P2: 10時間、P3-P14: 5時間、P15-P18: 4時間）を維持し、
+生産時刻やライン割り当てを自由に変更可能です。
+商品の生産の順番は自由に入れ替えて構いません。
+
+変更後のスケジュールのP1の生産時間を述べてください。
+変更後のスケジュールをマークダウン形式で提示してください""",
+    "カスタムタスク": "",
+}
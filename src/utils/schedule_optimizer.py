@@ -0,0 +1,225 @@
+"""
+OR-Tools CP-SATによる生産スケジュール最適化
+
+各商品を1つのラインに連続して割り当て、同一ラインで商品が替わるときの
+切替時間を考慮したスケジュールを制限時間内に求めます。
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+from ortools.sat.python import cp_model
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+OBJECTIVES = ("minimize_makespan", "maximize_product", "minimize_changeovers")
+
+CHANGEOVER_LABEL = "切替"
+
+# 分析ページのサンプルタスク「生産スケジュール最適化」の前提条件
+SAMPLE_SCHEDULE_PROBLEM = {
+    "lines": ["L1", "L2", "L3", "L4", "L5"],
+    "product_hours": {
+        "P1": 10,
+        "P2": 10,
+        **{f"P{i}": 5 for i in range(3, 15)},
+        **{f"P{i}": 4 for i in range(15, 19)},
+        "P19": 2,
+        "P20": 2,
+    },
+    "changeover_hours": 1,
+    "horizon_hours": 24,
+}
+
+
+def solve_production_schedule(
+    lines: List[str],
+    product_hours: Dict[str, int],
+    changeover_hours: int = 1,
+    horizon_hours: int = 24,
+    objective: str = "minimize_makespan",
+    target_product: Optional[str] = None,
+    time_limit_seconds: float = 10.0,
+    num_workers: int = 8,
+) -> Dict:
+    """
+    生産スケジュールを最適化
+
+    Args:
+        lines (List[str]): ライン名のリスト（例: ["L1", "L2"]）
+        product_hours (Dict[str, int]): 商品ごとの生産時間（時間単位。maximize_productの対象商品は最低時間）
+        changeover_hours (int): 同一ラインで商品が替わるときの切替時間
+        horizon_hours (int): 各ラインの使用可能時間
+        objective (str): minimize_makespan / maximize_product / minimize_changeovers
+        target_product (Optional[str]): maximize_productで生産時間を最大化する商品
+        time_limit_seconds (float): ソルバーの制限時間（秒）
+        num_workers (int): ソルバーの並列探索数
+
+    Returns:
+        Dict: status, objective_value, wall_time_seconds, assignments（ライン・商品・開始・終了）,
+            makespan, changeovers（解が得られた場合）
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objectiveは{OBJECTIVES}のいずれかを指定してください: {objective}")
+    if objective == "maximize_product" and target_product not in product_hours:
+        raise ValueError(f"生産時間を最大化する商品が見つかりません: {target_product}")
+    if not lines:
+        raise ValueError("ラインを1つ以上指定してください")
+
+    products = list(product_hours.keys())
+    model = cp_model.CpModel()
+
+    starts, ends, durations = {}, {}, {}
+    for p in products:
+        min_hours = int(product_hours[p])
+        if min_hours > horizon_hours:
+            raise ValueError(f"{p}の生産時間が使用可能時間を超えています: {min_hours}時間")
+        max_hours = horizon_hours if p == target_product else min_hours
+        starts[p] = model.NewIntVar(0, horizon_hours, f"start_{p}")
+        ends[p] = model.NewIntVar(0, horizon_hours, f"end_{p}")
+        durations[p] = model.NewIntVar(min_hours, max_hours, f"duration_{p}")
+        model.Add(ends[p] == starts[p] + durations[p])
+
+    presence, line_used = {}, {}
+    changeover_literals = []
+    for line in lines:
+        # ノード0をダミーの始点・終点とし、商品の並び順を巡回路で表す
+        arcs = []
+        line_used[line] = model.NewBoolVar(f"used_{line}")
+        arcs.append((0, 0, line_used[line].Not()))
+        for i, p in enumerate(products, start=1):
+            presence[p, line] = model.NewBoolVar(f"on_{p}_{line}")
+            arcs.append((i, i, presence[p, line].Not()))
+            first = model.NewBoolVar(f"first_{p}_{line}")
+            last = model.NewBoolVar(f"last_{p}_{line}")
+            arcs.append((0, i, first))
+            arcs.append((i, 0, last))
+            model.AddImplication(presence[p, line], line_used[line])
+            for j, q in enumerate(products, start=1):
+                if i == j:
+                    continue
+                follows = model.NewBoolVar(f"{p}_to_{q}_{line}")
+                arcs.append((i, j, follows))
+                model.Add(starts[q] >= ends[p] + changeover_hours).OnlyEnforceIf(follows)
+                changeover_literals.append(follows)
+        model.AddCircuit(arcs)
+
+    for p in products:
+        model.AddExactlyOne(presence[p, line] for line in lines)
+
+    makespan = model.NewIntVar(0, horizon_hours, "makespan")
+    model.AddMaxEquality(makespan, [ends[p] for p in products])
+
+    # 冗長制約: 各ラインの生産時間と切替時間の合計は使用可能時間以内かつ完了時刻以下
+    for line in lines:
+        load = []
+        for p in products:
+            if p == target_product:
+                hours_on_line = model.NewIntVar(0, horizon_hours, f"hours_{p}_{line}")
+                model.Add(hours_on_line == durations[p]).OnlyEnforceIf(presence[p, line])
+                model.Add(hours_on_line == 0).OnlyEnforceIf(presence[p, line].Not())
+                load.append(hours_on_line)
+            else:
+                load.append(int(product_hours[p]) * presence[p, line])
+        count = sum(presence[p, line] for p in products)
+        line_load = sum(load) + changeover_hours * (count - line_used[line])
+        model.Add(line_load <= horizon_hours)
+        model.Add(line_load <= makespan)
+
+    # 対称性の除去: ラインは同一条件のため、i番目の商品は先頭からi番目までのラインに置く
+    for i, p in enumerate(products):
+        for line in lines[i + 1 :]:
+            model.Add(presence[p, line] == 0)
+
+    if objective == "maximize_product":
+        model.Maximize(durations[target_product])
+    elif objective == "minimize_changeovers":
+        model.Minimize(sum(changeover_literals))
+    else:
+        model.Minimize(makespan)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = float(time_limit_seconds)
+    solver.parameters.num_workers = int(num_workers)
+
+    start_time = time.perf_counter()
+    status = solver.Solve(model)
+    wall_time = time.perf_counter() - start_time
+    status_name = solver.StatusName(status)
+    logger.info(f"スケジュール最適化: status={status_name}, {wall_time:.2f}秒")
+
+    result = {
+        "status": status_name,
+        "objective": objective,
+        "objective_value": None,
+        "wall_time_seconds": wall_time,
+        "assignments": [],
+    }
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return result
+
+    result["objective_value"] = solver.ObjectiveValue()
+    for p in products:
+        line = next(line for line in lines if solver.BooleanValue(presence[p, line]))
+        result["assignments"].append(
+            {
+                "line": line,
+                "product": p,
+                "start": solver.Value(starts[p]),
+                "end": solver.Value(ends[p]),
+                "hours": solver.Value(durations[p]),
+            }
+        )
+    result["assignments"].sort(key=lambda a: (lines.index(a["line"]), a["start"]))
+    result["makespan"] = solver.Value(makespan)
+    used_lines = {a["line"] for a in result["assignments"]}
+    result["changeovers"] = len(result["assignments"]) - len(used_lines)
+    return result
+
+
+def build_timetable(
+    assignments: List[Dict],
+    lines: List[str],
+    horizon_hours: int = 24,
+    changeover_hours: int = 1,
+) -> pd.DataFrame:
+    """
+    割り当て結果を「時間帯×ライン」の表に変換（サンプルタスクのCSVと同じ形式）
+
+    Args:
+        assignments (List[Dict]): solve_production_scheduleのassignments
+        lines (List[str]): ライン名のリスト
+        horizon_hours (int): 各ラインの使用可能時間
+        changeover_hours (int): 切替時間
+
+    Returns:
+        pd.DataFrame: 時間帯ごとに各ラインの商品名（切替は"切替"、空きは空文字）
+    """
+    table = {line: [""] * horizon_hours for line in lines}
+    for line in lines:
+        on_line = sorted(
+            (a for a in assignments if a["line"] == line), key=lambda a: a["start"]
+        )
+        for index, a in enumerate(on_line):
+            for hour in range(a["start"], a["end"]):
+                table[line][hour] = a["product"]
+            # 次の商品がある場合は直後の時間帯に切替を表示
+            if index + 1 < len(on_line):
+                for hour in range(a["end"], min(a["end"] + changeover_hours, horizon_hours)):
+                    table[line][hour] = CHANGEOVER_LABEL
+    slots = [f"{h}:00-{h + 1}:00" for h in range(horizon_hours)]
+    return pd.DataFrame({"時間帯": slots, **table})
+
+
+def to_markdown_table(df: pd.DataFrame) -> str:
+    """DataFrameをマークダウン形式の表に変換"""
+    header = "| " + " | ".join(str(c) for c in df.columns) + " |"
+    separator = "|" + "|".join("---" for _ in df.columns) + "|"
+    rows = [
+        "| " + " | ".join("" if pd.isna(v) else str(v) for v in row) + " |"
+        for row in df.itertuples(index=False)
+    ]
+    return "\n".join([header, separator] + rows)
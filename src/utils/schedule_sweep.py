@@ -0,0 +1,236 @@
+"""
+生産スケジュールのWhat-ifシナリオを並列に解くスイープエンジン
+
+商品の停止・切替時間・ライン追加の組み合わせからシナリオを生成し、
+各シナリオをCP-SATの制約モデルとしてプロセスプールで並列に解いて比較表にまとめます。
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from .metrics import metrics
+from .schedule_optimizer import solve_production_schedule
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MAX_SCENARIOS = 100
+
+# 解が得られなかったシナリオの状態（ソルバーの状態に加えて使用）
+CANCELLED = "CANCELLED"
+ERROR = "ERROR"
+
+
+def build_schedule_scenarios(
+    lines: List[str],
+    product_hours: Dict[str, int],
+    changeover_options: Sequence[int] = (1,),
+    drop_product_options: Sequence[Sequence[str]] = ((),),
+    extra_line_options: Sequence[int] = (0,),
+    horizon_hours: int = 24,
+    objective: str = "minimize_makespan",
+    target_product: Optional[str] = None,
+) -> List[Dict]:
+    """
+    条件の組み合わせ（直積）からシナリオのリストを生成
+
+    Args:
+        lines (List[str]): 基準のライン名のリスト
+        product_hours (Dict[str, int]): 基準の商品ごとの生産時間
+        changeover_options (Sequence[int]): 切替時間の候補
+        drop_product_options (Sequence[Sequence[str]]): 生産をやめる商品の組の候補
+        extra_line_options (Sequence[int]): 追加するライン数の候補
+        horizon_hours (int): 各ラインの使用可能時間
+        objective (str): 最適化の目的（solve_production_scheduleと同じ）
+        target_product (Optional[str]): maximize_productの対象商品
+
+    Returns:
+        List[Dict]: シナリオ（name と solve_production_schedule の引数）のリスト
+    """
+    scenarios = []
+    for changeover, dropped, extra in itertools.product(
+        changeover_options, drop_product_options, extra_line_options
+    ):
+        dropped = [p for p in dropped if p in product_hours]
+        scenario_lines = list(lines) + [f"追加L{i + 1}" for i in range(int(extra))]
+        name_parts = [f"切替{changeover}h"]
+        if dropped:
+            name_parts.append(f"{'/'.join(dropped)}停止")
+        if extra:
+            name_parts.append(f"ライン+{extra}")
+        scenarios.append(
+            {
+                "name": " ".join(name_parts),
+                "lines": scenario_lines,
+                "product_hours": {
+                    p: h for p, h in product_hours.items() if p not in dropped
+                },
+                "changeover_hours": int(changeover),
+                "horizon_hours": horizon_hours,
+                "objective": objective,
+                "target_product": target_product,
+                "dropped_products": dropped,
+            }
+        )
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(
+            f"シナリオ数が多すぎます: {len(scenarios)}件（最大{MAX_SCENARIOS}件）"
+        )
+    return scenarios
+
+
+def _solve_scenario(scenario: Dict, time_limit_seconds: float, num_workers: int) -> Dict:
+    """ワーカープロセスで1シナリオを解く（例外は結果に含めて返す）"""
+    try:
+        return solve_production_schedule(
+            scenario["lines"],
+            scenario["product_hours"],
+            changeover_hours=scenario["changeover_hours"],
+            horizon_hours=scenario["horizon_hours"],
+            objective=scenario["objective"],
+            target_product=scenario.get("target_product"),
+            time_limit_seconds=time_limit_seconds,
+            num_workers=num_workers,
+        )
+    except Exception as e:
+        return {"status": ERROR, "error": str(e), "wall_time_seconds": 0.0}
+
+
+def _terminate_workers(executor: ProcessPoolExecutor) -> None:
+    """解いている途中のワーカープロセスを停止（各シナリオの制限時間まで計算を続けさせない）"""
+    processes = list((executor._processes or {}).values())
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+
+
+def run_schedule_sweep(
+    scenarios: List[Dict],
+    time_limit_seconds: float = 10.0,
+    max_workers: Optional[int] = None,
+    deadline_seconds: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> pd.DataFrame:
+    """
+    シナリオをプロセスプールで並列に解き、比較表を作成
+
+    各シナリオの計算時間はtime_limit_secondsで打ち切ります。deadline_secondsを超えた場合や
+    cancel_eventがセットされた場合は、未完了のシナリオを"CANCELLED"として返します。
+    解いている途中のシナリオはワーカープロセスごと停止し、打ち切り後もCPUを使い続けないようにします。
+
+    Args:
+        scenarios (List[Dict]): build_schedule_scenariosの戻り値
+        time_limit_seconds (float): シナリオごとのソルバーの制限時間（秒）
+        max_workers (Optional[int]): 並列に解くプロセス数（省略時はCPU数）
+        deadline_seconds (Optional[float]): スイープ全体の制限時間（秒）
+        cancel_event (Optional[threading.Event]): セットされたら残りのシナリオを取り消すイベント
+
+    Returns:
+        pd.DataFrame: シナリオごとの状態・目的関数値・完了時刻・切替回数・計算時間
+    """
+    if not scenarios:
+        raise ValueError("シナリオを1つ以上指定してください")
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers or cpu_count, len(scenarios)))
+    # 1プロセスあたりの探索スレッド数をCPU数に合わせ、過剰なスレッド生成を避ける
+    solver_workers = max(1, cpu_count // max_workers)
+
+    start_time = time.perf_counter()
+    results: Dict[int, Dict] = {}
+    # ソルバーのスレッドを持つ親プロセスをforkしないようspawnで起動する
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        futures = {
+            executor.submit(_solve_scenario, scenario, time_limit_seconds, solver_workers): i
+            for i, scenario in enumerate(scenarios)
+        }
+        pending = set(futures)
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            remaining = None
+            if deadline_seconds is not None:
+                remaining = deadline_seconds - (time.perf_counter() - start_time)
+                if remaining <= 0:
+                    break
+            done, pending = wait(
+                pending,
+                timeout=min(remaining, 0.5) if remaining is not None else 0.5,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    # ワーカープロセスの異常終了など
+                    results[futures[future]] = {
+                        "status": ERROR,
+                        "error": str(e),
+                        "wall_time_seconds": None,
+                    }
+
+        for future in pending:
+            future.cancel()
+        if pending:
+            _terminate_workers(executor)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start_time
+    cancelled = len(scenarios) - len(results)
+    metrics.observe("schedule_sweep.seconds", elapsed)
+    metrics.increment("schedule_sweep.scenarios", len(results))
+    if cancelled:
+        metrics.increment("schedule_sweep.cancelled", cancelled)
+    logger.info(
+        f"スケジュールスイープ: {len(results)}/{len(scenarios)}件完了, {elapsed:.2f}秒"
+    )
+
+    rows = []
+    for i, scenario in enumerate(scenarios):
+        result = results.get(i, {"status": CANCELLED, "wall_time_seconds": None})
+        row = {
+            "シナリオ": scenario["name"],
+            "ライン数": len(scenario["lines"]),
+            "商品数": len(scenario["product_hours"]),
+            "切替時間": scenario["changeover_hours"],
+            "状態": result["status"],
+            "目的関数値": result.get("objective_value"),
+        }
+        target = scenario.get("target_product")
+        if target:
+            row[f"{target}の生産時間"] = next(
+                (
+                    a["hours"]
+                    for a in result.get("assignments", [])
+                    if a["product"] == target
+                ),
+                None,
+            )
+        row.update(
+            {
+                "完了時刻": result.get("makespan"),
+                "切替回数": result.get("changeovers"),
+                "計算時間(秒)": result["wall_time_seconds"],
+                "エラー": result.get("error", ""),
+            }
+        )
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    table.attrs["elapsed_seconds"] = elapsed
+    table.attrs["max_workers"] = max_workers
+    table.attrs["cancelled"] = cancelled
+    return table
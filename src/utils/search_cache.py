@@ -0,0 +1,261 @@
+"""
+ウェブ検索の結果キャッシュ
+
+search_duckduckgoは呼ばれるたびにDDGSのセッションを開いて検索しますが、複数のユーザーや
+エージェントの複数ターンで同じ内容を検索することがよくあります。このモジュールは正規化した
+クエリをキーに検索結果を保持し、同じ検索を通信せずに返します。
+
+- SearchResultCache: TTLと件数の上限を持つキャッシュ（JSONファイルに保存して再起動後も利用）
+- get_or_fetch(): 同じクエリの同時検索は1回の通信にまとめ、他の呼び出しはその結果を待つ
+- stats(): ヒット率と、キャッシュにより省略できた検索時間
+"""
+
+import collections
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data"
+)
+CACHE_FILE_NAME = "search_cache.json"
+
+DEFAULT_TTL_SECONDS = 6 * 3600
+DEFAULT_MAX_ENTRIES = 512
+
+
+def normalize_query(query: str) -> str:
+    """
+    キャッシュキー用にクエリを正規化（全角・半角の統一、小文字化、連続する空白の除去）
+
+    Args:
+        query (str): 検索クエリ
+
+    Returns:
+        str: 正規化したクエリ
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class SearchResultCache:
+    """正規化したクエリと検索結果をTTLと件数の上限付きで保持するスレッドセーフなキャッシュ"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        """
+        初期化
+
+        Args:
+            path (Optional[str]): キャッシュを保存するJSONファイルのパス（Noneの場合はメモリ上のみ）
+            ttl_seconds (float): 保存してから有効な時間（秒）
+            max_entries (int): 保持する最大件数（超えたら最も古く使われたものから削除）
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[str, Dict]" = self._load()
+        self._in_flight: Dict[str, Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "latency_saved_seconds": 0.0}
+
+    def _load(self) -> "collections.OrderedDict[str, Dict]":
+        entries: "collections.OrderedDict[str, Dict]" = collections.OrderedDict()
+        if self.path is None:
+            return entries
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return entries
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"検索結果のキャッシュを読み込めないため空のキャッシュで開始します: {e}")
+            return entries
+        now = time.time()
+        # 保存時の並び（古く使われた順）を保ち、期限切れのものは読み込まない
+        for key, entry in stored.items():
+            if now - entry.get("stored_at", 0) <= self.ttl_seconds:
+                entries[key] = entry
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return entries
+
+    def _save(self) -> None:
+        """キャッシュをファイルに保存（書き込み途中で壊れないよう一時ファイルから置き換える）"""
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"検索結果のキャッシュを保存できませんでした: {e}")
+
+    def _record_hit(self, entry: Dict, coalesced: bool = False) -> None:
+        """ヒットを記録（省略できた時間は元の検索にかかった時間とする）"""
+        self._stats["coalesced" if coalesced else "hits"] += 1
+        self._stats["latency_saved_seconds"] += entry.get("fetch_seconds", 0.0)
+        metrics.increment("search_cache.coalesced" if coalesced else "search_cache.hits")
+        metrics.increment("search_cache.latency_saved_seconds", entry.get("fetch_seconds", 0.0))
+
+    def get(self, query: str) -> Optional[str]:
+        """
+        キャッシュを取得（期限切れの場合は削除してNone）
+
+        Args:
+            query (str): 検索クエリ（正規化前）
+
+        Returns:
+            Optional[str]: 検索結果
+        """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["stored_at"] > self.ttl_seconds:
+                del self._entries[key]
+                metrics.increment("search_cache.expired")
+                metrics.set_gauge("search_cache.entries", len(self._entries))
+                return None
+            self._entries.move_to_end(key)
+            return entry["result"]
+
+    def put(self, query: str, result: str, fetch_seconds: float = 0.0) -> None:
+        """
+        検索結果を保存
+
+        Args:
+            query (str): 検索クエリ（正規化前）
+            result (str): 検索結果
+            fetch_seconds (float): 検索にかかった時間（ヒット時に省略できた時間として集計）
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "result": result,
+                "stored_at": time.time(),
+                "fetch_seconds": fetch_seconds,
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("search_cache.evictions")
+            metrics.set_gauge("search_cache.entries", len(self._entries))
+            self._save()
+
+    def get_or_fetch(self, query: str, fetch: Callable[[str], str]) -> str:
+        """
+        キャッシュがあれば返し、なければfetchで検索して保存
+
+        同じクエリの検索が実行中の場合は新たに検索せず、その結果を待ちます。
+        fetchが例外を送出した場合は保存せず、待っていた呼び出しにも同じ例外を送出します。
+
+        Args:
+            query (str): 検索クエリ
+            fetch (Callable[[str], str]): クエリを受け取って検索結果を返す関数
+
+        Returns:
+            str: 検索結果
+        """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["stored_at"] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._record_hit(entry)
+                return entry["result"]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["misses"] += 1
+                metrics.increment("search_cache.misses")
+
+        if not owner:
+            result, fetch_seconds = future.result()
+            with self._lock:
+                self._record_hit({"fetch_seconds": fetch_seconds}, coalesced=True)
+            return result
+
+        start_time = time.perf_counter()
+        try:
+            result = fetch(query)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        fetch_seconds = time.perf_counter() - start_time
+        metrics.observe("search.fetch_seconds", fetch_seconds)
+        self.put(query, result, fetch_seconds)
+        with self._lock:
+            del self._in_flight[key]
+        future.set_result((result, fetch_seconds))
+        return result
+
+    def clear(self) -> None:
+        """すべてのキャッシュを削除"""
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("search_cache.entries", 0)
+            self._save()
+
+    def stats(self) -> Dict:
+        """
+        キャッシュの状態を取得
+
+        Returns:
+            Dict: entries, hits, misses, coalesced（実行中の検索を待った回数）,
+                hit_rate（通信せずに返した割合）, latency_saved_seconds
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        total = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / total if total else 0.0
+        return stats
+
+
+_cache: Optional[SearchResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchResultCache]:
+    """
+    プロセス共通の検索結果キャッシュを取得（初回のみ生成）
+
+    環境変数SEARCH_CACHEが"0"の場合は無効（None）です。有効期間・上限・保存先は
+    SEARCH_CACHE_TTL_SECONDS（既定21600）、SEARCH_CACHE_MAX_ENTRIES（既定512）、
+    SEARCH_CACHE_PATH（既定はdata/search_cache.json、空文字で保存しない）で指定します。
+    """
+    global _cache
+    if os.getenv("SEARCH_CACHE", "1").lower() in ("0", "false", "off"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("SEARCH_CACHE_PATH", os.path.join(DATA_DIR, CACHE_FILE_NAME))
+            _cache = SearchResultCache(
+                path=path or None,
+                ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS))),
+                max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+            )
+        return _cache
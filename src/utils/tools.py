@@ -1,20 +1,80 @@
 import os
-from azure.storage.blob import BlobServiceClient
-import uuid
+import json
 import logging
 from duckduckgo_search import DDGS
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
+from autogen_core.tools import FunctionTool
 from autogen_ext.tools.code_execution import PythonCodeExecutionTool
 import pandas as pd
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import re
 import functools
 import time
 import streamlit as st
 
+from .anomaly_detector import get_packaging_machine_monitor
+from .blob_dedup import (
+    content_blob_name,
+    content_digest,
+    get_blob_index,
+    start_blob_cleanup,
+    storage_key,
+)
+from .blob_storage import (
+    MEMORY_CONNECTION_PREFIX,
+    UPLOAD_FAILED,
+    UPLOAD_PENDING,
+    get_background_uploader,
+    get_blob_client_pool,
+    get_storage_settings,
+)
+from .chart_renderer import (
+    cache_chart,
+    chart_cache_key,
+    get_cached_chart,
+    render_chart_spec,
+)
+from .execution_cache import CachedCodeExecutor, get_execution_cache
+from .execution_limiter import LimitedCodeExecutor, get_execution_limiter
+from .execution_output import (
+    ExecutionOutputStream,
+    OutputLimitedCodeExecutor,
+    follow_output,
+    get_output_limits,
+)
+from .image_optimizer import get_optimize_options, optimize_image
+from .kernel_executor import (
+    BootstrappedLocalCommandLineCodeExecutor,
+    WarmPythonKernelExecutor,
+    get_kernel_pool,
+    get_resource_limits,
+)
+from .forecasting import get_forecast_service
+from .cost_simulator import load_cost_baseline, simulate_cost_scenarios
+from .schedule_optimizer import (
+    build_timetable,
+    solve_production_schedule,
+    to_markdown_table,
+)
+from .schedule_sweep import build_schedule_scenarios, run_schedule_sweep
+from .search_cache import get_search_cache
+from .web_search import (
+    MAX_QUERIES,
+    format_digest,
+    get_multi_search_options,
+    merge_results,
+    run_multi_search,
+)
+from .work_dirs import get_work_dir_manager
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# サムネイルを置くBLOB名の接頭辞（本体と同じ名前で配置）
+THUMBNAIL_BLOB_PREFIX = "thumbnails/"
+
+# 実行中の出力として画面に表示する末尾の文字数
+EXECUTION_OUTPUT_DISPLAY_CHARS = 3000
+
 
 def timer(func):
     """実行時間を計測するデコレータ"""
@@ -82,35 +142,163 @@ def search_duckduckgo(query: str) -> str:
     """
     try:
         print(f"[llm_agent] DuckDuckGo検索ツールを使用: query='{query}'")
-        with DDGS() as ddgs:
-            results = ddgs.text(query)
-            return "\n".join([f"{r['title']}: {r['body']}" for r in results[:3]])
+        # 同じ内容の検索は共有キャッシュから返す（同時の検索は1回にまとめる）
+        cache = get_search_cache()
+        if cache is None:
+            return _fetch_duckduckgo(query)
+        return cache.get_or_fetch(query, _fetch_duckduckgo)
     except Exception as e:
         return f"検索エラー: {str(e)}"
 
 
-def create_execute_tool() -> PythonCodeExecutionTool:
+def _fetch_duckduckgo(query: str) -> str:
+    """DuckDuckGoで検索し、上位3件のタイトルと本文を返す（失敗時は例外を送出）"""
+    with DDGS() as ddgs:
+        results = ddgs.text(query)
+        return "\n".join([f"{r['title']}: {r['body']}" for r in results[:3]])
+
+
+def search_web_multi(queries: List[str], max_results_per_query: int = 5) -> str:
+    """
+    複数のクエリでDuckDuckGoのウェブ検索を並列に行い、統合した結果を返すツール。
+
+    調べたい観点が複数ある場合は、1回の呼び出しでまとめて検索してください。
+    URLが同じ結果は1件にまとめ、複数のクエリで上位に出た結果ほど上位に並べます。
+
+    Args:
+        queries (List[str]): 検索クエリのリスト（最大8件）
+        max_results_per_query (int): 1クエリあたりに取得する結果の件数（1〜10）
+
+    Returns:
+        str: 順位付きの検索結果（タイトル・URL・本文の抜粋・一致したクエリ）。
+            タイムアウト・失敗したクエリがあれば末尾に記載します。
+
+    Examples:
+        search_web_multi(["包装機 フィルムロス 原因", "包装機 シール不良 対策"])
+    """
+    if not queries:
+        return "検索エラー: queriesに1件以上のクエリを指定してください"
+    if len(queries) > MAX_QUERIES:
+        return f"検索エラー: queriesは最大{MAX_QUERIES}件まで指定できます"
+    max_results = max(1, min(int(max_results_per_query), 10))
+    options = get_multi_search_options()
+    print(f"[llm_agent] DuckDuckGo並列検索ツールを使用: queries={queries}")
+    cache = get_search_cache()
+
+    def fetch(query: str) -> List[Dict]:
+        def fetch_json(_: str) -> str:
+            with DDGS(timeout=int(options["query_timeout_seconds"])) as ddgs:
+                return json.dumps(ddgs.text(query, max_results=max_results), ensure_ascii=False)
+
+        if cache is None:
+            return json.loads(fetch_json(query))
+        # search_duckduckgoの結果（整形済みの文字列）とは別のキーで保存する
+        return json.loads(cache.get_or_fetch(f"[{max_results}] {query}", fetch_json))
+
+    search = run_multi_search(queries, fetch, **options)
+    ranked = merge_results(search["results"])
+    logger.info(
+        f"並列検索: {len(queries)}クエリ・{len(ranked)}件（{search['elapsed_seconds']:.2f}秒、"
+        f"タイムアウト{len(search['timed_out'])}件・失敗{len(search['failed'])}件）"
+    )
+    return format_digest(ranked, search["failed"], search["timed_out"])
+
+
+def _get_current_user() -> Optional[str]:
+    """ログイン中のユーザー名を取得（Streamlitの外から呼ばれた場合はNone）"""
+    try:
+        return st.session_state.get("username")
+    except Exception:
+        return None
+
+
+def create_session_work_dir() -> str:
+    """
+    セッション用の作業ディレクトリを作成（古いディレクトリはバックグラウンドで削除）
+
+    同じパスをcreate_execute_toolとcreate_upload_image_toolに渡し、コードの実行と
+    画像のアップロードを同じセッションのディレクトリの中で行います。
+    """
+    return get_work_dir_manager(get_work_directory()).create_session_dir()
+
+
+def create_execute_tool(
+    output_stream: Optional[ExecutionOutputStream] = None,
+    user: Optional[str] = None,
+    work_dir: Optional[str] = None,
+) -> PythonCodeExecutionTool:
     """
     PythonCodeExecutionToolを作成するファクトリ関数。
 
+    環境変数CODE_EXECUTOR_MODEで実行方式を切り替えます。
+    - "pool"（既定）: 全セッションで共有する事前起動済みPythonカーネルのプールで実行
+    - "kernel": セッションごとに専用のPythonカーネルを常駐させて実行
+    - "subprocess": 実行ごとに新しいPythonプロセスを起動
+
+    作業ディレクトリはセッションごとにWorkDirectoryManagerが払い出します。
+    実行はExecutionLimiterで全体・ユーザーごとの同時実行数を制限し、
+    結果はExecutionResultCacheでキャッシュします（コードに"# no-cache"と書くと対象外）。
+    長い出力はモデルには先頭と末尾だけを返し、全文は作業ディレクトリのlogs配下に保存します。
+
+    Args:
+        output_stream (Optional[ExecutionOutputStream]): 実行中の出力を画面に表示するための出力先
+            （逐次書き込むのはpool・kernel方式のみ）
+        user (Optional[str]): 同時実行数の公平性の単位となるユーザー
+            （省略時はログイン中のユーザー、ログインしていない場合はセッション）
+        work_dir (Optional[str]): create_session_work_dirで作成した作業ディレクトリ
+            （省略時は新しく作成）
+
     Returns:
         PythonCodeExecutionTool: 設定済みのPythonコード実行ツール
     """
-    return PythonCodeExecutionTool(
-        LocalCommandLineCodeExecutor(
+    mode = os.getenv("CODE_EXECUTOR_MODE", "pool").lower()
+    root_dir = get_work_directory()
+    # セッションごとのサブディレクトリで実行（古いディレクトリはバックグラウンドで削除）
+    work_dir = work_dir or create_session_work_dir()
+    if mode == "subprocess":
+        executor = BootstrappedLocalCommandLineCodeExecutor(
             timeout=300,
-            work_dir=get_work_directory(),
+            work_dir=work_dir,
             cleanup_temp_files=False,
+            **get_resource_limits(),
+        )
+    else:
+        pool = get_kernel_pool(root_dir) if mode == "pool" else None
+        executor = WarmPythonKernelExecutor(
+            work_dir=work_dir,
+            timeout=300,
+            pool=pool,
+            on_output=output_stream.write if output_stream is not None else None,
+            **get_resource_limits(),
         )
+
+    # 全体の同時実行数を制限し、ユーザー間で公平に実行する
+    user = user or _get_current_user() or os.path.basename(work_dir)
+    executor = LimitedCodeExecutor(
+        executor, get_execution_limiter(), user, output_stream=output_stream
+    )
+
+    # 同じコード・データ・環境の実行結果を再利用（CODE_RESULT_CACHE=0で無効）
+    cache = get_execution_cache()
+    if cache is not None:
+        executor = CachedCodeExecutor(
+            executor, cache, work_dir, stateful=mode != "subprocess"
+        )
+
+    # 長い出力はモデルに先頭と末尾だけを返す（全文はファイルに保存）
+    executor = OutputLimitedCodeExecutor(
+        executor, work_dir, output_stream=output_stream, **get_output_limits()
     )
+    return PythonCodeExecutionTool(executor)
 
 
-def upload_image_to_blob(file_path: str) -> str:
+def upload_image_to_blob(file_path: str, work_dir: Optional[str] = None) -> str:
     """
     指定されたローカルファイルパスの画像をAzure Blob Storageにアップロードし、その公開URLを返します。
 
     Args:
         file_path (str): アップロードする画像ファイルのローカルパス
+        work_dir (Optional[str]): セッションの作業ディレクトリ（指定した場合はその中のファイルだけを探す）
 
     Returns:
         str: アップロード成功時は成功メッセージとURL、失敗時はエラーメッセージ
@@ -121,6 +309,9 @@ def upload_image_to_blob(file_path: str) -> str:
     Note:
         グラフをローカルに保存した後にこのツールを呼び出して、画像をクラウドにアップロードしてください。
         アップロード後、ローカルファイルは自動的に削除されます。
+        既定ではURLを先に返し、アップロードはバックグラウンドで行います（BLOB_UPLOAD_ASYNC=0で完了を待つ）。
+        完了するまでの間、画面にはローカルのファイルを表示します（get_image_sourceを参照）。
+        同じ内容の画像を再度アップロードした場合は、アップロード済みの画像のURLを返します。
     """
     # コード実行エージェントの作業ディレクトリを取得
     agent_work_dir = get_work_directory()
@@ -141,8 +332,13 @@ def upload_image_to_blob(file_path: str) -> str:
     # 絶対パスで扱うため、作業ディレクトリの絶対パスと結合
     full_path_in_agent_work_dir = os.path.join(abs_work, file_path)
 
+    if work_dir is not None:
+        # セッションの作業ディレクトリ内だけを探索（他のセッションの同名ファイルは使わない）
+        path_to_use = get_work_dir_manager(agent_work_dir).resolve(normalized, work_dir)
+        if path_to_use is None:
+            return f"エラー: ファイルが見つかりません。試行したパス: {os.path.join(work_dir, normalized)}"
     # まずエージェントの作業ディレクトリ内を探索
-    if os.path.exists(full_path_in_agent_work_dir):
+    elif os.path.exists(full_path_in_agent_work_dir):
         path_to_use = full_path_in_agent_work_dir
     # 次に渡されたパスをそのまま探索（後方互換性または絶対パス指定の場合）
     elif os.path.exists(file_path):
@@ -151,37 +347,84 @@ def upload_image_to_blob(file_path: str) -> str:
         return f"エラー: ファイルが見つかりません。試行したパス: {full_path_in_agent_work_dir} および {file_path}"
 
     try:
-        connect_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-        container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME")
+        # 保存先（Azure / ローカルディスク / メモリ）はARTIFACT_STORAGEで切り替え
+        connect_str, container_name = get_storage_settings()
 
         if not connect_str or not container_name:
             error_msg = "環境変数にAzure Storageの接続情報が設定されていません。"
             logger.error(error_msg)
             return f"エラー: {error_msg}"
 
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-
-        # 上書きを防ぐために一意のBLOB名を生成
-        blob_name = f"{uuid.uuid4()}-{os.path.basename(path_to_use)}"
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name, blob=blob_name
+        # 表示サイズへの縮小・再圧縮とサムネイルの作成（IMAGE_OPTIMIZE=0で無効）
+        thumbnail = None
+        options = get_optimize_options()
+        optimized = optimize_image(path_to_use, **options) if options else None
+        if optimized is not None:
+            if optimized["path"] != path_to_use:
+                # 元の画像は最適化した画像で置き換える（従来もアップロード後に削除している）
+                os.remove(path_to_use)
+                path_to_use = optimized["path"]
+            thumbnail = optimized["thumbnail_path"]
+
+        # 同じ内容の画像がアップロード済みの場合は索引を参照するだけで済ませる
+        index = get_blob_index(
+            persistent=not connect_str.startswith(MEMORY_CONNECTION_PREFIX)
         )
+        key = storage_key(connect_str, container_name)
+        digest = content_digest(path_to_use)
+        start_blob_cleanup(connect_str, container_name)
+        entry = index.lookup(key, digest)
+        if entry is not None:
+            logger.info(f"同じ内容の画像がアップロード済みのため再利用します: {entry['blob_name']}")
+            _remove_local_files(path_to_use, thumbnail)
+            return f"画像のアップロードに成功しました。[image: {entry['url']}]"
+
+        # 内容のハッシュをBLOB名にする（同じ内容の画像は同じBLOBになる）
+        blob_name = content_blob_name(digest, path_to_use)
+        # サムネイルは同じ名前でthumbnails配下に置く
+        thumbnail_blob_name = f"{THUMBNAIL_BLOB_PREFIX}{blob_name}" if thumbnail else None
+
+        def register(upload: Dict) -> None:
+            index.record(
+                key, digest, blob_name, upload["url"], upload["bytes"], thumbnail_blob_name
+            )
+
+        if os.getenv("BLOB_UPLOAD_ASYNC", "1") != "0":
+            # URLだけ先に確定させ、アップロード（成功後のローカルファイル削除を含む）はバックグラウンドで行う
+            uploader = get_background_uploader()
+            url = get_blob_client_pool().blob_url(connect_str, container_name, blob_name)
+            if uploader.status(url) == UPLOAD_PENDING:
+                # 同じ内容の画像をアップロード中
+                _remove_local_files(path_to_use, thumbnail)
+                return f"画像のアップロードに成功しました。[image: {url}]"
+            uploader.submit(connect_str, container_name, blob_name, path_to_use, register)
+            if thumbnail is not None:
+                uploader.submit(connect_str, container_name, thumbnail_blob_name, thumbnail)
+            logger.info(f"Queued upload of {path_to_use} as blob {blob_name}")
+            return f"画像のアップロードに成功しました。[image: {url}]"
 
         logger.info(
             f"Uploading {path_to_use} to Azure Blob Storage as blob {blob_name}..."
         )
-        with open(path_to_use, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-
-        logger.info("Upload successful.")
-        url = blob_client.url
+        # プロセス共通のクライアント（接続プール）を使い回してアップロード
+        upload = get_blob_client_pool().upload_file(
+            connect_str, container_name, blob_name, path_to_use
+        )
+        url = upload["url"]
+        logger.info(
+            f"Upload successful. {upload['bytes']} bytes, "
+            f"connect {upload['connect_seconds'] * 1000:.1f}ms"
+            f"{'（再利用）' if upload['reused'] else '（新規）'}, "
+            f"transfer {upload['transfer_seconds'] * 1000:.1f}ms"
+        )
+        if thumbnail is not None:
+            get_blob_client_pool().upload_file(
+                connect_str, container_name, thumbnail_blob_name, thumbnail
+            )
+        register(upload)
 
         # アップロード後にローカルファイルを削除
-        try:
-            os.remove(path_to_use)
-            logger.info(f"ローカルファイルを削除しました: {path_to_use}")
-        except Exception as e:
-            logger.warning(f"ローカルファイルの削除に失敗しました {path_to_use}: {e}")
+        _remove_local_files(path_to_use, thumbnail)
 
         return f"画像のアップロードに成功しました。[image: {url}]"
 
@@ -190,6 +433,78 @@ def upload_image_to_blob(file_path: str) -> str:
         return f"エラー: ファイルのアップロードに失敗しました。 {e}"
 
 
+def create_upload_image_tool(work_dir: str) -> FunctionTool:
+    """
+    セッションの作業ディレクトリに固定したupload_image_to_blobツールを作成
+
+    モデルにはfile_pathだけを見せ、探索するディレクトリは変更させません。
+
+    Args:
+        work_dir (str): create_session_work_dirで作成した作業ディレクトリ
+
+    Returns:
+        FunctionTool: upload_image_to_blobという名前のツール
+    """
+
+    def upload(file_path: str) -> str:
+        return upload_image_to_blob(file_path, work_dir=work_dir)
+
+    # 説明はupload_image_to_blobのdocstringから、モデルが指定しないwork_dirの行を除いたもの
+    description = "\n".join(
+        line
+        for line in (upload_image_to_blob.__doc__ or "").splitlines()
+        if not line.strip().startswith("work_dir ")
+    )
+    return FunctionTool(upload, description=description, name="upload_image_to_blob")
+
+
+def _remove_local_files(*paths: Optional[str]) -> None:
+    """アップロード済み（または不要になった）ローカルファイルを削除"""
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            os.remove(path)
+            logger.info(f"ローカルファイルを削除しました: {path}")
+        except Exception as e:
+            logger.warning(f"ローカルファイルの削除に失敗しました {path}: {e}")
+
+
+def get_image_source(url: str):
+    """
+    画面に表示する画像を取得する。
+
+    バックグラウンドでのアップロードが完了していない画像は、ローカルのファイルの内容を返します。
+    ローカルディスク・メモリの保存先（ARTIFACT_STORAGE=local/memory）の画像も内容を返します。
+
+    Args:
+        url (str): upload_image_to_blobが返したURL
+
+    Returns:
+        Union[str, bytes]: st.imageに渡す値（Azureにアップロード済みの場合はURLのまま）
+    """
+    local_path = get_background_uploader().local_preview(url)
+    if local_path is not None:
+        try:
+            with open(local_path, "rb") as f:
+                return f.read()
+        except OSError:
+            # 読み込む直前にアップロードが完了して削除された場合
+            pass
+    # ローカルディスク・メモリの保存先の画像はプロセス内で読み込む
+    stored = get_blob_client_pool().read_stored(url)
+    return stored if stored is not None else url
+
+
+def _has_failed_upload(message: str) -> bool:
+    """メッセージ内の画像のバックグラウンドアップロードが失敗しているかどうか"""
+    uploader = get_background_uploader()
+    return any(
+        uploader.status(url) == UPLOAD_FAILED
+        for url in re.findall(r"\[image: (.*?)\]", message)
+    )
+
+
 def load_erp_data(year_months: List[str] = None, skus: List[str] = None) -> str:
     """
     SKUの固定費と変動費を読み込み、指定された年月とSKUに基づいてCSVデータを返すツール。
@@ -456,6 +771,378 @@ def load_daily_report(month: str, keyword: Optional[str] = None) -> str:
         return f"エラー: 日報データの読み込みに失敗しました: {str(e)}"
 
 
+def get_packaging_machine_status(
+    lot_ids: Optional[List[str]] = None, only_anomalies: bool = False
+) -> str:
+    """
+    包装機テレメトリ（振動・温度・電流・カット長ばらつき・アラーム）のストリーミング異常検知結果を返すツール。
+    設備別・ロット別の移動統計（EWMA、zスコア、アラーム発生率）と清掃要否の予測、直近の異常イベントを返します。
+
+    Args:
+        lot_ids (Optional[List[str]], optional): 対象ロットのリスト（例: ["Lot12345", "Lot12346"]）。指定しない場合は全ロット
+        only_anomalies (bool, optional): Trueの場合、異常または清掃予測のあるロットのみを返します
+
+    Returns:
+        str: 設備サマリー、ロット別状態、直近の異常イベントのCSVデータ
+
+    Examples:
+        get_packaging_machine_status()
+        get_packaging_machine_status(lot_ids=["Lot12353"])
+        get_packaging_machine_status(only_anomalies=True)
+    """
+    try:
+        monitor = get_packaging_machine_monitor()
+        new_rows = monitor.refresh()
+        logger.info(f"包装機テレメトリを取り込みました: {new_rows}行")
+
+        snapshot = monitor.snapshot(lot_ids=lot_ids)
+        lots_df = pd.DataFrame(snapshot["lots"])
+        if only_anomalies and not lots_df.empty:
+            lots_df = lots_df[
+                (lots_df["anomaly_count"] > 0) | lots_df["cleaning_predicted"]
+            ]
+
+        if lots_df.empty:
+            return f"指定された条件（ロット: {lot_ids}）に該当するデータがありません。"
+
+        sections = [
+            "## 設備サマリー",
+            pd.DataFrame(snapshot["machines"]).to_csv(index=False),
+            "## ロット別状態",
+            lots_df.to_csv(index=False),
+            "## 直近の異常イベント",
+            pd.DataFrame(snapshot["anomalies"]).to_csv(index=False)
+            if snapshot["anomalies"]
+            else "異常イベントはありません。",
+        ]
+        return "\n".join(sections)
+
+    except Exception as e:
+        logger.error(f"包装機テレメトリの異常検知エラー: {str(e)}")
+        return f"エラー: 包装機テレメトリの異常検知に失敗しました: {str(e)}"
+
+
+def forecast_defect_trend(sku: str, horizon_days: int = 14) -> str:
+    """
+    SKUの将来の不良率とロス内訳（加工機・包装機・検品・フィルム・不明ロス）の比率を予測するツール。
+    学習済みモデルを再利用するため、再学習なしで即座に予測結果を返します。
+
+    Args:
+        sku (str): 予測するSKU（例: "SKU-1234"）
+        horizon_days (int, optional): 予測日数（1〜60日）。デフォルトは14日
+
+    Returns:
+        str: モデル情報と日別予測値（総生産数に対する比率）のCSVデータ
+
+    Examples:
+        forecast_defect_trend("SKU-1234")
+        forecast_defect_trend("SKU002", horizon_days=30)
+    """
+    try:
+        result = get_forecast_service().predict(sku, horizon_days)
+        forecast_df = result["forecast"].copy()
+        forecast_df["年月日"] = forecast_df["年月日"].dt.strftime("%Y-%m-%d")
+
+        mae_text = ", ".join(
+            f"{target}={mae:.5f}" for target, mae in result["validation_mae"].items()
+        )
+        header = [
+            f"SKU: {sku}",
+            f"実績最終日: {result['last_actual_date']}",
+            f"モデル学習日時: {result['trained_at']} (データバージョン: {result['version']})",
+            f"検証MAE（直近28日）: {mae_text}",
+            f"応答時間: {result['elapsed_ms']:.1f}ms",
+        ]
+        if result["stale"]:
+            header.append("注意: データ更新を検知したため、再学習中です。前回のモデルで予測しています。")
+
+        return "\n".join(header) + "\n\n" + forecast_df.to_csv(
+            index=False, float_format="%.5f"
+        )
+
+    except ValueError as e:
+        return f"エラー: {str(e)}"
+    except Exception as e:
+        logger.error(f"不良率予測エラー: {str(e)}")
+        return f"エラー: 不良率の予測に失敗しました: {str(e)}"
+
+
+def simulate_variable_cost(
+    sku: str,
+    year_month: str,
+    scenarios: Optional[List[Dict[str, Any]]] = None,
+    n_samples: int = 5000,
+    seed: Optional[int] = None,
+) -> str:
+    """
+    原料ロット単価・歩留まり・ライン切替などのシナリオごとに、良品1個あたり変動費の分布をモンテカルロ法で計算するツール。
+    ERPの材料費・委託費とMESの良品数・不良数を基準に、全シナリオを一括で計算します。
+
+    Args:
+        sku (str): 対象SKU（例: "SKU-1234"）
+        year_month (str): 基準とする年月（例: "2025-06"）
+        scenarios (Optional[List[Dict[str, Any]]], optional): シナリオのリスト。各シナリオで指定できるキー:
+            name（シナリオ名）, target_lot（単価を変動させる原料ロット。省略時は全ロット）,
+            lot_price_change_pct / lot_price_volatility_pct（単価変化率と標準偏差, %）,
+            yield_change_pt / yield_volatility_pt（歩留まり変化と標準偏差, ポイント）,
+            defect_reduction_pct / defect_reduction_volatility_pct（ライン切替等による不良削減率と標準偏差, %）,
+            outsourcing_change_pct / outsourcing_volatility_pct（委託費変化率と標準偏差, %）
+        n_samples (int, optional): シナリオごとの試行回数（最大100000）。デフォルトは5000
+        seed (Optional[int], optional): 乱数シード（再現性が必要な場合に指定）
+
+    Returns:
+        str: 基準値とシナリオ別の分布（平均・標準偏差・パーセンタイル・基準比・基準超過確率）のCSVデータ
+
+    Examples:
+        simulate_variable_cost("SKU-1234", "2025-06", [{"name": "Lot5612単価+5%", "target_lot": "Lot5612", "lot_price_change_pct": 5, "lot_price_volatility_pct": 2}])
+        simulate_variable_cost("SKU-1234", "2025-06", [{"name": "設備2号機へ切替", "defect_reduction_pct": 30, "defect_reduction_volatility_pct": 10}])
+    """
+    try:
+        start_time = time.perf_counter()
+        baseline = load_cost_baseline(sku, year_month)
+        all_scenarios = [{"name": "現状"}] + list(scenarios or [])
+        result_df = simulate_cost_scenarios(baseline, all_scenarios, n_samples, seed)
+        elapsed = time.perf_counter() - start_time
+
+        lots_text = ", ".join(
+            f"{lot}={cost:,.0f}円"
+            for lot, cost in zip(baseline["lots"], baseline["lot_costs"])
+        )
+        header = [
+            f"SKU: {sku}, 基準年月: {year_month}（歩留まりはMES {baseline['mes_month']} の実績）",
+            f"材料費内訳: {lots_text}",
+            f"委託費: {baseline['outsourcing_cost']:,.0f}円, 総生産数: {baseline['total_units']:,.0f}個, 不良率: {baseline['defect_rate']:.4%}",
+            f"基準の良品1個あたり変動費: {result_df.attrs['base_unit_cost']:.6f}円",
+            f"試行回数: {result_df.attrs['n_samples']}回/シナリオ × {len(all_scenarios)}シナリオ（計算時間: {elapsed * 1000:.1f}ms）",
+        ]
+        return "\n".join(header) + "\n\n" + result_df.to_csv(
+            index=False, float_format="%.6f"
+        )
+
+    except ValueError as e:
+        return f"エラー: {str(e)}"
+    except Exception as e:
+        logger.error(f"変動費シミュレーションエラー: {str(e)}")
+        return f"エラー: 変動費シミュレーションに失敗しました: {str(e)}"
+
+
+def render_chart(
+    dataset: str,
+    chart_type: str,
+    y: List[str],
+    x: str = "年月",
+    group_by: Optional[str] = None,
+    year_months: Optional[List[str]] = None,
+    skus: Optional[List[str]] = None,
+    aggregate: str = "sum",
+    title: Optional[str] = None,
+) -> str:
+    """
+    サンプルデータの定型グラフ（折れ線・棒・積み上げ棒・パレート図）を描画し、Azure Blob Storageにアップロードするツール。
+    コードを書かずに1回の呼び出しでグラフの公開URLを返します。同じ条件のグラフはキャッシュから即座に返します。
+
+    Args:
+        dataset (str): データセット。"erp"（年月・SKU別の固定費/変動費-材料費/変動費-委託費）,
+            "erp_material"（年月・SKU・原料・備考別の費用）, "mes_total"（日別・SKU別の良品数/不良数）,
+            "mes_loss"（日別・SKU別の加工機ロス/包装機ロス/検品ロス/フィルムロス/不明ロス）
+        chart_type (str): "line"（折れ線）, "bar"（棒）, "stacked_bar"（積み上げ棒）, "pareto"（パレート図）
+        y (List[str]): 縦軸の列（例: ["変動費-材料費"]）。mes_totalでは"不良率(%)"も指定可能。
+            パレート図でyに複数列を指定すると、各列の合計を項目として並べます（ロス内訳など）
+        x (str, optional): 横軸の列。"年月"（月別に集計、既定）, "年月日"（日別）, "SKU", "原料"など
+        group_by (Optional[str], optional): 系列を分ける列（例: "SKU"）。指定する場合yは1列
+        year_months (Optional[List[str]], optional): 対象の年月（例: ["2024-06", "2024-07"]）
+        skus (Optional[List[str]], optional): 対象のSKU（例: ["SKU-1234"]）
+        aggregate (str, optional): 集計方法。"sum"（合計、既定）または"mean"（平均）
+        title (Optional[str], optional): グラフのタイトル（省略時は自動）
+
+    Returns:
+        str: アップロード結果（`[image: 公開URL]`）とグラフに描画した集計データのCSV
+
+    Examples:
+        render_chart(dataset="erp", chart_type="line", y=["変動費-材料費"], skus=["SKU-1234"])
+        render_chart(dataset="mes_total", chart_type="bar", y=["不良率(%)"], group_by="SKU", year_months=["2024-06", "2024-07"])
+        render_chart(dataset="mes_loss", chart_type="pareto", y=["加工機ロス", "包装機ロス", "検品ロス", "フィルムロス", "不明ロス"], skus=["SKU-1234"])
+    """
+    spec = {
+        "dataset": dataset,
+        "chart_type": chart_type,
+        "y": y,
+        "x": x,
+        "group_by": group_by,
+        "year_months": year_months,
+        "skus": skus,
+        "aggregate": aggregate,
+        "title": title,
+    }
+    try:
+        key = chart_cache_key(spec)
+        cached = get_cached_chart(key)
+        # アップロードに失敗した画像を指す結果は使わずに描画し直す
+        if cached is not None and not _has_failed_upload(cached):
+            return cached
+
+        chart = render_chart_spec(spec, os.path.join(get_work_directory(), "charts"))
+        upload_result = upload_image_to_blob(chart["file_path"])
+        if not upload_result.startswith("画像のアップロードに成功しました"):
+            return upload_result
+
+        result = (
+            upload_result
+            + "\n\n## グラフのデータ\n"
+            + chart["data"].head(60).to_csv(float_format="%.4g")
+        )
+        cache_chart(key, result)
+        return result
+
+    except ValueError as e:
+        return f"エラー: {str(e)}"
+    except Exception as e:
+        logger.error(f"グラフ描画エラー: {str(e)}")
+        return f"エラー: グラフの描画に失敗しました: {str(e)}"
+
+
+def optimize_production_schedule(
+    lines: List[str],
+    product_hours: Dict[str, int],
+    changeover_hours: int = 1,
+    horizon_hours: int = 24,
+    objective: str = "minimize_makespan",
+    target_product: Optional[str] = None,
+    time_limit_seconds: float = 10.0,
+) -> str:
+    """
+    ラインへの商品割り当てと生産順序を制約ソルバー（OR-Tools CP-SAT）で最適化するツール。
+    同一ラインで商品が替わるときの切替時間と各ラインの使用可能時間を制約として扱います。
+
+    Args:
+        lines (List[str]): ライン名のリスト（例: ["L1", "L2", "L3"]）
+        product_hours (Dict[str, int]): 商品ごとの生産時間（時間単位の整数。生産をやめる商品は含めない）
+        changeover_hours (int, optional): 同一ラインで商品が替わるときの切替時間。デフォルトは1
+        horizon_hours (int, optional): 各ラインの使用可能時間。デフォルトは24
+        objective (str, optional): 最適化の目的。
+            "minimize_makespan"（全商品の完了時刻を最小化）,
+            "maximize_product"（target_productの生産時間を最大化。product_hoursの値は最低生産時間）,
+            "minimize_changeovers"（切替回数を最小化）
+        target_product (Optional[str], optional): objectiveが"maximize_product"のときの対象商品
+        time_limit_seconds (float, optional): ソルバーの制限時間（秒、最大60）。デフォルトは10
+
+    Returns:
+        str: ソルバーの状態（OPTIMAL=最適解, FEASIBLE=制限時間内の実行可能解）、目的関数値、計算時間、
+            各商品の割り当て（ライン・開始・終了）と「時間帯×ライン」のマークダウン表
+
+    Examples:
+        optimize_production_schedule(["L1", "L2"], {"P1": 10, "P2": 5, "P3": 5}, objective="maximize_product", target_product="P1")
+    """
+    try:
+        result = solve_production_schedule(
+            lines,
+            product_hours,
+            changeover_hours=changeover_hours,
+            horizon_hours=horizon_hours,
+            objective=objective,
+            target_product=target_product,
+            time_limit_seconds=min(float(time_limit_seconds), 60.0),
+        )
+        header = [
+            f"ソルバー状態: {result['status']}",
+            f"目的: {objective}"
+            + (f"（対象商品: {target_product}）" if target_product else ""),
+            f"計算時間: {result['wall_time_seconds']:.2f}秒",
+        ]
+        if not result["assignments"]:
+            header.append("制約を満たすスケジュールが見つかりませんでした。生産時間・ライン数・使用可能時間を見直してください。")
+            return "\n".join(header)
+
+        header.append(f"目的関数値: {result['objective_value']:g}")
+        header.append(f"全商品の完了時刻: {result['makespan']}時")
+        if target_product:
+            hours = next(
+                a["hours"] for a in result["assignments"] if a["product"] == target_product
+            )
+            header.append(f"{target_product}の生産時間: {hours}時間")
+
+        assignments_df = pd.DataFrame(result["assignments"])
+        timetable = build_timetable(
+            result["assignments"], lines, horizon_hours, changeover_hours
+        )
+        return (
+            "\n".join(header)
+            + "\n\n## 割り当て\n"
+            + assignments_df.to_csv(index=False)
+            + "\n## スケジュール\n"
+            + to_markdown_table(timetable)
+        )
+
+    except ValueError as e:
+        return f"エラー: {str(e)}"
+    except Exception as e:
+        logger.error(f"スケジュール最適化エラー: {str(e)}")
+        return f"エラー: スケジュール最適化に失敗しました: {str(e)}"
+
+
+def sweep_production_schedule(
+    lines: List[str],
+    product_hours: Dict[str, int],
+    changeover_options: Optional[List[int]] = None,
+    drop_product_options: Optional[List[List[str]]] = None,
+    extra_line_options: Optional[List[int]] = None,
+    horizon_hours: int = 24,
+    objective: str = "minimize_makespan",
+    target_product: Optional[str] = None,
+    time_limit_seconds: float = 5.0,
+    deadline_seconds: float = 120.0,
+) -> str:
+    """
+    生産スケジュールのWhat-ifシナリオ（切替時間・生産をやめる商品・ライン追加の組み合わせ）を
+    制約ソルバーで並列に解き、比較表を返すツール。
+
+    Args:
+        lines (List[str]): 基準のライン名のリスト（例: ["L1", "L2", "L3", "L4", "L5"]）
+        product_hours (Dict[str, int]): 基準の商品ごとの生産時間（時間単位の整数）
+        changeover_options (Optional[List[int]], optional): 切替時間の候補（例: [0, 1, 2]）。デフォルトは[1]
+        drop_product_options (Optional[List[List[str]]], optional): 生産をやめる商品の組の候補（例: [[], ["P19", "P20"]]）
+        extra_line_options (Optional[List[int]], optional): 追加するライン数の候補（例: [0, 1]）
+        horizon_hours (int, optional): 各ラインの使用可能時間。デフォルトは24
+        objective (str, optional): "minimize_makespan" / "maximize_product" / "minimize_changeovers"
+        target_product (Optional[str], optional): objectiveが"maximize_product"のときの対象商品
+        time_limit_seconds (float, optional): シナリオごとのソルバーの制限時間（秒、最大30）。デフォルトは5
+        deadline_seconds (float, optional): スイープ全体の制限時間（秒、最大300）。超えたシナリオはCANCELLED
+
+    Returns:
+        str: シナリオごとの状態（OPTIMAL/FEASIBLE/INFEASIBLE/CANCELLED）・目的関数値・完了時刻・切替回数・計算時間のCSVデータ
+
+    Examples:
+        sweep_production_schedule(["L1", "L2", "L3", "L4", "L5"], {"P1": 10, "P2": 10, "P19": 2, "P20": 2}, changeover_options=[0, 1, 2], drop_product_options=[[], ["P19", "P20"]], extra_line_options=[0, 1], objective="maximize_product", target_product="P1")
+    """
+    try:
+        scenarios = build_schedule_scenarios(
+            lines,
+            product_hours,
+            changeover_options=changeover_options or [1],
+            drop_product_options=drop_product_options or [[]],
+            extra_line_options=extra_line_options or [0],
+            horizon_hours=horizon_hours,
+            objective=objective,
+            target_product=target_product,
+        )
+        table = run_schedule_sweep(
+            scenarios,
+            time_limit_seconds=min(float(time_limit_seconds), 30.0),
+            deadline_seconds=min(float(deadline_seconds), 300.0),
+        )
+        header = (
+            f"シナリオ数: {len(scenarios)}件（並列数: {table.attrs['max_workers']}, "
+            f"取り消し: {table.attrs['cancelled']}件, 合計時間: {table.attrs['elapsed_seconds']:.1f}秒）"
+        )
+        return header + "\n\n" + table.to_csv(index=False, float_format="%.2f")
+
+    except ValueError as e:
+        return f"エラー: {str(e)}"
+    except Exception as e:
+        logger.error(f"スケジュールスイープエラー: {str(e)}")
+        return f"エラー: スケジュールスイープに失敗しました: {str(e)}"
+
+
 def check_content(input_str: str) -> str:
     """
     入力文字列がFunction***かどうか判定する
@@ -500,3 +1187,44 @@ def display_multiagent_chat_message(message, index):
     role = "🤖 エージェント" if message.source != "user" else "👤 ユーザー"
     st.markdown(f"**{role} ({index + 1}):**")
     st.markdown(f"> {message.content}")
+
+
+async def display_execution_output(output_stream: ExecutionOutputStream) -> None:
+    """
+    コード実行中の出力を画面に逐次表示する（実行が終わると表示を消し、キャンセルされるまで続ける）。
+
+    run_streamと同じイベントループのタスクとして起動してください。
+
+    Args:
+        output_stream (ExecutionOutputStream): create_execute_toolに渡した出力先
+    """
+    placeholder = None
+
+    def render(snapshot: Dict) -> None:
+        nonlocal placeholder
+        if not snapshot["running"]:
+            if placeholder is not None:
+                placeholder.empty()
+                placeholder = None
+            return
+        if placeholder is None:
+            placeholder = st.empty()
+        with placeholder.container():
+            if snapshot["status"]:
+                # 同時実行数の上限で待機中（待ち順を表示）
+                st.caption(
+                    f"⏳ {snapshot['status']}（混雑しています、{snapshot['elapsed_seconds']:.0f}秒経過）"
+                )
+                return
+            st.caption(
+                f"⏳ コードを実行中です（{snapshot['elapsed_seconds']:.0f}秒経過、"
+                f"出力{snapshot['total_chars']}文字）"
+            )
+            text = snapshot["text"][-EXECUTION_OUTPUT_DISPLAY_CHARS:]
+            st.code(text or "（出力待ち）", language="text")
+
+    try:
+        await follow_output(output_stream, render)
+    finally:
+        if placeholder is not None:
+            placeholder.empty()
@@ -0,0 +1,253 @@
+"""
+複数クエリのウェブ検索の並列実行と結果の統合
+
+search_duckduckgoは1回の呼び出しで1つのクエリしか検索できないため、調査タスクではエージェントが
+クエリごとにLLMのターンを重ねていました。このモジュールは複数のクエリを並列に検索し、
+重複する結果をまとめて1つの要約（ダイジェスト）にします。
+
+- run_multi_search: クエリごとのタイムアウトと全体の締め切り付きで並列に検索
+- merge_results: URLで重複を除き、複数のクエリで上位に出た結果ほど上位に並べる
+- format_digest: 上限の文字数に収まるダイジェストを作成
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+from urllib.parse import urlsplit
+
+from .metrics import metrics
+from .search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MAX_QUERIES = 8
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_QUERY_TIMEOUT_SECONDS = 10.0
+DEFAULT_DEADLINE_SECONDS = 20.0
+DEFAULT_MAX_CHARS = 6000
+
+# ダイジェストに載せる1件あたりの本文の文字数
+SNIPPET_CHARS = 300
+
+
+def _url_key(url: str) -> str:
+    """重複判定用のURL（スキーム・www・末尾のスラッシュ・フラグメントの違いを無視）"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = f"{host}{parts.path.rstrip('/')}"
+    if parts.query:
+        key += f"?{parts.query}"
+    return key
+
+
+def run_multi_search(
+    queries: List[str],
+    fetch: Callable[[str], List[Dict]],
+    query_timeout_seconds: float = DEFAULT_QUERY_TIMEOUT_SECONDS,
+    deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Dict:
+    """
+    複数のクエリを並列に検索
+
+    表記揺れのみ異なるクエリは1回だけ検索します。タイムアウトしたクエリの結果は待たずに返します
+    （実行中の検索はバックグラウンドで終了させます）。
+
+    Args:
+        queries (List[str]): 検索クエリ
+        fetch (Callable[[str], List[Dict]]): クエリを受け取ってtitle, href, bodyの一覧を返す関数
+        query_timeout_seconds (float): 1クエリの検索を開始してから待つ時間（秒）
+        deadline_seconds (float): 全体の締め切り（秒）
+        max_workers (int): 同時に実行する検索の数
+
+    Returns:
+        Dict: results（クエリ→結果の一覧）, failed（クエリ→エラー内容）, timed_out（クエリの一覧）,
+            elapsed_seconds
+    """
+    unique_queries: Dict[str, str] = {}
+    for query in queries:
+        if query and query.strip():
+            unique_queries.setdefault(normalize_query(query), query.strip())
+    queries = list(unique_queries.values())
+
+    start_time = time.monotonic()
+    deadline_at = start_time + deadline_seconds
+    started_at: Dict[str, float] = {}
+    started_lock = threading.Lock()
+
+    def search(query: str) -> List[Dict]:
+        with started_lock:
+            started_at[query] = time.monotonic()
+        return fetch(query)
+
+    results: Dict[str, List[Dict]] = {}
+    failed: Dict[str, str] = {}
+    timed_out: List[str] = []
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(queries) or 1)),
+        thread_name_prefix="web-search",
+    )
+    try:
+        futures = {executor.submit(search, query): query for query in queries}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            if now >= deadline_at:
+                break
+            # 開始してからquery_timeout_secondsを過ぎたクエリは待たない
+            next_check = deadline_at
+            with started_lock:
+                started = dict(started_at)
+            for future in list(pending):
+                query = futures[future]
+                if query not in started or future.done():
+                    continue
+                expires_at = started[query] + query_timeout_seconds
+                if now >= expires_at:
+                    pending.discard(future)
+                    timed_out.append(query)
+                else:
+                    next_check = min(next_check, expires_at)
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=next_check - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                query = futures[future]
+                try:
+                    results[query] = future.result() or []
+                except Exception as e:
+                    logger.warning(f"検索に失敗しました query='{query}': {e}")
+                    failed[query] = str(e)
+        # 締め切りまでに終わらなかったクエリ
+        timed_out.extend(futures[future] for future in pending)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed_seconds = time.monotonic() - start_time
+    metrics.observe("web_search.multi_seconds", elapsed_seconds)
+    metrics.increment("web_search.queries", len(queries))
+    metrics.increment("web_search.failed", len(failed))
+    metrics.increment("web_search.timed_out", len(timed_out))
+    return {
+        "results": {query: results[query] for query in queries if query in results},
+        "failed": failed,
+        "timed_out": [query for query in queries if query in timed_out],
+        "elapsed_seconds": elapsed_seconds,
+    }
+
+
+def merge_results(results: Dict[str, List[Dict]]) -> List[Dict]:
+    """
+    クエリごとの検索結果をURLで重複を除いて統合し、順位を付ける
+
+    スコアは各クエリでの順位の逆数の合計（reciprocal rank fusion）で、複数のクエリで
+    上位に出た結果ほど上位になります。
+
+    Args:
+        results (Dict[str, List[Dict]]): クエリ→title, href, bodyの一覧
+
+    Returns:
+        List[Dict]: title, href, body, score, queries（一致したクエリ）の一覧（スコアの高い順）
+    """
+    merged: Dict[str, Dict] = {}
+    for query, items in results.items():
+        for rank, item in enumerate(items):
+            url = item.get("href") or item.get("url") or ""
+            title = (item.get("title") or "").strip()
+            key = _url_key(url) if url else normalize_query(title)
+            if not key:
+                continue
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {
+                    "title": title,
+                    "href": url,
+                    "body": (item.get("body") or "").strip(),
+                    "score": 0.0,
+                    "queries": [],
+                }
+            # 本文は長い方を残す
+            body = (item.get("body") or "").strip()
+            if len(body) > len(entry["body"]):
+                entry["body"] = body
+            entry["score"] += 1.0 / (rank + 1)
+            if query not in entry["queries"]:
+                entry["queries"].append(query)
+    ranked = sorted(merged.values(), key=lambda e: (-e["score"], -len(e["queries"])))
+    metrics.increment(
+        "web_search.duplicates_removed",
+        sum(len(items) for items in results.values()) - len(ranked),
+    )
+    return ranked
+
+
+def format_digest(
+    ranked: List[Dict],
+    failed: Dict[str, str],
+    timed_out: List[str],
+    max_chars: int = DEFAULT_MAX_CHARS,
+) -> str:
+    """
+    統合した検索結果をmax_chars以内のダイジェストにする
+
+    Args:
+        ranked (List[Dict]): merge_resultsの結果
+        failed (Dict[str, str]): 失敗したクエリとエラー内容
+        timed_out (List[str]): タイムアウトしたクエリ
+        max_chars (int): ダイジェストの最大の文字数
+
+    Returns:
+        str: ダイジェスト
+    """
+    notes = []
+    if timed_out:
+        notes.append(f"タイムアウトしたクエリ: {', '.join(timed_out)}")
+    if failed:
+        notes.append("失敗したクエリ: " + ", ".join(f"{q}（{e}）" for q, e in failed.items()))
+    footer = "\n".join(notes)
+    if not ranked:
+        return "\n".join(["検索結果はありませんでした。", footer]).strip()
+
+    lines = []
+    used = len(footer)
+    for i, entry in enumerate(ranked, start=1):
+        body = re.sub(r"\s+", " ", entry["body"])
+        if len(body) > SNIPPET_CHARS:
+            body = body[:SNIPPET_CHARS] + "…"
+        block = (
+            f"{i}. {entry['title']}\n   {entry['href']}\n   {body}\n"
+            f"   クエリ: {', '.join(entry['queries'])}"
+        )
+        if used + len(block) + 1 > max_chars and lines:
+            lines.append(f"（ほか{len(ranked) - i + 1}件の結果を省略しました）")
+            break
+        lines.append(block)
+        used += len(block) + 1
+    if footer:
+        lines.append(footer)
+    return "\n".join(lines)
+
+
+def get_multi_search_options() -> Dict:
+    """
+    並列検索の設定を環境変数から取得
+
+    WEB_SEARCH_QUERY_TIMEOUT_SECONDS（既定10）、WEB_SEARCH_DEADLINE_SECONDS（既定20）、
+    WEB_SEARCH_MAX_WORKERS（既定4）で指定します。
+    """
+    return {
+        "query_timeout_seconds": float(
+            os.getenv("WEB_SEARCH_QUERY_TIMEOUT_SECONDS", str(DEFAULT_QUERY_TIMEOUT_SECONDS))
+        ),
+        "deadline_seconds": float(
+            os.getenv("WEB_SEARCH_DEADLINE_SECONDS", str(DEFAULT_DEADLINE_SECONDS))
+        ),
+        "max_workers": int(os.getenv("WEB_SEARCH_MAX_WORKERS", str(DEFAULT_MAX_WORKERS))),
+    }
@@ -0,0 +1,275 @@
+"""
+コード実行用作業ディレクトリの管理
+
+全セッションが1つの作業ディレクトリ（App Serviceでは永続化される/home/site/work）を共有すると、
+生成されたコードや画像が削除されずに溜まり続け、ディレクトリの一覧やディスクI/Oが遅くなります。
+このモジュールはセッションごとのサブディレクトリを払い出し、バックグラウンドで
+期限切れ・容量超過のファイルを削除します。
+
+- sessions/<id>: セッションごとの作業ディレクトリ（WORK_SCRATCH_DIRを指定した場合はその配下）
+- 最終更新から一定時間が経過したセッションは削除し、セッションごと・全体の容量上限を超えた場合は
+  古いファイル・セッションから削除します
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SESSIONS_DIR_NAME = "sessions"
+
+# この時間内に更新されたセッションは、全体の容量超過でも削除しない（実行中とみなす）
+ACTIVE_SESSION_SECONDS = 15 * 60
+
+MB = 1024 * 1024
+
+
+def _scan(path: str) -> Dict:
+    """ディレクトリ内のファイル（パス・サイズ・更新時刻）と合計サイズ・最終更新時刻を取得"""
+    files = []
+    last_modified = os.stat(path).st_mtime
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            files.append((file_path, stat.st_size, stat.st_mtime))
+            last_modified = max(last_modified, stat.st_mtime)
+    return {
+        "files": files,
+        "bytes": sum(size for _, size, _ in files),
+        "last_modified": last_modified,
+    }
+
+
+def _prepare_scratch_root(scratch_dir: Optional[str]) -> Optional[str]:
+    """高速な一時領域（tmpfsなど）を作成し、書き込めない場合はNoneを返す"""
+    if not scratch_dir:
+        return None
+    try:
+        os.makedirs(scratch_dir, exist_ok=True)
+        probe = os.path.join(scratch_dir, f".probe-{uuid.uuid4().hex}")
+        with open(probe, "w"):
+            pass
+        os.remove(probe)
+        return scratch_dir
+    except OSError as e:
+        logger.warning(f"一時領域{scratch_dir}を使用できないため、通常の作業ディレクトリを使用します: {e}")
+        return None
+
+
+class WorkDirectoryManager:
+    """セッションごとの作業ディレクトリの払い出しと、期限・容量によるガベージコレクション"""
+
+    def __init__(
+        self,
+        root: str,
+        max_age_seconds: float = 24 * 3600,
+        max_session_bytes: int = 200 * MB,
+        max_total_bytes: int = 2048 * MB,
+        scratch_dir: Optional[str] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            root (str): 作業ディレクトリのルート（get_work_directory()）
+            max_age_seconds (float): 最終更新からこの時間が経過したセッション・ファイルを削除
+            max_session_bytes (int): 1セッションの容量上限（超えたら古いファイルから削除）
+            max_total_bytes (int): 全セッションの容量上限（超えたら古いセッションから削除）
+            scratch_dir (Optional[str]): セッションディレクトリを作成する高速な一時領域（/dev/shmなど）
+        """
+        self.root = os.path.abspath(root)
+        self.max_age_seconds = max_age_seconds
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        scratch_root = _prepare_scratch_root(scratch_dir)
+        self.sessions_root = os.path.join(scratch_root or self.root, SESSIONS_DIR_NAME)
+        os.makedirs(self.sessions_root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def create_session_dir(self) -> str:
+        """
+        新しいセッション用の作業ディレクトリを作成
+
+        Returns:
+            str: 作成したディレクトリの絶対パス
+        """
+        path = os.path.join(self.sessions_root, uuid.uuid4().hex)
+        os.makedirs(path)
+        metrics.increment("work_dir.sessions_created")
+        return path
+
+    def list_session_dirs(self) -> List[str]:
+        """セッションディレクトリの一覧（更新が新しい順）"""
+        try:
+            entries = [e for e in os.scandir(self.sessions_root) if e.is_dir()]
+        except OSError:
+            return []
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        return [e.path for e in entries]
+
+    def resolve(self, file_path: str, session_dir: str) -> Optional[str]:
+        """
+        セッションの作業ディレクトリ内のファイルを探す
+
+        他のセッションに同じ名前のファイルがあっても使いません（セッション間の分離のため）。
+
+        Args:
+            file_path (str): 作業ディレクトリからの相対パス、または作業ディレクトリ内の絶対パス
+            session_dir (str): 呼び出し元のセッションの作業ディレクトリ
+
+        Returns:
+            Optional[str]: 見つかったファイルの絶対パス（セッションの外を指す場合はNone）
+        """
+        path = os.path.abspath(os.path.join(session_dir, file_path))
+        # シンボリックリンクや".."でセッションの外を指すものは除く
+        real_session_dir = os.path.realpath(session_dir)
+        if os.path.commonpath([real_session_dir, os.path.realpath(path)]) != real_session_dir:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def _remove_file(self, path: str, size: int, stats: Dict) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        stats["bytes_reclaimed"] += size
+        stats["files_removed"] += 1
+
+    def _remove_session(self, path: str, size: int, stats: Dict) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+        if not os.path.exists(path):
+            stats["bytes_reclaimed"] += size
+            stats["sessions_removed"] += 1
+
+    def _collect_legacy_files(self, now: float, stats: Dict) -> None:
+        """セッション分割前にルート直下に作られた古いファイルを削除"""
+        for root, dirs, names in os.walk(self.root):
+            if root == self.root:
+                dirs[:] = [d for d in dirs if d != SESSIONS_DIR_NAME]
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    self._remove_file(path, stat.st_size, stats)
+
+    def collect(self) -> Dict:
+        """
+        期限切れ・容量超過のファイルとセッションを削除
+
+        Returns:
+            Dict: bytes_reclaimed, files_removed, sessions_removed, total_bytes, sessions
+        """
+        stats = {"bytes_reclaimed": 0, "files_removed": 0, "sessions_removed": 0}
+        now = time.time()
+        with self._lock, metrics.measure("work_dir.gc_seconds"):
+            self._collect_legacy_files(now, stats)
+
+            sessions = []
+            for path in self.list_session_dirs():
+                try:
+                    scan = _scan(path)
+                except OSError:
+                    continue
+                if now - scan["last_modified"] > self.max_age_seconds:
+                    self._remove_session(path, scan["bytes"], stats)
+                    continue
+                if scan["bytes"] > self.max_session_bytes:
+                    # 古いファイルから上限以下になるまで削除
+                    for file_path, size, _ in sorted(scan["files"], key=lambda f: f[2]):
+                        if scan["bytes"] <= self.max_session_bytes:
+                            break
+                        self._remove_file(file_path, size, stats)
+                        scan["bytes"] -= size
+                sessions.append((path, scan))
+
+            total_bytes = sum(scan["bytes"] for _, scan in sessions)
+            # 全体の上限を超えた場合は、実行中でないセッションを古い順に削除
+            for path, scan in sorted(sessions, key=lambda s: s[1]["last_modified"]):
+                if total_bytes <= self.max_total_bytes:
+                    break
+                if now - scan["last_modified"] < ACTIVE_SESSION_SECONDS:
+                    continue
+                self._remove_session(path, scan["bytes"], stats)
+                total_bytes -= scan["bytes"]
+
+        stats["total_bytes"] = total_bytes
+        stats["sessions"] = sum(1 for path, _ in sessions if os.path.exists(path))
+        metrics.increment("work_dir.gc_runs")
+        metrics.increment("work_dir.bytes_reclaimed", stats["bytes_reclaimed"])
+        metrics.increment("work_dir.files_removed", stats["files_removed"])
+        metrics.increment("work_dir.sessions_removed", stats["sessions_removed"])
+        metrics.set_gauge("work_dir.total_bytes", total_bytes)
+        metrics.set_gauge("work_dir.sessions", stats["sessions"])
+        if stats["bytes_reclaimed"]:
+            logger.info(
+                f"作業ディレクトリを整理しました: {stats['bytes_reclaimed'] / MB:.1f}MB解放"
+                f"（ファイル{stats['files_removed']}件、セッション{stats['sessions_removed']}件）"
+            )
+        return stats
+
+    def _gc_loop(self, interval_seconds: float) -> None:
+        while not self._stop_event.wait(interval_seconds):
+            try:
+                self.collect()
+            except Exception as e:
+                logger.error(f"作業ディレクトリの整理に失敗しました: {e}")
+
+    def start_background_gc(self, interval_seconds: float = 600.0) -> None:
+        """一定間隔でcollect()を実行するバックグラウンドスレッドを開始（開始済みの場合は何もしない）"""
+        with self._lock:
+            if self._gc_thread is not None and self._gc_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._gc_thread = threading.Thread(
+                target=self._gc_loop, args=(interval_seconds,), daemon=True
+            )
+            self._gc_thread.start()
+
+    def stop_background_gc(self) -> None:
+        """バックグラウンドのガベージコレクションを停止"""
+        self._stop_event.set()
+
+
+_manager: Optional[WorkDirectoryManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_work_dir_manager(root: str) -> WorkDirectoryManager:
+    """
+    プロセス共通の作業ディレクトリ管理を取得（初回のみ生成し、バックグラウンドの整理を開始）
+
+    上限は環境変数WORK_DIR_MAX_AGE_HOURS（既定24）、WORK_DIR_SESSION_MAX_MB（既定200）、
+    WORK_DIR_MAX_MB（既定2048）、整理の間隔はWORK_DIR_GC_INTERVAL_SECONDS（既定600）で指定します。
+    WORK_SCRATCH_DIR（例: /dev/shm/agent-work）を指定すると、セッションディレクトリをその配下に作成します。
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkDirectoryManager(
+                root,
+                max_age_seconds=float(os.getenv("WORK_DIR_MAX_AGE_HOURS", "24")) * 3600,
+                max_session_bytes=int(float(os.getenv("WORK_DIR_SESSION_MAX_MB", "200")) * MB),
+                max_total_bytes=int(float(os.getenv("WORK_DIR_MAX_MB", "2048")) * MB),
+                scratch_dir=os.getenv("WORK_SCRATCH_DIR"),
+            )
+            _manager.start_background_gc(
+                float(os.getenv("WORK_DIR_GC_INTERVAL_SECONDS", "600"))
+            )
+        return _manager